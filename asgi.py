@@ -0,0 +1,3 @@
+from ml_ids_api.asgi import create_asgi_app
+
+app = create_asgi_app('config.Config')
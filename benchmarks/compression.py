@@ -0,0 +1,64 @@
+"""
+Benchmark measuring the bandwidth saved by compressing prediction requests, prediction responses and SNS
+notifications, and the CPU time spent per megabyte of uncompressed data to compress and decompress them.
+"""
+import argparse
+import json
+import time
+
+from ml_ids_api.compression import compress, compress_text, decompress, supported_encodings
+from ml_ids_api.data import deserialize_dataframe, merge_predictions
+from ml_ids_api.messaging import SNSMessageProducer
+from benchmarks.utils import create_flows, create_predictions
+
+MAX_BYTES = 1024 * 1024 * 1024
+
+
+def measure(func, repeat):
+    """
+    Measures the minimum runtime of the given function in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{:>10} {:>8} {:>6} {:>12} {:>12} {:>8} {:>14} {:>16}'
+          .format('payload', 'rows', 'enc', 'raw (KiB)', 'comp (KiB)', 'saved', 'comp (ms/MB)', 'decomp (ms/MB)'))
+    for rows in args.rows:
+        request_body = create_flows(rows).to_json(orient='split', index=False).encode('utf-8')
+        response_body = json.dumps(create_predictions(rows)).encode('utf-8')
+
+        for payload, body in (('request', request_body), ('response', response_body)):
+            megabytes = len(body) / (1024 * 1024)
+            for encoding in supported_encodings():
+                compressed = compress(body, encoding)
+                compress_ms = measure(lambda: compress(body, encoding), args.repeat)
+                decompress_ms = measure(lambda: decompress(compressed, encoding, MAX_BYTES), args.repeat)
+                print('{:>10} {:>8} {:>6} {:>12.1f} {:>12.1f} {:>7.1f}% {:>14.1f} {:>16.1f}'
+                      .format(payload, rows, encoding, len(body) / 1024, len(compressed) / 1024,
+                              100 * (1 - len(compressed) / len(body)), compress_ms / megabytes,
+                              decompress_ms / megabytes))
+
+    data = merge_predictions(deserialize_dataframe(create_flows(100).to_json(orient='split', index=False)),
+                             create_predictions(100))
+    messages = SNSMessageProducer.create_messages(data)
+    raw = sum(len(message.message) for message in messages)
+
+    print('\n{:>6} {:>18} {:>18}'.format('enc', 'SNS message (B)', 'compressed (B)'))
+    for encoding in supported_encodings():
+        compressed = sum(len(compress_text(message.message, encoding)) for message in messages)
+        print('{:>6} {:>18.0f} {:>18.0f}'.format(encoding, raw / len(messages), compressed / len(messages)))
+
+
+if __name__ == '__main__':
+    main()
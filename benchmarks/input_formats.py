@@ -0,0 +1,79 @@
+"""
+Benchmark comparing the size on the wire and the parse time per prediction request of the supported request formats.
+Parse time covers decoding the request body and creating the `split-JSON` body sent to SageMaker.
+Requires the optional dependencies `pyarrow` and `msgpack`.
+"""
+import argparse
+import time
+
+import msgpack
+import pyarrow
+
+from ml_ids_api.data import deserialize_dataframe, deserialize_split_frame, serialize_split_frame
+from ml_ids_api.formats import deserialize_arrow_stream, deserialize_msgpack_split_frame
+from benchmarks.utils import create_flows
+
+
+def encode_arrow(df):
+    """
+    Encodes a DataFrame as Arrow IPC stream.
+    """
+    batch = pyarrow.RecordBatch.from_arrays([pyarrow.array(df[column].values) for column in df.columns],
+                                            list(df.columns))
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_msgpack(df):
+    """
+    Encodes a DataFrame as MessagePack split frame.
+    """
+    return msgpack.packb({'columns': list(df.columns), 'data': df.astype(object).values.tolist()})
+
+
+FORMATS = {
+    'json (pandas)': (lambda df: df.to_json(orient='split', index=False).encode('utf-8'),
+                      lambda body: (deserialize_dataframe(body), body)),
+    'json (json)': (lambda df: df.to_json(orient='split', index=False).encode('utf-8'),
+                    lambda body: (deserialize_split_frame(body), body)),
+    'msgpack': (encode_msgpack,
+                lambda body: serialize_split_frame(deserialize_msgpack_split_frame(body))),
+    'arrow': (encode_arrow,
+              lambda body: serialize_split_frame(deserialize_arrow_stream(body)))
+}
+
+
+def run(parse, body, repeat):
+    """
+    Parses the request body `repeat` times.
+
+    :return: Median parse time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(body)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{:>8} {:>14} {:>14} {:>12}'.format('rows', 'format', 'size (KB)', 'parse (ms)'))
+    for rows in args.rows:
+        df = create_flows(rows)
+
+        for name, (encode, parse) in FORMATS.items():
+            body = encode(df)
+            elapsed = run(parse, body, args.repeat)
+            print('{:>8} {:>14} {:>14.1f} {:>12.1f}'.format(rows, name, len(body) / 1024, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
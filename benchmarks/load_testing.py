@@ -0,0 +1,229 @@
+"""
+Load test of the service as deployed: the Flask application created by `create_app` is run by gunicorn's gevent
+workers against local stand-ins for SageMaker and SNS. Prediction requests are sent open-loop at a fixed rate per
+step, i.e. independent of the response times, so that latencies are measured from the scheduled send time and a
+saturated service shows up as growing latencies instead of a lower request rate.
+
+Requests contain a varying number of network flows, either synthetic flows or the flows of an NDJSON file (one flow
+record per line as accepted by `/api/predictions/stream`), replayed in order. Reports the achieved requests and flows
+per second, the p50, p95 and p99 latency, the number of failed and skipped requests and the peak resident memory per
+worker. Results can be written as JSON (`--output`) and compared against the results of a previous run
+(`--baseline`), e.g. of another commit.
+Requires `gunicorn`, `gevent` and `aiohttp`.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import subprocess
+import time
+import aiohttp
+
+from benchmarks.serving_modes import free_port, start_server
+from benchmarks.stubs import SagemakerStubServer, SnsStubServer
+from benchmarks.utils import create_flows, percentile
+
+
+def load_request_bodies(rows, flows_path=None, bodies=100, seed=42):
+    """
+    Creates prediction request bodies in `split-JSON` format, the number of flows per request is drawn uniformly
+    from `rows`.
+
+    :return: List of tuples of (request body, number of flows).
+    """
+    rand = random.Random(seed)
+    sizes = [rand.choice(rows) for _ in range(bodies)]
+
+    if flows_path is None:
+        flows = create_flows(max(rows) * 10, seed=seed)
+        records = flows.values.tolist()
+        columns = flows.columns.tolist()
+    else:
+        with open(flows_path) as flows_file:
+            objects = [json.loads(line) for line in flows_file if line.strip()]
+        columns = list(objects[0])
+        records = [[record.get(column) for column in columns] for record in objects]
+
+    result = []
+    offset = 0
+    for size in sizes:
+        data = [records[(offset + i) % len(records)] for i in range(size)]
+        offset += size
+        result.append((json.dumps({'columns': columns, 'data': data}).encode('utf-8'), size))
+    return result
+
+
+def worker_pids(master_pid):
+    """
+    Returns the process ids of the gunicorn workers of the given master process.
+    """
+    with open('/proc/{0}/task/{0}/children'.format(master_pid)) as children:
+        return [int(pid) for pid in children.read().split()]
+
+
+def peak_memory_mb(pid):
+    """
+    Returns the peak resident memory of the given process in MiB.
+    """
+    with open('/proc/{}/status'.format(pid)) as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024.0
+    return float('nan')
+
+
+async def generate_load(url, bodies, rate, duration, max_in_flight):
+    """
+    Sends prediction requests at `rate` requests per second for `duration` seconds. Requests scheduled while
+    `max_in_flight` requests are outstanding are skipped.
+
+    :return: Dictionary of results.
+    """
+    latencies = []
+    counters = {'rows': 0, 'failed': 0, 'skipped': 0}
+    headers = {'Content-Type': 'application/json; format=pandas-split'}
+    in_flight = [0]
+
+    connector = aiohttp.TCPConnector(limit=max_in_flight)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+
+        async def send(scheduled, body, rows):
+            try:
+                async with session.post(url, data=body, headers=headers) as response:
+                    await response.read()
+                    if response.status == 200:
+                        latencies.append((time.perf_counter() - scheduled) * 1000)
+                        counters['rows'] += rows
+                    else:
+                        counters['failed'] += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                counters['failed'] += 1
+            finally:
+                in_flight[0] -= 1
+
+        tasks = []
+        start = time.perf_counter()
+        for i in range(int(rate * duration)):
+            scheduled = start + i / rate
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+
+            if in_flight[0] >= max_in_flight:
+                counters['skipped'] += 1
+                continue
+
+            in_flight[0] += 1
+            body, rows = bodies[i % len(bodies)]
+            tasks.append(asyncio.ensure_future(send(scheduled, body, rows)))
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return {
+        'rate': rate,
+        'requests_per_second': len(latencies) / elapsed,
+        'rows_per_second': counters['rows'] / elapsed,
+        'p50_ms': percentile(latencies, 50) if latencies else None,
+        'p95_ms': percentile(latencies, 95) if latencies else None,
+        'p99_ms': percentile(latencies, 99) if latencies else None,
+        'failed': counters['failed'],
+        'skipped': counters['skipped']
+    }
+
+
+def git_commit():
+    """
+    Returns the current git commit or None if unavailable.
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL) \
+            .decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_change(value, baseline):
+    """
+    Formats the relative change of a value compared to the baseline value.
+    """
+    if value is None or not baseline:
+        return '{:>9}'.format('-')
+    return '{:>+8.1f}%'.format((value - baseline) / baseline * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rates', type=float, nargs='+', default=[20, 50, 100])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--flows', help='NDJSON file of network flows to replay')
+    parser.add_argument('--max-in-flight', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--latency-distribution', choices=SagemakerStubServer.LATENCY_DISTRIBUTIONS,
+                        default='lognormal')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--sns-latency-ms', type=float, default=5.0)
+    parser.add_argument('--parser', choices=['json', 'pandas'], default='json')
+    parser.add_argument('--setting', action='append', default=[], metavar='KEY=VALUE',
+                        help='additional configuration parameter of the service')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    args = parser.parse_args()
+
+    settings = dict(setting.split('=', 1) for setting in args.setting)
+    bodies = load_request_bodies(args.rows, args.flows)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = {result['rate']: result for result in json.load(baseline_file)['results']}
+
+    loop = asyncio.get_event_loop()
+    results = []
+
+    print('{:>8} {:>12} {:>10} {:>10} {:>10} {:>10} {:>7} {:>8} {:>9}'.format(
+        'rate', 'requests/s', 'rows/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'failed', 'skipped', 'p99 diff'))
+
+    with SagemakerStubServer(latency_ms=args.latency_ms, error_rate=args.error_rate,
+                             latency_distribution=args.latency_distribution,
+                             error_status=args.error_status) as sagemaker, \
+            SnsStubServer(latency_ms=args.sns_latency_ms) as sns:
+        port = free_port()
+        process = start_server('gevent', args.workers, port, sagemaker, sns, args.parser, **settings)
+
+        try:
+            url = 'http://127.0.0.1:{}/api/predictions'.format(port)
+            loop.run_until_complete(generate_load(url, bodies, 10, 1.0, args.max_in_flight))
+
+            for rate in args.rates:
+                result = loop.run_until_complete(generate_load(url, bodies, rate, args.duration,
+                                                               args.max_in_flight))
+                results.append(result)
+                print('{:>8.0f} {:>12.1f} {:>10.0f} {:>10.1f} {:>10.1f} {:>10.1f} {:>7} {:>8} {}'.format(
+                    rate, result['requests_per_second'], result['rows_per_second'],
+                    *[result[key] if result[key] is not None else float('nan')
+                      for key in ('p50_ms', 'p95_ms', 'p99_ms')],
+                    result['failed'], result['skipped'],
+                    format_change(result['p99_ms'], baseline.get(rate, {}).get('p99_ms'))))
+
+            memory = [peak_memory_mb(pid) for pid in worker_pids(process.pid)]
+            print('peak memory per worker (MiB): {}'.format(', '.join('{:.1f}'.format(mb) for mb in memory)))
+        finally:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        report = {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+            'parameters': vars(args),
+            'results': results,
+            'worker_peak_memory_mb': memory
+        }
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
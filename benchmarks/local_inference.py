@@ -0,0 +1,81 @@
+"""
+Benchmark comparing the throughput in rows per second of the in-process prediction backend against requesting
+predictions over HTTP from a local SageMaker stand-in. The in-process backend scores a randomly initialized model of
+the size of the ML-IDS classifier, loaded memory-mapped from disk. Both backends receive the same request bodies.
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient
+from ml_ids_api.inference import LocalModel, LocalModelPredictor, load_model
+from benchmarks.stubs import SagemakerStubServer
+from benchmarks.utils import FEATURE_COLUMNS, create_flows
+
+
+def create_model(hidden_layers, seed=42):
+    """
+    Creates a randomly initialized model using all numeric feature columns.
+
+    :return: Model.
+    """
+    rng = np.random.RandomState(seed)
+    columns = [column for column in FEATURE_COLUMNS if column != 'timestamp']
+    sizes = [len(columns)] + hidden_layers + [1]
+
+    return LocalModel(columns=columns,
+                      mean=rng.normal(size=len(columns)),
+                      scale=rng.uniform(0.5, 2.0, size=len(columns)),
+                      weights=[rng.normal(size=(n_in, n_out)) / np.sqrt(n_in)
+                               for n_in, n_out in zip(sizes[:-1], sizes[1:])],
+                      biases=[np.zeros(n_out) for n_out in sizes[1:]])
+
+
+def measure(predictor, request_body, rows, duration):
+    """
+    Requests predictions repeatedly for at least `duration` seconds.
+
+    :return: Rows per second.
+    """
+    requests = 0
+    start = time.perf_counter()
+
+    while time.perf_counter() - start < duration:
+        predictor.post_invocations(request_body)
+        requests += 1
+
+    return requests * rows / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100, 1000, 10000])
+    parser.add_argument('--hidden-layers', type=int, nargs='+', default=[64, 32])
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as model_path, SagemakerStubServer(latency_ms=args.latency_ms) as sagemaker:
+        create_model(args.hidden_layers).save(model_path)
+        predictors = {
+            'local': LocalModelPredictor(load_model(model_path)),
+            'http': AwsSagemakerHttpClient(access_key='ACCESS_KEY',
+                                           secret_key='SECRET_KEY',
+                                           schema='http',
+                                           host=sagemaker.host,
+                                           endpoint='/invocations',
+                                           region='eu-west-1')
+        }
+
+        print('{:>8} {:>8} {:>14}'.format('rows', 'backend', 'rows/s'))
+        for rows in args.rows:
+            request_body = create_flows(rows).to_json(orient='split', index=False).encode('utf-8')
+
+            for name, predictor in predictors.items():
+                print('{:>8} {:>8} {:>14.0f}'.format(rows, name, measure(predictor, request_body, rows,
+                                                                         args.duration)))
+
+
+if __name__ == '__main__':
+    main()
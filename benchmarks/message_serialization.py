@@ -0,0 +1,41 @@
+"""
+Benchmark comparing the serialization of per-flow SNS messages using per-row DataFrame slicing against the
+vectorized serialization of `SNSMessageProducer.create_messages`.
+"""
+import argparse
+import time
+
+from ml_ids_api.data import deserialize_dataframe, merge_predictions
+from ml_ids_api.messaging import SNSMessageProducer
+from benchmarks.utils import create_flows, create_predictions
+
+
+def create_messages_per_row(data):
+    """
+    Serializes the messages by slicing and serializing every row separately.
+    """
+    messages = []
+    for i in range(0, len(data)):
+        sample = data.iloc[i:i + 1]
+        prediction = 'attack' if sample.iloc[0]['prediction'] == 1 else 'benign'
+        messages.append((sample.to_json(orient='split'), prediction))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    request_body = create_flows(args.rows).to_json(orient='split', index=False)
+    data = merge_predictions(deserialize_dataframe(request_body), create_predictions(args.rows))
+
+    print('{:>12} {:>12}'.format('mode', 'time (ms)'))
+    for mode, func in (('per-row', create_messages_per_row), ('vectorized', SNSMessageProducer.create_messages)):
+        start = time.perf_counter()
+        func(data)
+        print('{:>12} {:>12.1f}'.format(mode, (time.perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark measuring the overhead of the metrics on the request path of the Flask application. Prediction requests
+are sent through the Flask test client with a SageMaker client and SNS producer answering immediately, so that the
+measured time is spent in the application only. Compares disabled metrics against Prometheus metrics.
+Requires `prometheus_client`.
+"""
+import argparse
+import time
+from flask import Flask
+
+from ml_ids_api.app import register_api_endpoints
+from ml_ids_api.metrics import NoopMetrics, PrometheusMetrics
+from ml_ids_api.util.constants import HttpHeaders, MimeTypes
+from benchmarks.utils import create_flows, create_predictions
+
+METRICS = {
+    'disabled': NoopMetrics,
+    'prometheus': PrometheusMetrics
+}
+
+
+class _SagemakerClient:
+    def __init__(self, predictions):
+        self.predictions = predictions
+
+    def post_invocations(self, _request_body):
+        return self.predictions
+
+
+class _Producer:
+    def publish_predictions(self, data):
+        pass
+
+
+def run(metrics, request_body, predictions, requests):
+    """
+    Sends the given number of prediction requests.
+
+    :return: Mean seconds per request.
+    """
+    app = Flask(__name__)
+    app.config['PREDICTIONS_PARSER'] = 'json'
+    register_api_endpoints(app, _SagemakerClient(predictions), _Producer(), METRICS[metrics]())
+    headers = {HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT}
+
+    with app.test_client() as client:
+        client.post('/api/predictions', headers=headers, data=request_body)
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.post('/api/predictions', headers=headers, data=request_body)
+        return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} {:>16}'.format('rows', 'metrics', 'request (us)'))
+    for rows in args.rows:
+        request_body = create_flows(rows).to_json(orient='split', index=False).encode('utf-8')
+        predictions = create_predictions(rows)
+
+        for name in METRICS:
+            elapsed = run(name, request_body, predictions, args.requests)
+            print('{:>8} {:>12} {:>16.1f}'.format(rows, name, elapsed * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark comparing the number of SNS messages and the time to create them when publishing attack predictions per flow
+and as digests, for a port scan (many flows to a single destination port) and for attack flows spread over many
+destination ports.
+"""
+import argparse
+import time
+
+from ml_ids_api.aggregation import DigestAggregator
+from ml_ids_api.data import deserialize_dataframe
+from ml_ids_api.messaging import SNSMessageProducer, create_digest_message
+from benchmarks.utils import create_flows
+
+
+def create_attacks(rows, ports):
+    """
+    Creates attack flows targeting the given number of distinct destination ports.
+    """
+    data = deserialize_dataframe(create_flows(rows).to_json(orient='split', index=False))
+    data['dst_port'] = data.index % ports
+    data['protocol'] = 6
+    data['prediction'] = 1
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    print('{:>12} {:>8} {:>10} {:>12}'.format('scenario', 'mode', 'messages', 'time (ms)'))
+    for scenario, ports in (('port scan', 1), ('many ports', 1000), ('all ports', 65536)):
+        data = create_attacks(args.rows, ports)
+
+        for mode in ('flow', 'digest'):
+            aggregator = DigestAggregator(keys=['dst_port', 'protocol']) if mode == 'digest' else None
+            producer = SNSMessageProducer(client=None, topic=None, aggregator=aggregator)
+
+            start = time.perf_counter()
+            messages = producer.create_notifications(data)
+            if aggregator is not None:
+                messages += [create_digest_message(digest) for digest in aggregator.flush(force=True)]
+            elapsed = (time.perf_counter() - start) * 1000
+            print('{:>12} {:>8} {:>10} {:>12.1f}'.format(scenario, mode, len(messages), elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark comparing CPU time and peak memory per prediction request of the Pandas parser, which deserializes the
+request into a DataFrame, against the JSON parser building notifications directly from the parsed rows, each with
+and without validation against the feature schema (`PREDICTIONS_SCHEMA_VALIDATION`).
+Each run covers deserialization, merging of predictions and creation of the SNS messages.
+"""
+import argparse
+import time
+import tracemalloc
+
+from ml_ids_api.data import deserialize_dataframe, merge_predictions, deserialize_split_frame, \
+    merge_split_predictions
+from ml_ids_api.messaging import SNSMessageProducer
+from ml_ids_api.schema import create_flow_schema
+from benchmarks.utils import create_flows, create_predictions
+
+SCHEMA = create_flow_schema()
+
+PARSERS = {
+    'pandas': (deserialize_dataframe, merge_predictions),
+    'pandas+schema': (SCHEMA.deserialize_dataframe, merge_predictions),
+    'json': (deserialize_split_frame, merge_split_predictions),
+    'json+schema': (SCHEMA.deserialize_split_frame, merge_split_predictions)
+}
+
+
+def run(parser, request_body, predictions):
+    """
+    Processes a single prediction request using the given parser.
+
+    :return: Tuple of (CPU seconds, peak memory in bytes).
+    """
+    deserialize, merge = PARSERS[parser]
+    producer = SNSMessageProducer(client=None, topic=None)
+
+    tracemalloc.start()
+    start = time.process_time()
+
+    data = merge(deserialize(request_body), predictions)
+    if parser.startswith('pandas'):
+        producer.create_messages(data)
+    else:
+        producer.create_split_frame_messages(data)
+
+    elapsed = time.process_time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print('{:>8} {:>14} {:>12} {:>16}'.format('rows', 'parser', 'cpu (ms)', 'peak mem (MB)'))
+    for rows in args.rows:
+        request_body = create_flows(rows).to_json(orient='split', index=False).encode('utf-8')
+        predictions = create_predictions(rows)
+
+        for name in PARSERS:
+            elapsed, peak = run(name, request_body, predictions)
+            print('{:>8} {:>14} {:>12.1f} {:>16.1f}'.format(rows, name, elapsed * 1000, peak / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Load test of the request coalescer: concurrent clients send small prediction requests to a local SageMaker stand-in,
+either directly or combined by `PredictionRequestCoalescer` using different batch windows.
+Reports the SageMaker invocations per second and the per-request latency.
+"""
+import argparse
+import random
+import threading
+import time
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient, create_http_session
+from ml_ids_api.batching import PredictionRequestCoalescer
+from benchmarks.stubs import SagemakerStubServer
+from benchmarks.utils import create_flows, percentile
+
+
+def run(client, bodies, concurrency):
+    """
+    Sends the given request bodies using the given number of concurrent client threads.
+
+    :return: Tuple of (elapsed seconds, request latencies in milliseconds).
+    """
+    latencies = []
+    lock = threading.Lock()
+    chunks = [bodies[i::concurrency] for i in range(concurrency)]
+
+    def send(chunk):
+        for body in chunk:
+            start = time.perf_counter()
+            client.post_invocations(body)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=send, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--windows-ms', type=float, nargs='+', default=[1, 2, 5, 10])
+    args = parser.parse_args()
+
+    flows = create_flows(20)
+    rand = random.Random(42)
+    bodies = [flows.iloc[:rand.randint(1, 20)].to_json(orient='split', index=False).encode('utf-8')
+              for _ in range(args.requests)]
+
+    print('{:>12} {:>16} {:>10} {:>10}'.format('window (ms)', 'invocations/s', 'p50 (ms)', 'p99 (ms)'))
+    for window in [None] + args.windows_ms:
+        with SagemakerStubServer(latency_ms=args.latency_ms) as server:
+            client = AwsSagemakerHttpClient('ACCESS_KEY', 'SECRET_KEY', 'http', server.host, '/invocations',
+                                            'eu-west-1', session=create_http_session(pool_size=args.concurrency))
+            if window is not None:
+                client = PredictionRequestCoalescer(client, max_wait_ms=window)
+
+            elapsed, latencies = run(client, bodies, args.concurrency)
+            print('{:>12} {:>16.1f} {:>10.2f} {:>10.2f}'.format('off' if window is None else window,
+                                                                 server.requests / elapsed,
+                                                                 percentile(latencies, 50),
+                                                                 percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark comparing SageMaker request latency with a pooled keep-alive HTTP session against opening a new connection
+per request, using a local SageMaker stand-in.
+"""
+import argparse
+import time
+import requests
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient, create_http_session
+from benchmarks.stubs import SagemakerStubServer
+from benchmarks.utils import create_flows, percentile
+
+
+class UnpooledSession:
+    """
+    Session stand-in opening a new connection for every request.
+    """
+
+    @staticmethod
+    def post(**kwargs):
+        return requests.post(**kwargs)
+
+
+def run(host, session, request_body, requests_count):
+    """
+    Sends the given number of prediction requests and records the latency of each request.
+
+    :return: List of latencies in milliseconds.
+    """
+    client = AwsSagemakerHttpClient(access_key='ACCESS_KEY',
+                                    secret_key='SECRET_KEY',
+                                    schema='http',
+                                    host=host,
+                                    endpoint='/invocations',
+                                    region='eu-west-1',
+                                    session=session)
+    latencies = []
+
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        client.post_invocations(request_body)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=10)
+    args = parser.parse_args()
+
+    request_body = create_flows(args.rows).to_json(orient='split', index=False).encode('utf-8')
+
+    with SagemakerStubServer() as server:
+        print('{:>10} {:>10} {:>10}'.format('mode', 'p50 (ms)', 'p99 (ms)'))
+        for mode, session in (('unpooled', UnpooledSession()), ('pooled', create_http_session())):
+            latencies = run(server.host, session, request_body, args.requests)
+            print('{:>10} {:>10.2f} {:>10.2f}'.format(mode, percentile(latencies, 50), percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Load test comparing the serving modes of the service: the Flask application run by gunicorn's gevent workers
+(`wsgi:app`) and the ASGI application run by uvicorn workers (`asgi:app`). Both are backed by local stand-ins for
+SageMaker and SNS. Concurrent clients send prediction requests for a fixed duration per concurrency level.
+Reports the requests per second, the p50 and p99 latency and the number of failed requests. The `json` prediction
+parser is used by default, as parsing requests with Pandas is CPU bound and hides the differences between the I/O
+models.
+Requires `gunicorn`, `gevent`, `uvicorn` and `aiohttp`.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import aiohttp
+
+from benchmarks.stubs import SagemakerStubServer, SnsStubServer
+from benchmarks.utils import create_flows, percentile
+
+MODES = {
+    'gevent': ['-k', 'gevent', 'wsgi:app'],
+    'asgi': ['-k', 'uvicorn.workers.UvicornWorker', 'asgi:app']
+}
+
+
+def free_port():
+    """
+    Returns an unused local TCP port.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workers, port, sagemaker, sns, parser, **settings):
+    """
+    Starts the service in the given serving mode using gunicorn and waits until it accepts requests. Additional
+    configuration parameters of the service are passed as keyword arguments.
+
+    :return: Server process.
+    """
+    env = dict(os.environ,
+               AWS_REGION='eu-west-1',
+               AWS_ACCESS_KEY='ACCESS_KEY',
+               AWS_SECRET_KEY='SECRET_KEY',
+               AWS_SAGEMAKER_HOST=sagemaker.host,
+               AWS_SAGEMAKER_ENDPOINT='/invocations',
+               AWS_SAGEMAKER_SCHEMA='http',
+               AWS_SNS_PREDICTIONS_TOPIC='arn:aws:sns:eu-west-1:000000000000:predictions',
+               AWS_SNS_ENDPOINT_URL=sns.endpoint_url,
+               PREDICTIONS_PARSER=parser,
+               **settings)
+    command = [os.path.join(os.path.dirname(sys.executable), 'gunicorn'), '--bind', '127.0.0.1:{}'.format(port),
+               '-w', str(workers), '--log-level', 'warning'] + MODES[mode]
+    process = subprocess.Popen(command, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError('Server in mode [{}] did not start.'.format(mode))
+
+
+async def generate_load(url, body, concurrency, duration):
+    """
+    Sends prediction requests from `concurrency` concurrent clients for `duration` seconds.
+
+    :return: Tuple of (elapsed seconds, request latencies in milliseconds, number of failed requests).
+    """
+    latencies = []
+    failures = [0]
+    headers = {'Content-Type': 'application/json; format=pandas-split'}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as session:
+        start = time.perf_counter()
+        deadline = start + duration
+
+        async def client():
+            while time.perf_counter() < deadline:
+                request_start = time.perf_counter()
+                try:
+                    async with session.post(url, data=body, headers=headers) as response:
+                        await response.read()
+                        if response.status != 200:
+                            failures[0] += 1
+                            continue
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    failures[0] += 1
+                    continue
+                latencies.append((time.perf_counter() - request_start) * 1000)
+
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+        return time.perf_counter() - start, latencies, failures[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--parser', choices=['json', 'pandas'], default='json')
+    args = parser.parse_args()
+
+    body = create_flows(args.rows).to_json(orient='split', index=False).encode('utf-8')
+    loop = asyncio.get_event_loop()
+
+    print('{:>8} {:>12} {:>12} {:>10} {:>10} {:>8}'.format('mode', 'concurrency', 'requests/s', 'p50 (ms)',
+                                                            'p99 (ms)', 'failed'))
+    with SagemakerStubServer(latency_ms=args.latency_ms) as sagemaker, SnsStubServer() as sns:
+        for mode in args.modes:
+            port = free_port()
+            process = start_server(mode, args.workers, port, sagemaker, sns, args.parser)
+
+            try:
+                for concurrency in args.concurrency:
+                    elapsed, latencies, failed = loop.run_until_complete(
+                        generate_load('http://127.0.0.1:{}/api/predictions'.format(port), body, concurrency,
+                                      args.duration))
+                    print('{:>8} {:>12} {:>12.1f} {:>10.1f} {:>10.1f} {:>8}'.format(
+                        mode, concurrency, len(latencies) / elapsed,
+                        percentile(latencies, 50) if latencies else float('nan'),
+                        percentile(latencies, 99) if latencies else float('nan'), failed))
+            finally:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
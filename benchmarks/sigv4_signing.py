@@ -0,0 +1,58 @@
+"""
+Micro-benchmark of the per-request cost of creating SigV4 authorization headers, comparing the signer memoizing the
+signing key against deriving the signing key and rebuilding the canonical request parts on every request.
+"""
+import argparse
+import hashlib
+import hmac
+import timeit
+
+from ml_ids_api.aws.signing import AwsSigV4Signer, hash_payload
+from benchmarks.utils import create_flows
+
+HOST = 'runtime.sagemaker.eu-west-1.amazonaws.com'
+ENDPOINT = '/endpoints/ml-ids/invocations'
+CONTENT_TYPE = 'application/json; format=pandas-split'
+AMZ_DATE = '20200115T123045Z'
+
+
+def _sign(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def sign_uncached(request_body):
+    """
+    Signs the request deriving the signing key and all canonical request parts per call.
+    """
+    date_stamp = AMZ_DATE[:8]
+    credential_scope = date_stamp + '/eu-west-1/sagemaker/aws4_request'
+    canonical_headers = 'content-type:' + CONTENT_TYPE + '\n' + 'host:' + HOST + '\n' + 'x-amz-date:' + AMZ_DATE + '\n'
+    canonical_request = 'POST\n' + ENDPOINT + '\n\n' + canonical_headers + '\ncontent-type;host;x-amz-date\n' \
+        + hashlib.sha256(request_body).hexdigest()
+    string_to_sign = 'AWS4-HMAC-SHA256\n' + AMZ_DATE + '\n' + credential_scope + '\n' \
+        + hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+    key = _sign(_sign(_sign(_sign(b'AWS4SECRET_KEY', date_stamp), 'eu-west-1'), 'sagemaker'), 'aws4_request')
+    return hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    signer = AwsSigV4Signer('ACCESS_KEY', 'SECRET_KEY', HOST, ENDPOINT, 'eu-west-1', 'sagemaker')
+
+    def sign_cached(request_body):
+        return signer.create_authorization_header('POST', AMZ_DATE, CONTENT_TYPE, hash_payload(request_body))
+
+    print('{:>8} {:>12} {:>12}'.format('rows', 'before (us)', 'after (us)'))
+    for rows in args.rows:
+        request_body = create_flows(rows).to_json(orient='split', index=False).encode('utf-8')
+        timings = [timeit.timeit(lambda func=func: func(request_body), number=args.iterations) / args.iterations
+                   for func in (sign_uncached, sign_cached)]
+        print('{:>8} {:>12.2f} {:>12.2f}'.format(rows, timings[0] * 1e6, timings[1] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark comparing per-message `Publish` and batched `PublishBatch` SNS publishing against a local SNS stub
+simulating a fixed network round trip per call.
+"""
+import argparse
+import time
+
+from ml_ids_api.aws.client.sns_client import AwsSNSClient
+from ml_ids_api.data import merge_predictions
+from ml_ids_api.messaging import SNSMessageProducer
+from benchmarks.utils import create_flows, create_predictions
+
+TOPIC = 'arn:aws:sns:eu-west-1:000000000000:benchmark'
+
+
+class StubSNS:
+    """
+    Stand-in for the boto3 SNS client sleeping for a fixed round trip time per API call.
+    """
+
+    def __init__(self, round_trip_ms):
+        self.round_trip = round_trip_ms / 1000.0
+        self.calls = 0
+
+    def publish(self, **_):
+        self.calls += 1
+        time.sleep(self.round_trip)
+
+    def publish_batch(self, **_):
+        self.calls += 1
+        time.sleep(self.round_trip)
+        return {'Successful': [], 'Failed': []}
+
+
+def run(rows, batch_size, round_trip_ms):
+    """
+    Publishes the predictions of a DataFrame with the given number of rows and measures the elapsed time.
+
+    :return: Tuple of (SNS calls, elapsed seconds).
+    """
+    stub = StubSNS(round_trip_ms)
+    client = AwsSNSClient(access_key=None, secret_key=None, region=None)
+    client.client = stub
+    producer = SNSMessageProducer(client=client, topic=TOPIC, batch_size=batch_size)
+    data = merge_predictions(create_flows(rows), create_predictions(rows))
+
+    start = time.perf_counter()
+    producer.publish_predictions(data)
+    return stub.calls, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--round-trip-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    print('{:>8} {:>10} {:>10} {:>14} {:>14}'.format('rows', 'mode', 'sns calls', 'calls/s', 'latency (ms)'))
+    for rows in args.rows:
+        for mode, batch_size in (('publish', 1), ('batch', 10)):
+            calls, elapsed = run(rows, batch_size, args.round_trip_ms)
+            print('{:>8} {:>10} {:>10} {:>14.1f} {:>14.1f}'.format(rows, mode, calls, calls / elapsed,
+                                                                     elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Local stand-ins for the Amazon SageMaker runtime API and the Amazon SNS API used by the benchmark scripts.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import json
+import math
+import socket
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _StubServer:
+    """
+    HTTP server running in a background thread, handling each connection in a thread of its own. Connections are kept
+    alive between requests.
+
+    :param latency_ms: Simulated processing latency per request in milliseconds.
+    """
+
+    def __init__(self, latency_ms=0.0, port=0):
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        self.server = _ThreadingHTTPServer(('127.0.0.1', port), self._create_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        return '127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def delay(self):
+        """
+        Returns the simulated latency of a request in seconds.
+        """
+        return self.latency
+
+    def handle(self, body):
+        """
+        Handles a POST request.
+
+        :param body: Request body.
+        :return: Tuple of (status code, content type, response body).
+        """
+        raise NotImplementedError
+
+    def _create_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.requests += 1
+
+                delay = stub.delay()
+                if delay:
+                    time.sleep(delay)
+
+                status, content_type, response = stub.handle(body)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *_):  # pylint: disable=arguments-differ
+                pass
+
+        return Handler
+
+
+class SagemakerStubServer(_StubServer):
+    """
+    HTTP server speaking the SageMaker invocations contract: accepts a Pandas DataFrame in `split-JSON` format and
+    responds with one prediction per row. Connections are kept alive between requests.
+
+    :param latency_ms: Simulated mean inference latency per request in milliseconds.
+    :param error_rate: Fraction of requests answered with the `error_status` status code.
+    :param latency_distribution: Distribution of the latencies, either `constant`, `exponential` or `lognormal`
+                                 (with a standard deviation of the underlying normal distribution of 0.5).
+    :param error_status: Status code of failed requests, e.g. `429` to simulate throttling.
+    """
+
+    LATENCY_DISTRIBUTIONS = ('constant', 'exponential', 'lognormal')
+
+    def __init__(self, latency_ms=0.0, error_rate=0.0, port=0, latency_distribution='constant', error_status=500):
+        if latency_distribution not in self.LATENCY_DISTRIBUTIONS:
+            raise ValueError('Unsupported latency distribution: [{}].'.format(latency_distribution))
+
+        super().__init__(latency_ms=latency_ms, port=port)
+        self.error_rate = error_rate
+        self.latency_distribution = latency_distribution
+        self.error_status = error_status
+
+    def delay(self):
+        if not self.latency or self.latency_distribution == 'constant':
+            return self.latency
+        if self.latency_distribution == 'exponential':
+            return random.expovariate(1.0 / self.latency)
+        return random.lognormvariate(math.log(self.latency) - 0.125, 0.5)
+
+    def handle(self, body):
+        if random.random() < self.error_rate:
+            return self.error_status, 'application/json', json.dumps({'error': 'stub-error'}).encode('utf-8')
+
+        rows = len(json.loads(body)['data'])
+        return 200, 'application/json', json.dumps([random.randint(0, 1) for _ in range(rows)]).encode('utf-8')
+
+
+class SnsStubServer(_StubServer):
+    """
+    HTTP server speaking the subset of the SNS query API used by the service, `Publish` and `PublishBatch`,
+    acknowledging every message. Counts the number of received messages.
+
+    :param latency_ms: Simulated latency per request in milliseconds.
+    """
+
+    _NAMESPACE = 'http://sns.amazonaws.com/doc/2010-03-31/'
+
+    def __init__(self, latency_ms=0.0, port=0):
+        super().__init__(latency_ms=latency_ms, port=port)
+        self.messages = 0
+
+    @property
+    def endpoint_url(self):
+        return 'http://' + self.host
+
+    def handle(self, body):
+        params = urllib.parse.parse_qs(body.decode('utf-8'))
+        action = params.get('Action', [''])[0]
+
+        if action == 'Publish':
+            self.messages += 1
+            result = '<MessageId>{}</MessageId>'.format(uuid.uuid4())
+        elif action == 'PublishBatch':
+            ids = [values[0] for key, values in sorted(params.items())
+                   if key.startswith('PublishBatchRequestEntries.member.') and key.endswith('.Id')]
+            self.messages += len(ids)
+            result = '<Successful>{}</Successful><Failed/>'.format(''.join(
+                '<member><Id>{}</Id><MessageId>{}</MessageId></member>'.format(entry_id, uuid.uuid4())
+                for entry_id in ids))
+        else:
+            return 400, 'text/xml', '<ErrorResponse xmlns="{}"><Error><Code>InvalidAction</Code></Error>' \
+                                    '</ErrorResponse>'.format(self._NAMESPACE).encode('utf-8')
+
+        response = '<{action}Response xmlns="{ns}"><{action}Result>{result}</{action}Result>' \
+                   '<ResponseMetadata><RequestId>{request_id}</RequestId></ResponseMetadata></{action}Response>' \
+            .format(action=action, ns=self._NAMESPACE, result=result, request_id=uuid.uuid4())
+        return 200, 'text/xml', response.encode('utf-8')
@@ -0,0 +1,59 @@
+"""
+Shared utilities for the benchmark scripts.
+"""
+from typing import List
+import random
+import numpy as np
+import pandas as pd
+
+from ml_ids_api.schema import FLOW_COLUMNS, INTEGER, TIMESTAMP
+
+FEATURE_COLUMNS = [spec.name for spec in FLOW_COLUMNS]
+
+
+def create_flows(rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Creates a Pandas DataFrame of synthetic network flows using the feature columns of the API specification.
+
+    :param rows: Number of flows.
+    :param seed: Random seed.
+    :return: Pandas DataFrame containing the flows.
+    """
+    rng = np.random.RandomState(seed)
+    data = {}
+
+    for spec in FLOW_COLUMNS:
+        if spec.kind == TIMESTAMP:
+            data[spec.name] = ['21/02/2018 10:15:{:02d}'.format(i % 60) for i in range(rows)]
+        elif spec.kind == INTEGER:
+            data[spec.name] = rng.randint(0, 256 if spec.name == 'protocol' else 1024, size=rows)
+        else:
+            data[spec.name] = np.round(rng.exponential(scale=1000.0, size=rows), 4)
+
+    return pd.DataFrame(data=data, columns=FEATURE_COLUMNS)
+
+
+def create_predictions(rows: int, attack_ratio: float = 0.01, seed: int = 42) -> List[int]:
+    """
+    Creates a list of random binary predictions.
+
+    :param rows: Number of predictions.
+    :param attack_ratio: Fraction of predictions labeled as attack.
+    :param seed: Random seed.
+    :return: List of predictions.
+    """
+    rand = random.Random(seed)
+    return [1 if rand.random() < attack_ratio else 0 for _ in range(rows)]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Computes the percentile of the given values using the nearest-rank method.
+
+    :param values: Values.
+    :param pct: Percentile in the range `[0, 100]`.
+    :return: Percentile value.
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
@@ -0,0 +1,96 @@
+"""
+Benchmark comparing the startup of the service with and without preloading the application in the gunicorn master
+process (`PRELOAD_APP`). Reports the time from launching gunicorn until the first prediction request succeeds, and the
+resident (RSS), proportional (PSS) and unique (USS) memory per worker after a short warm-up load. Memory shared
+copy-on-write with the master process counts fully towards RSS, but only proportionally towards PSS and not at all
+towards USS, which is the memory a worker actually adds.
+Backed by local stand-ins for SageMaker and SNS. Requires `gunicorn`, `gevent`, `uvicorn` and `aiohttp`.
+"""
+import argparse
+import asyncio
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.load_testing import worker_pids
+from benchmarks.serving_modes import MODES, free_port, generate_load, start_server
+from benchmarks.stubs import SagemakerStubServer, SnsStubServer
+from benchmarks.utils import create_flows
+
+HEADERS = {'Content-Type': 'application/json; format=pandas-split'}
+
+
+def wait_for_first_prediction(url, body, timeout=60.0):
+    """
+    Sends prediction requests until the first one succeeds.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        request = urllib.request.Request(url, data=body, headers=HEADERS)
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.01)
+    raise RuntimeError('No prediction request succeeded within {} seconds.'.format(timeout))
+
+
+def memory_mb(pid):
+    """
+    Returns the resident, proportional and unique memory of the given process in MiB.
+    """
+    values = {}
+    with open('/proc/{}/smaps_rollup'.format(pid)) as smaps:
+        for line in smaps:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == 'kB':
+                values[fields[0].rstrip(':')] = int(fields[1]) / 1024.0
+    return values['Rss'], values['Pss'], values['Private_Clean'] + values['Private_Dirty']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=['gevent'])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--parser', choices=['json', 'pandas'], default='pandas')
+    args = parser.parse_args()
+
+    body = create_flows(args.rows).to_json(orient='split', index=False).encode('utf-8')
+    loop = asyncio.get_event_loop()
+
+    print('{:>8} {:>8} {:>12} {:>16} {:>16} {:>16} {:>16}'.format(
+        'mode', 'preload', 'first (ms)', 'worker RSS (MB)', 'worker PSS (MB)', 'worker USS (MB)', 'total PSS (MB)'))
+    with SagemakerStubServer(latency_ms=5.0) as sagemaker, SnsStubServer() as sns:
+        for mode in args.modes:
+            for preload in (False, True):
+                port = free_port()
+                url = 'http://127.0.0.1:{}/api/predictions'.format(port)
+
+                start = time.perf_counter()
+                process = start_server(mode, args.workers, port, sagemaker, sns, args.parser, SERVING_MODE=mode,
+                                       PRELOAD_APP='true' if preload else 'false')
+                try:
+                    wait_for_first_prediction(url, body)
+                    first_ms = (time.perf_counter() - start) * 1000
+
+                    loop.run_until_complete(generate_load(url, body, 4 * args.workers, args.warmup))
+                    workers = [memory_mb(pid) for pid in worker_pids(process.pid)]
+                    master_pss = memory_mb(process.pid)[1]
+
+                    print('{:>8} {:>8} {:>12.0f} {:>16.1f} {:>16.1f} {:>16.1f} {:>16.1f}'.format(
+                        mode, 'yes' if preload else 'no', first_ms,
+                        sum(rss for rss, _, _ in workers) / len(workers),
+                        sum(pss for _, pss, _ in workers) / len(workers),
+                        sum(uss for _, _, uss in workers) / len(workers),
+                        master_pss + sum(pss for _, pss, _ in workers)))
+                finally:
+                    process.terminate()
+                    process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,16 @@
 #!/bin/bash
 
-gunicorn --bind 0.0.0.0:5000 -w 5 -k gevent wsgi:app
\ No newline at end of file
+case "$(echo "$METRICS_ENABLED" | tr '[:upper:]' '[:lower:]')" in
+  1|true|yes)
+    # metrics of all workers are collected in a directory which must be empty on startup
+    export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/ml-ids-metrics}"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    ;;
+esac
+
+if [ "$SERVING_MODE" = "asgi" ]; then
+  gunicorn --bind 0.0.0.0:5000 -w 5 -k uvicorn.workers.UvicornWorker asgi:app
+else
+  gunicorn --bind 0.0.0.0:5000 -w 5 -k gevent wsgi:app
+fi
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+Gunicorn configuration of the ML-IDS service, loaded by gunicorn from the working directory.
+
+If the environment variable `PRELOAD_APP` is set, the application is created in the master process before the workers
+are forked, so that the imported packages and the immutable application state are shared by all workers
+(copy-on-write) instead of being loaded per worker. Clients and background threads are created lazily in each worker.
+"""
+import os
+
+PRELOAD_APP = os.environ.get('PRELOAD_APP', '').strip().lower() in ('1', 'true', 'yes')
+
+if PRELOAD_APP and os.environ.get('SERVING_MODE') != 'asgi':
+    # the preloaded application must be created with the patched locks and queues used by the gevent workers
+    from gevent import monkey
+
+    monkey.patch_all()
+
+# pylint: disable=wrong-import-position
+from ml_ids_api.inference import load_model
+from ml_ids_api.metrics import mark_worker_dead
+from ml_ids_api.util.import_utils import import_deferred_modules
+
+preload_app = PRELOAD_APP  # pylint: disable=invalid-name
+
+
+def on_starting(server):
+    """
+    Loads the model of the local prediction backend in the master process, so that the loaded model is inherited by
+    all workers instead of being loaded per worker. If the application is preloaded, the packages otherwise imported
+    on first use by each worker are imported as well.
+    """
+    from config import Config
+
+    if Config.PREDICTION_BACKEND == 'local':
+        load_model(Config.LOCAL_MODEL_PATH)
+
+    if server.cfg.preload_app:
+        import_deferred_modules()
+
+
+def child_exit(_server, worker):
+    """
+    Removes the metrics of exited workers from the aggregated metrics.
+    """
+    mark_worker_dead(worker.pid)
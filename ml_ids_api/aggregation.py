@@ -0,0 +1,247 @@
+"""
+Module providing the aggregation of attack notifications into digests. Instead of one notification per attack flow,
+the attack flows sharing the values of the key columns, e.g. the destination port and protocol, are counted within a
+window and published as a single digest containing the number of flows, the first and last flow timestamp and a few
+sample flows. A port scan producing thousands of attack flows thus results in a handful of notifications.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+import datetime
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from ml_ids_api.data import SplitFrame, count_rows
+from ml_ids_api.schema import TIMESTAMP_FORMAT
+
+TIMESTAMP_COLUMN = 'timestamp'
+# timestamps are kept as nanoseconds, missing first and last timestamps are represented by the bounds of int64
+NAT = np.iinfo(np.int64).min
+NO_FIRST = np.iinfo(np.int64).max
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class Digest(NamedTuple):
+    """
+    Number of attack flows sharing the values of the key columns within a window. Timestamps are given in ISO format,
+    or None if the flows do not contain valid timestamps, the window bounds as Unix time. Sample flows are given as
+    rows of the `columns`.
+    """
+    key: Dict[str, Any]
+    flows: int
+    first_timestamp: Optional[str]
+    last_timestamp: Optional[str]
+    window_start: float
+    window_end: float
+    columns: List[str]
+    samples: List[list]
+
+
+class DigestWindow:
+    """
+    Open window of a digest.
+    """
+
+    def __init__(self, key: Dict[str, Any], opened_at: float, columns: List[str]):
+        self.key = key
+        self.opened_at = opened_at
+        self.columns = columns
+        self.count = 0
+        self.first = NO_FIRST
+        self.last = NAT
+        self.samples = []  # type: List[list]
+
+    def close(self, closed_at: float) -> Digest:
+        """
+        Closes the window.
+
+        :param closed_at: Unix time the window is closed.
+        :return: Digest of the window.
+        """
+        return Digest(key=self.key,
+                      flows=self.count,
+                      first_timestamp=_isoformat(self.first) if self.first != NO_FIRST else None,
+                      last_timestamp=_isoformat(self.last) if self.last != NAT else None,
+                      window_start=self.opened_at,
+                      window_end=closed_at,
+                      columns=self.columns,
+                      samples=self.samples)
+
+
+class DigestAggregator:
+    """
+    Aggregator grouping attack flows by the values of the `keys` columns. The window of a group is opened by its first
+    flow and closed after `window` seconds or as soon as it contains `max_flows` flows, whichever comes first. The
+    first `sample_rows` flows of each window are retained as samples, provided they contain the same columns as the
+    flow opening the window. If more than `max_windows` windows are open,
+    the oldest window is closed early, bounding the memory consumption during scans with many distinct keys.
+
+    Flows are grouped by vectorized operations on the key columns, missing key columns or values are grouped as None.
+    Windows are kept in the order they were opened, so that expired windows are found without scanning all windows.
+    """
+
+    def __init__(self, keys: List[str], window: float = 60.0, max_flows: int = 10000, sample_rows: int = 3,
+                 max_windows: int = 10000, clock=None):
+        if not keys:
+            raise ValueError('At least one digest key column must be given.')
+
+        self.keys = list(keys)
+        self.window = window
+        self.max_flows = max_flows
+        self.sample_rows = sample_rows
+        self.max_windows = max_windows
+        self.clock = clock if clock is not None else time.time
+        self._windows = OrderedDict()  # type: OrderedDict[Tuple, DigestWindow]
+        self._lock = threading.Lock()
+        self._counters = {'flows': 0, 'digests': 0}
+
+    @property
+    def flush_interval(self) -> float:
+        """
+        Interval in seconds to check for expired windows.
+        """
+        return min(self.window, 1.0)
+
+    def add(self, data: Union[pd.DataFrame, SplitFrame]) -> List[Digest]:
+        """
+        Adds the given attack flows to the windows of their groups.
+
+        :param data: Pandas DataFrame or SplitFrame containing the attack flows.
+        :return: Digests of the windows closed as they are full or expired.
+        """
+        if count_rows(data) == 0:
+            return self.flush()
+
+        columns = list(data.columns)
+        groups = self._group(data)
+        now = self.clock()
+        closed = []
+
+        with self._lock:
+            for key, count, first, last, samples in groups:
+                window = self._windows.get(key)
+                if window is None:
+                    window = self._windows[key] = DigestWindow(dict(zip(self.keys, key)), now, columns)
+
+                window.count += count
+                window.first = min(window.first, first)
+                window.last = max(window.last, last)
+                if window.columns == columns:
+                    window.samples.extend(samples[:self.sample_rows - len(window.samples)])
+
+                if window.count >= self.max_flows:
+                    closed.append(self._windows.pop(key))
+
+            while len(self._windows) > self.max_windows:
+                closed.append(self._windows.popitem(last=False)[1])
+
+            closed.extend(self._pop_expired(now))
+            self._counters['flows'] += count_rows(data)
+            self._counters['digests'] += len(closed)
+
+        return [window.close(now) for window in closed]
+
+    def flush(self, force: bool = False) -> List[Digest]:
+        """
+        Closes the expired windows.
+
+        :param force: Close all windows regardless of their age, e.g. on shutdown.
+        :return: Digests of the closed windows.
+        """
+        now = self.clock()
+        with self._lock:
+            if force:
+                closed = list(self._windows.values())
+                self._windows.clear()
+            else:
+                closed = self._pop_expired(now)
+            self._counters['digests'] += len(closed)
+
+        return [window.close(now) for window in closed]
+
+    def metrics(self) -> dict:
+        """
+        Returns the number of aggregated flows, closed digests and open windows.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            return dict(open_windows=len(self._windows), **self._counters)
+
+    def _pop_expired(self, now):
+        expired = []
+        while self._windows:
+            key = next(iter(self._windows))
+            if now - self._windows[key].opened_at < self.window:
+                break
+            expired.append(self._windows.pop(key))
+        return expired
+
+    def _group(self, data):
+        rows = count_rows(data)
+        group_keys, inverse = self._factorize_keys(data, rows)
+
+        # rows are ordered by group, retaining their order within each group
+        order = np.argsort(inverse, kind='stable')
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(inverse[order])) + 1])
+        counts = np.diff(np.append(starts, rows))
+
+        timestamps = self._parse_timestamps(_column_values(data, TIMESTAMP_COLUMN), rows)[order]
+        firsts = np.minimum.reduceat(  # pylint: disable=no-member
+            np.where(timestamps == NAT, NO_FIRST, timestamps), starts)
+        lasts = np.maximum.reduceat(timestamps, starts)  # pylint: disable=no-member
+
+        # the first rows of each group are sampled at once
+        ranks = np.arange(rows) - np.repeat(starts, counts)
+        samples = self._samples(data, order[ranks < self.sample_rows])
+        sample_ends = np.cumsum(np.minimum(counts, self.sample_rows)).tolist()
+
+        return [(key, count, first, last, samples[sample_start:sample_end])
+                for key, count, first, last, sample_start, sample_end
+                in zip(group_keys, counts.tolist(), firsts.tolist(), lasts.tolist(), [0] + sample_ends, sample_ends)]
+
+    def _factorize_keys(self, data, rows):
+        codes, uniques = [], []
+        for name in self.keys:
+            values = _column_values(data, name)
+            key_codes, key_uniques = pd.factorize(values) if values is not None else (np.full(rows, -1), [])
+            codes.append(key_codes)
+            # missing values are factorized as -1, hence indexing the trailing None
+            uniques.append([_to_python(value) for value in key_uniques] + [None])
+
+        group_codes, inverse = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+        group_keys = [tuple(key_uniques[code] for key_uniques, code in zip(uniques, key_codes))
+                      for key_codes in group_codes.tolist()]
+        return group_keys, inverse
+
+    @staticmethod
+    def _parse_timestamps(values, rows):
+        if values is None:
+            return np.full(rows, NAT, dtype=np.int64)
+        if isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+            return values.astype('datetime64[ns]').astype(np.int64)
+        return np.asarray(pd.to_datetime(list(values), format=TIMESTAMP_FORMAT, errors='coerce').asi8)
+
+    @staticmethod
+    def _samples(data, positions):
+        if isinstance(data, SplitFrame):
+            return [data.data[i] for i in positions]
+        return data.iloc[positions].astype(object).values.tolist()
+
+
+def _column_values(data, name):
+    if isinstance(data, SplitFrame):
+        if name not in data.columns:
+            return None
+        index = data.columns.index(name)
+        return [row[index] for row in data.data]
+    return data[name].values if name in data.columns else None
+
+
+def _to_python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _isoformat(timestamp):
+    return (EPOCH + datetime.timedelta(microseconds=timestamp // 1000)).isoformat()
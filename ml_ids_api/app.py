@@ -1,17 +1,38 @@
 """
 Module containing the REST API for ML-IDS service.
 """
-from flask import Flask, request, make_response, jsonify
+import atexit
+import time
+from flask import Flask, Response, request, make_response, jsonify, stream_with_context, g
 from werkzeug.exceptions import HTTPException
 
 from ml_ids_api.util.response_utils import invalid_content_type, bad_request_missing_body, \
-    bad_request_deserialization_error, response_error
+    bad_request_deserialization_error, bad_request_invalid_flow_records, payload_too_large, response_error, \
+    service_unavailable
 from ml_ids_api.util.validation_utils import is_valid_content_type
 from ml_ids_api.util.constants import HttpHeaders, MimeTypes
-from ml_ids_api.data import deserialize_dataframe, merge_predictions
-from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient
+from ml_ids_api.data import deserialize_dataframe, merge_predictions, deserialize_split_frame, \
+    merge_split_predictions, serialize_split_frame, count_rows
+from ml_ids_api.formats import request_decoders, response_encoders
+from ml_ids_api.aggregation import DigestAggregator
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient, create_http_session
 from ml_ids_api.aws.client.sns_client import AwsSNSClient
-from ml_ids_api.messaging import SNSMessageProducer
+from ml_ids_api.batching import PredictionRequestCoalescer, ChunkedPredictionClient
+from ml_ids_api.caching import CachingPredictionClient, create_cache_backend
+from ml_ids_api.compression import PayloadTooLargeError, UnsupportedEncodingError, compress, decompress, \
+    supported_encodings
+from ml_ids_api.idempotency import IdempotencyConflictError, IdempotencyGuard, StoredResponse, \
+    create_idempotency_store
+from ml_ids_api.inference import LocalModelPredictor, load_model
+from ml_ids_api.limits import BoundedReader, TooManyRowsError, check_content_length, check_rows
+from ml_ids_api.messaging import SNSMessageProducer, AsyncMessageProducer, PublishPolicy
+from ml_ids_api.metrics import NoopMetrics, create_metrics
+from ml_ids_api.resilience import AimdLimiter, CircuitBreaker, ResilientPredictionClient, ServiceUnavailableError, \
+    retry_after_header
+from ml_ids_api.routing import Endpoint, EndpointRouter
+from ml_ids_api.schema import create_flow_schema
+from ml_ids_api.spool import SpoolingMessageProducer
+from ml_ids_api.streaming import FlowRecordReader, stream_predictions
 
 
 def create_app(config_path):
@@ -22,11 +43,12 @@ def create_app(config_path):
     :return: Flask app.
     """
     app = create_flask_app(config_path)
-    sagemaker_client = create_sagemaker_client(app.config)
+    metrics = create_metrics(app.config)
+    sagemaker_client = create_sagemaker_client(app.config, metrics)
     sns_client = create_sns_client(app.config)
-    sns_message_publisher = SNSMessageProducer(client=sns_client, topic=app.config['AWS_SNS_PREDICTIONS_TOPIC'])
+    sns_message_publisher = create_sns_message_producer(app.config, sns_client, metrics)
 
-    register_api_endpoints(app, sagemaker_client, sns_message_publisher)
+    register_api_endpoints(app, sagemaker_client, sns_message_publisher, metrics)
     return app
 
 
@@ -42,50 +64,277 @@ def create_flask_app(config_path):
     return app
 
 
-def create_sagemaker_client(config):
+def create_sagemaker_client(config, metrics=None):
     """
-    Creates the AWS SageMaker client.
+    Creates the predictor of the configured prediction backend, either the AWS SageMaker client, optionally routing
+    requests across multiple endpoints, guarding invocations against overload and splitting oversized requests into
+    concurrent invocations, or the in-process model. Concurrent requests are optionally
+    combined into single invocations and predictions are optionally cached.
 
     :param config: Application configuration.
-    :return: SageMaker client.
+    :param metrics: Metrics recording the SageMaker requests and the counters of the prediction cache.
+    :return: Predictor.
     """
-    return AwsSagemakerHttpClient(access_key=config['AWS_ACCESS_KEY'],
-                                  secret_key=config['AWS_SECRET_KEY'],
-                                  schema='https',
-                                  host=config['AWS_SAGEMAKER_HOST'],
-                                  endpoint=config['AWS_SAGEMAKER_ENDPOINT'],
-                                  region=config['AWS_REGION'])
+    metrics = metrics if metrics is not None else NoopMetrics()
+    if config['PREDICTION_BACKEND'] == 'local':
+        client = LocalModelPredictor(load_model(config['LOCAL_MODEL_PATH']))
+    elif config['PREDICTION_BACKEND'] == 'sagemaker':
+        if is_routing_enabled(config):
+            client = create_sagemaker_router(config, metrics)
+        else:
+            client = create_sagemaker_http_client(config, metrics)
+
+        if config['AWS_SAGEMAKER_OVERLOAD_PROTECTION']:
+            client = create_overload_protection(client, config, metrics)
+
+        if config['AWS_SAGEMAKER_CHUNKING']:
+            client = ChunkedPredictionClient(client=client,
+                                             max_chunk_bytes=config['AWS_SAGEMAKER_CHUNK_MAX_BYTES'],
+                                             max_concurrency=config['AWS_SAGEMAKER_CHUNK_CONCURRENCY'],
+                                             max_retries=config['AWS_SAGEMAKER_CHUNK_MAX_RETRIES'])
+    else:
+        raise ValueError('Unsupported prediction backend: [{}].'.format(config['PREDICTION_BACKEND']))
+
+    if config['AWS_SAGEMAKER_COALESCING']:
+        client = PredictionRequestCoalescer(client=client,
+                                            max_wait_ms=config['AWS_SAGEMAKER_COALESCING_MAX_WAIT_MS'],
+                                            max_rows=config['AWS_SAGEMAKER_COALESCING_MAX_ROWS'],
+                                            max_bytes=config['AWS_SAGEMAKER_COALESCING_MAX_BYTES'])
+
+    if config['PREDICTION_CACHE']:
+        backend = create_cache_backend(backend=config['PREDICTION_CACHE'],
+                                       max_entries=config['PREDICTION_CACHE_MAX_ENTRIES'],
+                                       ttl=config['PREDICTION_CACHE_TTL'],
+                                       path=config['PREDICTION_CACHE_PATH'])
+        client = CachingPredictionClient(client=client,
+                                         backend=backend,
+                                         excluded_columns=config['PREDICTION_CACHE_EXCLUDED_COLUMNS'])
+        metrics.register_source('prediction_cache', client.metrics)
+    return client
+
+
+def create_sagemaker_http_client(config, metrics=None, endpoint=None, session=None):
+    """
+    Creates the AWS SageMaker HTTP client.
+
+    :param config: Application configuration.
+    :param metrics: Metrics recording the SageMaker requests.
+    :param endpoint: Endpoint of the SageMaker API, defaults to the configured endpoint.
+    :param session: HTTP session shared with other clients, a new session is created if omitted.
+    :return: SageMaker HTTP client.
+    """
+    timeout = (config['AWS_SAGEMAKER_CONNECT_TIMEOUT'], config['AWS_SAGEMAKER_READ_TIMEOUT'])
+    if session is None:
+        session = create_http_session(pool_size=config['AWS_SAGEMAKER_POOL_SIZE'],
+                                      max_retries=sagemaker_max_retries(config),
+                                      backoff_factor=config['AWS_SAGEMAKER_RETRY_BACKOFF'])
+
+    settings = sagemaker_endpoint_settings(config)
+    if endpoint is not None:
+        settings['endpoint'] = endpoint
+
+    return AwsSagemakerHttpClient(session=session, timeout=timeout, metrics=metrics, **settings)
+
+
+def create_overload_protection(client, config, metrics=None):
+    """
+    Wraps the SageMaker client by an adaptive concurrency limit and a circuit breaker, rejecting requests with
+    `503 - Service Unavailable` while SageMaker is overloaded or unavailable.
+
+    :param client: SageMaker client.
+    :param config: Application configuration.
+    :param metrics: Metrics recording the state of the concurrency limit and the circuit breaker.
+    :return: Guarded SageMaker client.
+    """
+    limiter = AimdLimiter(initial_limit=config['AWS_SAGEMAKER_CONCURRENCY_INITIAL_LIMIT'],
+                          min_limit=config['AWS_SAGEMAKER_CONCURRENCY_MIN_LIMIT'],
+                          max_limit=config['AWS_SAGEMAKER_CONCURRENCY_MAX_LIMIT'],
+                          backoff_ratio=config['AWS_SAGEMAKER_CONCURRENCY_BACKOFF_RATIO'],
+                          latency_threshold=config['AWS_SAGEMAKER_CONCURRENCY_LATENCY_THRESHOLD'])
+    breaker = CircuitBreaker(failure_threshold=config['AWS_SAGEMAKER_CIRCUIT_FAILURE_THRESHOLD'],
+                             reset_timeout=config['AWS_SAGEMAKER_CIRCUIT_RESET_TIMEOUT'])
+    return ResilientPredictionClient(client=client, limiter=limiter, breaker=breaker, metrics=metrics)
+
+
+def is_routing_enabled(config):
+    """
+    Returns whether prediction requests are routed across multiple SageMaker endpoints.
+
+    :param config: Application configuration.
+    :return: True if additional or shadow endpoints are configured or hedging is enabled.
+    """
+    return bool(config['AWS_SAGEMAKER_ENDPOINTS'] or config['AWS_SAGEMAKER_SHADOW_ENDPOINT'] or
+                config['AWS_SAGEMAKER_HEDGING'])
+
+
+def create_sagemaker_router(config, metrics=None):
+    """
+    Creates the client routing prediction requests across the configured endpoint and the additional endpoints of
+    the SageMaker host according to the configured weights, optionally mirroring them to a shadow endpoint and
+    hedging slow requests. The endpoint clients share a single HTTP session.
+
+    :param config: Application configuration.
+    :param metrics: Metrics recording the SageMaker requests and the counters of the router.
+    :return: Endpoint router.
+    """
+    metrics = metrics if metrics is not None else NoopMetrics()
+    session = create_http_session(pool_size=config['AWS_SAGEMAKER_POOL_SIZE'],
+                                  max_retries=sagemaker_max_retries(config),
+                                  backoff_factor=config['AWS_SAGEMAKER_RETRY_BACKOFF'])
+    names = [config['AWS_SAGEMAKER_ENDPOINT']] + config['AWS_SAGEMAKER_ENDPOINTS']
+    weights = [float(weight) for weight in config['AWS_SAGEMAKER_ENDPOINT_WEIGHTS']] or [1.0] * len(names)
+    if len(weights) != len(names):
+        raise ValueError('Expected a weight per SageMaker endpoint: {} endpoints, {} weights.'
+                         .format(len(names), len(weights)))
+
+    def create_endpoint(name, weight=1.0):
+        return Endpoint(name, create_sagemaker_http_client(config, metrics, name, session), weight)
+
+    shadow_endpoint = config['AWS_SAGEMAKER_SHADOW_ENDPOINT']
+    router = EndpointRouter(endpoints=[create_endpoint(name, weight) for name, weight in zip(names, weights)],
+                            shadow=create_endpoint(shadow_endpoint) if shadow_endpoint else None,
+                            hedging=config['AWS_SAGEMAKER_HEDGING'],
+                            hedge_percentile=config['AWS_SAGEMAKER_HEDGE_PERCENTILE'],
+                            hedge_min_delay_ms=config['AWS_SAGEMAKER_HEDGE_MIN_DELAY_MS'],
+                            hedge_concurrency=config['AWS_SAGEMAKER_HEDGE_CONCURRENCY'],
+                            shadow_concurrency=config['AWS_SAGEMAKER_SHADOW_CONCURRENCY'])
+    metrics.register_source('sagemaker_router', router.metrics)
+    return router
+
+
+def sagemaker_max_retries(config):
+    """
+    Returns the maximum number of retries per SageMaker request of the HTTP clients. Failed requests are retried by
+    a single layer only: if chunking is enabled, failed chunks are retried by the chunking client and the HTTP
+    clients don't retry.
+
+    :param config: Application configuration.
+    :return: Maximum number of retries per request.
+    """
+    return 0 if config['AWS_SAGEMAKER_CHUNKING'] else config['AWS_SAGEMAKER_MAX_RETRIES']
+
+
+def sagemaker_endpoint_settings(config):
+    """
+    Returns the credentials and the location of the SageMaker endpoint shared by the SageMaker HTTP clients.
+
+    :param config: Application configuration.
+    :return: Dictionary of client arguments.
+    """
+    return {'access_key': config['AWS_ACCESS_KEY'],
+            'secret_key': config['AWS_SECRET_KEY'],
+            'schema': config['AWS_SAGEMAKER_SCHEMA'],
+            'host': config['AWS_SAGEMAKER_HOST'],
+            'endpoint': config['AWS_SAGEMAKER_ENDPOINT'],
+            'region': config['AWS_REGION']}
 
 
 def create_sns_client(config):
     """
-    Creates the AWS SNS client.
+    Creates the AWS SNS client. The boto3 client is created lazily on first use, i.e. in the worker processes if the
+    application is preloaded.
 
     :param config: Application configuration.
-    :return: SageMaker client.
+    :return: SNS client.
     """
     client = AwsSNSClient(access_key=config['AWS_ACCESS_KEY'],
                           secret_key=config['AWS_SECRET_KEY'],
-                          region=config['AWS_REGION'])
-    client.initialize()
+                          region=config['AWS_REGION'],
+                          endpoint_url=config['AWS_SNS_ENDPOINT_URL'])
     return client
 
 
-def register_api_endpoints(app, sagemaker_client, sns_message_producer):
+def create_sns_message_producer(config, sns_client, metrics=None):
+    """
+    Creates the producer publishing prediction notifications. If a spool directory is configured, notifications are
+    persisted in a local spool and published by a background drainer. Otherwise, if asynchronous publishing is
+    enabled, notifications are published by a background worker pool which is flushed on process exit. In `digest`
+    notification mode, flushed digests are spooled or enqueued like the notifications of requests, the open digests
+    are flushed on process exit.
+
+    :param config: Application configuration.
+    :param sns_client: AWS SNS client.
+    :param metrics: Metrics recording the SNS requests and the counters of the producer.
+    :return: SNS message producer.
+    """
+    metrics = metrics if metrics is not None else NoopMetrics()
+    policy = PublishPolicy(mode=config['AWS_SNS_PUBLISH_POLICY'],
+                           benign_sample_rate=config['AWS_SNS_BENIGN_SAMPLE_RATE'])
+    producer = SNSMessageProducer(client=sns_client,
+                                  topic=config['AWS_SNS_PREDICTIONS_TOPIC'],
+                                  batch_size=config['AWS_SNS_PUBLISH_BATCH_SIZE'],
+                                  policy=policy,
+                                  metrics=metrics,
+                                  compression=config['AWS_SNS_COMPRESSION'],
+                                  aggregator=create_digest_aggregator(config))
+    metrics.register_source('sns_producer', producer.metrics)
+
+    if config['AWS_SNS_SPOOL_DIR']:
+        spooling_producer = SpoolingMessageProducer(producer=producer,
+                                                    directory=config['AWS_SNS_SPOOL_DIR'],
+                                                    segment_bytes=config['AWS_SNS_SPOOL_SEGMENT_BYTES'],
+                                                    drain_batch_size=config['AWS_SNS_SPOOL_DRAIN_BATCH_SIZE'],
+                                                    max_backoff=config['AWS_SNS_SPOOL_MAX_BACKOFF'],
+                                                    sync=config['AWS_SNS_SPOOL_SYNC'])
+        # notifications not published on exit remain in the spool and are published by the next process
+        atexit.register(spooling_producer.shutdown, 5.0)
+        return spooling_producer
+
+    if not config['AWS_SNS_ASYNC_PUBLISHING']:
+        if producer.aggregator is not None:
+            atexit.register(producer.shutdown, 5.0)
+        return producer
+
+    async_producer = AsyncMessageProducer(producer=producer,
+                                          queue_size=config['AWS_SNS_PUBLISH_QUEUE_SIZE'],
+                                          workers=config['AWS_SNS_PUBLISH_WORKERS'],
+                                          full_policy=config['AWS_SNS_PUBLISH_QUEUE_FULL_POLICY'],
+                                          block_timeout=config['AWS_SNS_PUBLISH_QUEUE_TIMEOUT'])
+    metrics.register_source('sns_publish_queue', async_producer.metrics)
+    atexit.register(async_producer.shutdown)
+    return async_producer
+
+
+def create_digest_aggregator(config):
+    """
+    Creates the aggregator of attack notifications if the `digest` notification mode is configured.
+
+    :param config: Application configuration.
+    :return: Digest aggregator or None if notifications are published per flow.
+    """
+    mode = config['AWS_SNS_NOTIFICATION_MODE']
+    if mode == 'flow':
+        return None
+    if mode != 'digest':
+        raise ValueError('Unsupported SNS notification mode: [{}].'.format(mode))
+
+    return DigestAggregator(keys=config['AWS_SNS_DIGEST_KEYS'],
+                            window=config['AWS_SNS_DIGEST_WINDOW'],
+                            max_flows=config['AWS_SNS_DIGEST_MAX_FLOWS'],
+                            sample_rows=config['AWS_SNS_DIGEST_SAMPLE_ROWS'])
+
+
+def register_api_endpoints(app, sagemaker_client, sns_message_producer, metrics=None):
     """
     Registers the API HTTP endpoints.
 
     :param app: Flask application.
     :param sagemaker_client: AWS SageMaker client.
     :param sns_message_producer: AWS SNS client.
+    :param metrics: Metrics of the application. If metrics are enabled a `/metrics` endpoint is registered.
     :return: None
     """
+    metrics = metrics if metrics is not None else NoopMetrics()
+    if metrics.enabled:
+        register_metrics_endpoint(app, metrics)
+    register_error_handlers(app)
+    register_request_limits(app)
 
-    @app.errorhandler(Exception)
-    def handle_exception(err):
-        if isinstance(err, HTTPException):
-            return err
-        return response_error(500, str(err))
+    schema = create_flow_schema() if app.config['PREDICTIONS_SCHEMA_VALIDATION'] else None
+    deserialize, merge = create_request_parser(app.config, schema)
+    idempotency = create_idempotency_guard(app.config, metrics)
+    decoders = request_decoders()
+    encoders = response_encoders()
 
     @app.route('/')
     def root():
@@ -93,28 +342,292 @@ def register_api_endpoints(app, sagemaker_client, sns_message_producer):
 
     @app.route('/api/predictions', methods=['POST'])
     def predict():
-        content_type = request.headers[HttpHeaders.CONTENT_TYPE] if HttpHeaders.CONTENT_TYPE in request.headers \
-            else None
+        if idempotency is None:
+            return compress_response(process_prediction_request(), app.config)
+        return compress_response(process_idempotently(idempotency, process_prediction_request), app.config)
 
-        if not is_valid_content_type(content_type, MimeTypes.APPLICATION_JSON_PANDAS_SPLIT):
-            return invalid_content_type(content_type, MimeTypes.APPLICATION_JSON_PANDAS_SPLIT)
+    def process_prediction_request():
+        with metrics.stage('validate'):
+            content_type = request.headers[HttpHeaders.CONTENT_TYPE] if HttpHeaders.CONTENT_TYPE in request.headers \
+                else None
 
-        if not request.data:
-            return bad_request_missing_body()
+            decode = decoders.get(content_type.strip().lower()) if content_type is not None else None
+            supported = decode is not None or is_valid_content_type(content_type,
+                                                                    MimeTypes.APPLICATION_JSON_PANDAS_SPLIT)
+
+        if not supported:
+            return invalid_content_type(content_type, MimeTypes.APPLICATION_JSON_PANDAS_SPLIT, *decoders)
+
+        body, error = read_request_body(app.config['REQUEST_MAX_DECOMPRESSED_BYTES'])
+        if error is not None:
+            return error
 
         try:
-            request_body = request.data
+            with metrics.stage('deserialize'):
+                if decode is None:
+                    request_body = body
+                    data = deserialize(request_body)
+                    merge_request = merge
+                else:
+                    data = decode(body)
+                    if schema is not None:
+                        schema.validate(data)
+                    request_body = serialize_split_frame(data)
+                    merge_request = merge_split_predictions
+
+            check_rows(count_rows(data), app.config['REQUEST_MAX_ROWS'])
+            metrics.count_rows(count_rows(data))
+
+            with metrics.stage('invoke'):
+                predictions = sagemaker_client.post_invocations(request_body)
+
+            with metrics.stage('merge'):
+                data_predictions = merge_request(data, predictions)
 
-            data = deserialize_dataframe(request_body)
-            predictions = sagemaker_client.post_invocations(request_body)
+            with metrics.stage('publish'):
+                sns_message_producer.publish_predictions(data_predictions)
 
-            data_predictions = merge_predictions(data, predictions)
-            sns_message_producer.publish_predictions(data_predictions)
+            with metrics.stage('serialize'):
+                response_type = request.accept_mimetypes.best_match([MimeTypes.APPLICATION_JSON] + list(encoders),
+                                                                    default=MimeTypes.APPLICATION_JSON)
+                if response_type in encoders:
+                    return Response(encoders[response_type](predictions), status=200, mimetype=response_type)
 
-            return make_response(jsonify(predictions), 200)
+                return make_response(jsonify(predictions), 200)
         except ValueError as err:
             return bad_request_deserialization_error(err)
 
+    @app.route('/api/predictions/stream', methods=['POST'])
+    def predict_stream():
+        content_type = request.headers[HttpHeaders.CONTENT_TYPE] if HttpHeaders.CONTENT_TYPE in request.headers \
+            else None
+
+        if not is_valid_content_type(content_type, MimeTypes.APPLICATION_NDJSON):
+            return invalid_content_type(content_type, MimeTypes.APPLICATION_NDJSON)
+
+        reader = FlowRecordReader(request.stream, max_line_bytes=app.config['STREAM_MAX_LINE_BYTES'])
+
+        try:
+            if reader.peek() is None:
+                return bad_request_invalid_flow_records('No flow records supplied.')
+        except ValueError as err:
+            return bad_request_invalid_flow_records(err)
+
+        predictions = stream_predictions(reader, sagemaker_client, sns_message_producer,
+                                         batch_rows=app.config['STREAM_BATCH_ROWS'], schema=schema,
+                                         max_batch_wait_ms=app.config['STREAM_MAX_BATCH_WAIT_MS'])
+        return Response(stream_with_context(predictions), mimetype=MimeTypes.APPLICATION_NDJSON)
+
+
+def process_idempotently(idempotency, process_request):
+    """
+    Processes the current request unless it is a retry of a request whose response is stored, in which case the
+    stored response is returned with an `Idempotent-Replayed` header. Requests are identified by their
+    `Idempotency-Key` header or a hash of the body, separately per route, Content-Type and accepted response format.
+
+    :param idempotency: Idempotency guard.
+    :param process_request: Function processing the request, returning a Flask response.
+    :return: Flask response.
+    """
+    variant = ' '.join([request.path, request.headers.get(HttpHeaders.CONTENT_TYPE, ''),
+                        request.headers.get(HttpHeaders.ACCEPT, '')])
+    request_key = idempotency.create_key(request.headers.get(HttpHeaders.IDEMPOTENCY_KEY), request.get_data(),
+                                         variant=variant)
+    if request_key is None:
+        return process_request()
+
+    def process():
+        response = process_request()
+        return StoredResponse(status=response.status_code, body=response.get_data(),
+                              content_type=response.content_type)
+
+    try:
+        stored, replayed = idempotency.execute(*request_key, process)
+    except IdempotencyConflictError as err:
+        return response_error(409 if err.reason == 'in_progress' else 422, str(err))
+
+    response = Response(stored.body, status=stored.status, content_type=stored.content_type)
+    if replayed:
+        response.headers[HttpHeaders.IDEMPOTENT_REPLAYED] = 'true'
+    return response
+
+
+def register_error_handlers(app):
+    """
+    Registers the handler of unexpected errors, answering requests with `500 - Internal Server Error`, or
+    `503 - Service Unavailable` while SageMaker is overloaded or unavailable.
+
+    :param app: Flask application.
+    :return: None
+    """
+
+    @app.errorhandler(Exception)
+    def handle_exception(err):
+        if isinstance(err, HTTPException):
+            return err
+        if isinstance(err, ServiceUnavailableError):
+            return service_unavailable(str(err), retry_after_header(err))
+        return response_error(500, str(err))
+
+
+def register_request_limits(app):
+    """
+    Registers the limits of the size of prediction requests, `MAX_CONTENT_LENGTH` bytes and `REQUEST_MAX_ROWS` network
+    flows. Requests exceeding the limits are answered with `413 - Payload Too Large`.
+
+    :param app: Flask application.
+    :return: None
+    """
+
+    @app.before_request
+    def limit_prediction_request():
+        if request.endpoint == 'predict':
+            return limit_request_body(app.config['MAX_CONTENT_LENGTH'])
+        return None
+
+    @app.errorhandler(PayloadTooLargeError)
+    @app.errorhandler(TooManyRowsError)
+    def handle_payload_too_large(err):
+        return payload_too_large(err)
+
+
+def limit_request_body(max_bytes):
+    """
+    Limits the size of the body of the current request before it is read. Requests declaring a larger
+    `Content-Length` are rejected right away. Bodies of unknown length, e.g. sent with chunked transfer encoding, fail
+    with `PayloadTooLargeError` as soon as they are read beyond the limit.
+
+    :param max_bytes: Maximum size of the body in bytes, None if unlimited.
+    :return: Error response if the request is rejected, otherwise None.
+    """
+    try:
+        check_content_length(request.content_length, max_bytes)
+    except PayloadTooLargeError as err:
+        return payload_too_large(err)
+
+    if max_bytes is not None:
+        # the WSGI input is wrapped before the request stream is created from it on first access
+        request.environ['wsgi.input'] = BoundedReader(request.environ['wsgi.input'], max_bytes)
+    return None
+
+
+def read_request_body(max_bytes):
+    """
+    Reads the body of the current request, decompressing it according to its `Content-Encoding` header.
+
+    :param max_bytes: Maximum size of the decompressed body in bytes.
+    :return: Tuple of the request body and an error response, the body is None if the request is rejected.
+    """
+    try:
+        body = decompress(request.get_data(), request.headers.get(HttpHeaders.CONTENT_ENCODING), max_bytes)
+    except UnsupportedEncodingError as err:
+        return None, response_error(415, str(err))
+    except PayloadTooLargeError as err:
+        return None, payload_too_large(err)
+    except ValueError as err:
+        return None, bad_request_deserialization_error(err)
+
+    if not body:
+        return None, bad_request_missing_body()
+    return body, None
+
+
+def compress_response(response, config):
+    """
+    Compresses the body of a successful response to the current request with the preferred encoding of its
+    `Accept-Encoding` header, if `RESPONSE_COMPRESSION` is enabled and the body has at least
+    `RESPONSE_COMPRESSION_MIN_BYTES` bytes.
+
+    :param response: Flask response.
+    :param config: Application configuration.
+    :return: Flask response.
+    """
+    if not config['RESPONSE_COMPRESSION'] or response.status_code != 200 or response.is_streamed \
+            or HttpHeaders.CONTENT_ENCODING in response.headers:
+        return response
+
+    response.vary.add(HttpHeaders.ACCEPT_ENCODING)
+    encoding = request.accept_encodings.best_match(supported_encodings())
+    body = response.get_data()
+    if encoding is not None and len(body) >= config['RESPONSE_COMPRESSION_MIN_BYTES']:
+        response.set_data(compress(body, encoding))
+        response.headers[HttpHeaders.CONTENT_ENCODING] = encoding
+    return response
+
+
+def create_idempotency_guard(config, metrics=None):
+    """
+    Creates the guard deduplicating retried prediction requests if an idempotency store is configured.
+
+    :param config: Application config.
+    :param metrics: Metrics recording the counters of the guard.
+    :return: Idempotency guard or None if deduplication is disabled.
+    """
+    if not config['IDEMPOTENCY_STORE']:
+        return None
+
+    metrics = metrics if metrics is not None else NoopMetrics()
+
+    store = create_idempotency_store(backend=config['IDEMPOTENCY_STORE'],
+                                     max_entries=config['IDEMPOTENCY_MAX_ENTRIES'],
+                                     ttl=config['IDEMPOTENCY_TTL'],
+                                     lease=config['IDEMPOTENCY_LEASE'],
+                                     path=config['IDEMPOTENCY_STORE_PATH'])
+    guard = IdempotencyGuard(store=store,
+                             wait_timeout=config['IDEMPOTENCY_WAIT_TIMEOUT'],
+                             hash_body=config['IDEMPOTENCY_HASH_BODY'])
+    metrics.register_source('idempotency', guard.metrics)
+    return guard
+
+
+def create_request_parser(config, schema=None):
+    """
+    Creates the functions deserializing prediction requests and merging the predictions with the deserialized data,
+    depending on the configured parser. If a feature schema is given, requests are validated against it and the
+    Pandas parser builds its DataFrame from the coerced columns.
+
+    :param config: Application config.
+    :param schema: Feature schema or None to skip validation.
+    :return: Tuple of (deserialize, merge) functions.
+    """
+    if config['PREDICTIONS_PARSER'] == 'json':
+        return (schema.deserialize_split_frame if schema is not None else deserialize_split_frame,
+                merge_split_predictions)
+    return schema.deserialize_dataframe if schema is not None else deserialize_dataframe, merge_predictions
+
+
+def register_metrics_endpoint(app, metrics):
+    """
+    Registers the `/metrics` endpoint exposing the metrics in the Prometheus text format and records the duration,
+    status and payload sizes of all requests.
+
+    :param app: Flask application.
+    :param metrics: Metrics of the application.
+    :return: None
+    """
+
+    def request_route():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    @app.before_request
+    def start_request():
+        g.request_start = time.perf_counter()
+        metrics.request_started(request_route())
+
+    @app.after_request
+    def finish_request(response):
+        metrics.request_finished(route=request_route(),
+                                 status=response.status_code,
+                                 duration=time.perf_counter() - g.request_start,
+                                 request_bytes=request.content_length,
+                                 response_bytes=None if response.is_streamed else response.content_length)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        body, content_type = metrics.generate()
+        return Response(body, status=200, content_type=content_type)
+
 
 if __name__ == '__main__':
     application = create_app('config.Config')
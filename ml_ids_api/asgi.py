@@ -0,0 +1,647 @@
+"""
+Module containing the ASGI application of the ML-IDS service, an alternative to the Flask application serving the same
+endpoints. SageMaker requests are sent without blocking the event loop, allowing a single process to hold thousands
+of in-flight requests. Requires `aiohttp`.
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, cast
+import asyncio
+import logging
+import math
+import os
+import time
+from flask import Config
+from werkzeug.datastructures import Accept, MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from ml_ids_api.app import create_request_parser, create_sns_client, create_sns_message_producer, \
+    is_routing_enabled, sagemaker_endpoint_settings, sagemaker_max_retries
+from ml_ids_api.aws.client.async_sagemaker_client import AsyncAwsSagemakerHttpClient
+from ml_ids_api.batching import AsyncChunkedPredictionClient
+from ml_ids_api.compression import PayloadTooLargeError, UnsupportedEncodingError, compress, decompress, \
+    supported_encodings
+from ml_ids_api.data import SplitFrame, merge_split_predictions, serialize_split_frame, json_dumps, count_rows
+from ml_ids_api.formats import request_decoders, response_encoders
+from ml_ids_api.inference import AsyncLocalModelPredictor, LocalModelPredictor, load_model
+from ml_ids_api.limits import TooManyRowsError, check_content_length, check_rows, read_chunks
+from ml_ids_api.messaging import ExecutorMessageProducer
+from ml_ids_api.metrics import NoopMetrics, create_metrics
+from ml_ids_api.schema import create_flow_schema
+from ml_ids_api.streaming import FlowRecordParser, batch_deadline, create_batch, encode_predictions, encode_error
+from ml_ids_api.util.constants import HttpHeaders, MimeTypes
+from ml_ids_api.util.response_utils import MISSING_BODY_MESSAGE, invalid_content_type_message, \
+    deserialization_error_message, invalid_flow_records_message, payload_too_large_message
+from ml_ids_api.util.validation_utils import is_valid_content_type
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsgiResponse(NamedTuple):
+    """
+    Response of an ASGI request handler. Streaming responses provide the body as asynchronous iterator of chunks.
+    Responses negotiating their content encoding specify the encoding of the body, `identity` if not compressed.
+    """
+    status: int
+    body: bytes
+    content_type: str
+    chunks: Optional[AsyncIterator[bytes]] = None
+    content_encoding: Optional[str] = None
+
+
+class AsgiRequest:
+    """
+    Request received by the ASGI application. The body is read from the `receive` channel on demand.
+    """
+
+    def __init__(self, scope, receive):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        self.receive = receive
+
+    def header(self, name: str) -> Optional[str]:
+        """
+        Returns the value of the given header.
+
+        :param name: Header name.
+        :return: Header value or None if the header is not present.
+        """
+        return self.headers.get(name.lower())
+
+    @property
+    def content_length(self) -> Optional[int]:
+        """
+        Declared size of the request body or None if the `Content-Length` header is missing or invalid.
+        """
+        try:
+            content_length = int(self.headers['content-length'])
+        except (KeyError, ValueError):
+            return None
+        return content_length if content_length >= 0 else None
+
+    async def body(self, max_bytes: Optional[int] = None) -> bytes:
+        """
+        Reads the complete request body.
+
+        :param max_bytes: Maximum size of the body in bytes, None if unlimited.
+        :return: Request body.
+        :raises ConnectionAbortedError: If the client disconnected.
+        :raises PayloadTooLargeError: If the body exceeds `max_bytes`.
+        """
+        return await read_chunks(self.stream(), max_bytes)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """
+        Reads the request body chunk by chunk, as received from the client.
+
+        :return: Asynchronous iterator of body chunks.
+        :raises ConnectionAbortedError: If the client disconnected.
+        """
+        more_body = True
+        while more_body:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionAbortedError('Client disconnected.')
+            yield message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+    async def lines(self, max_line_bytes: int) -> AsyncIterator[bytes]:
+        """
+        Reads the request body line by line. A line exceeding `max_line_bytes` is truncated to `max_line_bytes + 1`
+        bytes without line break and ends the iteration.
+
+        :param max_line_bytes: Maximum length of a line in bytes.
+        :return: Asynchronous iterator of lines including their line break.
+        """
+        buffer = b''
+        async for chunk in self.stream():
+            buffer += chunk
+            start = 0
+            end = buffer.find(b'\n')
+
+            while end != -1:
+                yield buffer[start:end + 1]
+                start = end + 1
+                end = buffer.find(b'\n', start)
+
+            buffer = buffer[start:]
+            if len(buffer) > max_line_bytes:
+                yield buffer[:max_line_bytes + 1]
+                return
+
+        if buffer:
+            yield buffer
+
+
+class AsgiApplication:
+    """
+    ASGI application serving the prediction endpoints of the Flask application (see `register_api_endpoints`)
+    using an asynchronous SageMaker client and a producer publishing notifications without blocking the event loop.
+    If metrics are enabled a `/metrics` endpoint is served.
+    """
+
+    def __init__(self, config, sagemaker_client, sns_message_producer, metrics=None):
+        self.config = config
+        self.sagemaker_client = sagemaker_client
+        self.sns_message_producer = sns_message_producer
+        self.metrics = metrics if metrics is not None else NoopMetrics()
+        self.decoders = request_decoders()
+        self.encoders = response_encoders()
+        self.routes = {
+            ('GET', '/'): self.root,
+            ('POST', '/api/predictions'): self.predict,
+            ('POST', '/api/predictions/stream'): self.predict_stream
+        }  # type: Dict[Any, Callable[[AsgiRequest], Awaitable[AsgiResponse]]]
+
+        if self.metrics.enabled:
+            self.routes[('GET', '/metrics')] = self.metrics_endpoint
+
+        self.schema = create_flow_schema() if config['PREDICTIONS_SCHEMA_VALIDATION'] else None
+        self.deserialize, self.merge = create_request_parser(config, self.schema)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported scope type: [{}].'.format(scope['type']))
+
+        request = AsgiRequest(scope, receive)
+        handler = self.routes.get((request.method, request.path))
+        route = request.path if any(path == request.path for _, path in self.routes) else 'unmatched'
+
+        start = time.perf_counter()
+        self.metrics.request_started(route)
+        response = await self.handle(request, handler)
+
+        # requests of disconnected clients are recorded with the non-standard status code 499
+        self.metrics.request_finished(route=route,
+                                      status=response.status if response is not None else 499,
+                                      duration=time.perf_counter() - start,
+                                      request_bytes=request.content_length,
+                                      response_bytes=len(response.body) if response is not None
+                                      and response.chunks is None else None)
+
+        if response is None:
+            return
+
+        try:
+            await send_response(send, response)
+        except ConnectionAbortedError:
+            LOGGER.warning('Client disconnected while streaming the response.')
+
+    async def handle(self, request: AsgiRequest,
+                     handler: Optional[Callable[[AsgiRequest], Awaitable[AsgiResponse]]]) -> Optional[AsgiResponse]:
+        """
+        Handles the given request, responding with an error if the request could not be handled.
+
+        :param request: Request.
+        :param handler: Request handler of the requested route or None if the route does not exist.
+        :return: Response or None if the client disconnected.
+        """
+        try:
+            if request.header(HttpHeaders.CONTENT_LENGTH) is not None and request.content_length is None:
+                response = error_response(400, 'Invalid Content-Length header.')
+            elif handler is not None:
+                response = await handler(request)
+            elif any(path == request.path for _, path in self.routes):
+                response = error_response(405, 'The method is not allowed for the requested URL.')
+            else:
+                response = error_response(404, 'The requested URL was not found on the server.')
+        except ConnectionAbortedError:
+            return None
+        except TooManyRowsError as err:
+            response = error_response(413, payload_too_large_message(err))
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.exception('Failed to process request.')
+            response = error_response(500, str(err))
+
+        return response
+
+    async def lifespan(self, receive, send) -> None:
+        """
+        Handles the lifespan protocol, releasing the pooled SageMaker connections and flushing pending notifications on
+        shutdown.
+
+        :param receive: ASGI receive channel.
+        :param send: ASGI send channel.
+        :return: None
+        """
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.sagemaker_client.close()
+                self.sns_message_producer.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def root(self, _request: AsgiRequest) -> AsgiResponse:
+        """
+        Handles `GET /`.
+        """
+        return AsgiResponse(status=200, body=b'ML-IDS API', content_type='text/html; charset=utf-8')
+
+    async def predict(self, request: AsgiRequest) -> AsgiResponse:
+        """
+        Handles `POST /api/predictions`.
+        """
+        with self.metrics.stage('validate'):
+            content_type = request.header(HttpHeaders.CONTENT_TYPE)
+            decode = self.decoders.get(content_type.strip().lower()) if content_type is not None else None
+            supported = decode is not None or is_valid_content_type(content_type,
+                                                                    MimeTypes.APPLICATION_JSON_PANDAS_SPLIT)
+
+        if not supported:
+            return error_response(415, invalid_content_type_message(content_type,
+                                                                    MimeTypes.APPLICATION_JSON_PANDAS_SPLIT,
+                                                                    *self.decoders))
+
+        body, response = await self.read_body(request)
+        if response is not None:
+            return response
+
+        # parsing, merging and serializing large requests is CPU bound and would stall the event loop
+        loop = asyncio.get_event_loop()
+        try:
+            data, request_body, merge = await loop.run_in_executor(None, self.deserialize_request, body, decode)
+
+            check_rows(count_rows(data), self.config['REQUEST_MAX_ROWS'])
+            self.metrics.count_rows(count_rows(data))
+
+            with self.metrics.stage('invoke'):
+                predictions = await self.sagemaker_client.post_invocations(request_body)
+
+            data_predictions = await loop.run_in_executor(None, self.merge_predictions, merge, data, predictions)
+
+            with self.metrics.stage('publish'):
+                await self.sns_message_producer.publish_predictions(data_predictions)
+        except ValueError as err:
+            return error_response(400, deserialization_error_message(err))
+
+        return await loop.run_in_executor(None, self.serialize_predictions, request, predictions)
+
+    def deserialize_request(self, body: bytes, decode: Optional[Callable[[bytes], SplitFrame]]) \
+            -> Tuple[Any, bytes, Callable[[Any, List[int]], Any]]:
+        """
+        Deserializes the body of a prediction request, either in `split-JSON` format using the configured parser or
+        in a binary format using the given decoder.
+
+        :param body: Request body.
+        :param decode: Decoder of the binary request format or None if the body is in `split-JSON` format.
+        :return: Tuple of the deserialized data, the body of the SageMaker request and the function merging the
+                 predictions with the data.
+        :raises ValueError: If the request body is invalid.
+        """
+        with self.metrics.stage('deserialize'):
+            if decode is None:
+                return self.deserialize(body), body, self.merge
+
+            data = decode(body)
+            if self.schema is not None:
+                self.schema.validate(data)
+            return data, serialize_split_frame(data), merge_split_predictions
+
+    def merge_predictions(self, merge: Callable[[Any, List[int]], Any], data: Any, predictions: List[int]) -> Any:
+        """
+        Merges the predictions with the deserialized data of a prediction request.
+
+        :param merge: Function merging the predictions with the data.
+        :param data: Deserialized data.
+        :param predictions: List of predictions.
+        :return: Data containing a `prediction` column.
+        """
+        with self.metrics.stage('merge'):
+            return merge(data, predictions)
+
+    def serialize_predictions(self, request: AsgiRequest, predictions: List[int]) -> AsgiResponse:
+        """
+        Serializes the predictions in the format preferred by the `Accept` header of the request and compresses them.
+
+        :param request: Request.
+        :param predictions: List of predictions.
+        :return: Response.
+        """
+        with self.metrics.stage('serialize'):
+            accept = parse_accept_header(request.header(HttpHeaders.ACCEPT), MIMEAccept)
+            response_type = accept.best_match([MimeTypes.APPLICATION_JSON] + list(self.encoders),
+                                              default=MimeTypes.APPLICATION_JSON)
+            if response_type is not None and response_type in self.encoders:
+                response = AsgiResponse(status=200, body=self.encoders[response_type](predictions),
+                                        content_type=response_type)
+            else:
+                response = json_response(200, predictions)
+
+            return self.compress_response(request, response)
+
+    async def read_body(self, request: AsgiRequest) -> Tuple[bytes, Optional[AsgiResponse]]:
+        """
+        Reads the body of the given request, decompressing it according to its `Content-Encoding` header. Bodies
+        exceeding `MAX_CONTENT_LENGTH` are rejected before they are read if their size is declared, otherwise as soon
+        as they are read beyond the limit.
+
+        :param request: Request.
+        :return: Tuple of the request body and an error response if the request is rejected.
+        """
+        try:
+            check_content_length(request.content_length, self.config['MAX_CONTENT_LENGTH'])
+            body = await request.body(self.config['MAX_CONTENT_LENGTH'])
+            encoding = request.header(HttpHeaders.CONTENT_ENCODING)
+            if encoding is not None:
+                # decompressing is CPU bound and would stall the event loop
+                body = await asyncio.get_event_loop().run_in_executor(
+                    None, decompress, body, encoding, self.config['REQUEST_MAX_DECOMPRESSED_BYTES'])
+        except UnsupportedEncodingError as err:
+            return b'', error_response(415, str(err))
+        except PayloadTooLargeError as err:
+            return b'', error_response(413, payload_too_large_message(err))
+        except ValueError as err:
+            return b'', error_response(400, deserialization_error_message(err))
+
+        if not body:
+            return b'', error_response(400, MISSING_BODY_MESSAGE)
+        return body, None
+
+    def compress_response(self, request: AsgiRequest, response: AsgiResponse) -> AsgiResponse:
+        """
+        Compresses the body of the given response with the preferred encoding of the `Accept-Encoding` header of the
+        request, if `RESPONSE_COMPRESSION` is enabled and the body has at least `RESPONSE_COMPRESSION_MIN_BYTES` bytes.
+
+        :param request: Request.
+        :param response: Response.
+        :return: Response specifying its content encoding if compression is enabled.
+        """
+        if not self.config['RESPONSE_COMPRESSION']:
+            return response
+
+        accept = parse_accept_header(request.header(HttpHeaders.ACCEPT_ENCODING), Accept)
+        encoding = accept.best_match(supported_encodings())
+
+        if encoding is None or len(response.body) < self.config['RESPONSE_COMPRESSION_MIN_BYTES']:
+            return response._replace(content_encoding='identity')
+        return response._replace(body=compress(response.body, encoding), content_encoding=encoding)
+
+    async def metrics_endpoint(self, _request: AsgiRequest) -> AsgiResponse:
+        """
+        Handles `GET /metrics`.
+        """
+        body, content_type = self.metrics.generate()
+        return AsgiResponse(status=200, body=body, content_type=content_type)
+
+    async def predict_stream(self, request: AsgiRequest) -> AsgiResponse:
+        """
+        Handles `POST /api/predictions/stream`.
+        """
+        content_type = request.header(HttpHeaders.CONTENT_TYPE)
+
+        if not is_valid_content_type(content_type, MimeTypes.APPLICATION_NDJSON):
+            return error_response(415, invalid_content_type_message(content_type, MimeTypes.APPLICATION_NDJSON))
+
+        parser = FlowRecordParser(max_line_bytes=self.config['STREAM_MAX_LINE_BYTES'])
+        lines = request.lines(self.config['STREAM_MAX_LINE_BYTES'])
+
+        try:
+            first_row = await next_record(parser, lines)
+        except ValueError as err:
+            return error_response(400, invalid_flow_records_message(err))
+
+        if first_row is None:
+            return error_response(400, invalid_flow_records_message('No flow records supplied.'))
+
+        return AsgiResponse(status=200, body=b'', content_type=MimeTypes.APPLICATION_NDJSON,
+                            chunks=self.stream_predictions(parser, lines, first_row))
+
+    async def stream_predictions(self, parser: FlowRecordParser, lines: AsyncIterator[bytes],
+                                 first_row: List[Any]) -> AsyncIterator[bytes]:
+        """
+        Asynchronous counterpart of `ml_ids_api.streaming.stream_predictions`, requesting predictions in batches of
+        at most `STREAM_BATCH_ROWS` records as they arrive, at the latest `STREAM_MAX_BATCH_WAIT_MS` after the first
+        record of a batch arrived. A read of the next record interrupted by the deadline continues while the batch is
+        processed.
+
+        :param parser: Flow record parser holding the columns of the stream.
+        :param lines: Remaining lines of the request body.
+        :param first_row: First record of the stream.
+        :return: Asynchronous iterator of response chunks.
+        """
+        batch_rows = self.config['STREAM_BATCH_ROWS']
+        max_batch_wait_ms = self.config['STREAM_MAX_BATCH_WAIT_MS']
+        offset = 0
+        rows = [first_row]
+        deadline = batch_deadline(max_batch_wait_ms)
+        error = None  # type: Optional[Exception]
+        end_of_stream = False
+        records = RecordWaiter(parser, lines)
+
+        try:
+            while not end_of_stream:
+                if len(rows) < batch_rows:
+                    try:
+                        row = await records.next(deadline if rows else None)
+                        if row is not None:
+                            deadline = deadline if rows else batch_deadline(max_batch_wait_ms)
+                            rows.append(row)
+                    except StopAsyncIteration:
+                        end_of_stream = True
+                    except ValueError as err:
+                        error, end_of_stream = err, True
+
+                if rows and (end_of_stream or len(rows) >= batch_rows or time.monotonic() >= deadline):
+                    try:
+                        predictions = await self._process_batch(parser, rows, offset)
+                    except Exception as err:  # pylint: disable=broad-except
+                        error, end_of_stream = err, True
+                    else:
+                        yield encode_predictions(predictions)
+                        offset += len(rows)
+                        rows = []
+        finally:
+            records.close()
+
+        if error is not None:
+            yield encode_error(error, offset)
+
+    async def _process_batch(self, parser, rows, offset):
+        data = create_batch(cast(List[str], parser.columns), rows, offset)
+        if self.schema is not None:
+            self.schema.validate(data)
+        predictions = await self.sagemaker_client.post_invocations(serialize_split_frame(data))
+        await self.sns_message_producer.publish_predictions(merge_split_predictions(data, predictions))
+        return predictions
+
+
+async def next_record(parser: FlowRecordParser, lines: AsyncIterator[bytes]) -> Optional[List[Any]]:
+    """
+    Parses the next record from the given lines, skipping blank lines.
+
+    :param parser: Flow record parser.
+    :param lines: Asynchronous iterator of lines.
+    :return: Values of the record or None if no records are left.
+    :raises ValueError: If the record is invalid.
+    """
+    async for line in lines:
+        row = parser.parse(line)
+        if row is not None:
+            return row
+    return None
+
+
+class RecordWaiter:
+    """
+    Waits for the records of a stream of lines until a deadline. A read exceeding the deadline is not cancelled, which
+    would end the iteration of the lines, but awaited again by the next call.
+    """
+
+    def __init__(self, parser: FlowRecordParser, lines: AsyncIterator[bytes]):
+        self.parser = parser
+        self.lines = lines
+        self._pending = None  # type: Optional[asyncio.Future]
+
+    async def next(self, deadline: Optional[float] = None) -> Optional[List[Any]]:
+        """
+        Returns the next record.
+
+        :param deadline: Time until which to wait on the clock of `time.monotonic`, None or infinite to wait
+                         indefinitely.
+        :return: Values of the record or None if the deadline passed.
+        :raises StopAsyncIteration: If no records are left.
+        :raises ValueError: If the record is invalid.
+        """
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(next_record(self.parser, self.lines))
+
+        timeout = None if deadline is None or math.isinf(deadline) else max(deadline - time.monotonic(), 0.0)
+        await asyncio.wait([self._pending], timeout=timeout)
+        if not self._pending.done():
+            return None
+
+        pending, self._pending = self._pending, None
+        row = pending.result()
+        if row is None:
+            raise StopAsyncIteration
+        return row
+
+    def close(self) -> None:
+        """
+        Cancels the pending read, e.g. if the stream is aborted.
+
+        :return: None
+        """
+        if self._pending is not None:
+            self._pending.cancel()
+
+
+def json_response(status: int, payload: Any) -> AsgiResponse:
+    """
+    Creates a JSON response.
+
+    :param status: Status code of the response.
+    :param payload: Object to send in the response body.
+    :return: Response.
+    """
+    return AsgiResponse(status=status, body=json_dumps(payload) + b'\n', content_type=MimeTypes.APPLICATION_JSON)
+
+
+def error_response(status: int, error_msg: str) -> AsgiResponse:
+    """
+    Creates an error response in the format of `ml_ids_api.util.response_utils.response_error`.
+
+    :param status: Status code of the response.
+    :param error_msg: Error message to be sent in the response body.
+    :return: Response.
+    """
+    return json_response(status, {'error': error_msg})
+
+
+async def send_response(send, response: AsgiResponse) -> None:
+    """
+    Sends the given response, streaming the body chunks of streaming responses using chunked transfer encoding.
+
+    :param send: ASGI send channel.
+    :param response: Response.
+    :return: None
+    """
+    headers = [(b'content-type', response.content_type.encode('latin-1'))]
+    if response.chunks is None:
+        headers.append((b'content-length', str(len(response.body)).encode('latin-1')))
+    if response.content_encoding is not None:
+        headers.append((b'vary', HttpHeaders.ACCEPT_ENCODING.encode('latin-1')))
+        if response.content_encoding != 'identity':
+            headers.append((b'content-encoding', response.content_encoding.encode('latin-1')))
+
+    await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+
+    if response.chunks is not None:
+        async for chunk in response.chunks:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    await send({'type': 'http.response.body', 'body': response.body, 'more_body': False})
+
+
+def create_asgi_app(config_path):
+    """
+    Creates the ASGI application.
+
+    :param config_path: Path to the configuration file.
+    :return: ASGI application.
+    """
+    config = Config(os.getcwd())
+    config.from_object(config_path)
+    check_supported_options(config)
+
+    metrics = create_metrics(config)
+    sagemaker_client = create_async_sagemaker_client(config, metrics)
+    sns_message_producer = ExecutorMessageProducer(create_sns_message_producer(config, create_sns_client(config),
+                                                                               metrics),
+                                                   workers=config['AWS_SNS_PUBLISH_THREADS'])
+
+    return AsgiApplication(config, sagemaker_client, sns_message_producer, metrics)
+
+
+def check_supported_options(config) -> None:
+    """
+    Checks that the configuration does not enable options supported by the Flask application only, which would
+    otherwise be ignored silently.
+
+    :param config: Application configuration.
+    :return: None
+    :raises ValueError: If an option unsupported by the ASGI application is enabled.
+    """
+    unsupported = [option for option in ('IDEMPOTENCY_STORE', 'AWS_SAGEMAKER_OVERLOAD_PROTECTION',
+                                         'AWS_SAGEMAKER_COALESCING', 'PREDICTION_CACHE') if config[option]]
+    if is_routing_enabled(config):
+        unsupported.append('AWS_SAGEMAKER_ENDPOINTS/AWS_SAGEMAKER_SHADOW_ENDPOINT/AWS_SAGEMAKER_HEDGING')
+
+    if unsupported:
+        raise ValueError('Options not supported by the ASGI application: {}. Use the Flask application (gevent '
+                         'serving mode) instead.'.format(', '.join(unsupported)))
+
+
+def create_async_sagemaker_client(config, metrics=None):
+    """
+    Creates the asynchronous predictor of the configured prediction backend, either the AWS SageMaker client,
+    optionally splitting oversized requests into concurrent invocations, or the in-process model.
+
+    :param config: Application configuration.
+    :param metrics: Metrics recording the SageMaker requests.
+    :return: Predictor.
+    """
+    if config['PREDICTION_BACKEND'] == 'local':
+        return AsyncLocalModelPredictor(LocalModelPredictor(load_model(config['LOCAL_MODEL_PATH'])))
+
+    client = AsyncAwsSagemakerHttpClient(pool_size=config['AWS_SAGEMAKER_ASYNC_POOL_SIZE'],
+                                         max_retries=sagemaker_max_retries(config),
+                                         backoff_factor=config['AWS_SAGEMAKER_RETRY_BACKOFF'],
+                                         connect_timeout=config['AWS_SAGEMAKER_CONNECT_TIMEOUT'],
+                                         read_timeout=config['AWS_SAGEMAKER_READ_TIMEOUT'],
+                                         metrics=metrics,
+                                         **sagemaker_endpoint_settings(config))
+
+    if config['AWS_SAGEMAKER_CHUNKING']:
+        client = AsyncChunkedPredictionClient(client=client,
+                                              max_chunk_bytes=config['AWS_SAGEMAKER_CHUNK_MAX_BYTES'],
+                                              max_concurrency=config['AWS_SAGEMAKER_CHUNK_CONCURRENCY'],
+                                              max_retries=config['AWS_SAGEMAKER_CHUNK_MAX_RETRIES'])
+    return client
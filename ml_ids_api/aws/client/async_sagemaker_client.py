@@ -0,0 +1,100 @@
+"""
+Module containing an asynchronous client to interface with the Amazon SageMaker service, based on `aiohttp`.
+"""
+from typing import List, Optional
+import asyncio
+import urllib.parse
+import aiohttp
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError, RETRY_STATUS_CODES, \
+    create_invocation_headers, create_signer
+from ml_ids_api.data import json_loads
+from ml_ids_api.metrics import NoopMetrics
+
+
+class AsyncAwsSagemakerHttpClient:
+    """
+    An asynchronous client to interface with the Amazon SageMaker HTTP API, the non-blocking counterpart of
+    `AwsSagemakerHttpClient`. Requests share a pool of at most `pool_size` keep-alive connections, requests exceeding
+    the pool size wait for a free connection without blocking the event loop. Requests failing due to connection errors
+    or responding with a status code of 429 or 5xx are retried with exponential backoff.
+
+    The HTTP session is created on first use, as it must be bound to the running event loop, and released by `close`.
+    The duration of request signing and failed requests are recorded by the given metrics.
+    """
+
+    def __init__(self, access_key, secret_key, schema, host, endpoint, region, pool_size=1000, max_retries=3,
+                 backoff_factor=0.1, connect_timeout=None, read_timeout=None, metrics=None):
+        self.signer = create_signer(access_key, secret_key, host, endpoint, region)
+        self.url = urllib.parse.urljoin(schema + '://' + host, endpoint)
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.session = None  # type: Optional[aiohttp.ClientSession]
+        self.metrics = metrics if metrics is not None else NoopMetrics()
+
+    async def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Send a new POST request to the SageMaker HTTP endpoint using a Pandas DataFrame in `split-JSON` format as the
+        request-body.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        :raises AwsSagemakerHttpClientError: If the request failed after all retries.
+        """
+        with self.metrics.stage('sign'):
+            headers = create_invocation_headers(self.signer, request_body)
+
+        try:
+            return await self._send(request_body, headers)
+        except AwsSagemakerHttpClientError as err:
+            self.metrics.count_error('sagemaker', err)
+            raise
+
+    async def _send(self, request_body, headers):
+        session = self._get_session()
+
+        for attempt in range(self.max_retries + 1):
+            retry = attempt < self.max_retries
+
+            try:
+                async with session.post(self.url, data=request_body, headers=headers) as response:
+                    body = await response.read()
+
+                    if response.status < 400:
+                        try:
+                            return json_loads(body)
+                        except ValueError as json_err:
+                            raise AwsSagemakerHttpClientError(cause=json_err,
+                                                              status_code=response.status,
+                                                              response_body=body.decode('utf-8', errors='replace'))
+
+                    if not retry or response.status not in RETRY_STATUS_CODES:
+                        raise AwsSagemakerHttpClientError(cause='{} Error: {}'.format(response.status,
+                                                                                      response.reason),
+                                                          status_code=response.status,
+                                                          response_body=body.decode('utf-8', errors='replace'))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as http_err:
+                if not retry:
+                    raise AwsSagemakerHttpClientError(cause=http_err)
+
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+        return []
+
+    async def close(self) -> None:
+        """
+        Closes the HTTP session and its pooled connections.
+
+        :return: None
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                                 timeout=self.timeout)
+        return self.session
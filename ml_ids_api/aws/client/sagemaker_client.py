@@ -1,13 +1,19 @@
 """
 Module containing classes to interface with the Amazon SageMaker service (https://aws.amazon.com/sagemaker/).
 """
-from typing import List
+from typing import Dict, List
 import datetime
-import hashlib
-import hmac
 import urllib.parse
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
+
+from ml_ids_api.aws.signing import AwsSigV4Signer, hash_payload
+from ml_ids_api.inference import Predictor
+from ml_ids_api.metrics import NoopMetrics
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 
 class AwsSagemakerHttpClientError(IOError):
@@ -26,13 +32,105 @@ class AwsSagemakerHttpClientError(IOError):
             .format(self.cause, self.status_code, self.response_body)
 
 
-class AwsSagemakerHttpClient:
+def is_retryable_error(err: Exception) -> bool:
+    """
+    Returns whether a failed SageMaker invocation may succeed when retried: it failed due to a connection error or a
+    timeout, or the endpoint responded with a status code of 429 or 5xx.
+
+    :param err: Error of a failed invocation.
+    :return: True if the invocation should be retried, False otherwise.
+    """
+    if not isinstance(err, AwsSagemakerHttpClientError):
+        return False
+    return err.status_code is None or err.status_code in RETRY_STATUS_CODES or err.status_code >= 500
+
+
+def retry_all_methods() -> Dict[str, None]:
+    """
+    Returns the `Retry` argument allowing retries of all HTTP methods, including `POST`. The argument is named
+    `allowed_methods` since urllib3 1.26, `method_whitelist` is removed in urllib3 2.
+
+    :return: Keyword arguments of `Retry`.
+    """
+    if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS'):
+        return {'allowed_methods': None}
+    return {'method_whitelist': None}
+
+
+def create_http_session(pool_size=10, max_retries=3, backoff_factor=0.1) -> requests.Session:
+    """
+    Creates a HTTP session holding a pool of keep-alive connections. Requests failing due to connection errors or
+    responding with a status code of 429 or 5xx are retried with exponential backoff.
+
+    :param pool_size: Maximum number of connections kept alive per host.
+    :param max_retries: Maximum number of retries per request.
+    :param backoff_factor: Backoff factor in seconds applied between consecutive retries.
+    :return: HTTP session.
+    """
+    retry = Retry(total=max_retries,  # pylint: disable=unexpected-keyword-arg
+                  backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUS_CODES,
+                  raise_on_status=False,
+                  **retry_all_methods())
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def create_signer(access_key, secret_key, host, endpoint, region) -> AwsSigV4Signer:
+    """
+    Creates the signer of requests to a SageMaker endpoint.
+
+    :param access_key: AWS access key.
+    :param secret_key: AWS secret key.
+    :param host: Host of the SageMaker endpoint.
+    :param endpoint: Path of the SageMaker endpoint.
+    :param region: AWS region.
+    :return: Signer.
+    """
+    return AwsSigV4Signer(access_key=access_key,
+                          secret_key=secret_key,
+                          host=host,
+                          endpoint=endpoint,
+                          region=region,
+                          service='sagemaker')
+
+
+def create_invocation_headers(signer: AwsSigV4Signer, request_body) -> Dict[str, str]:
+    """
+    Creates the signed headers of a SageMaker invocation request.
+
+    :param signer: Signer of the SageMaker endpoint.
+    :param request_body: Pandas DataFrame in `split-JSON` format.
+    :return: Request headers.
+    """
+    content_type = 'application/json; format=pandas-split'
+    amz_date = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+
+    authorization_header = signer.create_authorization_header(method='POST',
+                                                              amz_date=amz_date,
+                                                              content_type=content_type,
+                                                              payload_hash=hash_payload(request_body))
+
+    return {'Content-Type': content_type,
+            'X-Amz-Date': amz_date,
+            'Authorization': authorization_header}
+
+
+class AwsSagemakerHttpClient(Predictor):
     """
     A client to interface with the the Amazon SageMaker HTTP API.
     Can be used to send prediction requests to an Amazon SageMaker HTTP endpoint.
+    Requests are sent using the given HTTP session, reusing its pooled connections across requests. If no session is
+    given a session with the default pool and retry settings is created.
+    The duration of request signing and failed requests are recorded by the given metrics.
     """
 
-    def __init__(self, access_key, secret_key, schema, host, endpoint, region):
+    def __init__(self, access_key, secret_key, schema, host, endpoint, region, session=None, timeout=None,
+                 metrics=None):
         self.access_key = access_key
         self.secret_key = secret_key
         self.schema = schema
@@ -40,10 +138,13 @@ class AwsSagemakerHttpClient:
         self.endpoint = endpoint
         self.region = region
         self.service = 'sagemaker'
-        self.algorithm = 'AWS4-HMAC-SHA256'
+        self.signer = create_signer(access_key, secret_key, host, endpoint, region)
         self.url = urllib.parse.urljoin(schema + '://' + host, endpoint)
+        self.session = session if session is not None else create_http_session()
+        self.timeout = timeout
+        self.metrics = metrics if metrics is not None else NoopMetrics()
 
-    def post_invocations(self, request_body: str) -> List[int]:
+    def post_invocations(self, request_body) -> List[int]:
         """
         Send a new POST request to the SageMaker HTTP endpoint using a Pandas DataFrame in `split-JSON` format as the
         request-body.
@@ -51,78 +152,22 @@ class AwsSagemakerHttpClient:
         :param request_body: Pandas DataFrame in `split-JSON` format.
         :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
         """
-        content_type = 'application/json; format=pandas-split'
-        now = datetime.datetime.utcnow()
-        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
-
-        authorization_header = self._create_authorization_header(method='POST',
-                                                                 time=now,
-                                                                 amz_date=amz_date,
-                                                                 content_type=content_type,
-                                                                 request_body=request_body)
-
-        headers = {'Content-Type': content_type,
-                   'X-Amz-Date': amz_date,
-                   'Authorization': authorization_header}
+        with self.metrics.stage('sign'):
+            headers = create_invocation_headers(self.signer, request_body)
 
         response = None
 
         try:
-            response = requests.post(url=self.url,
-                                     data=request_body,
-                                     headers=headers)
+            response = self.session.post(url=self.url,
+                                         data=request_body,
+                                         headers=headers,
+                                         timeout=self.timeout)
 
             response.raise_for_status()
             return response.json()
         except RequestException as http_err:
             body = response.text if response is not None else None
             status = response.status_code if response is not None else None
-            raise AwsSagemakerHttpClientError(cause=http_err, status_code=status, response_body=body)
-
-    def _create_authorization_header(self, method, time, amz_date, content_type, request_body):
-        signed_headers = 'content-type;host;x-amz-date'
-        date_stamp = time.strftime('%Y%m%d')
-        credential_scope = date_stamp + '/' + self.region + '/' + self.service + '/' + 'aws4_request'
-
-        canonical_request = self._create_canonical_request(method=method,
-                                                           content_type=content_type,
-                                                           amz_date=amz_date,
-                                                           request_body=request_body,
-                                                           signed_headers=signed_headers)
-
-        string_to_sign = self._create_string_to_sign(amz_date=amz_date,
-                                                     canonical_request=canonical_request,
-                                                     credential_scope=credential_scope)
-
-        signing_key = self._get_signature_key(self.secret_key, date_stamp, self.region, self.service)
-
-        signature = self._create_signature(signing_key, string_to_sign)
-
-        return self.algorithm + ' ' + 'Credential=' + self.access_key + '/' + credential_scope + ', ' \
-               + 'SignedHeaders=' + signed_headers + ', ' + 'Signature=' + signature
-
-    def _create_canonical_request(self, method, content_type, amz_date, request_body, signed_headers, query_string=''):
-        canonical_headers = 'content-type:' + content_type + '\n' + 'host:' + self.host + '\n' \
-                            + 'x-amz-date:' + amz_date + '\n'
-        payload_hash = hashlib.sha256(request_body).hexdigest()
-        return method + '\n' + self.endpoint + '\n' + query_string + '\n' + canonical_headers + '\n' \
-               + signed_headers + '\n' + payload_hash
-
-    def _create_string_to_sign(self, amz_date, canonical_request, credential_scope):
-        encoded_request = hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
-        return self.algorithm + '\n' + amz_date + '\n' + credential_scope + '\n' + encoded_request
-
-    def _get_signature_key(self, key, date_stamp, region_name, service_name):
-        k_date = self._sign(('AWS4' + key).encode('utf-8'), date_stamp)
-        k_region = self._sign(k_date, region_name)
-        k_service = self._sign(k_region, service_name)
-        k_signing = self._sign(k_service, 'aws4_request')
-        return k_signing
-
-    @staticmethod
-    def _create_signature(signing_key, string_to_sign):
-        return hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
-
-    @staticmethod
-    def _sign(key, msg):
-        return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+            error = AwsSagemakerHttpClientError(cause=http_err, status_code=status, response_body=body)
+            self.metrics.count_error('sagemaker', error)
+            raise error
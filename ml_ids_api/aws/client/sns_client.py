@@ -1,31 +1,84 @@
 """
 Module containing classes to interface with the Amazon SNS service (https://aws.amazon.com/sns/).
 """
-import boto3
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import os
+import threading
+import time
+
+from ml_ids_api.util.import_utils import import_module
+
+MAX_BATCH_SIZE = 10
+RETRYABLE_ERROR_CODES = frozenset(['Throttling', 'ThrottlingException', 'Throttled', 'RequestLimitExceeded',
+                                   'KMSThrottling', 'InternalError', 'InternalFailure', 'ServiceUnavailable'])
+
+
+class SNSMessage(NamedTuple):
+    """
+    A single SNS message consisting of the message body and its message attributes.
+    """
+    message: str
+    attrs: dict
+
+
+class AwsSNSClientError(IOError):
+    """
+    An error caused by SNS messages that could not be published.
+    """
+
+    def __init__(self, cause, failed_entries=None):
+        self.cause = cause
+        self.failed_entries = failed_entries or []
+        super(AwsSNSClientError, self).__init__()
+
+    def __str__(self):
+        return 'AwsSNSClientError: [{}]. Failed Entries: [{}].'.format(self.cause, self.failed_entries)
+
+
+def is_retryable_error(err) -> bool:
+    """
+    Checks whether a failed SNS request may succeed when retried, i.e. whether it failed due to throttling or a
+    server-side error.
+
+    :param err: `botocore.exceptions.ClientError` raised by the request.
+    :return: True if the request should be retried.
+    """
+    status = err.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    return err.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES or status >= 500 or status == 429
 
 
 class AwsSNSClient:
     """
     A client to interface with the the Amazon SNS service.
     Can be used to publish new SNS messages.
+
+    The underlying boto3 client is created on first use in each process, so that `boto3` is not imported by workers
+    never publishing notifications and no client, nor its connections, is shared by forked worker processes.
     """
 
-    def __init__(self, access_key, secret_key, region):
+    def __init__(self, access_key, secret_key, region, max_retries=3, retry_backoff=0.1, endpoint_url=None):
         self.access_key = access_key
         self.secret_key = secret_key
         self.region = region
+        self.endpoint_url = endpoint_url
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
         self.client = None
+        self._pid = None  # type: Optional[int]
+        self._lock = threading.Lock()
 
     def initialize(self) -> None:
         """
-        Initializes the client. Must be invoked before messages can be published.
+        Initializes the client. Invoked on first use if not invoked explicitly, and again in forked processes.
 
         :return: None
         """
-        self.client = boto3.client('sns',
-                                   aws_access_key_id=self.access_key,
-                                   aws_secret_access_key=self.secret_key,
-                                   region_name=self.region)
+        self._pid = os.getpid()
+        self.client = import_module('boto3').client('sns',
+                                                    aws_access_key_id=self.access_key,
+                                                    aws_secret_access_key=self.secret_key,
+                                                    region_name=self.region,
+                                                    endpoint_url=self.endpoint_url)
 
     def publish(self, topic: str, message: str, attrs: dict) -> None:
         """
@@ -36,6 +89,77 @@ class AwsSNSClient:
         :param attrs: Additional message attributes.
         :return: None
         """
+        self._ensure_client()
         self.client.publish(TopicArn=topic,
                             Message=message,
                             MessageAttributes=attrs)
+
+    def publish_batch(self, topic: str, messages: Sequence[SNSMessage], batch_size: int = MAX_BATCH_SIZE) -> None:
+        """
+        Publish the given SNS messages to the given topic using `PublishBatch` requests.
+        Messages are grouped into batches of at most 10 messages. Entries failing due to a server-side error, as well
+        as requests failing as a whole due to throttling or a server-side error, are retried with exponential backoff.
+
+        :param topic: ARN of the topic to publish the messages.
+        :param messages: Messages to publish.
+        :param batch_size: Maximum number of messages per `PublishBatch` request, limited to 10.
+        :return: None
+        :raises AwsSNSClientError: If one or more messages could not be published.
+        """
+        batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        failed_entries = []  # type: List[dict]
+        self._ensure_client()
+
+        for start in range(0, len(messages), batch_size):
+            failed_entries.extend(self._publish_batch_with_retries(topic, messages[start:start + batch_size]))
+
+        if failed_entries:
+            raise AwsSNSClientError(cause='{} of {} messages could not be published'
+                                    .format(len(failed_entries), len(messages)),
+                                    failed_entries=failed_entries)
+
+    def _ensure_client(self):
+        # a client assigned directly, i.e. without a pid, is used as is
+        if self.client is None or (self._pid is not None and self._pid != os.getpid()):
+            with self._lock:
+                if self.client is None or (self._pid is not None and self._pid != os.getpid()):
+                    self.initialize()
+
+    def _publish_batch_with_retries(self, topic, messages):
+        pending = {str(i): message for i, message in enumerate(messages)}  # type: Dict[str, SNSMessage]
+        failed_entries = []  # type: List[dict]
+
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+
+            try:
+                response = self.client.publish_batch(TopicArn=topic,
+                                                     PublishBatchRequestEntries=[
+                                                         {
+                                                             'Id': entry_id,
+                                                             'Message': message.message,
+                                                             'MessageAttributes': message.attrs
+                                                         } for entry_id, message in pending.items()
+                                                     ])
+            except import_module('botocore.exceptions').ClientError as err:
+                if not is_retryable_error(err):
+                    raise
+                # the request failed as a whole, all pending entries are retried
+                response = {'Failed': [{'Id': entry_id, 'Code': err.response['Error'].get('Code'), 'SenderFault': False}
+                                       for entry_id in pending]}
+
+            retryable_ids = set()
+            for entry in response.get('Failed', []):
+                if entry.get('SenderFault', False):
+                    failed_entries.append(entry)
+                else:
+                    retryable_ids.add(entry['Id'])
+
+            pending = {entry_id: message for entry_id, message in pending.items() if entry_id in retryable_ids}
+
+            if not pending:
+                return failed_entries
+
+        return failed_entries + [{'Id': entry_id, 'Code': 'RetriesExhausted', 'SenderFault': False}
+                                 for entry_id in pending]
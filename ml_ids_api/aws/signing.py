@@ -0,0 +1,100 @@
+"""
+Module implementing the AWS Signature Version 4 signing process
+(https://docs.aws.amazon.com/general/latest/gr/signature-version-4.html).
+"""
+from functools import lru_cache
+from typing import BinaryIO, Union
+import hashlib
+import hmac
+
+ALGORITHM = 'AWS4-HMAC-SHA256'
+SIGNED_HEADERS = 'content-type;host;x-amz-date'
+PAYLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=32)
+def derive_signing_key(secret_key: str, date_stamp: str, region: str, service: str) -> bytes:
+    """
+    Derives the signing key for the given date, region and service. As the signing key only changes once per day, the
+    derived keys are memoized.
+
+    :param secret_key: AWS secret key.
+    :param date_stamp: Date in the format `YYYYMMDD`.
+    :param region: AWS region.
+    :param service: AWS service name.
+    :return: Signing key.
+    """
+    k_date = _sign(('AWS4' + secret_key).encode('utf-8'), date_stamp)
+    k_region = _sign(k_date, region)
+    k_service = _sign(k_region, service)
+    return _sign(k_service, 'aws4_request')
+
+
+def hash_payload(payload: Union[bytes, str, BinaryIO]) -> str:
+    """
+    Computes the hex encoded SHA-256 hash of the request payload. File-like payloads are hashed incrementally in
+    chunks and rewound afterwards, avoiding to load large bodies into memory.
+
+    :param payload: Request payload.
+    :return: Hex encoded SHA-256 hash.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(payload).hexdigest()
+
+    payload_hash = hashlib.sha256()
+    start = payload.tell()
+
+    for chunk in iter(lambda: payload.read(PAYLOAD_CHUNK_SIZE), b''):  # type: ignore
+        payload_hash.update(chunk)
+
+    payload.seek(start)
+    return payload_hash.hexdigest()
+
+
+class AwsSigV4Signer:
+    """
+    Creates Signature Version 4 authorization headers for requests sent to a fixed host and endpoint.
+    The parts of the canonical request that do not vary between requests are computed once upon creation.
+    """
+
+    def __init__(self, access_key, secret_key, host, endpoint, region, service):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.service = service
+        self._scope_suffix = '/' + region + '/' + service + '/aws4_request'
+        self._endpoint_prefix = '\n' + endpoint + '\n\n'
+        self._host_header = '\nhost:' + host + '\nx-amz-date:'
+        self._headers_suffix = '\n\n' + SIGNED_HEADERS + '\n'
+
+    def create_authorization_header(self, method: str, amz_date: str, content_type: str, payload_hash: str) -> str:
+        """
+        Creates the value of the `Authorization` header for a request with the given properties.
+
+        :param method: HTTP method.
+        :param amz_date: Request time in the format `YYYYMMDD'T'HHMMSS'Z'`, matching the `X-Amz-Date` header.
+        :param content_type: Content-Type of the request.
+        :param payload_hash: Hex encoded SHA-256 hash of the request payload (see `hash_payload`).
+        :return: Authorization header value.
+        """
+        date_stamp = amz_date[:8]
+        credential_scope = date_stamp + self._scope_suffix
+
+        canonical_request = method + self._endpoint_prefix + 'content-type:' + content_type + self._host_header \
+            + amz_date + self._headers_suffix + payload_hash
+
+        string_to_sign = ALGORITHM + '\n' + amz_date + '\n' + credential_scope + '\n' \
+            + hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+
+        signing_key = derive_signing_key(self.secret_key, date_stamp, self.region, self.service)
+        signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+        return ALGORITHM + ' Credential=' + self.access_key + '/' + credential_scope + ', SignedHeaders=' \
+            + SIGNED_HEADERS + ', Signature=' + signature
+
+
+def _sign(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
@@ -0,0 +1,353 @@
+"""
+Module providing facilities to combine concurrent prediction requests into single SageMaker invocations and to split
+oversized prediction requests into multiple invocations.
+"""
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import threading
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError, is_retryable_error
+from ml_ids_api.data import SplitFrame, deserialize_split_frame, serialize_split_frame, json_dumps
+
+
+class _PendingRequest:
+    """
+    A prediction request waiting for the predictions of its batch.
+    """
+
+    def __init__(self, data: SplitFrame, size: int):
+        self.data = data
+        self.size = size
+        self.predictions = None  # type: Optional[List[int]]
+        self.error = None  # type: Optional[Exception]
+
+
+class _Batch:
+    """
+    A batch of prediction requests sharing the same columns, sent to SageMaker in a single invocation.
+    """
+
+    def __init__(self):
+        self.requests = []  # type: List[_PendingRequest]
+        self.rows = 0
+        self.size = 0
+        self.closed = threading.Event()
+        self.done = threading.Event()
+
+    def add(self, request: _PendingRequest) -> None:
+        """
+        Adds a prediction request to the batch.
+
+        :param request: Prediction request.
+        :return: None
+        """
+        self.requests.append(request)
+        self.rows += len(request.data.data)
+        self.size += request.size
+
+
+def is_client_error(err: Exception) -> bool:
+    """
+    Returns whether a failed SageMaker invocation was rejected due to its request, i.e. with a status code of 4xx
+    other than 429.
+
+    :param err: Error of a failed invocation.
+    :return: True if the request was rejected, False otherwise.
+    """
+    return (isinstance(err, AwsSagemakerHttpClientError) and err.status_code is not None and
+            400 <= err.status_code < 500 and not is_retryable_error(err))
+
+
+class PredictionRequestCoalescer:
+    """
+    Client combining concurrent prediction requests into single SageMaker invocations.
+
+    The first request arriving for a given set of columns opens a batch and waits up to `max_wait_ms` for further
+    requests to join. The batch is sent as soon as the window expires or adding another request would exceed
+    `max_rows` or `max_bytes`. The predictions are then split up and handed back to the waiting requests in the order
+    of their rows. Requests exceeding the limits on their own are sent directly. If SageMaker rejects a batch with a
+    status code of 4xx, its requests are sent one by one, so that only the invalid requests fail.
+    Exposes the same `post_invocations` interface as the wrapped client.
+    """
+
+    def __init__(self, client, max_wait_ms=5.0, max_rows=1000, max_bytes=5 * 1024 * 1024):
+        self.client = client
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._batches = {}  # type: Dict[Tuple[str, ...], _Batch]
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'invocations': 0}
+
+    def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Requests predictions for a Pandas DataFrame in `split-JSON` format, sharing the SageMaker invocation with
+        concurrent requests.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        :raises ValueError: If the request body is not a valid DataFrame in `split-JSON` format.
+        """
+        data = deserialize_split_frame(request_body)
+
+        if len(data.data) >= self.max_rows or len(request_body) >= self.max_bytes:
+            self._increment(requests=1, invocations=1)
+            return self.client.post_invocations(request_body)
+
+        request = _PendingRequest(data, len(request_body))
+        batch, leader = self._join_batch(request)
+
+        if leader:
+            batch.closed.wait(self.max_wait)
+            self._close_batch(tuple(data.columns), batch)
+            self._invoke(batch)
+        else:
+            batch.done.wait()
+
+        if request.error is not None:
+            raise request.error  # pylint: disable=raising-bad-type
+
+        return request.predictions  # type: ignore
+
+    def metrics(self) -> dict:
+        """
+        Returns the number of received prediction requests and of SageMaker invocations.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def _join_batch(self, request):
+        key = tuple(request.data.columns)
+
+        with self._lock:
+            self._counters['requests'] += 1
+            batch = self._batches.get(key)
+
+            if batch is not None and (batch.rows + len(request.data.data) > self.max_rows
+                                      or batch.size + request.size > self.max_bytes):
+                batch.closed.set()
+                del self._batches[key]
+                batch = None
+
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._batches[key] = batch
+
+            batch.add(request)
+
+            if batch.rows >= self.max_rows:
+                batch.closed.set()
+                del self._batches[key]
+
+            return batch, leader
+
+    def _close_batch(self, key, batch):
+        with self._lock:
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+            self._counters['invocations'] += 1
+
+    def _invoke(self, batch):
+        try:
+            predictions = self._predict(batch.requests[0].data.columns,
+                                        [row for request in batch.requests for row in request.data.data])
+
+            offset = 0
+            for request in batch.requests:
+                request.predictions = predictions[offset:offset + len(request.data.data)]
+                offset += len(request.data.data)
+        except Exception as err:  # pylint: disable=broad-except
+            if len(batch.requests) > 1 and is_client_error(err):
+                # the batch was rejected due to one of its requests, which must not fail the other requests
+                self._invoke_individually(batch.requests)
+            else:
+                for request in batch.requests:
+                    request.error = err
+        finally:
+            batch.done.set()
+
+    def _invoke_individually(self, requests):
+        self._increment(invocations=len(requests))
+
+        for request in requests:
+            try:
+                request.predictions = self._predict(request.data.columns, request.data.data)
+            except Exception as err:  # pylint: disable=broad-except
+                request.error = err
+
+    def _predict(self, columns, rows):
+        predictions = self.client.post_invocations(serialize_split_frame(SplitFrame(columns=columns, data=rows)))
+
+        if len(predictions) != len(rows):
+            raise AwsSagemakerHttpClientError(cause='Expected {} predictions, received {}.'
+                                              .format(len(rows), len(predictions)))
+        return predictions
+
+    def _increment(self, **values):
+        with self._lock:
+            for counter, value in values.items():
+                self._counters[counter] += value
+
+
+class ChunkedPredictionClient:
+    """
+    Client splitting prediction requests exceeding `max_chunk_bytes` into chunks of consecutive rows, each fitting
+    into the byte budget, which are sent to SageMaker concurrently. At most `max_concurrency` invocations are in
+    flight per client. Chunks failing due to connection errors or a status code of 429 or 5xx are retried
+    individually with exponential backoff. As soon as a chunk fails for good, the remaining chunks are cancelled and
+    the error is raised. Otherwise the predictions of all chunks are returned in the order of the input rows.
+    Exposes the same `post_invocations` interface as the wrapped client.
+    """
+
+    def __init__(self, client, max_chunk_bytes=5 * 1024 * 1024, max_concurrency=4, max_retries=2,
+                 retry_backoff=0.1):
+        self.client = client
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='sagemaker-chunk')
+
+    def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Requests predictions for a Pandas DataFrame in `split-JSON` format, splitting the request into chunks if it
+        exceeds the byte budget.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        :raises ValueError: If an oversized request body is not a valid DataFrame in `split-JSON` format.
+        :raises AwsSagemakerHttpClientError: If a chunk could not be processed.
+        """
+        if len(request_body) <= self.max_chunk_bytes:
+            return self.client.post_invocations(request_body)
+
+        chunks = self.split(deserialize_split_frame(request_body))
+        cancelled = threading.Event()
+        futures = [self.executor.submit(self._post_chunk, chunk, cancelled) for chunk in chunks]
+
+        try:
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in futures:
+                if future in done and future.exception() is not None:
+                    raise future.exception()  # type: ignore
+            return [prediction for future in futures for prediction in future.result()]
+        finally:
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+
+    def split(self, data: SplitFrame) -> List[bytes]:
+        """
+        Splits the given SplitFrame into `split-JSON` request bodies of consecutive rows not exceeding the byte budget.
+        A single row exceeding the budget is sent as chunk of its own.
+
+        :param data: SplitFrame.
+        :return: List of request bodies.
+        """
+        return split_request(data, self.max_chunk_bytes)
+
+    def _post_chunk(self, chunk, cancelled):
+        for attempt in range(self.max_retries + 1):
+            if cancelled.is_set():
+                break
+            try:
+                return self.client.post_invocations(chunk)
+            except AwsSagemakerHttpClientError as err:
+                if attempt == self.max_retries or not is_retryable_error(err):
+                    raise
+                cancelled.wait(self.retry_backoff * (2 ** attempt))
+
+        return []
+
+
+class AsyncChunkedPredictionClient:
+    """
+    Asynchronous counterpart of `ChunkedPredictionClient` wrapping an asynchronous client. Chunks are sent
+    concurrently on the event loop, at most `max_concurrency` invocations are in flight per request. As soon as a chunk
+    fails for good, the remaining chunks are cancelled.
+    """
+
+    def __init__(self, client, max_chunk_bytes=5 * 1024 * 1024, max_concurrency=4, max_retries=2,
+                 retry_backoff=0.1):
+        self.client = client
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    async def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Requests predictions for a Pandas DataFrame in `split-JSON` format, splitting the request into chunks if it
+        exceeds the byte budget.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        :raises ValueError: If an oversized request body is not a valid DataFrame in `split-JSON` format.
+        :raises AwsSagemakerHttpClientError: If a chunk could not be processed.
+        """
+        if len(request_body) <= self.max_chunk_bytes:
+            return await self.client.post_invocations(request_body)
+
+        chunks = split_request(deserialize_split_frame(request_body), self.max_chunk_bytes)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [asyncio.ensure_future(self._post_chunk(chunk, semaphore))
+                 for chunk in chunks]  # type: List[asyncio.Future]
+
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)  # type: ignore
+            for task in tasks:
+                if task in done and task.exception() is not None:
+                    raise task.exception()  # type: ignore
+            return [prediction for task in tasks for prediction in task.result()]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def close(self) -> None:
+        """
+        Closes the wrapped client.
+
+        :return: None
+        """
+        await self.client.close()
+
+    async def _post_chunk(self, chunk, semaphore):
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await self.client.post_invocations(chunk)
+                except AwsSagemakerHttpClientError as err:
+                    if attempt == self.max_retries or not is_retryable_error(err):
+                        raise
+                    await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+
+        return []
+
+
+def split_request(data: SplitFrame, max_chunk_bytes: int) -> List[bytes]:
+    """
+    Splits the given SplitFrame into `split-JSON` request bodies of consecutive rows not exceeding `max_chunk_bytes`.
+    A single row exceeding the budget is sent as chunk of its own.
+
+    :param data: SplitFrame.
+    :param max_chunk_bytes: Maximum size of a request body in bytes.
+    :return: List of request bodies.
+    """
+    overhead = len(serialize_split_frame(SplitFrame(columns=data.columns, data=[])))
+    chunks = []
+    start, size = 0, overhead
+
+    for i, row in enumerate(data.data):
+        row_size = len(json_dumps(row)) + 1
+
+        if i > start and size + row_size > max_chunk_bytes:
+            chunks.append(serialize_split_frame(SplitFrame(columns=data.columns, data=data.data[start:i])))
+            start, size = i, overhead
+
+        size += row_size
+
+    chunks.append(serialize_split_frame(SplitFrame(columns=data.columns, data=data.data[start:])))
+    return chunks
@@ -0,0 +1,304 @@
+"""
+Module providing a cache for predictions keyed by the feature values of network flows.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError
+from ml_ids_api.data import SplitFrame, deserialize_split_frame, serialize_split_frame, json_dumps
+
+
+class InMemoryCacheBackend:
+    """
+    Process-local LRU cache evicting the least recently used entries if `max_entries` is exceeded and expiring
+    entries `ttl` seconds after they were stored.
+    """
+
+    def __init__(self, max_entries=100000, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, int]:
+        """
+        Returns the cached predictions of the given keys, omitting missing and expired entries.
+
+        :param keys: Cache keys.
+        :return: Dictionary mapping the found keys to their predictions.
+        """
+        now = time.monotonic()
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[0]
+
+        return found
+
+    def set_many(self, items: Dict[bytes, int]) -> None:
+        """
+        Stores the given predictions.
+
+        :param items: Dictionary mapping cache keys to predictions.
+        :return: None
+        """
+        expires = time.monotonic() + self.ttl
+
+        with self._lock:
+            for key, prediction in items.items():
+                self._entries[key] = (prediction, expires)
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the number of entries, the approximate memory footprint in bytes and the number of evictions.
+
+        :return: Dictionary of statistics.
+        """
+        with self._lock:
+            entries = len(self._entries)
+            entry_size = 0
+            if entries:
+                key, value = next(iter(self._entries.items()))
+                entry_size = sys.getsizeof(key) + sys.getsizeof(value) + sys.getsizeof(value[1])
+
+            return {'entries': entries,
+                    'memory_bytes': sys.getsizeof(self._entries) + entries * entry_size,
+                    'evictions': self.evictions}
+
+
+class SqliteCacheBackend:
+    """
+    Approximate LRU cache stored in a SQLite database file, shared by all worker processes on the same host. Entries
+    expire `ttl` seconds after they were stored. The access time of an entry is only updated if it is older than
+    `access_resolution` seconds, so that most cache hits do not write to the database. Expired and least recently
+    used entries exceeding `max_entries` are deleted by each process after every `evict_every` stored entries, by
+    default a tenth of `max_entries`, hence the cache may temporarily exceed `max_entries`. The number of entries is
+    maintained by triggers on insert and delete, so that statistics do not require a table scan.
+    The database connection is opened lazily per process, so the backend can be created before workers are forked.
+    """
+
+    def __init__(self, path, max_entries=100000, ttl=3600.0, access_resolution=60.0, evict_every=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.access_resolution = access_resolution
+        self.evict_every = evict_every if evict_every is not None else max(1, max_entries // 10)
+        self._stored = 0
+        self._connection = None  # type: Optional[sqlite3.Connection]
+        self._pid = None  # type: Optional[int]
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, int]:
+        """
+        Returns the cached predictions of the given keys, omitting missing and expired entries.
+
+        :param keys: Cache keys.
+        :return: Dictionary mapping the found keys to their predictions.
+        """
+        now = time.time()
+        found = {}  # type: Dict[bytes, int]
+        stale = []  # type: List[bytes]
+
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(keys), 500):
+                params = list(keys[start:start + 500])  # type: List[Any]
+                placeholders = ','.join('?' * len(params))
+                rows = connection.execute('SELECT key, prediction, accessed FROM predictions '
+                                          'WHERE key IN ({}) AND expires > ?'.format(placeholders),
+                                          params + [now]).fetchall()
+                for key, prediction, accessed in rows:
+                    found[key] = prediction
+                    if accessed <= now - self.access_resolution:
+                        stale.append(key)
+
+            if stale:
+                connection.executemany('UPDATE predictions SET accessed = ? WHERE key = ?',
+                                       [(now, key) for key in stale])
+                connection.commit()
+
+        return found
+
+    def set_many(self, items: Dict[bytes, int]) -> None:
+        """
+        Stores the given predictions.
+
+        :param items: Dictionary mapping cache keys to predictions.
+        :return: None
+        """
+        now = time.time()
+
+        with self._lock:
+            connection = self._connect()
+            connection.executemany('INSERT OR REPLACE INTO predictions (key, prediction, expires, accessed) '
+                                   'VALUES (?, ?, ?, ?)',
+                                   [(key, prediction, now + self.ttl, now) for key, prediction in items.items()])
+            self._stored += len(items)
+            if self._stored >= self.evict_every:
+                self._stored = 0
+                self._evict(connection, now)
+            connection.commit()
+
+    def stats(self) -> dict:
+        """
+        Returns the number of entries, the size of the database file in bytes and the number of evictions.
+
+        :return: Dictionary of statistics.
+        """
+        with self._lock:
+            connection = self._connect()
+            entries, evictions = connection.execute('SELECT entries, evictions FROM stats').fetchone()
+            page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+            page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+
+        return {'entries': entries, 'memory_bytes': page_count * page_size, 'evictions': evictions}
+
+    def _evict(self, connection, now):
+        connection.execute('DELETE FROM predictions WHERE expires <= ?', (now,))
+        evicted = connection.execute('DELETE FROM predictions WHERE key IN (SELECT key FROM predictions '
+                                     'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.max_entries,)).rowcount
+        if evicted:
+            connection.execute('UPDATE stats SET evictions = evictions + ?', (evicted,))
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._pid = os.getpid()
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            # rows replaced by `INSERT OR REPLACE` only fire the delete trigger with recursive triggers enabled
+            self._connection.execute('PRAGMA recursive_triggers=ON')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS predictions '
+                                     '(key BLOB PRIMARY KEY, prediction INTEGER, expires REAL, accessed REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS stats (evictions INTEGER, entries INTEGER)')
+            self._connection.execute('INSERT INTO stats SELECT 0, COUNT(*) FROM predictions '
+                                     'WHERE NOT EXISTS (SELECT * FROM stats)')
+            self._connection.execute('CREATE TRIGGER IF NOT EXISTS predictions_inserted AFTER INSERT ON predictions '
+                                     'BEGIN UPDATE stats SET entries = entries + 1; END')
+            self._connection.execute('CREATE TRIGGER IF NOT EXISTS predictions_deleted AFTER DELETE ON predictions '
+                                     'BEGIN UPDATE stats SET entries = entries - 1; END')
+            self._connection.commit()
+        return self._connection
+
+
+class CachingPredictionClient:
+    """
+    Client caching predictions per network flow. Each row is identified by a hash of its feature values, excluding
+    volatile columns such as `timestamp`. Only rows missing from the cache are sent to SageMaker, identical rows
+    within a request are sent once. Cached and new predictions are returned in the order of the input rows.
+    Exposes the same `post_invocations` interface as the wrapped client.
+    """
+
+    def __init__(self, client, backend, excluded_columns=('timestamp',)):
+        self.client = client
+        self.backend = backend
+        self.excluded_columns = set(excluded_columns)
+        self._counters = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Requests predictions for a Pandas DataFrame in `split-JSON` format, answering rows from the cache if possible.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        :raises ValueError: If the request body is not a valid DataFrame in `split-JSON` format.
+        """
+        data = deserialize_split_frame(request_body)
+        keys = self.create_keys(data)
+        cached = self.backend.get_many(keys)
+
+        missing = OrderedDict()  # type: OrderedDict
+        misses = 0
+        for key, row in zip(keys, data.data):
+            if key not in cached:
+                misses += 1
+                missing.setdefault(key, row)
+
+        with self._lock:
+            self._counters['hits'] += len(keys) - misses
+            self._counters['misses'] += misses
+
+        if missing:
+            if len(missing) == len(data.data):
+                predictions = self.client.post_invocations(request_body)
+            else:
+                predictions = self.client.post_invocations(
+                    serialize_split_frame(SplitFrame(columns=data.columns, data=list(missing.values()))))
+
+            if len(predictions) != len(missing):
+                raise AwsSagemakerHttpClientError(cause='Expected {} predictions, received {}.'
+                                                  .format(len(missing), len(predictions)))
+
+            new_items = dict(zip(missing.keys(), predictions))
+            self.backend.set_many(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def create_keys(self, data: SplitFrame) -> List[bytes]:
+        """
+        Creates the cache keys of all rows of the given SplitFrame.
+
+        :param data: SplitFrame.
+        :return: List of cache keys.
+        """
+        positions = [i for i, column in enumerate(data.columns) if column not in self.excluded_columns]
+        prefix = json_dumps([data.columns[i] for i in positions])
+        return [self._hash(prefix, json_dumps([row[i] for i in positions])) for row in data.data]
+
+    def metrics(self) -> dict:
+        """
+        Returns the number of cache hits and misses, the hit rate and the statistics of the cache backend.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            metrics = dict(self._counters)
+
+        total = metrics['hits'] + metrics['misses']
+        metrics['hit_rate'] = metrics['hits'] / total if total else 0.0
+        metrics.update(self.backend.stats())
+        return metrics
+
+    @staticmethod
+    def _hash(prefix, values) -> bytes:
+        return hashlib.blake2b(prefix + values, digest_size=16).digest()
+
+
+def create_cache_backend(backend: str, max_entries: int, ttl: float, path: str):
+    """
+    Creates a prediction cache backend, either `memory` for a process-local cache or `sqlite` for a cache shared
+    across worker processes.
+
+    :param backend: Name of the backend.
+    :param max_entries: Maximum number of cached predictions.
+    :param ttl: Time to live of cached predictions in seconds.
+    :param path: Path of the database file used by the `sqlite` backend.
+    :return: Cache backend.
+    """
+    if backend == 'memory':
+        return InMemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+    if backend == 'sqlite':
+        return SqliteCacheBackend(path=path, max_entries=max_entries, ttl=ttl)
+    raise ValueError('Unsupported prediction cache backend: [{}].'.format(backend))
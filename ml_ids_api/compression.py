@@ -0,0 +1,187 @@
+"""
+Module providing the compression of request bodies, response bodies and SNS notifications with gzip or, if the
+optional package `zstandard` is installed, zstd. Request bodies are decompressed incrementally, failing as soon as the
+decompressed size exceeds a limit, so that small compressed bodies cannot exhaust the memory of a worker
+(decompression bombs).
+"""
+from typing import List, Optional
+import base64
+import io
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+IDENTITY = 'identity'
+
+ENCODING_ALIASES = {'x-gzip': GZIP}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+CHUNK_BYTES = 64 * 1024
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class UnsupportedEncodingError(Exception):
+    """
+    A request body compressed with an unsupported content encoding.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        super(UnsupportedEncodingError, self).__init__()
+
+    def __str__(self):
+        return 'Unsupported Content-Encoding: [{}]. Supported encodings: {}.' \
+            .format(self.encoding, supported_encodings())
+
+
+class PayloadTooLargeError(Exception):
+    """
+    A request body exceeding the maximum size.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        super(PayloadTooLargeError, self).__init__()
+
+    def __str__(self):
+        return 'Request body exceeds the maximum size of {} bytes.'.format(self.limit)
+
+
+def supported_encodings() -> List[str]:
+    """
+    Returns the supported content encodings in the order of preference.
+
+    :return: List of content encodings.
+    """
+    return [ZSTD, GZIP] if zstandard is not None else [GZIP]
+
+
+def normalize_encoding(encoding: Optional[str]) -> str:
+    """
+    Normalizes the value of a `Content-Encoding` header.
+
+    :param encoding: Header value or None if not present.
+    :return: Content encoding, `identity` if the body is not compressed.
+    """
+    if encoding is None or not encoding.strip():
+        return IDENTITY
+    encoding = encoding.strip().lower()
+    return ENCODING_ALIASES.get(encoding, encoding)
+
+
+def decompress(body: bytes, encoding: Optional[str], max_bytes: int) -> bytes:
+    """
+    Decompresses a request body incrementally, checking the decompressed size after each chunk.
+
+    :param body: Compressed request body.
+    :param encoding: Value of the `Content-Encoding` header or None if not present.
+    :param max_bytes: Maximum size of the decompressed body in bytes.
+    :return: Decompressed body.
+    :raises UnsupportedEncodingError: If the content encoding is not supported.
+    :raises PayloadTooLargeError: If the decompressed body exceeds `max_bytes`.
+    :raises ValueError: If the body is not valid compressed data.
+    """
+    encoding = normalize_encoding(encoding)
+    if encoding == IDENTITY:
+        return body
+    if encoding not in supported_encodings():
+        raise UnsupportedEncodingError(encoding)
+
+    chunks = []
+    size = 0
+    decompressed_chunks = _gunzip_chunks(body) if encoding == GZIP else _unzstd_chunks(body)
+    for chunk in decompressed_chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            raise PayloadTooLargeError(max_bytes)
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    Compresses the given data.
+
+    :param data: Uncompressed data.
+    :param encoding: Content encoding, either `gzip` or `zstd`.
+    :return: Compressed data.
+    :raises UnsupportedEncodingError: If the content encoding is not supported.
+    """
+    if encoding == GZIP:
+        # the zlib stream is used instead of `gzip.compress` to omit the modification time from the header
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise UnsupportedEncodingError(encoding)
+
+
+def compress_text(text: str, encoding: str) -> str:
+    """
+    Compresses the given text, encoding the compressed bytes as Base64, e.g. for message bodies restricted to text.
+
+    :param text: Text.
+    :param encoding: Content encoding, either `gzip` or `zstd`.
+    :return: Base64 encoded compressed text.
+    """
+    return base64.b64encode(compress(text.encode('utf-8'), encoding)).decode('ascii')
+
+
+def decompress_text(text: str, encoding: str, max_bytes: int = 1024 * 1024) -> str:
+    """
+    Reverses `compress_text`.
+
+    :param text: Base64 encoded compressed text.
+    :param encoding: Content encoding, either `gzip` or `zstd`.
+    :param max_bytes: Maximum size of the decompressed text in bytes.
+    :return: Text.
+    """
+    return decompress(base64.b64decode(text), encoding, max_bytes).decode('utf-8')
+
+
+def _gunzip_chunks(body):
+    data = body
+    try:
+        while True:
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+            while not decompressor.eof:
+                chunk = decompressor.decompress(data, CHUNK_BYTES)
+                data = decompressor.unconsumed_tail
+                if not chunk and not data:
+                    break
+                yield chunk
+
+            if not decompressor.eof:
+                raise ValueError('Invalid gzip data: unexpected end of data.')
+            # concatenated gzip members are decompressed into a single body, as by `gzip.decompress`
+            data = decompressor.unused_data
+            if not data:
+                break
+    except zlib.error as err:
+        raise ValueError('Invalid gzip data: {}'.format(err))
+
+
+def _unzstd_chunks(body):
+    # each read decompresses at most one chunk, regardless of how well the input compresses, concatenated frames are
+    # decompressed into a single body
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body), read_across_frames=True)
+    size = 0
+    try:
+        chunk = reader.read(CHUNK_BYTES)
+        while chunk:
+            size += len(chunk)
+            yield chunk
+            chunk = reader.read(CHUNK_BYTES)
+        declared_size = zstandard.frame_content_size(body)
+    except zstandard.ZstdError as err:
+        raise ValueError('Invalid zstd data: {}'.format(err))
+
+    # the reader ends silently at the end of truncated input, which is detected by the size declared in the frame
+    # header, if the compressor declared it
+    if size < declared_size:
+        raise ValueError('Invalid zstd data: unexpected end of data.')
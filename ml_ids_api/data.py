@@ -1,18 +1,60 @@
 """
 Utilities for Pandas DataFrame manipulation.
 """
-from typing import List
+from typing import Any, List, NamedTuple, Optional, Union
+import io
+import json
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
 
-def deserialize_dataframe(json_dataframe: str) -> pd.DataFrame:
+
+def json_loads(document: Union[bytes, str]) -> Any:
+    """
+    Deserializes a JSON document, using `orjson` if available.
+
+    :param document: JSON document.
+    :return: Deserialized object.
+    """
+    return orjson.loads(document) if orjson is not None else json.loads(document)
+
+
+def json_dumps(obj: Any) -> bytes:
+    """
+    Serializes the given object to compact UTF-8 encoded JSON, using `orjson` if available.
+
+    :param obj: Object to serialize.
+    :return: JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class SplitFrame(NamedTuple):
+    """
+    Lightweight representation of a DataFrame in `split-JSON` format, holding the parsed column names and data rows
+    without constructing a Pandas DataFrame. If no index is given, rows are indexed by their position.
+    """
+    columns: List[str]
+    data: List[List[Any]]
+    row_index: Optional[List[Any]] = None
+
+
+def deserialize_dataframe(json_dataframe: Union[str, bytes]) -> pd.DataFrame:
     """
     Deserializes a Pandas DataFrame from `split-JSON` format.
 
     :param json_dataframe: Pandas DataFrame as JSON.
     :return: Deserialized Pandas DataFrame.
     """
-    return pd.read_json(json_dataframe, orient='split')
+    if isinstance(json_dataframe, bytes):
+        json_dataframe = json_dataframe.decode('utf-8')
+    # recent Pandas versions no longer accept bytes and deprecate literal JSON strings, buffers are accepted by all
+    return pd.read_json(io.StringIO(json_dataframe), orient='split')
 
 
 def merge_predictions(data: pd.DataFrame, predictions: List[int]) -> pd.DataFrame:
@@ -25,3 +67,85 @@ def merge_predictions(data: pd.DataFrame, predictions: List[int]) -> pd.DataFram
     """
     data['prediction'] = predictions
     return data
+
+
+def deserialize_split_frame(json_dataframe: Union[bytes, str]) -> SplitFrame:
+    """
+    Deserializes a DataFrame in `split-JSON` format into a `SplitFrame`, validating its structure. Values are kept as
+    parsed from JSON, no type inference or date conversion is performed.
+
+    :param json_dataframe: Pandas DataFrame as JSON.
+    :return: Deserialized SplitFrame.
+    :raises ValueError: If the JSON document is malformed or not in `split` format.
+    """
+    return split_frame_from_document(json_loads(json_dataframe))
+
+
+def split_frame_from_document(document: Any) -> SplitFrame:
+    """
+    Creates a `SplitFrame` from a deserialized document in `split` format, i.e. a mapping containing the keys
+    `columns` and `data` and optionally `index`, validating its structure.
+
+    :param document: Deserialized document.
+    :return: SplitFrame.
+    :raises ValueError: If the document is not in `split` format.
+    """
+    if not isinstance(document, dict):
+        raise ValueError('Expected a JSON object containing the keys [\'columns\', \'data\'].')
+
+    columns = document.get('columns')
+    data = document.get('data')
+
+    if not isinstance(columns, list) or not all(isinstance(column, str) for column in columns):
+        raise ValueError('Expected \'columns\' to be an array of column names.')
+
+    if not isinstance(data, list):
+        raise ValueError('Expected \'data\' to be an array of rows.')
+
+    for i, row in enumerate(data):
+        if not isinstance(row, list) or len(row) != len(columns):
+            raise ValueError('Row {} does not contain {} values.'.format(i, len(columns)))
+
+    index = document.get('index')
+    if index is not None and (not isinstance(index, list) or len(index) != len(data)):
+        raise ValueError('Expected \'index\' to be an array of {} row labels.'.format(len(data)))
+
+    return SplitFrame(columns=columns, data=data, row_index=index)
+
+
+def serialize_split_frame(data: SplitFrame) -> bytes:
+    """
+    Serializes a SplitFrame to `split-JSON` format without index.
+
+    :param data: SplitFrame.
+    :return: UTF-8 encoded JSON.
+    """
+    return json_dumps({'columns': data.columns, 'data': data.data})
+
+
+def merge_split_predictions(data: SplitFrame, predictions: List[int]) -> SplitFrame:
+    """
+    Merge list of predictions with the given SplitFrame by appending a new column `prediction`.
+
+    :param data: SplitFrame.
+    :param predictions: List of predictions.
+    :return: Merged SplitFrame containing a `prediction` column.
+    :raises ValueError: If the number of predictions does not match the number of rows.
+    """
+    if len(predictions) != len(data.data):
+        raise ValueError('Length of predictions ({}) does not match the number of rows ({}).'
+                         .format(len(predictions), len(data.data)))
+
+    return SplitFrame(columns=data.columns + ['prediction'],
+                      data=[row + [prediction] for row, prediction in zip(data.data, predictions)],
+                      row_index=data.row_index)
+
+
+def count_rows(data: Union[pd.DataFrame, SplitFrame]) -> int:
+    """
+    Returns the number of rows of the given Pandas DataFrame or SplitFrame.
+
+    :param data: Pandas DataFrame or SplitFrame.
+    :return: Number of rows.
+    """
+    return len(data.data) if isinstance(data, SplitFrame) else len(data)
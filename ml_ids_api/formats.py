@@ -0,0 +1,119 @@
+"""
+Module providing binary request and response formats for prediction requests, in addition to `split-JSON`.
+Apache Arrow IPC streams require `pyarrow`, MessagePack encoded split frames require `msgpack`. Formats are only
+available if the corresponding package is installed. The packages are imported on first use, so that workers not
+receiving binary requests do not load them.
+"""
+from typing import Callable, Dict, List
+import numpy as np
+
+from ml_ids_api.data import SplitFrame, split_frame_from_document
+from ml_ids_api.util.constants import MimeTypes
+from ml_ids_api.util.import_utils import import_module, is_installed
+
+
+def deserialize_arrow_stream(body: bytes) -> SplitFrame:
+    """
+    Deserializes an Apache Arrow IPC stream into a `SplitFrame`. The record batches reference the request body
+    without copying. The values are converted column by column into a NumPy object matrix, missing values are set by
+    their null masks, and the rows are created from the matrix at once. Columns must be of a boolean, numeric or
+    string type.
+
+    :param body: Arrow IPC stream.
+    :return: Deserialized SplitFrame.
+    :raises ValueError: If the stream is malformed or contains columns of unsupported types.
+    """
+    pyarrow = import_module('pyarrow')
+    table = pyarrow.ipc.open_stream(pyarrow.py_buffer(body)).read_all()
+
+    for field in table.schema:
+        if not (pyarrow.types.is_boolean(field.type) or pyarrow.types.is_integer(field.type)
+                or pyarrow.types.is_floating(field.type) or pyarrow.types.is_string(field.type)
+                or pyarrow.types.is_null(field.type)):
+            raise ValueError('Column \'{}\' has unsupported type {}.'.format(field.name, field.type))
+
+    values = np.empty((table.num_columns, table.num_rows), dtype=object)
+    for i, column in enumerate(table.itercolumns()):
+        if column.null_count and pyarrow.types.is_integer(column.type):
+            # integers containing nulls would otherwise be converted to floats
+            values[i] = column.fill_null(0).to_numpy()
+        else:
+            values[i] = column.to_numpy()
+
+        if column.null_count:
+            values[i][column.is_null().to_numpy()] = None
+
+    return SplitFrame(columns=table.column_names, data=values.T.tolist())
+
+
+def deserialize_msgpack_split_frame(body: bytes) -> SplitFrame:
+    """
+    Deserializes a MessagePack encoded map containing the keys `columns` and `data` in `split` format into a
+    `SplitFrame`, validating its structure.
+
+    :param body: MessagePack document.
+    :return: Deserialized SplitFrame.
+    :raises ValueError: If the document is malformed or not in `split` format.
+    """
+    msgpack = import_module('msgpack')
+    try:
+        document = msgpack.unpackb(body, raw=False)
+    except (ValueError, msgpack.UnpackException) as err:
+        raise ValueError('Invalid MessagePack document: {}'.format(err))
+
+    return split_frame_from_document(document)
+
+
+def serialize_arrow_predictions(predictions: List[int]) -> bytes:
+    """
+    Serializes predictions to an Apache Arrow IPC stream containing a single column `prediction`.
+
+    :param predictions: List of predictions.
+    :return: Arrow IPC stream.
+    """
+    pyarrow = import_module('pyarrow')
+    batch = pyarrow.RecordBatch.from_arrays([pyarrow.array(predictions)], ['prediction'])
+    sink = pyarrow.BufferOutputStream()
+
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+
+    return sink.getvalue().to_pybytes()
+
+
+def serialize_msgpack_predictions(predictions: List[int]) -> bytes:
+    """
+    Serializes predictions to a MessagePack encoded array.
+
+    :param predictions: List of predictions.
+    :return: MessagePack document.
+    """
+    return import_module('msgpack').packb(predictions)
+
+
+def request_decoders() -> Dict[str, Callable[[bytes], SplitFrame]]:
+    """
+    Returns the decoders of the available binary request formats.
+
+    :return: Dictionary mapping MIME types to decoders.
+    """
+    decoders = {}  # type: Dict[str, Callable[[bytes], SplitFrame]]
+    if is_installed('pyarrow'):
+        decoders[MimeTypes.APPLICATION_ARROW_STREAM] = deserialize_arrow_stream
+    if is_installed('msgpack'):
+        decoders[MimeTypes.APPLICATION_MSGPACK_PANDAS_SPLIT] = deserialize_msgpack_split_frame
+    return decoders
+
+
+def response_encoders() -> Dict[str, Callable[[List[int]], bytes]]:
+    """
+    Returns the encoders of the available binary response formats.
+
+    :return: Dictionary mapping MIME types to encoders.
+    """
+    encoders = {}  # type: Dict[str, Callable[[List[int]], bytes]]
+    if is_installed('pyarrow'):
+        encoders[MimeTypes.APPLICATION_ARROW_STREAM] = serialize_arrow_predictions
+    if is_installed('msgpack'):
+        encoders[MimeTypes.APPLICATION_MSGPACK] = serialize_msgpack_predictions
+    return encoders
@@ -0,0 +1,383 @@
+"""
+Module providing the deduplication of retried prediction requests. Requests are identified by their `Idempotency-Key`
+header or, if no key is given, by a hash of the request body. The response of the first request is stored and
+returned to retries of the same request without requesting predictions or publishing notifications again, duplicates
+arriving while the first request is processed wait for its response.
+"""
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class StoredResponse(NamedTuple):
+    """
+    Response of a processed request, returned to its retries.
+    """
+    status: int
+    body: bytes
+    content_type: str
+
+
+class IdempotencyConflictError(Exception):
+    """
+    A request that cannot be answered from the idempotency store, because the request with the same key is still in
+    progress (`in_progress`) or because the key was used for a different request body (`mismatch`).
+    """
+
+    def __init__(self, reason):
+        self.reason = reason
+        super(IdempotencyConflictError, self).__init__()
+
+    def __str__(self):
+        if self.reason == 'mismatch':
+            return 'The idempotency key was already used for a different request.'
+        return 'A request with the same idempotency key is still in progress.'
+
+
+class _Entry:
+    __slots__ = ['fingerprint', 'response', 'expires']
+
+    def __init__(self, fingerprint, response, expires):
+        self.fingerprint = fingerprint
+        self.response = response
+        self.expires = expires
+
+
+class InMemoryIdempotencyStore:
+    """
+    Process-local idempotency store. Stored responses expire `ttl` seconds after they were stored, the least recently
+    used responses are evicted if `max_entries` is exceeded. Requests in progress are claimed for at most `lease`
+    seconds, so that a failed worker does not block retries indefinitely.
+    """
+
+    def __init__(self, max_entries=10000, ttl=600.0, lease=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lease = lease
+        self.evictions = 0
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._condition = threading.Condition()
+
+    def claim(self, key: bytes, fingerprint: bytes, timeout: float) -> Optional[StoredResponse]:
+        """
+        Claims the processing of a request or returns the stored response of the request with the same key. If the
+        request with the same key is in progress, waits up to `timeout` seconds for its response.
+
+        :param key: Idempotency key.
+        :param fingerprint: Fingerprint of the request body.
+        :param timeout: Maximum time in seconds to wait for a request in progress.
+        :return: Stored response or None if the caller claimed the processing of the request.
+        :raises IdempotencyConflictError: If the key was used for a different request body or the request with the
+                                          same key did not finish in time.
+        """
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                entry = self._entries.get(key)
+
+                if entry is None or entry.expires <= now:
+                    self._entries[key] = _Entry(fingerprint, None, now + self.lease)
+                    self._entries.move_to_end(key)
+                    self._evict()
+                    return None
+
+                if entry.fingerprint != fingerprint:
+                    raise IdempotencyConflictError('mismatch')
+
+                if entry.response is not None:
+                    self._entries.move_to_end(key)
+                    return entry.response
+
+                if now >= deadline:
+                    raise IdempotencyConflictError('in_progress')
+                self._condition.wait(min(deadline, entry.expires) - now)
+
+    def complete(self, key: bytes, response: StoredResponse) -> None:
+        """
+        Stores the response of a claimed request and wakes up the duplicates waiting for it.
+
+        :param key: Idempotency key.
+        :param response: Response.
+        :return: None
+        """
+        with self._condition:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.response = response
+                entry.expires = time.monotonic() + self.ttl
+            self._condition.notify_all()
+
+    def release(self, key: bytes) -> None:
+        """
+        Releases the claim of a request that failed without a response to store, so that a waiting duplicate or
+        a later retry processes the request again.
+
+        :param key: Idempotency key.
+        :return: None
+        """
+        with self._condition:
+            entry = self._entries.get(key)
+            if entry is not None and entry.response is None:
+                del self._entries[key]
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Returns the number of entries and the number of evictions.
+
+        :return: Dictionary of statistics.
+        """
+        with self._condition:
+            return {'entries': len(self._entries), 'evictions': self.evictions}
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class SqliteIdempotencyStore:
+    """
+    Idempotency store in a SQLite database file, shared by all worker processes on the same host, so that retries
+    are deduplicated regardless of the worker they are routed to. Expiry, eviction and leases are handled as by
+    `InMemoryIdempotencyStore`, duplicates poll the database while the request with the same key is in progress,
+    taking the write lock only to claim a missing or expired key.
+    Expired and least recently used entries are deleted by each process after every `evict_every` claimed keys, by
+    default a tenth of `max_entries`, hence the store may temporarily exceed `max_entries`. The number of entries is
+    maintained by triggers on insert and delete, so that statistics do not require a table scan.
+    The database connection is opened lazily per process, so the store can be created before workers are forked.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl=600.0, lease=60.0, poll_interval=0.01, evict_every=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.evict_every = evict_every if evict_every is not None else max(1, max_entries // 10)
+        self._claimed = 0
+        self._connection = None  # type: Optional[sqlite3.Connection]
+        self._pid = None  # type: Optional[int]
+        self._lock = threading.Lock()
+
+    def claim(self, key: bytes, fingerprint: bytes, timeout: float) -> Optional[StoredResponse]:
+        """
+        See `InMemoryIdempotencyStore.claim`.
+        """
+        deadline = time.time() + timeout
+        interval = self.poll_interval
+
+        while True:
+            with self._lock:
+                connection = self._connect()
+                now = time.time()
+                # duplicates poll without taking the write lock, which is only required to claim the key
+                row = self._select(connection, key)
+                if row is None or row[4] <= now:
+                    row = self._insert(connection, key, fingerprint, now)
+                elif row[1] is not None and row[0] == fingerprint:
+                    connection.execute('UPDATE requests SET accessed = ? WHERE key = ?', (now, key))
+
+            if row is None:
+                return None
+            if row[0] != fingerprint:
+                raise IdempotencyConflictError('mismatch')
+            if row[1] is not None:
+                return StoredResponse(status=row[1], body=row[2], content_type=row[3])
+            if now >= deadline:
+                raise IdempotencyConflictError('in_progress')
+
+            time.sleep(min(interval, max(0.0, deadline - now)))
+            interval = min(interval * 2, 0.1)
+
+    def complete(self, key: bytes, response: StoredResponse) -> None:
+        """
+        See `InMemoryIdempotencyStore.complete`.
+        """
+        now = time.time()
+        with self._lock:
+            self._connect().execute('UPDATE requests SET status = ?, body = ?, content_type = ?, expires = ?, '
+                                    'accessed = ? WHERE key = ?',
+                                    (response.status, response.body, response.content_type, now + self.ttl, now, key))
+
+    def release(self, key: bytes) -> None:
+        """
+        See `InMemoryIdempotencyStore.release`.
+        """
+        with self._lock:
+            self._connect().execute('DELETE FROM requests WHERE key = ? AND status IS NULL', (key,))
+
+    def stats(self) -> dict:
+        """
+        Returns the number of entries, the size of the database file in bytes and the number of evictions.
+
+        :return: Dictionary of statistics.
+        """
+        with self._lock:
+            connection = self._connect()
+            entries, evictions = connection.execute('SELECT entries, evictions FROM stats').fetchone()
+            page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+            page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+
+        return {'entries': entries, 'memory_bytes': page_count * page_size, 'evictions': evictions}
+
+    @staticmethod
+    def _select(connection, key):
+        return connection.execute('SELECT fingerprint, status, body, content_type, expires '
+                                  'FROM requests WHERE key = ?', (key,)).fetchone()
+
+    def _insert(self, connection, key, fingerprint, now):
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # the key may have been claimed by another process since it was read
+            row = self._select(connection, key)
+            if row is not None and row[4] > now:
+                return row
+
+            connection.execute('INSERT OR REPLACE INTO requests (key, fingerprint, expires, accessed) '
+                               'VALUES (?, ?, ?, ?)', (key, fingerprint, now + self.lease, now))
+            self._claimed += 1
+            if self._claimed >= self.evict_every:
+                self._claimed = 0
+                self._evict(connection, now)
+            return None
+        finally:
+            connection.execute('COMMIT')
+
+    def _evict(self, connection, now):
+        connection.execute('DELETE FROM requests WHERE expires <= ?', (now,))
+        evicted = connection.execute('DELETE FROM requests WHERE key IN (SELECT key FROM requests '
+                                     'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.max_entries,)).rowcount
+        if evicted:
+            connection.execute('UPDATE stats SET evictions = evictions + ?', (evicted,))
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            # autocommit mode, claims are made in explicit transactions
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._pid = os.getpid()
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            # rows replaced by `INSERT OR REPLACE` only fire the delete trigger with recursive triggers enabled
+            self._connection.execute('PRAGMA recursive_triggers=ON')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS requests (key BLOB PRIMARY KEY, fingerprint BLOB, '
+                                     'status INTEGER, body BLOB, content_type TEXT, expires REAL, accessed REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS requests_accessed ON requests (accessed)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS stats (evictions INTEGER, entries INTEGER)')
+            self._connection.execute('INSERT INTO stats SELECT 0, COUNT(*) FROM requests '
+                                     'WHERE NOT EXISTS (SELECT * FROM stats)')
+            self._connection.execute('CREATE TRIGGER IF NOT EXISTS requests_inserted AFTER INSERT ON requests '
+                                     'BEGIN UPDATE stats SET entries = entries + 1; END')
+            self._connection.execute('CREATE TRIGGER IF NOT EXISTS requests_deleted AFTER DELETE ON requests '
+                                     'BEGIN UPDATE stats SET entries = entries - 1; END')
+        return self._connection
+
+
+class IdempotencyGuard:
+    """
+    Deduplicates requests using an idempotency store. Only successful responses are stored, after a failed request
+    its key is released, so that retries are processed again.
+    """
+
+    def __init__(self, store, wait_timeout=30.0, hash_body=True):
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self.hash_body = hash_body
+        self._counters = {'requests': 0, 'replayed': 0, 'stored': 0, 'conflicts': 0}
+        self._lock = threading.Lock()
+
+    def create_key(self, idempotency_key: Optional[str], body: bytes, variant: str = '') \
+            -> Optional[Tuple[bytes, bytes]]:
+        """
+        Creates the key identifying a request and the fingerprint of its body.
+
+        :param idempotency_key: Value of the `Idempotency-Key` header or None if not given.
+        :param body: Request body.
+        :param variant: Further request attributes the response depends on, e.g. the route and the accepted
+                        response format.
+        :return: Tuple of (key, fingerprint) or None if the request is not deduplicated, i.e. no idempotency key is
+                 given and body hashing is disabled.
+        """
+        if idempotency_key is None and not self.hash_body:
+            return None
+
+        fingerprint = hashlib.blake2b(body, digest_size=16).digest()
+        identity = idempotency_key.encode('utf-8') if idempotency_key is not None else fingerprint
+        key = hashlib.blake2b(variant.encode('utf-8') + b'\0' + identity, digest_size=16).digest()
+        return key, fingerprint
+
+    def execute(self, key: bytes, fingerprint: bytes, process: Callable[[], StoredResponse]) \
+            -> Tuple[StoredResponse, bool]:
+        """
+        Processes a request unless the response of a request with the same key is stored.
+
+        :param key: Idempotency key.
+        :param fingerprint: Fingerprint of the request body.
+        :param process: Function processing the request.
+        :return: Tuple of (response, whether the response was replayed from the store).
+        :raises IdempotencyConflictError: If the key was used for a different request body or the request with the
+                                          same key did not finish within `wait_timeout` seconds.
+        """
+        self._increment('requests')
+        try:
+            stored = self.store.claim(key, fingerprint, self.wait_timeout)
+        except IdempotencyConflictError:
+            self._increment('conflicts')
+            raise
+
+        if stored is not None:
+            self._increment('replayed')
+            return stored, True
+
+        try:
+            response = process()
+        except BaseException:
+            self.store.release(key)
+            raise
+
+        if 200 <= response.status < 300:
+            self.store.complete(key, response)
+            self._increment('stored')
+        else:
+            self.store.release(key)
+        return response, False
+
+    def metrics(self) -> dict:
+        """
+        Returns the number of deduplicated requests, of responses replayed from and stored in the idempotency
+        store and of conflicting requests, and the statistics of the store.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            metrics = dict(self._counters)  # type: dict
+        metrics.update(self.store.stats())
+        return metrics
+
+    def _increment(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+
+def create_idempotency_store(backend: str, max_entries: int, ttl: float, lease: float, path: str):
+    """
+    Creates an idempotency store, either `memory` for a store per worker process or `sqlite` for a store shared
+    across worker processes.
+
+    :param backend: Name of the backend.
+    :param max_entries: Maximum number of stored responses.
+    :param ttl: Time to live of stored responses in seconds.
+    :param lease: Maximum time in seconds a request in progress blocks duplicates.
+    :param path: Path of the database file used by the `sqlite` backend.
+    :return: Idempotency store.
+    """
+    if backend == 'memory':
+        return InMemoryIdempotencyStore(max_entries=max_entries, ttl=ttl, lease=lease)
+    if backend == 'sqlite':
+        return SqliteIdempotencyStore(path=path, max_entries=max_entries, ttl=ttl, lease=lease)
+    raise ValueError('Unsupported idempotency store: [{}].'.format(backend))
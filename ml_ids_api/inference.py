@@ -0,0 +1,251 @@
+"""
+Module containing the prediction backends of the service. Predictions are requested either from an Amazon SageMaker
+endpoint (`AwsSagemakerHttpClient`) or computed in-process by an exported ML-IDS model (`LocalModelPredictor`).
+"""
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from itertools import chain
+from operator import itemgetter
+from typing import Any, List
+import json
+import os
+import numpy as np
+
+from ml_ids_api.data import deserialize_split_frame
+
+MANIFEST_FILE = 'model.json'
+
+# layers without effect at inference time
+KERAS_INFERENCE_NOOP_LAYERS = ('InputLayer', 'Dropout', 'GaussianNoise', 'GaussianDropout')
+
+
+class Predictor(ABC):
+    """
+    Interface of the prediction backends. Clients splitting, combining or caching prediction requests expose the same
+    interface as the backend they wrap.
+    """
+
+    @abstractmethod
+    def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Requests predictions for a Pandas DataFrame in `split-JSON` format.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        """
+
+
+class LocalModel:
+    """
+    An ML-IDS classifier exported as NumPy arrays: a feed-forward network over the standardized feature columns with
+    ReLU activations in the hidden layers and a sigmoid output. Network flows with an attack probability above
+    `threshold` are classified as attacks.
+
+    The artifacts of the training pipeline, a Keras network and the scikit-learn `StandardScaler` fitted on the
+    training data, are converted once by `from_keras` and exported by `save`. The service then only requires NumPy.
+    """
+
+    def __init__(self, columns: List[str], mean: np.ndarray, scale: np.ndarray, weights: List[np.ndarray],
+                 biases: List[np.ndarray], threshold: float = 0.5):
+        if len(weights) != len(biases) or not weights:
+            raise ValueError('Expected a bias vector per weight matrix.')
+        if not 0 < threshold < 1:
+            raise ValueError('Expected a threshold between 0 and 1, got [{}].'.format(threshold))
+
+        self.columns = columns
+        self.mean = mean
+        self.scale = scale
+        self.weights = weights
+        self.biases = biases
+        self.threshold = threshold
+        self.logit_threshold = np.log(threshold / (1 - threshold))
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Classifies the given network flows. Missing and infinite feature values are treated as zero.
+
+        :param features: Matrix of feature values, one row per network flow, in the order of `columns`.
+        :return: Array of binary predictions `[0, 1]` per network flow.
+        """
+        activations = np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0)
+        activations = (activations - self.mean) / self.scale
+
+        for weights, bias in zip(self.weights[:-1], self.biases[:-1]):
+            activations = np.maximum(activations @ weights + bias, 0.0)
+
+        # sigmoid(z) > threshold is equivalent to z > logit(threshold)
+        logits = activations @ self.weights[-1] + self.biases[-1]
+        return (logits[:, 0] > self.logit_threshold).astype(np.int64)
+
+    @staticmethod
+    def from_keras(model: Any, scaler: Any, columns: List[str], threshold: float = 0.5) -> 'LocalModel':
+        """
+        Converts a trained Keras network of `Dense` layers with ReLU activations in the hidden layers and a single
+        sigmoid output unit. Layers without effect at inference time, e.g. `Dropout`, are skipped.
+
+        :param model: Keras model, e.g. loaded by `tf.keras.models.load_model`.
+        :param scaler: Fitted scikit-learn `StandardScaler` standardizing the feature columns.
+        :param columns: Feature columns in the order of the model inputs.
+        :param threshold: Attack probability above which network flows are classified as attacks.
+        :return: Model.
+        :raises ValueError: If the network contains unsupported layers or activations or the threshold is invalid.
+        """
+        weights = []
+        biases = []
+        activations = []
+        for layer in model.layers:
+            layer_type = type(layer).__name__
+            if layer_type in KERAS_INFERENCE_NOOP_LAYERS:
+                continue
+            if layer_type != 'Dense':
+                raise ValueError('Unsupported Keras layer: [{}].'.format(layer_type))
+
+            layer_weights, layer_bias = layer.get_weights()
+            weights.append(np.asarray(layer_weights, dtype=np.float64))
+            biases.append(np.asarray(layer_bias, dtype=np.float64))
+            activations.append(layer.get_config()['activation'])
+
+        if not weights or any(activation != 'relu' for activation in activations[:-1]):
+            raise ValueError('Expected Dense layers with ReLU activations, got: {}.'.format(activations))
+        if activations[-1] != 'sigmoid' or weights[-1].shape[1] != 1:
+            raise ValueError('Expected a single sigmoid output unit.')
+
+        return LocalModel(columns=list(columns),
+                          mean=np.asarray(scaler.mean_, dtype=np.float64),
+                          scale=np.asarray(scaler.scale_, dtype=np.float64),
+                          weights=weights,
+                          biases=biases,
+                          threshold=threshold)
+
+    def save(self, path: str) -> None:
+        """
+        Exports the model to the given directory, writing a manifest and one `.npy` file per array.
+
+        :param path: Directory of the model artifact.
+        :return: None
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = {'mean': self.mean, 'scale': self.scale}
+        arrays.update({'weights_{}'.format(i): weights for i, weights in enumerate(self.weights)})
+        arrays.update({'bias_{}'.format(i): bias for i, bias in enumerate(self.biases)})
+
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), np.asarray(array, dtype=np.float64))
+
+        with open(os.path.join(path, MANIFEST_FILE), 'w') as manifest:
+            json.dump({'columns': self.columns, 'layers': len(self.weights), 'threshold': self.threshold}, manifest)
+
+    @staticmethod
+    def load(path: str) -> 'LocalModel':
+        """
+        Loads a model artifact from the given directory. Arrays are memory-mapped read-only, so that their pages are
+        shared by all processes loading the same artifact.
+
+        :param path: Directory of the model artifact.
+        :return: Model.
+        :raises ValueError: If the manifest declares an invalid threshold or a bias vector is missing.
+        """
+        with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+            manifest = json.load(manifest_file)
+
+        def load_array(name):
+            # a plain array view of the memory map avoids the overhead of `np.memmap` results
+            return np.asarray(np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+
+        layers = range(manifest['layers'])
+        return LocalModel(columns=manifest['columns'],
+                          mean=load_array('mean'),
+                          scale=load_array('scale'),
+                          weights=[load_array('weights_{}'.format(i)) for i in layers],
+                          biases=[load_array('bias_{}'.format(i)) for i in layers],
+                          threshold=manifest['threshold'])
+
+
+@lru_cache(maxsize=None)
+def load_model(path: str) -> LocalModel:
+    """
+    Loads the model artifact from the given directory once per process. Models loaded by the gunicorn master before
+    the workers are forked are shared by all workers.
+
+    :param path: Directory of the model artifact.
+    :return: Model.
+    """
+    return LocalModel.load(path)
+
+
+class LocalModelPredictor(Predictor):
+    """
+    Predictor classifying network flows in-process using an exported ML-IDS model, avoiding the network round trip
+    to SageMaker. Requests may contain additional columns not used by the model, e.g. `timestamp`.
+    """
+
+    def __init__(self, model: LocalModel):
+        self.model = model
+
+    def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Classifies the network flows of a Pandas DataFrame in `split-JSON` format.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        :raises ValueError: If the request body is invalid, a feature column is missing or a feature is not numeric.
+        """
+        data = deserialize_split_frame(request_body)
+        if not data.data:
+            return []
+
+        positions = {column: i for i, column in enumerate(data.columns)}
+        missing = [column for column in self.model.columns if column not in positions]
+        if missing:
+            raise ValueError('Missing feature columns: {}.'.format(missing))
+
+        indices = [positions[column] for column in self.model.columns]
+        return self.model.predict(create_feature_matrix(data.data, indices)).tolist()
+
+
+class AsyncLocalModelPredictor:
+    """
+    Asynchronous counterpart of `LocalModelPredictor`. Predictions are computed on the event loop, vectorized
+    inference of typical requests takes less time than handing them over to a thread.
+    """
+
+    def __init__(self, predictor: LocalModelPredictor):
+        self.predictor = predictor
+
+    async def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        See `LocalModelPredictor.post_invocations`.
+        """
+        return self.predictor.post_invocations(request_body)
+
+    async def close(self) -> None:
+        """
+        Releases no resources, provided for compatibility with the asynchronous SageMaker client.
+
+        :return: None
+        """
+
+
+def create_feature_matrix(rows: List[List[Any]], indices: List[int]) -> np.ndarray:
+    """
+    Selects the given columns of the rows as matrix of 64-bit floats. Missing values (`null`) are converted to NaN.
+    The values are streamed into a preallocated array, falling back to the slower conversion of nested lists,
+    which supports missing values, only if a value cannot be converted.
+
+    :param rows: Rows of a SplitFrame.
+    :param indices: Positions of the feature columns.
+    :return: Feature matrix.
+    :raises ValueError: If a feature value is not numeric.
+    """
+    select = itemgetter(*indices)
+    values = map(select, rows) if len(indices) == 1 else chain.from_iterable(map(select, rows))
+
+    try:
+        return np.fromiter(values, dtype=np.float64, count=len(rows) * len(indices)).reshape(len(rows), len(indices))
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        return np.array([[row[i] for i in indices] for row in rows], dtype=np.float64)
+    except (TypeError, ValueError) as err:
+        raise ValueError('Feature values must be numeric: {}'.format(err))
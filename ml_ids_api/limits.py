@@ -0,0 +1,116 @@
+"""
+Module providing the limits of the size of prediction requests. Requests declaring a `Content-Length` above the byte
+limit are rejected before their body is read. Bodies of unknown length, e.g. sent with chunked transfer encoding, are
+counted while they are read, failing as soon as the limit is exceeded, so that a worker never buffers more than the
+limit. The byte limit bounds the memory of a worker, the optional limit of the number of network flows is checked
+once the body is deserialized, before SageMaker is invoked.
+"""
+from typing import AsyncIterator, BinaryIO, Optional
+
+from ml_ids_api.compression import CHUNK_BYTES, PayloadTooLargeError
+
+
+class TooManyRowsError(Exception):
+    """
+    A prediction request containing more network flows than allowed.
+    """
+
+    def __init__(self, limit, rows):
+        self.limit = limit
+        self.rows = rows
+        super(TooManyRowsError, self).__init__()
+
+    def __str__(self):
+        return 'Request contains {} network flows, exceeding the maximum of {} flows per request.' \
+            .format(self.rows, self.limit)
+
+
+class BoundedReader:
+    """
+    Binary stream wrapper failing with `PayloadTooLargeError` as soon as more than `max_bytes` bytes are read.
+    Reading the complete stream reads it in chunks, so that at most `max_bytes` plus one chunk are buffered.
+    """
+
+    def __init__(self, stream: BinaryIO, max_bytes: int):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Reads up to `size` bytes, or the complete stream if `size` is negative.
+
+        :param size: Maximum number of bytes to read.
+        :return: Bytes read, empty at the end of the stream.
+        :raises PayloadTooLargeError: If the stream exceeds `max_bytes`.
+        """
+        if size is not None and size >= 0:
+            return self._count(self.stream.read(size))
+
+        chunks = []
+        chunk = self._count(self.stream.read(CHUNK_BYTES))
+        while chunk:
+            chunks.append(chunk)
+            chunk = self._count(self.stream.read(CHUNK_BYTES))
+        return b''.join(chunks)
+
+    def readline(self, size: int = -1) -> bytes:
+        """
+        Reads a single line of at most `size` bytes.
+
+        :param size: Maximum number of bytes to read.
+        :return: Line including its line break, empty at the end of the stream.
+        :raises PayloadTooLargeError: If the stream exceeds `max_bytes`.
+        """
+        return self._count(self.stream.readline(size))
+
+    def _count(self, data):
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise PayloadTooLargeError(self.max_bytes)
+        return data
+
+
+def check_content_length(content_length: Optional[int], max_bytes: Optional[int]) -> None:
+    """
+    Checks the declared size of a request body before it is read.
+
+    :param content_length: Value of the `Content-Length` header or None if not present.
+    :param max_bytes: Maximum size of the body in bytes, None if unlimited.
+    :return: None
+    :raises PayloadTooLargeError: If the declared size exceeds `max_bytes`.
+    """
+    if max_bytes is not None and content_length is not None and content_length > max_bytes:
+        raise PayloadTooLargeError(max_bytes)
+
+
+def check_rows(rows: int, max_rows: Optional[int]) -> None:
+    """
+    Checks the number of network flows of a prediction request.
+
+    :param rows: Number of network flows.
+    :param max_rows: Maximum number of network flows, None if unlimited.
+    :return: None
+    :raises TooManyRowsError: If the request contains more than `max_rows` network flows.
+    """
+    if max_rows is not None and rows > max_rows:
+        raise TooManyRowsError(max_rows, rows)
+
+
+async def read_chunks(chunks: AsyncIterator[bytes], max_bytes: Optional[int]) -> bytes:
+    """
+    Reads a request body received in chunks, e.g. by the ASGI application.
+
+    :param chunks: Asynchronous iterator of body chunks.
+    :param max_bytes: Maximum size of the body in bytes, None if unlimited.
+    :return: Request body.
+    :raises PayloadTooLargeError: If the body exceeds `max_bytes`.
+    """
+    body = []
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise PayloadTooLargeError(max_bytes)
+        body.append(chunk)
+    return b''.join(body)
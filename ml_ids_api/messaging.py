@@ -1,36 +1,542 @@
 """
 Module providing facilities to publish messages to the Amazon SNS service.
 """
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Union
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import numpy as np
 import pandas as pd
+from pandas.io.json import dumps as pandas_json_dumps
+
+from ml_ids_api.aggregation import Digest
+from ml_ids_api.aws.client.sns_client import SNSMessage
+from ml_ids_api.compression import compress_text, supported_encodings
+from ml_ids_api.data import SplitFrame, count_rows
+from ml_ids_api.metrics import NoopMetrics
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PublishPolicy:
+    """
+    Policy selecting the predictions to publish. The `all` policy publishes every prediction, the `attacks` policy
+    only attack predictions and the `sampled` policy attack predictions plus a random fraction of benign predictions,
+    e.g. for monitoring purposes.
+    """
+    ALL = 'all'
+    ATTACKS = 'attacks'
+    SAMPLED = 'sampled'
+
+    def __init__(self, mode=ALL, benign_sample_rate=0.0, seed=None):
+        if mode not in (PublishPolicy.ALL, PublishPolicy.ATTACKS, PublishPolicy.SAMPLED):
+            raise ValueError('Unsupported publish policy: [{}].'.format(mode))
+
+        self.mode = mode
+        self.benign_sample_rate = benign_sample_rate
+        self.seed = seed
+        self.random = np.random.default_rng(seed)
+        self._pid = os.getpid()
+
+    def select(self, data: Union[pd.DataFrame, SplitFrame]) -> Union[pd.DataFrame, SplitFrame]:
+        """
+        Selects the rows of the given Pandas DataFrame or SplitFrame to publish. The index of the selected rows is
+        retained.
+
+        :param data: Pandas DataFrame or SplitFrame containing feature data and predictions.
+        :return: Pandas DataFrame or SplitFrame containing the selected rows.
+        """
+        if self.mode == PublishPolicy.ALL or count_rows(data) == 0:
+            return data
+
+        return select_rows(data, self._create_mask(prediction_values(data)))
+
+    def _create_mask(self, predictions):
+        mask = predictions == 1
+        if self.mode == PublishPolicy.SAMPLED:
+            if self.seed is None and self._pid != os.getpid():
+                # unseeded generators are reseeded in forked workers, which would otherwise sample the same rows
+                self.random = np.random.default_rng()
+                self._pid = os.getpid()
+            mask |= self.random.random(len(predictions)) < self.benign_sample_rate
+        return mask
 
 
 class SNSMessageProducer:
     """
     Producer to publish messages to a specified Amazon SNS topic.
+    Messages are published individually if `batch_size` is 1, otherwise they are grouped into `PublishBatch` requests
+    containing up to `batch_size` messages. Predictions not selected by the publish policy are suppressed.
+    Failed requests are recorded by the given metrics. If a compression is given, message bodies are compressed and
+    Base64 encoded, the encoding is given by the `content_encoding` message attribute.
+
+    If an aggregator is given, attack predictions are published as digests of the aggregator instead of per flow.
+    Digests of expired windows are flushed by a background thread, the remaining digests on shutdown. Flushed digests
+    are handed to `digest_publisher`, which publishes them directly unless a wrapping producer replaces it, e.g. to
+    enqueue or spool them like the notifications of requests.
     """
 
-    def __init__(self, client, topic):
+    def __init__(self, client, topic, batch_size=1, policy=None, metrics=None, compression=None, aggregator=None):
         self.client = client
         self.topic = topic
+        self.batch_size = batch_size
+        self.policy = policy if policy is not None else PublishPolicy()
+        if compression is not None and compression not in supported_encodings():
+            raise ValueError('Unsupported SNS compression [{}]. Supported encodings: {}.'
+                             .format(compression, supported_encodings()))
+        self.compression = compression
+        self.aggregator = aggregator
+        self._metrics = metrics if metrics is not None else NoopMetrics()
+        self._counters = {'published': 0, 'suppressed': 0}
+        if aggregator is not None:
+            self._counters['aggregated'] = 0
+        self._lock = threading.Lock()
+        self._flusher = None  # type: Optional[threading.Thread]
+        self._stopped = threading.Event()
+        self.digest_publisher = self.publish_messages  # type: Callable[[List[SNSMessage]], None]
+
+    def publish_predictions(self, data: Union[pd.DataFrame, SplitFrame]) -> None:
+        """
+        Publish feature data and predictions from the given Pandas DataFrame or SplitFrame.
+
+        :param data: Pandas DataFrame or SplitFrame containing feature data and predictions.
+        :return: None
+        """
+        self.publish_messages(self.create_notifications(data))
+
+    def create_notifications(self, data: Union[pd.DataFrame, SplitFrame]) -> List[SNSMessage]:
+        """
+        Creates the SNS messages of the predictions selected by the publish policy.
+
+        :param data: Pandas DataFrame or SplitFrame containing feature data and predictions.
+        :return: List of SNS messages.
+        """
+        selected = self.policy.select(data)
+        self._increment('suppressed', count_rows(data) - count_rows(selected))
+
+        digests = []  # type: List[Digest]
+        if self.aggregator is not None:
+            attacks = prediction_values(selected) == 1
+            digests = self.aggregator.add(select_rows(selected, attacks))
+            selected = select_rows(selected, ~attacks)
+            self._increment('aggregated', int(attacks.sum()))
+            self._ensure_flusher()
+
+        if isinstance(selected, SplitFrame):
+            messages = self.create_split_frame_messages(selected)
+        else:
+            messages = self.create_messages(selected)
+
+        return self._compress([create_digest_message(digest) for digest in digests] + messages)
+
+    def flush(self, force=False) -> None:
+        """
+        Hands the digests of the expired aggregation windows to the digest publisher.
+
+        :param force: Flush the digests of all aggregation windows regardless of their age.
+        :return: None
+        """
+        if self.aggregator is not None:
+            messages = self._compress([create_digest_message(digest) for digest in self.aggregator.flush(force)])
+            if messages:
+                self.digest_publisher(messages)
+
+    def shutdown(self, timeout=None) -> None:
+        """
+        Stops the background flushing of expired digests and flushes the digests of all aggregation windows.
+
+        :param timeout: Maximum number of seconds to wait for the background thread, or `None` to wait indefinitely.
+        :return: None
+        """
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout)
+        self.flush(force=True)
 
-    def publish_predictions(self, data: pd.DataFrame) -> None:
+    def publish_messages(self, messages: List[SNSMessage]) -> None:
         """
-        Publish feature data and predictions from the given Pandas DataFrame.
+        Publishes the given SNS messages to the topic.
+
+        :param messages: SNS messages.
+        :return: None
+        """
+        if not messages:
+            return
+
+        try:
+            if self.batch_size > 1:
+                self.client.publish_batch(topic=self.topic, messages=messages, batch_size=self.batch_size)
+            else:
+                for message in messages:
+                    self.client.publish(topic=self.topic, message=message.message, attrs=message.attrs)
+        except Exception as err:
+            self._metrics.count_error('sns', err)
+            raise
+
+        self._increment('published', len(messages))
+
+    def metrics(self) -> dict:
+        """
+        Returns the number of published and suppressed messages.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def _increment(self, counter, value):
+        with self._lock:
+            self._counters[counter] += value
+
+    def _compress(self, messages):
+        if self.compression is not None:
+            return [compress_message(message, self.compression) for message in messages]
+        return messages
+
+    def _ensure_flusher(self):
+        if self._flusher is not None or self._stopped.is_set():
+            return
+
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_expired, name='sns-digest-flusher', daemon=True)
+                self._flusher.start()
+
+    def _flush_expired(self):
+        while not self._stopped.wait(self.aggregator.flush_interval):
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Failed to flush digests.')
+
+    @staticmethod
+    def create_messages(data: pd.DataFrame) -> List[SNSMessage]:
+        """
+        Creates one SNS message per row of the given Pandas DataFrame. Each message is the row serialized as
+        single-row DataFrame in `split-JSON` format, identical to `data.iloc[i:i + 1].to_json(orient='split')`.
+        All rows are converted to Python objects in a single pass, column dtypes are preserved by converting via the
+        `object` dtype, and encoded with the JSON encoder used by `DataFrame.to_json`.
 
         :param data: Pandas DataFrame containing feature data and predictions.
+        :return: List of SNS messages.
+        """
+        if len(data) == 0:
+            return []
+
+        rows = data.astype(object).values.tolist()
+        labels = np.where(data['prediction'].values == 1, 'attack', 'benign')
+        message_prefix = '{"columns":' + _to_json(data.columns.tolist()) + ',"index":['
+
+        return [SNSMessage(message=message_prefix + _to_json(index) + '],"data":[' + _to_json(row) + ']}',
+                           attrs=create_prediction_attrs(label))
+                for index, row, label in zip(data.index.astype(object), rows, labels)]
+
+    @staticmethod
+    def create_split_frame_messages(data: SplitFrame) -> List[SNSMessage]:
+        """
+        Creates one SNS message per row of the given SplitFrame. The messages use the same `split-JSON` layout as the
+        messages created from Pandas DataFrames, but contain the row values as submitted by the client.
+
+        :param data: SplitFrame containing feature data and a trailing `prediction` column.
+        :return: List of SNS messages.
+        """
+        message_prefix = '{"columns":' + json.dumps(data.columns, separators=(',', ':')) + ',"index":['
+        index = data.row_index if data.row_index is not None else range(len(data.data))
+        messages = []
+
+        for i, row in zip(index, data.data):
+            prediction = 'attack' if row[-1] == 1 else 'benign'
+            message = message_prefix + json.dumps(i) + '],"data":[' + json.dumps(row, separators=(',', ':')) + ']}'
+            messages.append(SNSMessage(message=message, attrs=create_prediction_attrs(prediction)))
+
+        return messages
+
+
+def _to_json(obj) -> str:
+    return pandas_json_dumps(obj, double_precision=10)
+
+
+def prediction_values(data: Union[pd.DataFrame, SplitFrame]) -> np.ndarray:
+    """
+    Returns the predictions of the given Pandas DataFrame or SplitFrame, given by the `prediction` column of
+    DataFrames and the trailing column of SplitFrames.
+
+    :param data: Pandas DataFrame or SplitFrame containing feature data and predictions.
+    :return: Array of predictions.
+    """
+    if isinstance(data, SplitFrame):
+        return np.array([row[-1] for row in data.data])
+    return data['prediction'].values
+
+
+def select_rows(data: Union[pd.DataFrame, SplitFrame], mask: np.ndarray) -> Union[pd.DataFrame, SplitFrame]:
+    """
+    Selects the rows of the given Pandas DataFrame or SplitFrame marked by the mask, retaining their index.
+
+    :param data: Pandas DataFrame or SplitFrame.
+    :param mask: Boolean array marking the rows to select.
+    :return: Pandas DataFrame or SplitFrame containing the selected rows.
+    """
+    if isinstance(data, SplitFrame):
+        index = data.row_index if data.row_index is not None else range(len(data.data))
+        selected = np.flatnonzero(mask).tolist()
+        return SplitFrame(columns=data.columns,
+                          data=[data.data[i] for i in selected],
+                          row_index=[index[i] for i in selected])
+
+    return data[mask]
+
+
+def create_digest_message(digest: Digest) -> SNSMessage:
+    """
+    Creates the SNS message of a digest of attack flows. The message is a JSON object containing the values of the
+    key columns (`key`), the number of flows (`count`), the first and last flow timestamp, the window bounds as Unix
+    time and the sample flows in `split-JSON` format (`samples`). Digests are marked as `attack` predictions and by
+    the `notification_type` attribute `digest`.
+
+    :param digest: Digest.
+    :return: SNS message.
+    """
+    attrs = create_prediction_attrs('attack')
+    attrs['notification_type'] = {'DataType': 'String', 'StringValue': 'digest'}
+    message = {
+        'key': digest.key,
+        'count': digest.flows,
+        'first_timestamp': digest.first_timestamp,
+        'last_timestamp': digest.last_timestamp,
+        'window_start': digest.window_start,
+        'window_end': digest.window_end,
+        'samples': {'columns': digest.columns, 'data': digest.samples}
+    }
+    return SNSMessage(message=_to_json(message), attrs=attrs)
+
+
+def compress_message(message: SNSMessage, encoding: str) -> SNSMessage:
+    """
+    Compresses the body of the given SNS message, adding a `content_encoding` attribute specifying the compression.
+    Subscribers restore the body using `ml_ids_api.compression.decompress_text`.
+
+    :param message: SNS message.
+    :param encoding: Content encoding, either `gzip` or `zstd`.
+    :return: Compressed SNS message.
+    """
+    attrs = dict(message.attrs)
+    attrs['content_encoding'] = {'DataType': 'String', 'StringValue': encoding}
+    return SNSMessage(message=compress_text(message.message, encoding), attrs=attrs)
+
+
+def create_prediction_attrs(prediction: str) -> dict:
+    """
+    Creates the SNS message attributes marking a message as `attack` or `benign` prediction.
+
+    :param prediction: Prediction label.
+    :return: SNS message attributes.
+    """
+    return {
+        'prediction': {
+            'DataType': 'String',
+            'StringValue': prediction
+        }
+    }
+
+
+class QueueFullPolicy:
+    """
+    Policies applied by the `AsyncMessageProducer` if the publishing queue is full.
+    """
+    BLOCK = 'block'
+    DROP = 'drop'
+
+
+class AsyncMessageProducer:
+    """
+    Producer publishing predictions in the background, decoupled from the request handling.
+    Published DataFrames are placed on a bounded in-process queue drained by a pool of worker threads delegating to a
+    synchronous producer. When running under gunicorn's gevent worker the threading primitives are monkey-patched,
+    hence the workers run as greenlets.
+
+    If the queue is full, the `block` policy waits up to `block_timeout` seconds (indefinitely if `None`) for a free
+    slot before dropping the predictions, whereas the `drop` policy discards them immediately. Digests flushed by the
+    wrapped producer are enqueued as well.
+    """
+
+    _SHUTDOWN = object()
+
+    def __init__(self, producer, queue_size=1000, workers=4, full_policy=QueueFullPolicy.BLOCK, block_timeout=None):
+        if full_policy not in (QueueFullPolicy.BLOCK, QueueFullPolicy.DROP):
+            raise ValueError('Unsupported queue full policy: [{}].'.format(full_policy))
+
+        self.producer = producer
+        self.workers = workers
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=queue_size)  # type: queue.Queue
+        self._threads = []  # type: List[threading.Thread]
+        self._lock = threading.Lock()
+        self._shutdown_lock = threading.Lock()
+        self._stopped = False
+        self._counters = {'enqueued': 0, 'published': 0, 'dropped': 0, 'failed': 0}
+        self._lag = {'last': 0.0, 'max': 0.0}
+        if hasattr(producer, 'digest_publisher'):
+            producer.digest_publisher = self._enqueue_digests
+
+    def publish_predictions(self, data: Union[pd.DataFrame, SplitFrame]) -> None:
+        """
+        Enqueues feature data and predictions from the given Pandas DataFrame or SplitFrame to be published in the
+        background.
+
+        :param data: Pandas DataFrame or SplitFrame containing feature data and predictions.
+        :return: None
+        """
+        if self._stopped:
+            raise RuntimeError('AsyncMessageProducer has been shut down.')
+
+        if not self._enqueue(self.producer.publish_predictions, data):
+            LOGGER.warning('Publishing queue is full. Dropped predictions for %d flows.', count_rows(data))
+
+    def shutdown(self, timeout=None) -> None:
+        """
+        Stops accepting new predictions and waits until all enqueued predictions have been published.
+
+        :param timeout: Maximum number of seconds to wait for each worker to finish, or `None` to wait indefinitely.
         :return: None
         """
-        for i in range(0, len(data)):
-            sample = data.iloc[i:i + 1]
+        with self._shutdown_lock:
+            with self._lock:
+                if self._stopped:
+                    return
+                self._stopped = True
+                threads = list(self._threads)
 
-            prediction = 'attack' if sample.iloc[0]['prediction'] == 1 else 'benign'
-            message = sample.to_json(orient='split')
+            for _ in threads:
+                self.queue.put(self._SHUTDOWN)
 
-            self.client.publish(topic=self.topic,
-                                message=message,
-                                attrs={
-                                    'prediction': {
-                                        'DataType': 'String',
-                                        'StringValue': prediction
-                                    }
-                                })
+        for thread in threads:
+            thread.join(timeout)
+
+        if hasattr(self.producer, 'shutdown'):
+            # the open digests of the wrapped producer are published once the enqueued predictions are published
+            self.producer.shutdown(timeout)
+
+    def metrics(self) -> dict:
+        """
+        Returns the current queue depth, the lag between enqueuing and publishing in seconds and the number of
+        enqueued, published, dropped and failed predictions.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            return dict(queue_depth=self.queue.qsize(),
+                        last_lag=self._lag['last'],
+                        max_lag=self._lag['max'],
+                        **self._counters)
+
+    def _enqueue(self, publish, payload):
+        self._ensure_started()
+
+        try:
+            if self.full_policy == QueueFullPolicy.DROP:
+                self.queue.put_nowait((time.monotonic(), publish, payload))
+            else:
+                self.queue.put((time.monotonic(), publish, payload), timeout=self.block_timeout)
+            self._increment('enqueued')
+            return True
+        except queue.Full:
+            self._increment('dropped')
+            return False
+
+    def _enqueue_digests(self, messages):
+        with self._shutdown_lock:
+            if not self._stopped:
+                if not self._enqueue(self.producer.publish_messages, messages):
+                    LOGGER.warning('Publishing queue is full. Dropped %d digests.', len(messages))
+                return
+
+        # digests flushed after the workers have been stopped are published directly
+        self.producer.publish_messages(messages)
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+
+        with self._lock:
+            if self._threads:
+                return
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name='sns-publisher-{}'.format(i), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+
+            try:
+                if item is self._SHUTDOWN:
+                    return
+
+                enqueued_at, publish, payload = item
+                self._record_lag(time.monotonic() - enqueued_at)
+                publish(payload)
+                self._increment('published')
+            except Exception:  # pylint: disable=broad-except
+                self._increment('failed')
+                LOGGER.exception('Failed to publish predictions.')
+            finally:
+                self.queue.task_done()
+
+    def _increment(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _record_lag(self, lag):
+        with self._lock:
+            self._lag['last'] = lag
+            self._lag['max'] = max(self._lag['max'], lag)
+
+
+class ExecutorMessageProducer:
+    """
+    Adapter exposing the `publish_predictions` method of a synchronous producer as coroutine, used by the ASGI
+    application. The blocking SNS requests are run in a pool of `workers` threads, so the event loop keeps serving
+    requests while notifications are published.
+    """
+
+    def __init__(self, producer, workers=10):
+        self.producer = producer
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sns-executor')
+
+    async def publish_predictions(self, data: Union[pd.DataFrame, SplitFrame]) -> None:
+        """
+        Publish feature data and predictions from the given Pandas DataFrame or SplitFrame without blocking the event
+        loop.
+
+        :param data: Pandas DataFrame or SplitFrame containing feature data and predictions.
+        :return: None
+        """
+        await asyncio.get_event_loop().run_in_executor(self.executor, self.producer.publish_predictions, data)
+
+    def shutdown(self, timeout=None) -> None:
+        """
+        Waits until all pending notifications have been published and shuts down the wrapped producer if supported.
+
+        :param timeout: Maximum number of seconds to wait for the wrapped producer, or `None` to wait indefinitely.
+        :return: None
+        """
+        self.executor.shutdown(wait=True)
+        if hasattr(self.producer, 'shutdown'):
+            self.producer.shutdown(timeout)
+
+    def metrics(self) -> dict:
+        """
+        Returns the metrics of the wrapped producer.
+
+        :return: Dictionary of metrics.
+        """
+        return self.producer.metrics()
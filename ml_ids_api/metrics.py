@@ -0,0 +1,282 @@
+"""
+Module providing Prometheus metrics of the ML-IDS service: latency histograms per request stage, request and row
+counters, payload size histograms, error counters of the SageMaker and SNS services, gauges of in-flight requests and
+the state of the SageMaker concurrency limiter and circuit breaker, and the counters and statistics of the registered
+service components, e.g. the SNS producer or the prediction cache.
+Requires `prometheus_client`, which is imported when the metrics are created, i.e. not at all if metrics are disabled.
+
+Metrics of all gunicorn worker processes are aggregated if the environment variable `PROMETHEUS_MULTIPROC_DIR` points
+to an empty directory shared by the workers before they are started (see `entrypoint.sh`). Each worker then records
+its metrics in memory-mapped files of that directory, which are merged when the metrics are collected. The component
+metrics are exported per worker, labelled by its process id.
+"""
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Dict, Optional, Tuple
+import os
+import time
+
+from ml_ids_api.util.import_utils import import_module, is_installed
+
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+
+STAGES = ('validate', 'deserialize', 'sign', 'invoke', 'merge', 'publish', 'serialize')
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PAYLOAD_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+
+CIRCUIT_STATES = ('closed', 'half_open', 'open')
+
+SOURCE_REFRESH_SECONDS = 10.0
+
+_NULL_CONTEXT = nullcontext()
+
+
+class NoopMetrics:
+    """
+    Metrics discarding all observations, used if metrics are disabled. Stage timers are a shared no-op context
+    manager, instrumented code paths only pay for a method call.
+    """
+    enabled = False
+
+    def stage(self, name: str) -> ContextManager:  # pylint: disable=unused-argument,no-self-use
+        """
+        Returns a context manager measuring the duration of the given request stage.
+
+        :param name: Name of the stage, one of `STAGES`.
+        :return: Context manager.
+        """
+        return _NULL_CONTEXT
+
+    def request_started(self, route: str) -> None:
+        """
+        Records the start of a request.
+
+        :param route: Route of the request.
+        :return: None
+        """
+
+    def request_finished(self, route: str, status: int, duration: float, request_bytes: Optional[int],
+                         response_bytes: Optional[int]) -> None:
+        """
+        Records the end of a request.
+
+        :param route: Route of the request.
+        :param status: Status code of the response.
+        :param duration: Duration of the request in seconds.
+        :param request_bytes: Size of the request body in bytes or None if unknown.
+        :param response_bytes: Size of the response body in bytes or None if unknown, e.g. for streaming responses.
+        :return: None
+        """
+
+    def count_rows(self, rows: int) -> None:
+        """
+        Records the number of network flows of a prediction request.
+
+        :param rows: Number of network flows.
+        :return: None
+        """
+
+    def count_error(self, service: str, err: Exception) -> None:
+        """
+        Records a failed request to the given AWS service.
+
+        :param service: Name of the service, either `sagemaker` or `sns`.
+        :param err: Error of the failed request.
+        :return: None
+        """
+
+    def count_rejection(self, reason: str) -> None:
+        """
+        Records a prediction request rejected without invoking SageMaker.
+
+        :param reason: Reason of the rejection, either `concurrency` or `circuit_open`.
+        :return: None
+        """
+
+    def update_limiter(self, limit: int, in_flight: int, circuit_state: str) -> None:
+        """
+        Records the state of the concurrency limiter and the circuit breaker of the SageMaker invocations.
+
+        :param limit: Current concurrency limit.
+        :param in_flight: Number of SageMaker invocations in progress.
+        :param circuit_state: State of the circuit breaker, one of `CIRCUIT_STATES`.
+        :return: None
+        """
+
+    def register_source(self, component: str, source: Callable[[], dict]) -> None:
+        """
+        Registers the counters and statistics of a service component, exported whenever the metrics are collected.
+
+        :param component: Name of the component.
+        :param source: Function returning the metrics of the component, e.g. its `metrics` method.
+        :return: None
+        """
+
+
+class PrometheusMetrics(NoopMetrics):
+    """
+    Metrics recorded using `prometheus_client`. Metrics are registered in a registry of their own, multiple instances
+    can coexist in a process.
+    """
+    enabled = True
+
+    def __init__(self):
+        if not is_installed('prometheus_client'):
+            raise ValueError('Metrics require the package [prometheus_client].')
+
+        prometheus_client = import_module('prometheus_client')
+        self.registry = prometheus_client.CollectorRegistry()
+
+        stage_duration = prometheus_client.Histogram('ml_ids_stage_duration_seconds',
+                                                     'Duration of the stages of prediction requests.',
+                                                     ['stage'], buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.request_duration = prometheus_client.Histogram('ml_ids_request_duration_seconds',
+                                                            'Duration of HTTP requests.',
+                                                            ['route'], buckets=LATENCY_BUCKETS,
+                                                            registry=self.registry)
+        self.requests = prometheus_client.Counter('ml_ids_requests', 'Number of HTTP requests.',
+                                                  ['route', 'status'], registry=self.registry)
+        self.rows = prometheus_client.Counter('ml_ids_rows', 'Number of network flows of prediction requests.',
+                                              registry=self.registry)
+        self.payload_size = prometheus_client.Histogram('ml_ids_payload_bytes',
+                                                        'Size of request and response bodies in bytes.',
+                                                        ['route', 'direction'], buckets=PAYLOAD_BUCKETS,
+                                                        registry=self.registry)
+        self.errors = prometheus_client.Counter('ml_ids_backend_errors', 'Number of failed AWS service requests.',
+                                                ['service', 'code'], registry=self.registry)
+        self.in_flight = prometheus_client.Gauge('ml_ids_requests_in_flight', 'Number of requests in progress.',
+                                                 ['route'], multiprocess_mode='livesum', registry=self.registry)
+
+        self.rejections = prometheus_client.Counter('ml_ids_rejected_requests',
+                                                    'Number of prediction requests rejected without invoking '
+                                                    'SageMaker.', ['reason'], registry=self.registry)
+        self.concurrency_limit = prometheus_client.Gauge('ml_ids_sagemaker_concurrency_limit',
+                                                         'Concurrency limit of SageMaker invocations.',
+                                                         multiprocess_mode='livesum', registry=self.registry)
+        self.invocations_in_flight = prometheus_client.Gauge('ml_ids_sagemaker_invocations_in_flight',
+                                                             'Number of SageMaker invocations in progress.',
+                                                             multiprocess_mode='livesum', registry=self.registry)
+        self.circuit_state = prometheus_client.Gauge('ml_ids_sagemaker_circuit_state',
+                                                     'State of the SageMaker circuit breaker: 0 closed, '
+                                                     '1 half-open, 2 open.',
+                                                     multiprocess_mode='livemax', registry=self.registry)
+
+        # counters are per worker whereas the statistics of stores shared by the workers are not, values are not summed
+        self.component_metrics = prometheus_client.Gauge('ml_ids_component_metrics',
+                                                         'Counters and statistics of the service components.',
+                                                         ['component', 'name'], multiprocess_mode='liveall',
+                                                         registry=self.registry)
+        self.sources = {}  # type: Dict[str, Callable[[], dict]]
+        self._sources_refreshed = 0.0
+
+        self.stages = {stage: stage_duration.labels(stage) for stage in STAGES}
+
+    def stage(self, name: str) -> ContextManager:
+        return self.stages[name].time()
+
+    def request_started(self, route: str) -> None:
+        self.in_flight.labels(route).inc()
+
+    def request_finished(self, route: str, status: int, duration: float, request_bytes: Optional[int],
+                         response_bytes: Optional[int]) -> None:
+        self.in_flight.labels(route).dec()
+        self.requests.labels(route, str(status)).inc()
+        self.request_duration.labels(route).observe(duration)
+
+        if request_bytes is not None:
+            self.payload_size.labels(route, 'request').observe(request_bytes)
+        if response_bytes is not None:
+            self.payload_size.labels(route, 'response').observe(response_bytes)
+
+        # workers not serving the `/metrics` endpoint refresh their component metrics periodically
+        if self.sources and time.monotonic() - self._sources_refreshed >= SOURCE_REFRESH_SECONDS:
+            self.refresh_sources()
+
+    def count_rows(self, rows: int) -> None:
+        self.rows.inc(rows)
+
+    def count_error(self, service: str, err: Exception) -> None:
+        self.errors.labels(service, error_code(err)).inc()
+
+    def count_rejection(self, reason: str) -> None:
+        self.rejections.labels(reason).inc()
+
+    def update_limiter(self, limit: int, in_flight: int, circuit_state: str) -> None:
+        self.concurrency_limit.set(limit)
+        self.invocations_in_flight.set(in_flight)
+        self.circuit_state.set(CIRCUIT_STATES.index(circuit_state))
+
+    def register_source(self, component: str, source: Callable[[], dict]) -> None:
+        self.sources[component] = source
+
+    def refresh_sources(self) -> None:
+        """
+        Records the current metrics of the registered components. Values which are not numbers, e.g. the state of a
+        circuit breaker, are skipped.
+
+        :return: None
+        """
+        self._sources_refreshed = time.monotonic()
+        for component, source in self.sources.items():
+            for name, value in source().items():
+                if isinstance(value, (int, float)):
+                    self.component_metrics.labels(component, name).set(value)
+
+    def generate(self) -> Tuple[bytes, str]:
+        """
+        Collects the metrics in the Prometheus text format, aggregated across worker processes if
+        `PROMETHEUS_MULTIPROC_DIR` is set.
+
+        :return: Tuple of (metrics, content type).
+        """
+        self.refresh_sources()
+
+        prometheus_client = import_module('prometheus_client')
+        registry = self.registry
+        if os.environ.get(MULTIPROC_DIR_ENV):
+            registry = prometheus_client.CollectorRegistry()
+            import_module('prometheus_client.multiprocess').MultiProcessCollector(registry)
+
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def error_code(err: Exception) -> str:
+    """
+    Returns the HTTP status code of the response causing the given error, or the name of the error type if no
+    response was received.
+
+    :param err: Error of a failed SageMaker or SNS request.
+    :return: Status code or error name.
+    """
+    status = getattr(err, 'status_code', None)
+
+    response = getattr(err, 'response', None)
+    if status is None and isinstance(response, dict):
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+
+    return str(status) if status is not None else type(err).__name__
+
+
+def create_metrics(config):
+    """
+    Creates the metrics of the service, either `PrometheusMetrics` if `METRICS_ENABLED` is set or `NoopMetrics`.
+
+    :param config: Application configuration.
+    :return: Metrics.
+    """
+    if config['METRICS_ENABLED']:
+        return PrometheusMetrics()
+    return NoopMetrics()
+
+
+def mark_worker_dead(pid: int) -> None:
+    """
+    Removes the live gauge values of an exited worker process from the aggregated metrics. To be invoked by the
+    gunicorn `child_exit` hook.
+
+    :param pid: Process id of the worker.
+    :return: None
+    """
+    if os.environ.get(MULTIPROC_DIR_ENV) and is_installed('prometheus_client'):
+        import_module('prometheus_client.multiprocess').mark_process_dead(pid)
@@ -0,0 +1,293 @@
+"""
+Module providing facilities to protect the service and the SageMaker endpoint from overload: an adaptive concurrency
+limit of SageMaker invocations and a circuit breaker failing requests fast while the endpoint is unavailable.
+Rejected requests are answered with `503 - Service Unavailable` and a `Retry-After` header.
+"""
+from typing import List, Optional
+import math
+import threading
+import time
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError
+from ml_ids_api.inference import Predictor
+from ml_ids_api.metrics import NoopMetrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ServiceUnavailableError(Exception):
+    """
+    A prediction request rejected without invoking SageMaker, because the concurrency limit is reached or the circuit
+    breaker is open.
+    """
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = retry_after
+        super(ServiceUnavailableError, self).__init__()
+
+    def __str__(self):
+        return 'SageMaker endpoint unavailable: [{}]. Retry after [{}] seconds.'.format(self.reason, self.retry_after)
+
+
+class AimdLimiter:
+    """
+    Concurrency limit adapted by additive increase and multiplicative decrease (AIMD). The limit grows by one after
+    a successful invocation while at least half of the limit is in use, and shrinks by `backoff_ratio` after an
+    invocation failed due to overload or took longer than `latency_threshold` seconds. Invocations exceeding the
+    limit are rejected instead of queued.
+    """
+
+    def __init__(self, initial_limit=20, min_limit=1, max_limit=200, backoff_ratio=0.9, latency_threshold=5.0):
+        if not 0 < backoff_ratio < 1:
+            raise ValueError('The backoff ratio must be between 0 and 1.')
+        if not 0 < min_limit <= initial_limit <= max_limit:
+            raise ValueError('Expected 0 < min_limit <= initial_limit <= max_limit.')
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_threshold = latency_threshold
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        """
+        Current concurrency limit.
+        """
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of invocations in progress.
+        """
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        """
+        Acquires a slot for an invocation if the concurrency limit is not reached.
+
+        :return: True if a slot was acquired, False otherwise.
+        """
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self, latency: Optional[float], overloaded: bool) -> None:
+        """
+        Releases the slot of a finished invocation and adapts the concurrency limit.
+
+        :param latency: Duration of the invocation in seconds or None if it failed for reasons other than overload,
+                        in which case the limit is left unchanged.
+        :param overloaded: Whether the invocation failed due to overload, e.g. a timeout or throttling.
+        :return: None
+        """
+        with self._lock:
+            in_flight = self._in_flight
+            self._in_flight -= 1
+
+            if overloaded or (latency is not None and latency > self.latency_threshold):
+                self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+            elif latency is not None and in_flight * 2 >= int(self._limit):
+                self._limit = min(self.max_limit, self._limit + 1)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker opening after `failure_threshold` consecutive failed invocations. While open, invocations are
+    rejected. After `reset_timeout` seconds a single trial invocation is admitted (half-open): the circuit closes if
+    it succeeds and opens again otherwise.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """
+        Current state, one of `closed`, `open` or `half_open`.
+        """
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def try_acquire(self) -> bool:
+        """
+        Admits an invocation if the circuit is closed or if it is the trial invocation of a half-open circuit.
+
+        :return: True if the invocation is admitted, False otherwise.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        """
+        Returns the time until the circuit admits a trial invocation.
+
+        :return: Time in seconds.
+        """
+        with self._lock:
+            if self._state == OPEN:
+                return max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+            return self.reset_timeout if self._state == HALF_OPEN else 0.0
+
+    def record_success(self) -> None:
+        """
+        Records a successful invocation, closing the circuit.
+
+        :return: None
+        """
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """
+        Records a failed invocation.
+
+        :return: True if the circuit was opened by the failure, False otherwise.
+        """
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = self.clock()
+                return True
+            return False
+
+
+class ResilientPredictionClient(Predictor):
+    """
+    Client guarding SageMaker invocations by a circuit breaker and an adaptive concurrency limit. Requests are
+    rejected with `ServiceUnavailableError` while the circuit is open or the concurrency limit is reached, instead of
+    piling up on a slow or throttling endpoint. Every error counts as failure, except responses with a 4xx status code
+    other than 429, which are caused by invalid requests.
+    Exposes the same `post_invocations` interface as the wrapped client.
+    """
+
+    def __init__(self, client, limiter: Optional[AimdLimiter] = None, breaker: Optional[CircuitBreaker] = None,
+                 limit_retry_after=1.0, metrics=None):
+        self.client = client
+        self.limiter = limiter if limiter is not None else AimdLimiter()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.limit_retry_after = limit_retry_after
+        self._metrics = metrics if metrics is not None else NoopMetrics()
+        self._counters = {'requests': 0, 'rejected_concurrency': 0, 'rejected_circuit_open': 0, 'failures': 0,
+                          'circuit_opened': 0}
+        self._lock = threading.Lock()
+
+    def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Requests predictions for a Pandas DataFrame in `split-JSON` format from the wrapped client.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        :raises ServiceUnavailableError: If the circuit is open or the concurrency limit is reached.
+        """
+        self._increment(requests=1)
+
+        if not self.limiter.try_acquire():
+            self._reject('concurrency', self.limit_retry_after)
+        if not self.breaker.try_acquire():
+            self.limiter.release(None, False)
+            self._reject('circuit_open', self.breaker.retry_after())
+
+        self._report()
+        start = time.perf_counter()
+        try:
+            predictions = self.client.post_invocations(request_body)
+        except Exception as err:
+            failed = is_failure(err)
+            self.limiter.release(None, failed)
+            if failed:
+                self._increment(failures=1)
+                if self.breaker.record_failure():
+                    self._increment(circuit_opened=1)
+            else:
+                self.breaker.record_success()
+            self._report()
+            raise
+
+        self.limiter.release(time.perf_counter() - start, False)
+        self.breaker.record_success()
+        self._report()
+        return predictions
+
+    def metrics(self) -> dict:
+        """
+        Returns the number of requests, of requests rejected due to the concurrency limit or the open circuit, of
+        failed invocations and of times the circuit opened, and the current concurrency limit, invocations in flight
+        and circuit state.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            snapshot = dict(self._counters)  # type: dict
+        snapshot.update({'limit': self.limiter.limit, 'in_flight': self.limiter.in_flight,
+                         'circuit_state': self.breaker.state})
+        return snapshot
+
+    def _reject(self, reason, retry_after):
+        self._increment(**{'rejected_' + reason: 1})
+        self._metrics.count_rejection(reason)
+        self._report()
+        raise ServiceUnavailableError(reason, retry_after)
+
+    def _report(self):
+        self._metrics.update_limiter(self.limiter.limit, self.limiter.in_flight, self.breaker.state)
+
+    def _increment(self, **values):
+        with self._lock:
+            for counter, value in values.items():
+                self._counters[counter] += value
+
+
+def is_failure(err: Exception) -> bool:
+    """
+    Returns whether the given error counts as failure of the SageMaker endpoint: any error except a response with a
+    4xx status code other than 429, which is caused by the request rather than by the endpoint.
+
+    :param err: Error of a failed invocation.
+    :return: True if the error counts as failure, False otherwise.
+    """
+    if isinstance(err, AwsSagemakerHttpClientError) and err.status_code is not None:
+        return not 400 <= err.status_code < 500 or err.status_code == 429
+    return True
+
+
+def retry_after_header(err: ServiceUnavailableError) -> str:
+    """
+    Returns the value of the `Retry-After` header of a rejected request in whole seconds.
+
+    :param err: Rejection.
+    :return: Header value.
+    """
+    return str(max(1, int(math.ceil(err.retry_after))))
@@ -0,0 +1,313 @@
+"""
+Module providing facilities to route prediction requests across multiple SageMaker endpoints: weighted traffic
+splits, shadow invocations and hedged requests driven by the latencies observed per endpoint.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, FIRST_COMPLETED, wait
+from typing import Deque, Dict, List, NamedTuple, Optional
+import logging
+import os
+import random
+import threading
+import time
+import numpy as np
+
+from ml_ids_api.aws.client.sagemaker_client import is_retryable_error
+from ml_ids_api.inference import Predictor
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Endpoint(NamedTuple):
+    """
+    A SageMaker endpoint receiving the given share of the prediction requests.
+    """
+    name: str
+    client: object
+    weight: float = 1.0
+
+
+class LatencyTracker:
+    """
+    Tracks the latencies of the most recent `window` successful invocations of an endpoint and the number of
+    consecutive failed invocations.
+    """
+
+    def __init__(self, window=1000):
+        self._latencies = deque(maxlen=window)  # type: Deque[float]
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """
+        Records the latency of a successful invocation and resets the number of consecutive failures.
+
+        :param seconds: Latency in seconds.
+        :return: None
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        """
+        Records a failed invocation.
+
+        :return: None
+        """
+        with self._lock:
+            self._failures += 1
+
+    @property
+    def failures(self) -> int:
+        """
+        Number of consecutive failed invocations since the last successful invocation.
+        """
+        with self._lock:
+            return self._failures
+
+    def percentile(self, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """
+        Returns the given percentile of the recorded latencies.
+
+        :param percentile: Percentile between 0 and 100.
+        :param min_samples: Minimum number of recorded latencies.
+        :return: Latency in seconds or None if fewer than `min_samples` latencies were recorded.
+        """
+        with self._lock:
+            latencies = list(self._latencies)
+
+        if not latencies or len(latencies) < min_samples:
+            return None
+        return float(np.percentile(latencies, percentile))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._latencies)
+
+
+class EndpointRouter(Predictor):
+    """
+    Client routing prediction requests across multiple SageMaker endpoints.
+
+    Each request is sent to an endpoint chosen at random according to the endpoint weights. If hedging is enabled and
+    the endpoint does not respond within the `hedge_percentile` of its recent latencies, a duplicate request is sent
+    to the endpoint with the lowest median latency, preferring endpoints other than the first one and skipping
+    endpoints whose last invocation failed. The first successful response is returned. If the original request fails
+    with an error a duplicate cannot resolve, e.g. an invalid request, the error is raised without waiting for the
+    duplicate. Hedging starts once `min_samples` latencies were recorded for an endpoint and waits at least
+    `hedge_min_delay_ms`. Hedged invocations run in a pool of `hedge_concurrency` threads, greenlets under gevent.
+    Requests are only hedged while the pool has idle threads, otherwise they are sent without a duplicate, so that
+    the hedge delay is never extended by waiting for a thread.
+
+    Requests may additionally be mirrored to a shadow endpoint, e.g. to evaluate a new model on production traffic.
+    Shadow invocations are sent in the background after the response is available, at most `shadow_concurrency` at a
+    time, excess invocations are dropped. Their predictions are compared with the returned predictions but never
+    returned to the caller.
+    Exposes the same `post_invocations` interface as the wrapped clients.
+    """
+
+    def __init__(self, endpoints: List[Endpoint], shadow: Optional[Endpoint] = None, hedging=False,
+                 hedge_percentile=95.0, hedge_min_delay_ms=10.0, min_samples=20, window=1000, shadow_concurrency=4,
+                 hedge_concurrency=64, seed=None):
+        if not endpoints:
+            raise ValueError('At least one endpoint is required.')
+        if any(endpoint.weight < 0 for endpoint in endpoints) or not any(endpoint.weight for endpoint in endpoints):
+            raise ValueError('Endpoint weights must not be negative and at least one weight must be positive.')
+
+        self.endpoints = endpoints
+        self.shadow = shadow
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay_ms / 1000.0
+        self.min_samples = min_samples
+        self.trackers = {endpoint.name: LatencyTracker(window)
+                         for endpoint in endpoints + ([shadow] if shadow is not None else [])}
+        self.seed = seed
+        self.random = random.Random(seed)
+        self._pid = os.getpid()
+        self.shadow_executor = ThreadPoolExecutor(max_workers=shadow_concurrency,
+                                                  thread_name_prefix='sagemaker-shadow')
+        self._shadow_slots = threading.BoundedSemaphore(shadow_concurrency)
+        self.hedge_executor = ThreadPoolExecutor(max_workers=hedge_concurrency, thread_name_prefix='sagemaker-route')
+        self._hedge_slots = threading.BoundedSemaphore(hedge_concurrency)
+        self._counters = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'hedge_dropped': 0, 'shadowed': 0,
+                          'shadow_dropped': 0, 'shadow_failed': 0, 'shadow_mismatches': 0}
+        self._lock = threading.Lock()
+
+    def post_invocations(self, request_body: bytes) -> List[int]:
+        """
+        Requests predictions for a Pandas DataFrame in `split-JSON` format from one of the endpoints.
+
+        :param request_body: Pandas DataFrame in `split-JSON` format.
+        :return: List of binary predictions `[0, 1]` per row in the input DataFrame.
+        """
+        self._increment(requests=1)
+        endpoint = self.select()
+
+        if self.hedging:
+            predictions = self._invoke_hedged(endpoint, request_body)
+        else:
+            predictions = self._invoke(endpoint, request_body)
+
+        if self.shadow is not None:
+            self._mirror(request_body, predictions)
+
+        return predictions
+
+    def select(self) -> Endpoint:
+        """
+        Selects an endpoint at random according to the endpoint weights.
+
+        :return: Endpoint.
+        """
+        if len(self.endpoints) == 1:
+            return self.endpoints[0]
+        if self.seed is None and self._pid != os.getpid():
+            # unseeded generators are reseeded in forked workers, which would otherwise select the same endpoints
+            self.random.seed()
+            self._pid = os.getpid()
+        return self.random.choices(self.endpoints, weights=[endpoint.weight for endpoint in self.endpoints])[0]
+
+    def hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        """
+        Returns the time to wait for a response of the given endpoint before a duplicate request is sent.
+
+        :param endpoint: Endpoint.
+        :return: Delay in seconds or None if too few latencies were recorded.
+        """
+        latency = self.trackers[endpoint.name].percentile(self.hedge_percentile, self.min_samples)
+        return max(latency, self.hedge_min_delay) if latency is not None else None
+
+    def hedge_target(self, endpoint: Endpoint) -> Endpoint:
+        """
+        Selects the endpoint receiving the duplicate of a request sent to the given endpoint, the endpoint with the
+        lowest median latency among the other endpoints whose last invocation succeeded. Endpoints without recorded
+        latencies are preferred, so that they are measured. If there is no such endpoint, the duplicate is sent to the
+        same endpoint.
+
+        :param endpoint: Endpoint of the original request.
+        :return: Endpoint.
+        """
+        candidates = [candidate for candidate in self.endpoints
+                      if candidate.name != endpoint.name and not self.trackers[candidate.name].failures]
+        if not candidates:
+            return endpoint
+
+        def median_latency(candidate):
+            latency = self.trackers[candidate.name].percentile(50)
+            return latency if latency is not None else 0.0
+
+        return min(candidates, key=median_latency)
+
+    def latencies(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Returns the median and hedging percentile of the recent latencies per endpoint in seconds.
+
+        :return: Dictionary of latencies by endpoint name.
+        """
+        return {name: {'p50': tracker.percentile(50), 'p{:g}'.format(self.hedge_percentile):
+                       tracker.percentile(self.hedge_percentile)}
+                for name, tracker in self.trackers.items()}
+
+    def metrics(self) -> dict:
+        """
+        Returns the number of requests, of hedged requests, of requests answered by the duplicate and of requests not
+        hedged as the pool was busy, and the number of sent, dropped and failed shadow invocations and of shadow
+        predictions differing from the returned ones.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def _invoke(self, endpoint, request_body):
+        start = time.perf_counter()
+        try:
+            predictions = endpoint.client.post_invocations(request_body)
+        except Exception as err:
+            # invalid requests are not attributed to the endpoint
+            if is_retryable_error(err):
+                self.trackers[endpoint.name].record_failure()
+            raise
+        self.trackers[endpoint.name].record(time.perf_counter() - start)
+        return predictions
+
+    def _invoke_hedged(self, endpoint, request_body):
+        delay = self.hedge_delay(endpoint)
+        if delay is None:
+            return self._invoke(endpoint, request_body)
+
+        first = self._submit(endpoint, request_body)
+        if first is None:
+            self._increment(hedge_dropped=1)
+            return self._invoke(endpoint, request_body)
+
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+
+        duplicate = self._submit(self.hedge_target(endpoint), request_body)
+        if duplicate is None:
+            self._increment(hedge_dropped=1)
+            return first.result()
+        self._increment(hedged=1)
+
+        pending = {first, duplicate}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is duplicate:
+                        self._increment(hedge_wins=1)
+                    return future.result()
+                if future is first and not is_retryable_error(future.exception()):
+                    raise future.exception()  # type: ignore
+
+        raise first.exception()  # type: ignore
+
+    def _submit(self, endpoint, request_body):
+        if not self._hedge_slots.acquire(blocking=False):
+            return None
+
+        try:
+            return self.hedge_executor.submit(self._invoke_hedge, endpoint, request_body)
+        except RuntimeError:
+            self._hedge_slots.release()
+            raise
+
+    def _invoke_hedge(self, endpoint, request_body):
+        try:
+            return self._invoke(endpoint, request_body)
+        finally:
+            self._hedge_slots.release()
+
+    def _mirror(self, request_body, predictions):
+        if not self._shadow_slots.acquire(blocking=False):
+            self._increment(shadow_dropped=1)
+            return
+
+        try:
+            self.shadow_executor.submit(self._invoke_shadow, request_body, predictions)
+        except RuntimeError:
+            self._shadow_slots.release()
+            raise
+
+    def _invoke_shadow(self, request_body, predictions):
+        try:
+            shadow_predictions = self._invoke(self.shadow, request_body)
+            mismatches = sum(1 for prediction, shadow_prediction in zip(predictions, shadow_predictions)
+                             if prediction != shadow_prediction)
+            mismatches += abs(len(predictions) - len(shadow_predictions))
+            self._increment(shadowed=1, shadow_mismatches=mismatches)
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.warning('Shadow invocation of endpoint [%s] failed: %s', self.shadow.name, err)
+            self._increment(shadow_failed=1)
+        finally:
+            self._shadow_slots.release()
+
+    def _increment(self, **values):
+        with self._lock:
+            for counter, value in values.items():
+                self._counters[counter] += value
@@ -0,0 +1,237 @@
+"""
+Module providing the validation of prediction requests against the declared network flow features. The feature
+schema is compiled once at startup and applied column by column, coercing each column to a fixed NumPy dtype. Invalid
+requests are rejected with the offending row and column before a prediction is requested, and the Pandas parser
+builds its DataFrame from the coerced columns instead of inferring the dtypes of the request.
+"""
+from typing import Dict, List, NamedTuple, Optional, Union
+import numpy as np
+import pandas as pd
+
+from ml_ids_api.data import SplitFrame, deserialize_split_frame
+
+INTEGER = 'integer'
+NUMBER = 'number'
+TIMESTAMP = 'timestamp'
+
+TIMESTAMP_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+INT64_BOUND = 2.0 ** 63
+NONE_TYPE = type(None)  # type: type
+
+
+class ColumnSpec(NamedTuple):
+    """
+    Declaration of a column of the feature schema. Integer columns are coerced to `int64`, number columns to
+    `float64`, with missing values (`null`) converted to NaN if the column is nullable, and timestamp columns, given
+    as strings in `TIMESTAMP_FORMAT`, to `datetime64[ns]`. As in NumPy, booleans are accepted as numbers.
+    """
+    name: str
+    kind: str
+    nullable: bool = False
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+
+
+def integer(name: str, minimum: Optional[float] = None, maximum: Optional[float] = None) -> ColumnSpec:
+    """
+    Declares a non-nullable integer column.
+    """
+    return ColumnSpec(name=name, kind=INTEGER, minimum=minimum, maximum=maximum)
+
+
+def number(name: str) -> ColumnSpec:
+    """
+    Declares a nullable number column.
+    """
+    return ColumnSpec(name=name, kind=NUMBER, nullable=True)
+
+
+# network flow features in the order of the API specification (`api-spec.yaml`)
+FLOW_COLUMNS = [
+    integer('dst_port', 0, 65535), integer('protocol', 0, 255), ColumnSpec('timestamp', TIMESTAMP),
+    integer('flow_duration'), integer('tot_fwd_pkts'), integer('tot_bwd_pkts'), integer('totlen_fwd_pkts'),
+    integer('totlen_bwd_pkts'), integer('fwd_pkt_len_max'), integer('fwd_pkt_len_min'), number('fwd_pkt_len_mean'),
+    number('fwd_pkt_len_std'), integer('bwd_pkt_len_max'), integer('bwd_pkt_len_min'), number('bwd_pkt_len_mean'),
+    number('bwd_pkt_len_std'), number('flow_byts_s'), number('flow_pkts_s'), number('flow_iat_mean'),
+    number('flow_iat_std'), integer('flow_iat_max'), integer('flow_iat_min'), integer('fwd_iat_tot'),
+    number('fwd_iat_mean'), number('fwd_iat_std'), integer('fwd_iat_max'), integer('fwd_iat_min'),
+    integer('bwd_iat_tot'), number('bwd_iat_mean'), number('bwd_iat_std'), integer('bwd_iat_max'),
+    integer('bwd_iat_min'), integer('fwd_psh_flags'), integer('bwd_psh_flags'), integer('fwd_urg_flags'),
+    integer('bwd_urg_flags'), integer('fwd_header_len'), integer('bwd_header_len'), number('fwd_pkts_s'),
+    number('bwd_pkts_s'), integer('pkt_len_min'), integer('pkt_len_max'), number('pkt_len_mean'),
+    number('pkt_len_std'), number('pkt_len_var'), integer('fin_flag_cnt'), integer('syn_flag_cnt'),
+    integer('rst_flag_cnt'), integer('psh_flag_cnt'), integer('ack_flag_cnt'), integer('urg_flag_cnt'),
+    integer('cwe_flag_count'), integer('ece_flag_cnt'), integer('down_up_ratio'), number('pkt_size_avg'),
+    number('fwd_seg_size_avg'), number('bwd_seg_size_avg'), integer('fwd_byts_b_avg'), integer('fwd_pkts_b_avg'),
+    integer('fwd_blk_rate_avg'), integer('bwd_byts_b_avg'), integer('bwd_pkts_b_avg'), integer('bwd_blk_rate_avg'),
+    integer('subflow_fwd_pkts'), integer('subflow_fwd_byts'), integer('subflow_bwd_pkts'),
+    integer('subflow_bwd_byts'), integer('init_fwd_win_byts'), integer('init_bwd_win_byts'),
+    integer('fwd_act_data_pkts'), integer('fwd_seg_size_min'), number('active_mean'), number('active_std'),
+    integer('active_max'), integer('active_min'), number('idle_mean'), number('idle_std'), integer('idle_max'),
+    integer('idle_min')
+]
+
+
+class FeatureSchema:
+    """
+    Compiled feature schema. Requests must contain exactly the declared columns, in any order. Columns are
+    validated and coerced one at a time: each column is converted to a NumPy array at once and checked by vectorized
+    comparisons, values are only inspected individually if the column contains missing values or values of
+    unexpected types, or to report the first invalid row.
+    """
+
+    def __init__(self, columns: List[ColumnSpec], timestamp_format: str = TIMESTAMP_FORMAT):
+        if len({spec.name for spec in columns}) != len(columns):
+            raise ValueError('Column names of the feature schema must be unique.')
+
+        unsupported = [spec.name for spec in columns if spec.kind not in (INTEGER, NUMBER, TIMESTAMP)]
+        if unsupported:
+            raise ValueError('Unsupported kind of columns {}.'.format(unsupported))
+
+        self.columns = {spec.name: spec for spec in columns}
+        self.timestamp_format = timestamp_format
+        self._coerce = {INTEGER: self._coerce_numeric, NUMBER: self._coerce_numeric,
+                        TIMESTAMP: self._coerce_timestamp}
+        self._allowed_types = {spec.name: self._value_types(spec) for spec in columns}
+        self._expected = {spec.name: self._describe(spec) for spec in columns}
+
+    @property
+    def names(self) -> List[str]:
+        """
+        Names of the declared columns.
+        """
+        return list(self.columns)
+
+    def validate(self, frame: SplitFrame) -> Dict[str, np.ndarray]:
+        """
+        Validates the given SplitFrame against the schema and coerces its columns to the declared dtypes.
+
+        :param frame: SplitFrame.
+        :return: Dictionary mapping the column names, in the order of the SplitFrame, to the coerced arrays.
+        :raises ValueError: If columns are missing, unknown or duplicated, or if a value does not match the
+                            declaration of its column, specifying the row and column of the first invalid value.
+        """
+        self._validate_columns(frame.columns)
+
+        columns = zip(*frame.data) if frame.data else [()] * len(frame.columns)
+        return {name: self._coerce[self.columns[name].kind](frame, name, values)
+                for name, values in zip(frame.columns, columns)}
+
+    def deserialize_split_frame(self, json_dataframe: Union[bytes, str]) -> SplitFrame:
+        """
+        Deserializes a DataFrame in `split-JSON` format into a `SplitFrame` and validates it against the schema.
+        Values are kept as parsed from JSON.
+
+        :param json_dataframe: Pandas DataFrame as JSON.
+        :return: Validated SplitFrame.
+        :raises ValueError: If the JSON document is malformed or does not match the schema.
+        """
+        frame = deserialize_split_frame(json_dataframe)
+        self.validate(frame)
+        return frame
+
+    def deserialize_dataframe(self, json_dataframe: Union[bytes, str]) -> pd.DataFrame:
+        """
+        Deserializes a Pandas DataFrame from `split-JSON` format, validated against the schema and built from the
+        coerced columns without type inference. The index of the document is kept, if given.
+
+        :param json_dataframe: Pandas DataFrame as JSON.
+        :return: Deserialized Pandas DataFrame.
+        :raises ValueError: If the JSON document is malformed or does not match the schema.
+        """
+        frame = deserialize_split_frame(json_dataframe)
+        return pd.DataFrame(self.validate(frame), columns=frame.columns, index=frame.row_index)
+
+    def _validate_columns(self, columns):
+        present = set(columns)
+        if len(present) != len(columns):
+            raise ValueError('Duplicate columns: {}.'.format(sorted({c for c in columns if columns.count(c) > 1})))
+
+        missing = [name for name in self.columns if name not in present]
+        if missing:
+            raise ValueError('Missing columns: {}.'.format(missing))
+
+        unknown = [name for name in columns if name not in self.columns]
+        if unknown:
+            raise ValueError('Unknown columns: {}.'.format(unknown))
+
+    def _coerce_numeric(self, frame, name, values):
+        spec = self.columns[name]
+        try:
+            array = np.array(values)
+        except ValueError:
+            # nested sequences of different lengths are rejected by recent NumPy versions, their types are reported
+            array = np.array(values, dtype=object)
+
+        # columns of plain numbers are converted without inspecting the individual values, nested sequences of
+        # numbers are converted to multi-dimensional arrays and inspected as well
+        if array.dtype.kind not in 'biuf' or array.ndim != 1:
+            self._check_types(frame, name, values, set(map(type, values)))
+            try:
+                # missing values (None) are converted to NaN
+                array = np.array(values, dtype=np.int64 if spec.kind == INTEGER else np.float64)
+            except OverflowError:
+                array = np.array(values, dtype=np.float64)
+
+        invalid = np.zeros(len(values), dtype=bool)
+        if spec.kind == INTEGER and array.dtype.kind == 'f':
+            with np.errstate(invalid='ignore'):
+                invalid |= ~((array == np.trunc(array)) & (np.abs(array) < INT64_BOUND))
+        if spec.minimum is not None:
+            invalid |= array < spec.minimum
+        if spec.maximum is not None:
+            invalid |= array > spec.maximum
+        self._check_invalid(frame, name, values, invalid)
+
+        return array.astype(np.int64 if spec.kind == INTEGER else np.float64, copy=False)
+
+    def _coerce_timestamp(self, frame, name, values):
+        self._check_types(frame, name, values, set(map(type, values)))
+
+        timestamps = pd.to_datetime(list(values), format=self.timestamp_format, errors='coerce')
+        self._check_invalid(frame, name, values, np.asarray(timestamps.isna()))
+        return timestamps.values
+
+    def _check_types(self, frame, name, values, types):
+        invalid_types = types - self._allowed_types[name]
+        if invalid_types:
+            row = next(i for i, value_type in enumerate(map(type, values)) if value_type in invalid_types)
+            self._raise_invalid(frame, name, row, values[row])
+
+    def _check_invalid(self, frame, name, values, invalid):
+        rows = np.flatnonzero(invalid)
+        if rows.size:
+            self._raise_invalid(frame, name, rows[0], values[rows[0]])
+
+    def _raise_invalid(self, frame, name, row, value):
+        row_label = frame.row_index[row] if frame.row_index is not None else row
+        raise ValueError('Invalid value {!r} in row {} of column \'{}\': expected {}.'
+                         .format(value, row_label, name, self._expected[name]))
+
+    @staticmethod
+    def _value_types(spec):
+        types = {str} if spec.kind == TIMESTAMP else {bool, int, float}
+        return types | {NONE_TYPE} if spec.nullable else types
+
+    def _describe(self, spec):
+        if spec.kind == TIMESTAMP:
+            description = 'a timestamp in the format \'{}\''.format(self.timestamp_format)
+        else:
+            description = 'an integer' if spec.kind == INTEGER else 'a number'
+            if spec.minimum is not None and spec.maximum is not None:
+                description += ' between {:g} and {:g}'.format(spec.minimum, spec.maximum)
+            elif spec.minimum is not None:
+                description += ' of at least {:g}'.format(spec.minimum)
+            elif spec.maximum is not None:
+                description += ' of at most {:g}'.format(spec.maximum)
+        return description + ' or null' if spec.nullable else description
+
+
+def create_flow_schema() -> FeatureSchema:
+    """
+    Compiles the feature schema of the network flows accepted by the API.
+
+    :return: Feature schema.
+    """
+    return FeatureSchema(FLOW_COLUMNS)
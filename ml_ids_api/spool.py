@@ -0,0 +1,501 @@
+"""
+Module providing a durable local spool of SNS notifications. Notifications are appended to memory-mapped segment files
+on local disk before they are published and are published in the background by a drainer, so that slow or failing
+SNS requests neither delay prediction requests nor lose notifications.
+
+Each worker process writes to a spool directory of its own, locked for the lifetime of the process. Spool directories
+of exited processes are adopted and drained by the next drainer starting up.
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import threading
+import zlib
+
+from ml_ids_api.aws.client.sns_client import AwsSNSClientError, SNSMessage
+
+LOGGER = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT_FILE = 'checkpoint'
+LOCK_FILE = 'lock'
+
+# record header: payload length and CRC32 of the payload, a length of 0 marks the end of a segment
+RECORD_HEADER = struct.Struct('<II')
+
+
+class SpoolPosition(NamedTuple):
+    """
+    Position of a record in the spool: the sequence number of its segment and its offset within the segment.
+    """
+    segment: int
+    offset: int
+
+
+class SpoolLockedError(IOError):
+    """
+    An error raised when opening a spool directory locked by another process.
+    """
+
+
+class Segment:
+    """
+    Append-only segment file of fixed size, memory-mapped for reading and writing. Records are written as header
+    followed by the payload. When opened, the records are verified and a partially written record at the end, e.g. of
+    a process killed while appending, is discarded.
+    """
+
+    def __init__(self, path: str, size: int):
+        if not os.path.exists(path):
+            with open(path, 'wb') as segment_file:
+                segment_file.truncate(size)
+
+        self.path = path
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.size = len(self.map)
+        self.end = self._recover()
+
+    def append(self, payload: bytes) -> bool:
+        """
+        Appends a record to the segment.
+
+        :param payload: Payload of the record.
+        :return: True if the record was appended, False if the segment is full.
+        """
+        end = self.end + RECORD_HEADER.size + len(payload)
+        if end > self.size:
+            return False
+
+        # the payload is written before the header, a record becomes visible once its header is complete
+        self.map[self.end + RECORD_HEADER.size:end] = payload
+        self.map[self.end:self.end + RECORD_HEADER.size] = RECORD_HEADER.pack(len(payload), zlib.crc32(payload))
+        self.end = end
+        return True
+
+    def read(self, offset: int, max_records: int) -> Tuple[List[bytes], int]:
+        """
+        Reads records starting at the given offset.
+
+        :param offset: Offset of the first record.
+        :param max_records: Maximum number of records to read.
+        :return: Tuple of (payloads, offset following the last record read).
+        """
+        payloads = []  # type: List[bytes]
+        while offset < self.end and len(payloads) < max_records:
+            length, _ = RECORD_HEADER.unpack_from(self.map, offset)
+            start = offset + RECORD_HEADER.size
+            payloads.append(self.map[start:start + length])
+            offset = start + length
+        return payloads, offset
+
+    def flush(self) -> None:
+        """
+        Writes the modified pages of the segment to disk.
+
+        :return: None
+        """
+        self.map.flush()
+
+    def close(self) -> None:
+        """
+        Unmaps and closes the segment file.
+
+        :return: None
+        """
+        self.map.close()
+        self.file.close()
+
+    def _recover(self):
+        offset = 0
+        while offset + RECORD_HEADER.size <= self.size:
+            length, checksum = RECORD_HEADER.unpack_from(self.map, offset)
+            start = offset + RECORD_HEADER.size
+            if length == 0 or start + length > self.size or zlib.crc32(self.map[start:start + length]) != checksum:
+                break
+            offset = start + length
+
+        tail = self.map[offset:offset + RECORD_HEADER.size]
+        if tail.count(0) != len(tail):
+            LOGGER.warning('Discarding partially written record of spool segment [%s] at offset [%d].',
+                           self.path, offset)
+            self.map[offset:] = bytes(self.size - offset)
+        return offset
+
+
+class SegmentSpool:
+    """
+    Durable queue of records stored in a directory of segment files of `segment_bytes` bytes each. Records are
+    appended to the newest segment and read from the committed read position, which is persisted in a checkpoint
+    file. Segments are deleted once all of their records are committed.
+
+    Records are persisted in the page cache when appended and survive the termination of the process. If `sync` is
+    set, segments and checkpoints are additionally written to disk on every append and commit, protecting records
+    against the failure of the host at the cost of a disk write per request.
+
+    The spool is safe to use from multiple threads, records must be read and committed by a single consumer.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, sync: bool = False,
+                 create: bool = True):
+        if create:
+            os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.sync = sync
+        self._lock_file = open(os.path.join(directory, LOCK_FILE), 'a+b')
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise SpoolLockedError('Spool [{}] is locked by another process.'.format(directory))
+
+        self._lock = threading.Lock()
+        self._committed = self._read_checkpoint()
+        self._segments = {}  # type: Dict[int, Segment]
+
+        for sequence in sorted(self._list_segments()):
+            if sequence < self._committed.segment:
+                os.remove(self._segment_path(sequence))
+            else:
+                self._segments[sequence] = Segment(self._segment_path(sequence), segment_bytes)
+
+        if self._committed.segment not in self._segments:
+            # the checkpoint refers to a deleted segment, reading starts at the oldest remaining segment
+            self._committed = SpoolPosition(min(self._segments) if self._segments else self._committed.segment, 0)
+            if not self._segments:
+                self._segments[self._committed.segment] = Segment(self._segment_path(self._committed.segment),
+                                                                  segment_bytes)
+
+    @staticmethod
+    def adopt(directory: str, segment_bytes: int = 16 * 1024 * 1024) -> Optional['SegmentSpool']:
+        """
+        Opens the existing spool in the given directory unless it is locked by another process or was removed.
+
+        :param directory: Spool directory.
+        :param segment_bytes: Size of new segments in bytes.
+        :return: Spool or None if the spool is not available.
+        """
+        try:
+            return SegmentSpool(directory, segment_bytes, create=False)
+        except (SpoolLockedError, FileNotFoundError):
+            return None
+
+    def append(self, payloads: List[bytes]) -> None:
+        """
+        Appends records to the spool.
+
+        :param payloads: Payloads of the records.
+        :return: None
+        :raises ValueError: If a payload exceeds the segment size.
+        """
+        oversized = [len(payload) for payload in payloads if RECORD_HEADER.size + len(payload) > self.segment_bytes]
+        if oversized:
+            raise ValueError('Record of [{}] bytes exceeds the spool segment size.'.format(oversized[0]))
+
+        with self._lock:
+            segment = self._segments[max(self._segments)]
+
+            for payload in payloads:
+                if not segment.append(payload):
+                    if self.sync:
+                        segment.flush()
+
+                    sequence = max(self._segments) + 1
+                    segment = self._segments[sequence] = Segment(self._segment_path(sequence), self.segment_bytes)
+                    segment.append(payload)
+
+            if self.sync:
+                segment.flush()
+
+    def read(self, max_records: int) -> Tuple[List[bytes], SpoolPosition]:
+        """
+        Reads records starting at the committed read position.
+
+        :param max_records: Maximum number of records to read.
+        :return: Tuple of (payloads, position to commit once the records are processed).
+        """
+        with self._lock:
+            position = self._committed
+            payloads = []  # type: List[bytes]
+
+            while len(payloads) < max_records:
+                segment = self._segments[position.segment]
+                records, offset = segment.read(position.offset, max_records - len(payloads))
+                payloads.extend(records)
+                position = SpoolPosition(position.segment, offset)
+
+                # a segment followed by a newer segment is complete
+                if offset < segment.end or position.segment + 1 not in self._segments:
+                    break
+                position = SpoolPosition(position.segment + 1, 0)
+
+            return payloads, position
+
+    def commit(self, position: SpoolPosition) -> None:
+        """
+        Persists the read position, deleting segments whose records are all committed.
+
+        :param position: Position returned by `read`.
+        :return: None
+        """
+        with self._lock:
+            self._write_checkpoint(position)
+            self._committed = position
+
+            for sequence in [sequence for sequence in self._segments if sequence < position.segment]:
+                self._segments.pop(sequence).close()
+                os.remove(self._segment_path(sequence))
+
+    def backlog_bytes(self) -> int:
+        """
+        Returns the size of the records not yet committed in bytes.
+
+        :return: Number of bytes.
+        """
+        with self._lock:
+            return sum(segment.end - (self._committed.offset if sequence == self._committed.segment else 0)
+                       for sequence, segment in self._segments.items())
+
+    def close(self) -> None:
+        """
+        Closes the segment files and releases the lock of the spool directory.
+
+        :return: None
+        """
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+            self._lock_file.close()
+
+    def remove(self) -> None:
+        """
+        Closes the spool and deletes its directory.
+
+        :return: None
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.close()
+
+    def _list_segments(self):
+        return [int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                if name.endswith(SEGMENT_SUFFIX)]
+
+    def _segment_path(self, sequence):
+        return os.path.join(self.directory, '{:012d}{}'.format(sequence, SEGMENT_SUFFIX))
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as checkpoint:
+                return SpoolPosition(**json.load(checkpoint))
+        except FileNotFoundError:
+            segments = self._list_segments()
+            return SpoolPosition(min(segments) if segments else 0, 0)
+
+    def _write_checkpoint(self, position):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        with open(path + '.tmp', 'w') as checkpoint:
+            json.dump(position._asdict(), checkpoint)
+            if self.sync:
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+        os.replace(path + '.tmp', path)
+
+
+def encode_message(message: SNSMessage) -> bytes:
+    """
+    Encodes an SNS message as spool record.
+
+    :param message: SNS message.
+    :return: Record payload.
+    """
+    return json.dumps([message.message, message.attrs], separators=(',', ':')).encode('utf-8')
+
+
+def decode_message(payload: bytes) -> SNSMessage:
+    """
+    Decodes an SNS message from a spool record.
+
+    :param payload: Record payload.
+    :return: SNS message.
+    """
+    message, attrs = json.loads(payload)
+    return SNSMessage(message=message, attrs=attrs)
+
+
+class SpoolingMessageProducer:
+    """
+    Producer persisting notifications in a `SegmentSpool` before they are published. A drainer thread publishes the
+    spooled notifications in batches of up to `drain_batch_size` messages using the wrapped `SNSMessageProducer`.
+    Batches failing to publish are retried with exponential backoff of up to `max_backoff` seconds. Notifications are
+    published at least once: a batch failing partially is published again as a whole. Messages rejected by SNS as
+    invalid are logged and discarded. Digests flushed by the wrapped producer are spooled as well.
+
+    The spool of the process is created in a subdirectory of `directory` when the first notification is published,
+    so that the producer can be created before gunicorn forks its workers. When the drainer starts, it adopts and
+    drains the spools of processes that exited before their notifications were published.
+    """
+
+    def __init__(self, producer, directory, segment_bytes=16 * 1024 * 1024, drain_batch_size=100, max_backoff=30.0,
+                 initial_backoff=0.1, sync=False):
+        self.producer = producer
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.drain_batch_size = drain_batch_size
+        self.max_backoff = max_backoff
+        self.initial_backoff = initial_backoff
+        self.sync = sync
+        self.spool = None  # type: Optional[SegmentSpool]
+        self._thread = None  # type: Optional[threading.Thread]
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = {'spooled': 0, 'published': 0, 'failed': 0, 'rejected': 0, 'adopted': 0}
+        if hasattr(producer, 'digest_publisher'):
+            producer.digest_publisher = self._spool
+
+    def publish_predictions(self, data) -> None:
+        """
+        Persists the notifications of the given predictions in the spool to be published in the background.
+
+        :param data: Pandas DataFrame or SplitFrame containing feature data and predictions.
+        :return: None
+        """
+        if self._stopped.is_set():
+            raise RuntimeError('SpoolingMessageProducer has been shut down.')
+
+        self._spool(self.producer.create_notifications(data))
+
+    def drain(self, spool: SegmentSpool) -> int:
+        """
+        Publishes the notifications of the given spool until it is empty.
+
+        :param spool: Spool.
+        :return: Number of published notifications.
+        :raises Exception: If a batch of notifications could not be published.
+        """
+        published = 0
+        while True:
+            payloads, position = spool.read(self.drain_batch_size)
+            if not payloads:
+                return published
+
+            self._publish([decode_message(payload) for payload in payloads])
+            spool.commit(position)
+            published += len(payloads)
+
+    def shutdown(self, timeout=None) -> None:
+        """
+        Stops accepting new predictions and waits until the drainer has published the spooled notifications or
+        failed to do so. Unpublished notifications remain in the spool.
+
+        :param timeout: Maximum number of seconds to wait for the drainer, or `None` to wait indefinitely.
+        :return: None
+        """
+        if hasattr(self.producer, 'shutdown') and not self._stopped.is_set():
+            # the open digests of the wrapped producer are spooled before the drainer is stopped
+            self.producer.shutdown(timeout)
+
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            self._stopped.set()
+            thread = self._thread
+
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout)
+            if not thread.is_alive() and self.spool is not None:
+                self.spool.close()
+
+    def metrics(self) -> dict:
+        """
+        Returns the size of the unpublished notifications in bytes and the number of spooled, published and rejected
+        notifications, of failed publishing attempts and of adopted spools.
+
+        :return: Dictionary of metrics.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        counters['backlog_bytes'] = self.spool.backlog_bytes() if self.spool is not None else 0
+        return counters
+
+    def _spool(self, messages):
+        if not messages:
+            return
+
+        self._ensure_started().append([encode_message(message) for message in messages])
+        self._increment(spooled=len(messages))
+        self._wakeup.set()
+
+    def _ensure_started(self) -> SegmentSpool:
+        with self._lock:
+            if self.spool is None:
+                self.spool = SegmentSpool(os.path.join(self.directory, str(os.getpid())),
+                                          segment_bytes=self.segment_bytes, sync=self.sync)
+                self._thread = threading.Thread(target=self._work, name='sns-spool-drainer', daemon=True)
+                self._thread.start()
+            return self.spool
+
+    def _work(self):
+        self._adopt_spools()
+        failures = 0
+
+        while True:
+            self._wakeup.clear()
+            try:
+                self.drain(self.spool)
+                failures = 0
+            except Exception:  # pylint: disable=broad-except
+                failures += 1
+                self._increment(failed=1)
+                LOGGER.exception('Failed to publish spooled notifications.')
+
+            if self._stopped.is_set():
+                return
+
+            if failures:
+                self._stopped.wait(min(self.max_backoff, self.initial_backoff * 2 ** (failures - 1)))
+            else:
+                self._wakeup.wait()
+
+    def _adopt_spools(self):
+        own = os.path.basename(self.spool.directory)
+
+        for name in os.listdir(self.directory):
+            spool = SegmentSpool.adopt(os.path.join(self.directory, name), self.segment_bytes) if name != own \
+                else None
+            if spool is None:
+                continue
+
+            try:
+                LOGGER.info('Publishing notifications of spool [%s].', spool.directory)
+                self.drain(spool)
+                spool.remove()
+                self._increment(adopted=1)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Failed to publish notifications of spool [%s].', spool.directory)
+                spool.close()
+
+    def _publish(self, messages):
+        try:
+            self.producer.publish_messages(messages)
+        except AwsSNSClientError as err:
+            if not err.failed_entries or not all(entry.get('SenderFault') for entry in err.failed_entries):
+                raise
+            LOGGER.error('Discarding notifications rejected by SNS: %s', err)
+            self._increment(rejected=len(err.failed_entries), published=len(messages) - len(err.failed_entries))
+            return
+        self._increment(published=len(messages))
+
+    def _increment(self, **values):
+        with self._lock:
+            for counter, value in values.items():
+                self._counters[counter] += value
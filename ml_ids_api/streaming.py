@@ -0,0 +1,272 @@
+"""
+Module providing the incremental processing of network flows submitted as newline-delimited JSON (NDJSON).
+"""
+from typing import Any, BinaryIO, Iterator, List, Optional, Tuple
+import logging
+import queue
+import threading
+import time
+
+from ml_ids_api.data import SplitFrame, json_dumps, json_loads, merge_split_predictions, serialize_split_frame
+
+LOGGER = logging.getLogger(__name__)
+
+
+class FlowRecordParser:
+    """
+    Parses network flows submitted as one JSON object per line, mapping column names to values.
+    The columns of the first record determine the column order, all subsequent records must contain the same columns.
+    """
+
+    def __init__(self, max_line_bytes=1024 * 1024):
+        self.max_line_bytes = max_line_bytes
+        self.columns = None  # type: Optional[List[str]]
+        self.line_number = 0
+
+    def parse(self, line: bytes) -> Optional[List[Any]]:
+        """
+        Parses the next line of the stream.
+
+        :param line: Line including the trailing line break, if any.
+        :return: Values of the record in column order or None if the line is blank.
+        :raises ValueError: If the line exceeds the maximum length or does not contain a valid record.
+        """
+        self.line_number += 1
+        if len(line) - line.endswith(b'\n') > self.max_line_bytes:
+            raise ValueError('Line {} exceeds the maximum length of {} bytes.'
+                             .format(self.line_number, self.max_line_bytes))
+
+        if not line.strip():
+            return None
+
+        try:
+            record = json_loads(line)
+        except ValueError as err:
+            raise ValueError('Line {} is not valid JSON: {}'.format(self.line_number, err))
+
+        if not isinstance(record, dict):
+            raise ValueError('Line {} is not a JSON object.'.format(self.line_number))
+
+        if self.columns is None:
+            self.columns = list(record.keys())
+
+        if len(record) != len(self.columns) or any(column not in record for column in self.columns):
+            raise ValueError('Line {} does not contain the columns {}.'.format(self.line_number, self.columns))
+
+        return [record[column] for column in self.columns]
+
+
+class FlowRecordReader(FlowRecordParser):
+    """
+    Reads network flows from a binary stream containing one JSON object per line, see `FlowRecordParser`.
+    Blank lines are skipped. Only a single line is held in memory at a time.
+    """
+
+    def __init__(self, stream: BinaryIO, max_line_bytes=1024 * 1024):
+        super(FlowRecordReader, self).__init__(max_line_bytes=max_line_bytes)
+        self.stream = stream
+        self._peeked = None  # type: Optional[List[Any]]
+
+    def __iter__(self) -> Iterator[List[Any]]:
+        return self
+
+    def __next__(self) -> List[Any]:
+        if self._peeked is not None:
+            row, self._peeked = self._peeked, None
+            return row
+
+        while True:
+            line = self.stream.readline(self.max_line_bytes + 1)
+            if not line:
+                raise StopIteration
+
+            record = self.parse(line)
+            if record is not None:
+                return record
+
+    def peek(self) -> Optional[List[Any]]:
+        """
+        Reads the first record without consuming it, determining the columns of the stream.
+
+        :return: Values of the first record or None if the stream contains no records.
+        :raises ValueError: If the first record is invalid.
+        """
+        if self._peeked is None:
+            self._peeked = next(self, None)
+        return self._peeked
+
+
+class RecordPrefetcher:
+    """
+    Reads the records of a `FlowRecordReader` in a background thread, so that the next record can be awaited with a
+    timeout. At most `max_records` records are read ahead. Errors of the reader are raised by `next`.
+    """
+
+    def __init__(self, reader: FlowRecordReader, max_records: int):
+        self.reader = reader
+        self._records = queue.Queue(maxsize=max_records)  # type: queue.Queue
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def next(self, timeout: Optional[float] = None) -> List[Any]:
+        """
+        Returns the next record.
+
+        :param timeout: Maximum time to wait for the next record in seconds, None to wait indefinitely.
+        :return: Values of the record.
+        :raises queue.Empty: If no record arrives within `timeout`.
+        :raises StopIteration: If the stream contains no more records.
+        :raises ValueError: If the record is invalid.
+        """
+        record, error = self._records.get(timeout=timeout)
+        if error is not None:
+            raise error
+        return record
+
+    def close(self) -> None:
+        """
+        Stops reading ahead, e.g. if the stream is aborted.
+
+        :return: None
+        """
+        self._closed.set()
+
+    def _read(self):
+        try:
+            for record in self.reader:
+                if not self._put((record, None)):
+                    return
+            self._put((None, StopIteration()))
+        except Exception as err:  # pylint: disable=broad-except
+            self._put((None, err))
+
+    def _put(self, item: Tuple[Optional[List[Any]], Optional[Exception]]) -> bool:
+        while not self._closed.is_set():
+            try:
+                self._records.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+def stream_predictions(reader: FlowRecordReader, sagemaker_client, sns_message_producer,
+                       batch_rows=1000, schema=None, max_batch_wait_ms=None) -> Iterator[bytes]:
+    """
+    Requests predictions for the records of the given reader in batches of at most `batch_rows` rows as records
+    arrive, publishes the predictions of each batch and yields the predictions as newline-delimited JSON, one line per
+    record. Published notifications are indexed by the position of the record in the stream. If `max_batch_wait_ms`
+    is given, a batch is processed at the latest `max_batch_wait_ms` milliseconds after its first record arrived,
+    even if the client does not send further records, records are then read ahead by a `RecordPrefetcher`.
+
+    As the response status has already been sent once the first batch is processed, errors are reported in a final
+    line containing an `error` object. Records preceding an invalid record are processed before the error is reported.
+
+    :param reader: Flow record reader.
+    :param sagemaker_client: AWS SageMaker client.
+    :param sns_message_producer: AWS SNS message producer.
+    :param batch_rows: Maximum number of rows per SageMaker invocation.
+    :param schema: Feature schema validating each batch before predictions are requested or None.
+    :param max_batch_wait_ms: Maximum time records wait for their batch to fill up in milliseconds or None.
+    :return: Iterator of response chunks.
+    """
+    prefetcher = RecordPrefetcher(reader, batch_rows) if max_batch_wait_ms is not None else None
+    offset = 0
+    rows = []  # type: List[List[Any]]
+    deadline = float('inf')
+    error = None  # type: Optional[Exception]
+    end_of_stream = False
+
+    try:
+        while not end_of_stream:
+            try:
+                row = _next_record(reader, prefetcher, max(deadline - time.monotonic(), 0.0) if rows else None)
+                if row is not None:
+                    deadline = deadline if rows else batch_deadline(max_batch_wait_ms)
+                    rows.append(row)
+            except StopIteration:
+                end_of_stream = True
+            except ValueError as err:
+                error, end_of_stream = err, True
+
+            if rows and (end_of_stream or len(rows) >= batch_rows or time.monotonic() >= deadline):
+                try:
+                    chunk = _process_batch(reader.columns, rows, offset, sagemaker_client, sns_message_producer,
+                                           schema)
+                except Exception as err:  # pylint: disable=broad-except
+                    error, end_of_stream = err, True
+                else:
+                    yield chunk
+                    offset += len(rows)
+                    rows = []
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
+
+    if error is not None:
+        yield encode_error(error, offset)
+
+
+def create_batch(columns: List[str], rows: List[List[Any]], offset: int) -> SplitFrame:
+    """
+    Creates a SplitFrame of streamed records, indexed by the position of the records in the stream.
+
+    :param columns: Column names.
+    :param rows: Records.
+    :param offset: Position of the first record in the stream.
+    :return: SplitFrame.
+    """
+    return SplitFrame(columns=columns, data=rows, row_index=list(range(offset, offset + len(rows))))
+
+
+def encode_predictions(predictions: List[int]) -> bytes:
+    """
+    Encodes predictions as newline-delimited JSON, one line per prediction.
+
+    :param predictions: List of predictions.
+    :return: Response chunk.
+    """
+    return b''.join(json_dumps(prediction) + b'\n' for prediction in predictions)
+
+
+def encode_error(err: Exception, offset: int) -> bytes:
+    """
+    Logs the abort of a stream and encodes its final line.
+
+    :param err: Error aborting the stream.
+    :param offset: Number of records processed before the stream was aborted.
+    :return: Response chunk.
+    """
+    LOGGER.warning('Streaming prediction request aborted after %d records: %s', offset, err)
+    return json_dumps({'error': str(err)}) + b'\n'
+
+
+def batch_deadline(max_batch_wait_ms: Optional[float]) -> float:
+    """
+    Returns the time at which a batch starting now is processed at the latest, on the clock of `time.monotonic`.
+
+    :param max_batch_wait_ms: Maximum time records wait for their batch to fill up in milliseconds or None.
+    :return: Deadline of the batch, infinite if batches are only processed once they are filled up.
+    """
+    if max_batch_wait_ms is None:
+        return float('inf')
+    return time.monotonic() + max_batch_wait_ms / 1000
+
+
+def _next_record(reader, prefetcher, timeout):
+    if prefetcher is None:
+        return next(reader)
+    try:
+        return prefetcher.next(timeout)
+    except queue.Empty:
+        return None
+
+
+def _process_batch(columns, rows, offset, sagemaker_client, sns_message_producer, schema):
+    data = create_batch(columns, rows, offset)
+    if schema is not None:
+        schema.validate(data)
+    predictions = sagemaker_client.post_invocations(serialize_split_frame(data))
+    sns_message_producer.publish_predictions(merge_split_predictions(data, predictions))
+    return encode_predictions(predictions)
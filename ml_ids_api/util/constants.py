@@ -8,10 +8,23 @@ class HttpHeaders:
     HTTP Headers
     """
     CONTENT_TYPE = 'Content-Type'
+    CONTENT_LENGTH = 'Content-Length'
+    CONTENT_ENCODING = 'Content-Encoding'
+    ACCEPT = 'Accept'
+    ACCEPT_ENCODING = 'Accept-Encoding'
+    VARY = 'Vary'
+    RETRY_AFTER = 'Retry-After'
+    IDEMPOTENCY_KEY = 'Idempotency-Key'
+    IDEMPOTENT_REPLAYED = 'Idempotent-Replayed'
 
 
 class MimeTypes:
     """
     MimeTypes
     """
+    APPLICATION_JSON = 'application/json'
     APPLICATION_JSON_PANDAS_SPLIT = 'application/json; format=pandas-split'
+    APPLICATION_ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+    APPLICATION_MSGPACK = 'application/msgpack'
+    APPLICATION_MSGPACK_PANDAS_SPLIT = 'application/msgpack; format=pandas-split'
+    APPLICATION_NDJSON = 'application/x-ndjson'
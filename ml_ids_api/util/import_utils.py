@@ -0,0 +1,45 @@
+"""
+Utilities to defer the import of optional or heavyweight packages until they are first used. Worker processes not
+using a package do not pay for its import, e.g. `pyarrow` in workers never receiving Arrow requests. When the
+application is preloaded in the gunicorn master process, the deferred packages are imported by the master instead, so
+that their memory is shared by all workers.
+"""
+from functools import lru_cache
+from typing import Any, List
+import importlib
+import importlib.util
+
+DEFERRED_MODULES = ('boto3', 'pyarrow', 'msgpack', 'prometheus_client', 'prometheus_client.multiprocess')
+
+
+def is_installed(name: str) -> bool:
+    """
+    Checks whether a package is installed without importing it.
+
+    :param name: Name of the package.
+    :return: True if the package can be imported.
+    """
+    return importlib.util.find_spec(name) is not None
+
+
+@lru_cache(maxsize=None)
+def import_module(name: str) -> Any:
+    """
+    Imports a module on first use.
+
+    :param name: Name of the module.
+    :return: Module.
+    """
+    return importlib.import_module(name)
+
+
+def import_deferred_modules() -> List[str]:
+    """
+    Imports the installed deferred modules, e.g. in the gunicorn master process before the workers are forked.
+
+    :return: Names of the imported modules.
+    """
+    imported = [name for name in DEFERRED_MODULES if is_installed(name.split('.')[0])]
+    for name in imported:
+        import_module(name)
+    return imported
@@ -1,19 +1,24 @@
 """
 Module containing utilities to create HTTP responses.
+The error messages are shared by the Flask application and the ASGI application.
 """
 from flask import make_response, jsonify
+from ml_ids_api.util.constants import HttpHeaders
 
+MISSING_BODY_MESSAGE = 'No request body supplied. Please provide a valid json request body in Pandas \'split\' format.'
 
-def invalid_content_type(content_type, supported_content_type):
+
+def invalid_content_type(content_type, supported_content_type, *additional_content_types):
     """
     Creates a Flask response with status code `415 - Invalid Content Type`.
 
     :param content_type: Content-Type.
     :param supported_content_type: Supported Content-Type.
+    :param additional_content_types: Further supported Content-Types.
     :return: Flask response.
     """
-    return response_error(415, 'Content-Type: \'{}\' is not supported. Supported content-types are [\'{}\'].'
-                          .format(content_type, supported_content_type))
+    return response_error(415, invalid_content_type_message(content_type, supported_content_type,
+                                                            *additional_content_types))
 
 
 def bad_request_missing_body():
@@ -22,8 +27,7 @@ def bad_request_missing_body():
 
     :return: Flask response.
     """
-    return response_error(400, 'No request body supplied. Please provide a valid json request body in '
-                               'Pandas \'split\' format.')
+    return response_error(400, MISSING_BODY_MESSAGE)
 
 
 def bad_request_deserialization_error(err):
@@ -34,8 +38,42 @@ def bad_request_deserialization_error(err):
     :param err: Deserialization error.
     :return: Flask response.
     """
-    return response_error(400, 'Invalid request body supplied. Please provide a valid json request body in '
-                               'Pandas \'split\' format. Cause: {}'.format(err))
+    return response_error(400, deserialization_error_message(err))
+
+
+def bad_request_invalid_flow_records(err):
+    """
+    Creates a Flask response with status code `400 - Client Error`, specifying that the newline-delimited flow
+    records could not be read.
+
+    :param err: Error description.
+    :return: Flask response.
+    """
+    return response_error(400, invalid_flow_records_message(err))
+
+
+def payload_too_large(err):
+    """
+    Creates a Flask response with status code `413 - Payload Too Large`, advising to split the request.
+
+    :param err: Error describing the exceeded limit.
+    :return: Flask response.
+    """
+    return response_error(413, payload_too_large_message(err))
+
+
+def service_unavailable(error_msg: str, retry_after: str):
+    """
+    Creates a Flask response with status code `503 - Service Unavailable`, specifying when the request may be
+    retried.
+
+    :param error_msg: Error message to be sent in the response body.
+    :param retry_after: Value of the `Retry-After` header in seconds.
+    :return: Flask response.
+    """
+    response = response_error(503, error_msg)
+    response.headers[HttpHeaders.RETRY_AFTER] = retry_after
+    return response
 
 
 def response_error(code: int, error_msg: str):
@@ -47,3 +85,51 @@ def response_error(code: int, error_msg: str):
     :return: Flask response.
     """
     return make_response(jsonify({'error': error_msg}), code)
+
+
+def invalid_content_type_message(content_type, supported_content_type, *additional_content_types) -> str:
+    """
+    Creates the error message of an unsupported Content-Type.
+
+    :param content_type: Content-Type.
+    :param supported_content_type: Supported Content-Type.
+    :param additional_content_types: Further supported Content-Types.
+    :return: Error message.
+    """
+    supported_content_types = ', '.join('\'{}\''.format(supported)
+                                        for supported in (supported_content_type,) + additional_content_types)
+    return 'Content-Type: \'{}\' is not supported. Supported content-types are [{}].' \
+        .format(content_type, supported_content_types)
+
+
+def deserialization_error_message(err) -> str:
+    """
+    Creates the error message of a request body that could not be deserialized.
+
+    :param err: Deserialization error.
+    :return: Error message.
+    """
+    return 'Invalid request body supplied. Please provide a valid json request body in Pandas \'split\' format. ' \
+           'Cause: {}'.format(err)
+
+
+def payload_too_large_message(err) -> str:
+    """
+    Creates the error message of a request exceeding the size limits.
+
+    :param err: Error describing the exceeded limit.
+    :return: Error message.
+    """
+    return '{} Please split the network flows into multiple requests or submit them as newline-delimited JSON to ' \
+           '/api/predictions/stream.'.format(err)
+
+
+def invalid_flow_records_message(err) -> str:
+    """
+    Creates the error message of newline-delimited flow records that could not be read.
+
+    :param err: Error description.
+    :return: Error message.
+    """
+    return 'Invalid request body supplied. Please provide network flows as newline-delimited JSON objects. ' \
+           'Cause: {}'.format(err)
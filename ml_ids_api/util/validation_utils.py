@@ -1,9 +1,10 @@
 """
 Module containing utilities for request validation.
 """
+from typing import Optional
 
 
-def is_valid_content_type(content_type: str, expected_content_type: str) -> bool:
+def is_valid_content_type(content_type: Optional[str], expected_content_type: str) -> bool:
     """
     Checks if the given Content-Type is valid by comparing it to an expected Content-Type.
 
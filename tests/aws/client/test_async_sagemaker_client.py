@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+web = pytest.importorskip('aiohttp.web')
+
+from ml_ids_api.aws.client.async_sagemaker_client import AsyncAwsSagemakerHttpClient  # noqa: E402
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError  # noqa: E402
+
+PREDICTIONS = [0, 1, 0]
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+async def start_server(responses):
+    requests = []
+
+    async def invocations(request):
+        requests.append((dict(request.headers), await request.read()))
+        status, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        return web.json_response(body, status=status)
+
+    app = web.Application()
+    app.router.add_post('/invocations', invocations)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+    return runner, '127.0.0.1:{}'.format(port), requests
+
+
+def post_invocations(responses, request_body=b'{"columns":["feature"],"data":[[1],[2],[3]]}', **kwargs):
+    async def post():
+        runner, host, requests = await start_server(responses)
+        client = AsyncAwsSagemakerHttpClient('access_key', 'secret_key', 'http', host, '/invocations', 'eu-west-1',
+                                             backoff_factor=0, **kwargs)
+        try:
+            return await client.post_invocations(request_body), requests
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    return run(post())
+
+
+def test_post_invocations_must_return_predictions():
+    predictions, requests = post_invocations([(200, PREDICTIONS)])
+
+    assert predictions == PREDICTIONS
+    headers, body = requests[0]
+    assert body == b'{"columns":["feature"],"data":[[1],[2],[3]]}'
+    assert headers['Content-Type'] == 'application/json; format=pandas-split'
+    assert headers['Authorization'].startswith('AWS4-HMAC-SHA256 Credential=access_key/')
+    assert 'X-Amz-Date' in headers
+
+
+def test_post_invocations_when_server_error_occurs_must_retry():
+    predictions, requests = post_invocations([(503, {}), (500, {}), (200, PREDICTIONS)])
+
+    assert predictions == PREDICTIONS
+    assert len(requests) == 3
+
+
+def test_post_invocations_when_retries_exhausted_must_raise_error():
+    with pytest.raises(AwsSagemakerHttpClientError) as err:
+        post_invocations([(503, {'error': 'unavailable'})], max_retries=1)
+
+    assert err.value.status_code == 503
+    assert 'unavailable' in err.value.response_body
+
+
+def test_post_invocations_when_client_error_occurs_must_not_retry():
+    responses = [(400, {'error': 'invalid'}), (200, PREDICTIONS)]
+
+    with pytest.raises(AwsSagemakerHttpClientError) as err:
+        post_invocations(responses)
+
+    assert err.value.status_code == 400
+    assert responses == [(200, PREDICTIONS)]
+
+
+def test_post_invocations_when_connection_fails_must_raise_error():
+    client = AsyncAwsSagemakerHttpClient('access_key', 'secret_key', 'http', '127.0.0.1:1', '/invocations',
+                                         'eu-west-1', max_retries=1, backoff_factor=0)
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        run(client.post_invocations(b'{}'))
+
+    run(client.close())
@@ -1,9 +1,13 @@
+import io
 import pytest
 import pandas as pd
 import responses
 import pandas.util.testing as pdu
 
-from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient, AwsSagemakerHttpClientError
+from unittest.mock import MagicMock
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient, AwsSagemakerHttpClientError, \
+    create_http_session
 from ml_ids_api.util.constants import HttpHeaders, MimeTypes
 
 PREDICTIONS = [0, 1, 0]
@@ -83,7 +87,7 @@ def test_post_invocations_must_send_body_in_pandas_json_split_format(api_success
     assert len(api_success_response.calls) == 1
 
     request_body = api_success_response.calls[0].request.body
-    body_as_df = pd.read_json(request_body, orient='split', convert_dates=False)
+    body_as_df = pd.read_json(io.StringIO(request_body.decode('utf-8')), orient='split', convert_dates=False)
 
     pdu.assert_frame_equal(test_data, body_as_df)
 
@@ -103,3 +107,57 @@ def test_post_invocations_must_raise_error_on_server_error(api_server_error_resp
 def test_post_invocations_must_raise_error_on_client_error(api_client_error_response, client, test_data_json):
     with pytest.raises(AwsSagemakerHttpClientError):
         client.post_invocations(test_data_json)
+
+
+def test_post_invocations_must_reuse_session(api_success_response, client, test_data_json):
+    session = client.session
+
+    client.post_invocations(test_data_json)
+    client.post_invocations(test_data_json)
+
+    assert client.session is session
+    assert len(api_success_response.calls) == 2
+
+
+def test_post_invocations_must_use_given_session_and_timeout(test_data_json):
+    session = MagicMock()
+    session.post.return_value.json.return_value = PREDICTIONS
+    client = AwsSagemakerHttpClient(access_key='ACCESS_KEY',
+                                    secret_key='SECRET_KEY',
+                                    schema='http',
+                                    host='sagemaker.aws.com',
+                                    endpoint='/invocations',
+                                    region='eu-west-1',
+                                    session=session,
+                                    timeout=(1, 2))
+
+    predictions = client.post_invocations(test_data_json)
+
+    assert predictions == PREDICTIONS
+    session.post.assert_called_once()
+    assert session.post.call_args[1]['timeout'] == (1, 2)
+    assert session.post.call_args[1]['url'] == SAGEMAKER_URL
+
+
+def test_create_http_session_must_configure_pool_and_retries():
+    session = create_http_session(pool_size=5, max_retries=2, backoff_factor=0.5)
+
+    adapter = session.get_adapter('https://sagemaker.aws.com')
+    assert adapter._pool_maxsize == 5
+    assert adapter.max_retries.total == 2
+    assert adapter.max_retries.backoff_factor == 0.5
+    assert 429 in adapter.max_retries.status_forcelist
+    assert 503 in adapter.max_retries.status_forcelist
+    assert adapter.max_retries.is_retry('POST', status_code=503)
+
+
+def test_post_invocations_must_record_errors_by_status_code(api_client_error_response, client, test_data_json):
+    client.metrics = MagicMock()
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        client.post_invocations(test_data_json)
+
+    client.metrics.stage.assert_called_once_with('sign')
+    service, err = client.metrics.count_error.call_args[0]
+    assert service == 'sagemaker'
+    assert err.status_code == 400
@@ -0,0 +1,132 @@
+import pytest
+
+from botocore.exceptions import ClientError
+from unittest.mock import MagicMock
+
+from ml_ids_api.aws.client.sns_client import AwsSNSClient, AwsSNSClientError, SNSMessage
+
+AWS_TOPIC = 'AWS_TOPIC_ARN'
+
+
+def create_messages(count):
+    return [SNSMessage(message='message-{}'.format(i), attrs={}) for i in range(count)]
+
+
+def batch_entries(call):
+    return call[1]['PublishBatchRequestEntries']
+
+
+@pytest.fixture
+def client():
+    client = AwsSNSClient(access_key='ACCESS_KEY',
+                          secret_key='SECRET_KEY',
+                          region='eu-west-1',
+                          max_retries=2,
+                          retry_backoff=0)
+    client.client = MagicMock()
+    client.client.publish_batch = MagicMock(return_value={'Successful': [], 'Failed': []})
+    return client
+
+
+def test_publish_batch_must_group_messages_into_batches_of_ten(client):
+    client.publish_batch(AWS_TOPIC, create_messages(25))
+
+    calls = client.client.publish_batch.call_args_list
+    assert [len(batch_entries(call)) for call in calls] == [10, 10, 5]
+    assert all(call[1]['TopicArn'] == AWS_TOPIC for call in calls)
+
+
+def test_publish_batch_must_limit_batch_size_to_ten(client):
+    client.publish_batch(AWS_TOPIC, create_messages(25), batch_size=50)
+
+    assert client.client.publish_batch.call_count == 3
+
+
+def test_publish_batch_must_retry_failed_entries(client):
+    client.client.publish_batch = MagicMock(side_effect=[
+        {'Failed': [{'Id': '1', 'Code': 'InternalError', 'SenderFault': False}]},
+        {'Failed': []}
+    ])
+
+    client.publish_batch(AWS_TOPIC, create_messages(3))
+
+    calls = client.client.publish_batch.call_args_list
+    assert len(calls) == 2
+    assert batch_entries(calls[1]) == [{'Id': '1', 'Message': 'message-1', 'MessageAttributes': {}}]
+
+
+def test_publish_batch_when_retries_exhausted_must_raise_error(client):
+    client.client.publish_batch = MagicMock(return_value={
+        'Failed': [{'Id': '0', 'Code': 'InternalError', 'SenderFault': False}]
+    })
+
+    with pytest.raises(AwsSNSClientError) as err:
+        client.publish_batch(AWS_TOPIC, create_messages(2))
+
+    assert client.client.publish_batch.call_count == 3
+    assert len(err.value.failed_entries) == 1
+
+
+def test_publish_batch_when_sender_fault_must_not_retry_and_raise_error(client):
+    client.client.publish_batch = MagicMock(return_value={
+        'Failed': [{'Id': '0', 'Code': 'InvalidParameter', 'SenderFault': True}]
+    })
+
+    with pytest.raises(AwsSNSClientError):
+        client.publish_batch(AWS_TOPIC, create_messages(2))
+
+    assert client.client.publish_batch.call_count == 1
+
+
+def client_error(code, status):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'PublishBatch')
+
+
+def test_publish_batch_when_request_throttled_must_retry_request(client):
+    client.client.publish_batch = MagicMock(side_effect=[
+        client_error('Throttling', 400),
+        client_error('InternalError', 500),
+        {'Failed': []}
+    ])
+
+    client.publish_batch(AWS_TOPIC, create_messages(3))
+
+    calls = client.client.publish_batch.call_args_list
+    assert len(calls) == 3
+    assert len(batch_entries(calls[2])) == 3
+
+
+def test_publish_batch_when_request_retries_exhausted_must_raise_error(client):
+    client.client.publish_batch = MagicMock(side_effect=client_error('Throttling', 400))
+
+    with pytest.raises(AwsSNSClientError) as err:
+        client.publish_batch(AWS_TOPIC, create_messages(2))
+
+    assert client.client.publish_batch.call_count == 3
+    assert len(err.value.failed_entries) == 2
+
+
+def test_publish_batch_when_request_invalid_must_not_retry_request(client):
+    client.client.publish_batch = MagicMock(side_effect=client_error('AuthorizationError', 403))
+
+    with pytest.raises(ClientError):
+        client.publish_batch(AWS_TOPIC, create_messages(2))
+
+    assert client.client.publish_batch.call_count == 1
+
+
+def test_publish_must_create_boto3_client_on_first_use_per_process(monkeypatch):
+    boto3 = pytest.importorskip('boto3')
+    create_client = MagicMock()
+    monkeypatch.setattr(boto3, 'client', create_client)
+    client = AwsSNSClient(access_key='ACCESS_KEY', secret_key='SECRET_KEY', region='eu-west-1')
+
+    assert client.client is None
+    client.publish(AWS_TOPIC, 'message', {})
+    client.publish(AWS_TOPIC, 'message', {})
+    assert create_client.call_count == 1
+
+    # a forked worker must not reuse the client of its parent process
+    monkeypatch.setattr(client, '_pid', -1)
+    client.publish(AWS_TOPIC, 'message', {})
+    assert create_client.call_count == 2
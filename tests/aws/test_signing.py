@@ -0,0 +1,58 @@
+import io
+import hashlib
+
+from unittest.mock import patch
+
+from ml_ids_api.aws import signing
+from ml_ids_api.aws.signing import AwsSigV4Signer, derive_signing_key, hash_payload
+
+REQUEST_BODY = b'{"columns":["feature"],"data":[[1],[2],[3]]}'
+CONTENT_TYPE = 'application/json; format=pandas-split'
+EXPECTED_AUTHORIZATION_HEADER = 'AWS4-HMAC-SHA256 Credential=ACCESS_KEY/20200115/eu-west-1/sagemaker/aws4_request, ' \
+                                'SignedHeaders=content-type;host;x-amz-date, ' \
+                                'Signature=b9dec364a972b2438ccf5893bc754eb2aab0d60358d443767831f0b24e18e7ff'
+
+
+def create_signer():
+    return AwsSigV4Signer(access_key='ACCESS_KEY',
+                          secret_key='SECRET_KEY',
+                          host='runtime.sagemaker.eu-west-1.amazonaws.com',
+                          endpoint='/endpoints/ml-ids/invocations',
+                          region='eu-west-1',
+                          service='sagemaker')
+
+
+def test_create_authorization_header_must_create_valid_signature():
+    header = create_signer().create_authorization_header(method='POST',
+                                                         amz_date='20200115T123045Z',
+                                                         content_type=CONTENT_TYPE,
+                                                         payload_hash=hash_payload(REQUEST_BODY))
+
+    assert header == EXPECTED_AUTHORIZATION_HEADER
+
+
+def test_create_authorization_header_must_derive_signing_key_once_per_day():
+    derive_signing_key.cache_clear()
+    signer = create_signer()
+
+    with patch.object(signing, '_sign', wraps=signing._sign) as sign:
+        for amz_date in ['20200115T123045Z', '20200115T235959Z', '20200116T000001Z', '20200116T120000Z']:
+            signer.create_authorization_header(method='POST',
+                                               amz_date=amz_date,
+                                               content_type=CONTENT_TYPE,
+                                               payload_hash=hash_payload(REQUEST_BODY))
+
+    assert sign.call_count == 2 * 4
+
+
+def test_hash_payload_must_hash_file_like_payloads_incrementally():
+    payload = io.BytesIO(REQUEST_BODY * 100000)
+
+    payload_hash = hash_payload(payload)
+
+    assert payload_hash == hashlib.sha256(REQUEST_BODY * 100000).hexdigest()
+    assert payload.tell() == 0
+
+
+def test_hash_payload_must_hash_string_payloads():
+    assert hash_payload(REQUEST_BODY.decode('utf-8')) == hash_payload(REQUEST_BODY)
@@ -5,3 +5,80 @@ class TestConfig(object):
     AWS_SAGEMAKER_HOST = 'AWS_SAGEMAKER_HOST'
     AWS_SAGEMAKER_ENDPOINT = 'AWS_SAGEMAKER_ENDPOINT'
     AWS_SNS_PREDICTIONS_TOPIC = 'AWS_SNS_PREDICTIONS_TOPIC'
+    AWS_SNS_PUBLISH_BATCH_SIZE = 10
+    AWS_SNS_ASYNC_PUBLISHING = False
+    AWS_SNS_PUBLISH_QUEUE_SIZE = 1000
+    AWS_SNS_PUBLISH_WORKERS = 4
+    AWS_SNS_PUBLISH_QUEUE_FULL_POLICY = 'block'
+    AWS_SNS_PUBLISH_QUEUE_TIMEOUT = 1.0
+    AWS_SAGEMAKER_POOL_SIZE = 10
+    AWS_SAGEMAKER_CONNECT_TIMEOUT = 3.05
+    AWS_SAGEMAKER_READ_TIMEOUT = 60.0
+    AWS_SAGEMAKER_MAX_RETRIES = 3
+    AWS_SAGEMAKER_RETRY_BACKOFF = 0.1
+    PREDICTIONS_PARSER = 'pandas'
+    AWS_SNS_PUBLISH_POLICY = 'all'
+    AWS_SNS_BENIGN_SAMPLE_RATE = 0.01
+    AWS_SAGEMAKER_COALESCING = False
+    AWS_SAGEMAKER_COALESCING_MAX_WAIT_MS = 5.0
+    AWS_SAGEMAKER_COALESCING_MAX_ROWS = 1000
+    AWS_SAGEMAKER_COALESCING_MAX_BYTES = 5 * 1024 * 1024
+    AWS_SAGEMAKER_CHUNKING = True
+    AWS_SAGEMAKER_CHUNK_MAX_BYTES = 5 * 1024 * 1024
+    AWS_SAGEMAKER_CHUNK_CONCURRENCY = 4
+    AWS_SAGEMAKER_CHUNK_MAX_RETRIES = 2
+    PREDICTION_CACHE = None
+    PREDICTION_CACHE_MAX_ENTRIES = 100000
+    PREDICTION_CACHE_TTL = 3600.0
+    PREDICTION_CACHE_PATH = '/tmp/ml-ids-prediction-cache.db'
+    PREDICTION_CACHE_EXCLUDED_COLUMNS = ['timestamp']
+    STREAM_BATCH_ROWS = 1000
+    STREAM_MAX_LINE_BYTES = 1024 * 1024
+    STREAM_MAX_BATCH_WAIT_MS = 1000.0
+    AWS_SAGEMAKER_SCHEMA = 'https'
+    AWS_SNS_ENDPOINT_URL = None
+    AWS_SAGEMAKER_ASYNC_POOL_SIZE = 1000
+    AWS_SNS_PUBLISH_THREADS = 10
+    METRICS_ENABLED = False
+    PREDICTION_BACKEND = 'sagemaker'
+    LOCAL_MODEL_PATH = '/opt/ml/model'
+    AWS_SAGEMAKER_ENDPOINTS = []
+    AWS_SAGEMAKER_ENDPOINT_WEIGHTS = []
+    AWS_SAGEMAKER_SHADOW_ENDPOINT = None
+    AWS_SAGEMAKER_SHADOW_CONCURRENCY = 4
+    AWS_SAGEMAKER_HEDGING = False
+    AWS_SAGEMAKER_HEDGE_PERCENTILE = 95.0
+    AWS_SAGEMAKER_HEDGE_MIN_DELAY_MS = 10.0
+    AWS_SAGEMAKER_HEDGE_CONCURRENCY = 64
+    AWS_SAGEMAKER_OVERLOAD_PROTECTION = False
+    AWS_SAGEMAKER_CONCURRENCY_INITIAL_LIMIT = 20
+    AWS_SAGEMAKER_CONCURRENCY_MIN_LIMIT = 1
+    AWS_SAGEMAKER_CONCURRENCY_MAX_LIMIT = 200
+    AWS_SAGEMAKER_CONCURRENCY_BACKOFF_RATIO = 0.9
+    AWS_SAGEMAKER_CONCURRENCY_LATENCY_THRESHOLD = 5.0
+    AWS_SAGEMAKER_CIRCUIT_FAILURE_THRESHOLD = 5
+    AWS_SAGEMAKER_CIRCUIT_RESET_TIMEOUT = 10.0
+    AWS_SNS_SPOOL_DIR = None
+    AWS_SNS_SPOOL_SEGMENT_BYTES = 16 * 1024 * 1024
+    AWS_SNS_SPOOL_DRAIN_BATCH_SIZE = 100
+    AWS_SNS_SPOOL_MAX_BACKOFF = 30.0
+    AWS_SNS_SPOOL_SYNC = False
+    PREDICTIONS_SCHEMA_VALIDATION = False
+    IDEMPOTENCY_STORE = None
+    IDEMPOTENCY_STORE_PATH = '/tmp/ml-ids-idempotency.db'
+    IDEMPOTENCY_MAX_ENTRIES = 10000
+    IDEMPOTENCY_TTL = 600.0
+    IDEMPOTENCY_LEASE = 60.0
+    IDEMPOTENCY_WAIT_TIMEOUT = 30.0
+    IDEMPOTENCY_HASH_BODY = True
+    REQUEST_MAX_DECOMPRESSED_BYTES = 256 * 1024 * 1024
+    RESPONSE_COMPRESSION = True
+    RESPONSE_COMPRESSION_MIN_BYTES = 1024
+    AWS_SNS_COMPRESSION = None
+    AWS_SNS_NOTIFICATION_MODE = 'flow'
+    AWS_SNS_DIGEST_KEYS = ['dst_port', 'protocol']
+    AWS_SNS_DIGEST_WINDOW = 60.0
+    AWS_SNS_DIGEST_MAX_FLOWS = 10000
+    AWS_SNS_DIGEST_SAMPLE_ROWS = 3
+    MAX_CONTENT_LENGTH = 256 * 1024 * 1024
+    REQUEST_MAX_ROWS = None
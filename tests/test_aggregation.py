@@ -0,0 +1,199 @@
+import json
+import threading
+import time
+import pandas as pd
+import pytest
+
+from unittest.mock import MagicMock
+
+from ml_ids_api.aggregation import DigestAggregator
+from ml_ids_api.app import create_digest_aggregator, create_sns_message_producer
+from ml_ids_api.data import SplitFrame
+from ml_ids_api.messaging import AsyncMessageProducer, SNSMessageProducer
+from ml_ids_api.spool import SpoolingMessageProducer
+from tests.config import TestConfig
+
+COLUMNS = ['dst_port', 'protocol', 'timestamp', 'prediction']
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def create_frame(*rows):
+    return SplitFrame(columns=COLUMNS, data=[list(row) for row in rows])
+
+
+def test_aggregator_must_group_flows_by_key_columns():
+    clock = Clock()
+    aggregator = DigestAggregator(keys=['dst_port', 'protocol'], window=10.0, sample_rows=1, clock=clock)
+
+    assert aggregator.add(create_frame([22, 6, '21/02/2018 10:15:08', 1], [80, 6, '21/02/2018 10:15:00', 1],
+                                       [22, 6, '01/03/2018 09:00:00', 1])) == []
+    clock.now += 5.0
+    aggregator.add(create_frame([22, 6, '20/02/2018 23:59:59', 1]))
+    clock.now += 5.0
+    digests = aggregator.flush()
+
+    assert [(digest.key, digest.flows) for digest in digests] == [({'dst_port': 22, 'protocol': 6}, 3),
+                                                                  ({'dst_port': 80, 'protocol': 6}, 1)]
+    assert digests[0].first_timestamp == '2018-02-20T23:59:59'
+    assert digests[0].last_timestamp == '2018-03-01T09:00:00'
+    assert (digests[0].window_start, digests[0].window_end) == (1000.0, 1010.0)
+    assert digests[0].columns == COLUMNS
+    assert digests[0].samples == [[22, 6, '21/02/2018 10:15:08', 1]]
+    assert aggregator.metrics() == {'open_windows': 0, 'flows': 4, 'digests': 2}
+
+
+def test_aggregator_must_group_dataframe_flows_with_parsed_timestamps():
+    data = pd.read_json(json.dumps({'columns': COLUMNS, 'data': [[22, 6, '21/02/2018 10:15:08', 1]] * 2}),
+                        orient='split')
+    aggregator = DigestAggregator(keys=['dst_port', 'protocol'])
+
+    aggregator.add(data)
+    digest = aggregator.flush(force=True)[0]
+
+    assert digest.key == {'dst_port': 22, 'protocol': 6}
+    assert type(digest.key['dst_port']) is int
+    assert digest.flows == 2
+    assert digest.first_timestamp == digest.last_timestamp == '2018-02-21T10:15:08'
+
+
+def test_aggregator_when_window_full_must_close_window():
+    aggregator = DigestAggregator(keys=['dst_port'], max_flows=2)
+
+    assert aggregator.add(create_frame([22, 6, None, 1])) == []
+    digests = aggregator.add(create_frame([22, 6, None, 1], [22, 6, None, 1]))
+
+    assert [digest.flows for digest in digests] == [3]
+    assert digests[0].first_timestamp is None
+    assert aggregator.metrics()['open_windows'] == 0
+
+
+def test_aggregator_when_too_many_windows_open_must_close_oldest_window():
+    aggregator = DigestAggregator(keys=['dst_port'], max_windows=2)
+
+    digests = aggregator.add(create_frame(*[[port, 6, None, 1] for port in (21, 22, 23)]))
+
+    assert [digest.key for digest in digests] == [{'dst_port': 21}]
+
+
+def test_aggregator_must_group_missing_key_values_as_none():
+    aggregator = DigestAggregator(keys=['dst_port', 'src_ip'])
+
+    aggregator.add(create_frame([22, 6, None, 1], [None, 6, None, 1], [None, 17, None, 1]))
+
+    digests = sorted(aggregator.flush(force=True), key=lambda digest: digest.flows)
+
+    assert [(digest.key, digest.flows) for digest in digests] == [({'dst_port': 22, 'src_ip': None}, 1),
+                                                                  ({'dst_port': None, 'src_ip': None}, 2)]
+
+
+def test_aggregator_when_no_keys_given_must_raise_value_error():
+    with pytest.raises(ValueError):
+        DigestAggregator(keys=[])
+
+
+def test_producer_when_aggregator_given_must_publish_digests_of_attacks_and_benign_flows_individually():
+    client = MagicMock()
+    producer = SNSMessageProducer(client=client, topic='topic',
+                                  aggregator=DigestAggregator(keys=['dst_port', 'protocol'], max_flows=3))
+
+    producer.publish_predictions(create_frame([22, 6, None, 1], [22, 6, None, 1], [80, 6, None, 0]))
+    producer.publish_predictions(create_frame([22, 6, None, 1]))
+
+    messages = [call[1] for call in client.publish.call_args_list]
+    assert [message['attrs']['prediction']['StringValue'] for message in messages] == ['benign', 'attack']
+    assert messages[1]['attrs']['notification_type']['StringValue'] == 'digest'
+
+    digest = json.loads(messages[1]['message'])
+    assert digest['key'] == {'dst_port': 22, 'protocol': 6}
+    assert digest['count'] == 3
+    assert digest['samples'] == {'columns': COLUMNS, 'data': [[22, 6, None, 1]] * 3}
+    assert producer.metrics() == {'published': 2, 'suppressed': 0, 'aggregated': 3}
+    producer.shutdown()
+
+
+def test_producer_must_publish_expired_digests_in_background_and_open_digests_on_shutdown():
+    client = MagicMock()
+    published = threading.Event()
+    client.publish = MagicMock(side_effect=lambda **kwargs: published.set())
+    producer = SNSMessageProducer(client=client, topic='topic',
+                                  aggregator=DigestAggregator(keys=['dst_port'], window=0.05))
+
+    producer.publish_predictions(create_frame([22, 6, None, 1]))
+    assert published.wait(5.0)
+
+    producer.aggregator.window = 60.0
+    producer.publish_predictions(create_frame([80, 6, None, 1]))
+    producer.shutdown()
+
+    assert [json.loads(call[1]['message'])['key'] for call in client.publish.call_args_list] == \
+        [{'dst_port': 22}, {'dst_port': 80}]
+
+
+def test_spooling_producer_must_spool_expired_digests_and_retry_failed_publishing(tmpdir):
+    client = MagicMock()
+    published = []
+    attempts = {'count': 0}
+
+    def publish(**kwargs):
+        attempts['count'] += 1
+        if attempts['count'] == 1:
+            raise IOError('unavailable')
+        published.append(kwargs)
+
+    client.publish = MagicMock(side_effect=publish)
+    producer = SpoolingMessageProducer(SNSMessageProducer(client=client, topic='topic',
+                                                          aggregator=DigestAggregator(keys=['dst_port'], window=0.05)),
+                                       str(tmpdir), initial_backoff=0.01)
+
+    producer.publish_predictions(create_frame([22, 6, None, 1]))
+    deadline = time.monotonic() + 5.0
+    while not published and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    producer.producer.aggregator.window = 60.0
+    producer.publish_predictions(create_frame([80, 6, None, 1]))
+    producer.shutdown()
+
+    assert [json.loads(message['message'])['key'] for message in published] == [{'dst_port': 22}, {'dst_port': 80}]
+    assert producer.metrics()['spooled'] == 2
+    assert producer.metrics()['failed'] == 1
+
+
+def test_async_producer_must_enqueue_expired_digests_and_publish_open_digests_on_shutdown():
+    client = MagicMock()
+    published = threading.Event()
+    client.publish = MagicMock(side_effect=lambda **kwargs: published.set())
+    producer = AsyncMessageProducer(SNSMessageProducer(client=client, topic='topic',
+                                                       aggregator=DigestAggregator(keys=['dst_port'], window=0.05)))
+
+    producer.publish_predictions(create_frame([22, 6, None, 1]))
+    assert published.wait(5.0)
+
+    producer.producer.aggregator.window = 60.0
+    producer.publish_predictions(create_frame([80, 6, None, 1]))
+    producer.shutdown()
+
+    assert [json.loads(call[1]['message'])['key'] for call in client.publish.call_args_list] == \
+        [{'dst_port': 22}, {'dst_port': 80}]
+    assert producer.metrics()['enqueued'] == 3
+
+
+def test_create_digest_aggregator_must_follow_notification_mode():
+    config = {key: getattr(TestConfig, key) for key in dir(TestConfig) if key.isupper()}
+
+    assert create_digest_aggregator(config) is None
+    assert create_sns_message_producer(config, MagicMock()).aggregator is None
+
+    config['AWS_SNS_NOTIFICATION_MODE'] = 'digest'
+    assert create_digest_aggregator(config).keys == ['dst_port', 'protocol']
+
+    config['AWS_SNS_NOTIFICATION_MODE'] = 'batch'
+    with pytest.raises(ValueError):
+        create_digest_aggregator(config)
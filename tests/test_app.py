@@ -4,9 +4,12 @@ import pandas.util.testing as pdu
 
 from unittest.mock import MagicMock
 
-from ml_ids_api.app import create_flask_app, register_api_endpoints
+from ml_ids_api.app import create_flask_app, register_api_endpoints, create_sns_message_producer
 from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient, AwsSagemakerHttpClientError
-from ml_ids_api.messaging import SNSMessageProducer
+from ml_ids_api.messaging import SNSMessageProducer, AsyncMessageProducer
+from ml_ids_api.metrics import PrometheusMetrics
+from ml_ids_api.resilience import ServiceUnavailableError
+from ml_ids_api.data import SplitFrame
 from ml_ids_api.util.constants import HttpHeaders, MimeTypes
 
 
@@ -45,6 +48,18 @@ def client(sagemaker_client_mock, sns_producer_mock):
         yield client
 
 
+@pytest.fixture
+def json_parser_client(sagemaker_client_mock, sns_producer_mock):
+    app = create_flask_app('config.TestConfig')
+    app.config['TESTING'] = True
+    app.config['PREDICTIONS_PARSER'] = 'json'
+
+    register_api_endpoints(app, sagemaker_client_mock, sns_producer_mock)
+
+    with app.test_client() as client:
+        yield client
+
+
 def post_predictions(client, headers=None, data=None):
     return client.post('/api/predictions', headers=headers, data=data)
 
@@ -116,6 +131,28 @@ def test_predictions_must_send_notifications(client,
     pdu.assert_frame_equal(df.drop(columns=['prediction']), test_data)
 
 
+def test_predictions_when_json_parser_configured_must_send_notifications(json_parser_client,
+                                                                         sagemaker_client_mock,
+                                                                         sns_producer_mock,
+                                                                         test_data_json):
+    res = post_predictions(json_parser_client,
+                           headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                           data=test_data_json)
+
+    assert res.status_code == 200
+    assert res.json == [0, 1, 0]
+    sns_producer_mock.publish_predictions.assert_called_once_with(
+        SplitFrame(columns=['feature', 'prediction'], data=[[1, 0], [2, 1], [3, 0]]))
+
+
+def test_predictions_when_json_parser_configured_and_invalid_body_given_must_return_bad_request(json_parser_client):
+    res = post_predictions(json_parser_client,
+                           headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                           data='i_am_invalid')
+
+    assert res.status_code == 400
+
+
 def test_predictions_when_sagemaker_request_fails_must_return_internal_server_error(client,
                                                                                     test_data_json,
                                                                                     sagemaker_client_mock):
@@ -128,6 +165,20 @@ def test_predictions_when_sagemaker_request_fails_must_return_internal_server_er
     assert res.status_code == 500
 
 
+def test_predictions_when_sagemaker_request_rejected_must_return_service_unavailable(client,
+                                                                                    test_data_json,
+                                                                                    sagemaker_client_mock):
+    sagemaker_client_mock.post_invocations = MagicMock(side_effect=ServiceUnavailableError('circuit_open', 4.2))
+
+    res = post_predictions(client,
+                           headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                           data=test_data_json)
+
+    assert res.status_code == 503
+    assert res.headers[HttpHeaders.RETRY_AFTER] == '5'
+    assert 'circuit_open' in res.get_json()['error']
+
+
 def test_predictions_when_sns_request_fails_must_return_internal_server_error(client,
                                                                               test_data_json,
                                                                               sns_producer_mock):
@@ -139,3 +190,169 @@ def test_predictions_when_sns_request_fails_must_return_internal_server_error(cl
 
     print(res.data)
     assert res.status_code == 500
+
+
+def test_create_sns_message_producer_must_create_synchronous_producer_by_default():
+    app = create_flask_app('config.TestConfig')
+
+    producer = create_sns_message_producer(app.config, sns_client=None)
+
+    assert isinstance(producer, SNSMessageProducer)
+
+
+def test_create_sns_message_producer_must_register_producer_metrics():
+    app = create_flask_app('config.TestConfig')
+    metrics = MagicMock()
+
+    producer = create_sns_message_producer(app.config, sns_client=None, metrics=metrics)
+
+    metrics.register_source.assert_called_once_with('sns_producer', producer.metrics)
+
+
+def test_create_sns_message_producer_when_async_publishing_enabled_must_create_async_producer():
+    app = create_flask_app('config.TestConfig')
+    app.config['AWS_SNS_ASYNC_PUBLISHING'] = True
+
+    producer = create_sns_message_producer(app.config, sns_client=None)
+
+    assert isinstance(producer, AsyncMessageProducer)
+    assert isinstance(producer.producer, SNSMessageProducer)
+    producer.shutdown()
+
+
+def test_create_sns_message_producer_when_async_publishing_enabled_must_register_queue_metrics():
+    app = create_flask_app('config.TestConfig')
+    app.config['AWS_SNS_ASYNC_PUBLISHING'] = True
+    metrics = MagicMock()
+
+    producer = create_sns_message_producer(app.config, sns_client=None, metrics=metrics)
+
+    metrics.register_source.assert_any_call('sns_producer', producer.producer.metrics)
+    metrics.register_source.assert_any_call('sns_publish_queue', producer.metrics)
+    producer.shutdown()
+
+
+def post_stream_predictions(client, headers=None, data=None):
+    return client.post('/api/predictions/stream', headers=headers, data=data)
+
+
+def test_stream_predictions_when_invalid_content_type_given_must_return_unsupported_media_type(client):
+    res = post_stream_predictions(client,
+                                  headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                                  data=b'{"feature": 1}\n')
+
+    assert res.status_code == 415
+
+
+@pytest.mark.parametrize('data', [b'', b'\n', b'i_am_invalid\n'])
+def test_stream_predictions_when_no_valid_first_record_given_must_return_bad_request(client, data):
+    res = post_stream_predictions(client,
+                                  headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_NDJSON},
+                                  data=data)
+
+    assert res.status_code == 400
+
+
+def test_stream_predictions_must_stream_predictions_and_send_notifications(client,
+                                                                          sagemaker_client_mock,
+                                                                          sns_producer_mock):
+    res = post_stream_predictions(client,
+                                  headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_NDJSON},
+                                  data=b'{"feature": 1}\n{"feature": 2}\n{"feature": 3}\n')
+
+    assert res.status_code == 200
+    assert res.mimetype == MimeTypes.APPLICATION_NDJSON
+    assert res.data == b'0\n1\n0\n'
+    sns_producer_mock.publish_predictions.assert_called_once_with(
+        SplitFrame(columns=['feature', 'prediction'], data=[[1, 0], [2, 1], [3, 0]], row_index=[0, 1, 2]))
+
+
+def test_predictions_when_msgpack_body_given_must_return_predictions_and_send_notifications(client,
+                                                                                          sagemaker_client_mock,
+                                                                                          sns_producer_mock):
+    msgpack = pytest.importorskip('msgpack')
+
+    res = post_predictions(client,
+                           headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_MSGPACK_PANDAS_SPLIT},
+                           data=msgpack.packb({'columns': ['feature'], 'data': [[1], [2], [3]]}))
+
+    assert res.status_code == 200
+    assert res.json == [0, 1, 0]
+    sagemaker_client_mock.post_invocations.assert_called_once_with(b'{"columns":["feature"],"data":[[1],[2],[3]]}')
+    sns_producer_mock.publish_predictions.assert_called_once_with(
+        SplitFrame(columns=['feature', 'prediction'], data=[[1, 0], [2, 1], [3, 0]]))
+
+
+def test_predictions_when_msgpack_response_accepted_must_return_msgpack_predictions(client, test_data_json):
+    msgpack = pytest.importorskip('msgpack')
+
+    res = post_predictions(client,
+                           headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT,
+                                    HttpHeaders.ACCEPT: MimeTypes.APPLICATION_MSGPACK},
+                           data=test_data_json)
+
+    assert res.status_code == 200
+    assert res.mimetype == MimeTypes.APPLICATION_MSGPACK
+    assert msgpack.unpackb(res.data) == [0, 1, 0]
+
+
+def test_predictions_when_arrow_body_given_must_return_arrow_predictions(client, sns_producer_mock):
+    pyarrow = pytest.importorskip('pyarrow')
+    batch = pyarrow.RecordBatch.from_arrays([pyarrow.array([1, 2, 3])], ['feature'])
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+
+    res = post_predictions(client,
+                           headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_ARROW_STREAM,
+                                    HttpHeaders.ACCEPT: MimeTypes.APPLICATION_ARROW_STREAM},
+                           data=sink.getvalue().to_pybytes())
+
+    assert res.status_code == 200
+    assert res.mimetype == MimeTypes.APPLICATION_ARROW_STREAM
+    assert pyarrow.ipc.open_stream(res.data).read_all().column('prediction').to_pylist() == [0, 1, 0]
+    sns_producer_mock.publish_predictions.assert_called_once_with(
+        SplitFrame(columns=['feature', 'prediction'], data=[[1, 0], [2, 1], [3, 0]]))
+
+
+def test_predictions_when_invalid_arrow_body_given_must_return_bad_request(client):
+    pytest.importorskip('pyarrow')
+
+    res = post_predictions(client,
+                           headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_ARROW_STREAM},
+                           data=b'i_am_invalid')
+
+    assert res.status_code == 400
+
+
+@pytest.fixture
+def metrics_client(sagemaker_client_mock, sns_producer_mock):
+    pytest.importorskip('prometheus_client')
+    app = create_flask_app('config.TestConfig')
+    app.config['TESTING'] = True
+
+    register_api_endpoints(app, sagemaker_client_mock, sns_producer_mock, PrometheusMetrics())
+
+    with app.test_client() as client:
+        yield client
+
+
+def test_metrics_when_disabled_must_return_not_found(client):
+    res = client.get('/metrics')
+
+    assert res.status_code == 404
+
+
+def test_metrics_must_expose_request_and_stage_metrics(metrics_client, test_data_json):
+    post_predictions(metrics_client,
+                     headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                     data=test_data_json)
+
+    res = metrics_client.get('/metrics')
+
+    assert res.status_code == 200
+    assert res.content_type.startswith('text/plain')
+    assert b'ml_ids_requests_total{route="/api/predictions",status="200"} 1.0' in res.data
+    assert b'ml_ids_rows_total 3.0' in res.data
+    for stage in ('validate', 'deserialize', 'invoke', 'merge', 'publish', 'serialize'):
+        assert 'ml_ids_stage_duration_seconds_count{{stage="{}"}} 1.0'.format(stage).encode('utf-8') in res.data
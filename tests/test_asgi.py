@@ -0,0 +1,338 @@
+import asyncio
+import gzip
+import json
+import pytest
+import threading
+
+from flask import Config
+from unittest.mock import MagicMock
+
+pytest.importorskip('aiohttp')
+
+from ml_ids_api.asgi import AsgiApplication, check_supported_options, create_async_sagemaker_client  # noqa: E402
+from ml_ids_api.aws.client.async_sagemaker_client import AsyncAwsSagemakerHttpClient  # noqa: E402
+from ml_ids_api.batching import AsyncChunkedPredictionClient  # noqa: E402
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError  # noqa: E402
+from ml_ids_api.data import SplitFrame  # noqa: E402
+from ml_ids_api.metrics import PrometheusMetrics  # noqa: E402
+from ml_ids_api.util.constants import MimeTypes  # noqa: E402
+
+TEST_DATA_JSON = json.dumps({'columns': ['feature'], 'data': [[1], [2], [3]]}).encode('utf-8')
+
+
+class SagemakerClientStub:
+    def __init__(self, predictions=None, error=None):
+        self.predictions = predictions
+        self.error = error
+        self.requests = []
+        self.closed = False
+
+    async def post_invocations(self, request_body):
+        self.requests.append(request_body)
+        if self.error is not None:
+            raise self.error
+        if self.predictions is not None:
+            return self.predictions
+        return [row[0] % 2 for row in json.loads(request_body)['data']]
+
+    async def close(self):
+        self.closed = True
+
+
+class ProducerStub:
+    def __init__(self):
+        self.published = []
+        self.shutdown = MagicMock()
+
+    async def publish_predictions(self, data):
+        self.published.append(data)
+
+
+@pytest.fixture
+def sagemaker_client():
+    return SagemakerClientStub(predictions=[0, 1, 0])
+
+
+@pytest.fixture
+def producer():
+    return ProducerStub()
+
+
+def create_config():
+    config = Config('.')
+    config.from_object('config.TestConfig')
+    return config
+
+
+@pytest.fixture
+def app(sagemaker_client, producer):
+    config = create_config()
+    config['PREDICTIONS_PARSER'] = 'json'
+    return AsgiApplication(config, sagemaker_client, producer)
+
+
+def call(app, method, path, headers=None, body_chunks=(b'',)):
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http',
+             'method': method,
+             'path': path,
+             'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                         for name, value in (headers or {}).items()]}
+
+    asyncio.get_event_loop().run_until_complete(app(scope, receive, send))
+
+    response_headers = dict(sent[0]['headers'])
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return sent[0]['status'], response_headers, body
+
+
+def post_predictions(app, content_type=MimeTypes.APPLICATION_JSON_PANDAS_SPLIT, body=TEST_DATA_JSON, **headers):
+    return call(app, 'POST', '/api/predictions', headers=dict(headers, **{'Content-Type': content_type}),
+                body_chunks=(body,))
+
+
+def test_root(app):
+    assert call(app, 'GET', '/')[::2] == (200, b'ML-IDS API')
+
+
+def test_unknown_path_must_return_not_found(app):
+    assert call(app, 'GET', '/unknown')[0] == 404
+
+
+def test_unsupported_method_must_return_method_not_allowed(app):
+    assert call(app, 'GET', '/api/predictions')[0] == 405
+
+
+def test_predictions_when_invalid_content_type_given_must_return_unsupported_media_type(app):
+    status, _, body = post_predictions(app, content_type='application/json')
+
+    assert status == 415
+    assert 'is not supported' in json.loads(body)['error']
+
+
+def test_predictions_when_no_request_body_given_must_return_bad_request(app):
+    assert post_predictions(app, body=b'')[0] == 400
+
+
+def test_predictions_when_invalid_request_body_given_must_return_bad_request(app):
+    assert post_predictions(app, body=b'i_am_invalid')[0] == 400
+
+
+def test_predictions_must_return_predictions_and_send_notifications(app, sagemaker_client, producer):
+    status, headers, body = call(app, 'POST', '/api/predictions',
+                                 headers={'Content-Type': MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                                 body_chunks=(TEST_DATA_JSON[:10], TEST_DATA_JSON[10:]))
+
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert json.loads(body) == [0, 1, 0]
+    assert sagemaker_client.requests == [TEST_DATA_JSON]
+    assert producer.published == [SplitFrame(columns=['feature', 'prediction'], data=[[1, 0], [2, 1], [3, 0]])]
+
+
+def test_predictions_must_deserialize_merge_and_serialize_off_the_event_loop(app):
+    threads = []
+    deserialize, merge = app.deserialize, app.merge
+    app.deserialize = lambda body: threads.append(threading.get_ident()) or deserialize(body)
+    app.merge = lambda data, predictions: threads.append(threading.get_ident()) or merge(data, predictions)
+
+    status, _, _ = post_predictions(app)
+
+    assert status == 200
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
+
+
+def test_predictions_when_sagemaker_request_fails_must_return_internal_server_error(app, sagemaker_client):
+    sagemaker_client.error = AwsSagemakerHttpClientError('Failed')
+
+    status, _, body = post_predictions(app)
+
+    assert status == 500
+    assert 'Failed' in json.loads(body)['error']
+
+
+def test_predictions_when_msgpack_response_accepted_must_return_msgpack_predictions(app):
+    msgpack = pytest.importorskip('msgpack')
+
+    status, headers, body = post_predictions(app, Accept=MimeTypes.APPLICATION_MSGPACK)
+
+    assert status == 200
+    assert headers[b'content-type'] == MimeTypes.APPLICATION_MSGPACK.encode('latin-1')
+    assert msgpack.unpackb(body) == [0, 1, 0]
+
+
+def test_stream_predictions_must_stream_predictions_in_batches(app, sagemaker_client, producer):
+    sagemaker_client.predictions = None
+    app.config['STREAM_BATCH_ROWS'] = 2
+
+    status, headers, body = call(app, 'POST', '/api/predictions/stream',
+                                 headers={'Content-Type': MimeTypes.APPLICATION_NDJSON},
+                                 body_chunks=(b'{"feature": 1}\n{"fea', b'ture": 2}\n\n{"feature": 3}'))
+
+    assert status == 200
+    assert headers[b'content-type'] == MimeTypes.APPLICATION_NDJSON.encode('latin-1')
+    assert body == b'1\n0\n1\n'
+    assert len(sagemaker_client.requests) == 2
+    assert producer.published[1] == SplitFrame(columns=['feature', 'prediction'], data=[[3, 1]], row_index=[2])
+
+
+def test_stream_predictions_when_batch_not_filled_in_time_must_stream_waiting_predictions(app, sagemaker_client):
+    sagemaker_client.predictions = None
+    app.config['STREAM_MAX_BATCH_WAIT_MS'] = 50.0
+    sent = []
+    first_batch_sent = asyncio.Event()
+
+    async def receive():
+        if not sent:
+            return {'type': 'http.request', 'body': b'{"feature": 1}\n{"feature": 2}\n', 'more_body': True}
+        # the client pauses until it receives the predictions of the waiting records
+        await asyncio.wait_for(first_batch_sent.wait(), timeout=5.0)
+        return {'type': 'http.request', 'body': b'{"feature": 3}\n', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+        if message.get('body'):
+            first_batch_sent.set()
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/predictions/stream',
+             'headers': [(b'content-type', MimeTypes.APPLICATION_NDJSON.encode('latin-1'))]}
+    asyncio.get_event_loop().run_until_complete(app(scope, receive, send))
+
+    assert [message.get('body') for message in sent[1:] if message.get('body')] == [b'1\n0\n', b'1\n']
+    assert len(sagemaker_client.requests) == 2
+
+
+@pytest.mark.parametrize('body', [b'', b'i_am_invalid\n', b'{"feature": "' + b'x' * 100 + b'"}\n'])
+def test_stream_predictions_when_no_valid_first_record_given_must_return_bad_request(app, body):
+    app.config['STREAM_MAX_LINE_BYTES'] = 50
+
+    status, _, _ = call(app, 'POST', '/api/predictions/stream',
+                        headers={'Content-Type': MimeTypes.APPLICATION_NDJSON}, body_chunks=(body,))
+
+    assert status == 400
+
+
+def test_stream_predictions_when_invalid_record_given_must_report_error(app, sagemaker_client):
+    sagemaker_client.predictions = None
+
+    status, _, body = call(app, 'POST', '/api/predictions/stream',
+                           headers={'Content-Type': MimeTypes.APPLICATION_NDJSON},
+                           body_chunks=(b'{"feature": 1}\n[]\n',))
+
+    lines = body.splitlines()
+    assert status == 200
+    assert lines[0] == b'1'
+    assert 'Line 2' in json.loads(lines[1])['error']
+
+
+def test_lifespan_shutdown_must_close_clients(app, sagemaker_client, producer):
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.get_event_loop().run_until_complete(app({'type': 'lifespan'}, receive, send))
+
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert sagemaker_client.closed
+    producer.shutdown.assert_called_once()
+
+
+def test_create_async_sagemaker_client_must_split_oversized_requests_by_default():
+    client = create_async_sagemaker_client(create_config())
+
+    assert isinstance(client, AsyncChunkedPredictionClient)
+    assert isinstance(client.client, AsyncAwsSagemakerHttpClient)
+    assert client.client.max_retries == 0
+
+
+def test_metrics_must_expose_request_metrics(sagemaker_client, producer):
+    pytest.importorskip('prometheus_client')
+    config = create_config()
+    config['PREDICTIONS_PARSER'] = 'json'
+    app = AsgiApplication(config, sagemaker_client, producer, PrometheusMetrics())
+
+    post_predictions(app)
+    status, headers, body = call(app, 'GET', '/metrics')
+
+    assert status == 200
+    assert headers[b'content-type'].startswith(b'text/plain')
+    assert b'ml_ids_requests_total{route="/api/predictions",status="200"} 1.0' in body
+    assert b'ml_ids_payload_bytes_count{direction="response",route="/api/predictions"} 1.0' in body
+    assert b'ml_ids_stage_duration_seconds_count{stage="invoke"} 1.0' in body
+
+
+def test_metrics_when_disabled_must_return_not_found(app):
+    assert call(app, 'GET', '/metrics')[0] == 404
+
+
+def test_predictions_when_request_compressed_must_return_compressed_predictions(app, sagemaker_client):
+    sagemaker_client.predictions = [0] * 1000
+    body = json.dumps({'columns': ['feature'], 'data': [[i] for i in range(1000)]}).encode('utf-8')
+
+    status, headers, response_body = post_predictions(app, body=gzip.compress(body), **{'Content-Encoding': 'gzip',
+                                                                                         'Accept-Encoding': 'gzip'})
+
+    assert status == 200
+    assert headers[b'content-encoding'] == b'gzip'
+    assert headers[b'vary'] == b'Accept-Encoding'
+    assert json.loads(gzip.decompress(response_body)) == [0] * 1000
+    assert json.loads(sagemaker_client.requests[0]) == json.loads(body)
+
+
+def test_predictions_when_request_encoding_unsupported_must_return_unsupported_media_type(app):
+    status, _, _ = post_predictions(app, **{'Content-Encoding': 'br'})
+
+    assert status == 415
+
+
+def test_predictions_when_body_exceeds_limits_must_return_payload_too_large(app, sagemaker_client):
+    app.config.update(MAX_CONTENT_LENGTH=1024, REQUEST_MAX_ROWS=2)
+    body = json.dumps({'columns': ['feature'], 'data': [[i] for i in range(200)]}).encode('utf-8')
+
+    declared_status, _, _ = post_predictions(app, body=body, **{'Content-Length': str(len(body))})
+    chunked_status, _, chunked_body = call(app, 'POST', '/api/predictions',
+                                           headers={'Content-Type': MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                                           body_chunks=(body[:1000], body[1000:]))
+    rows_status, _, rows_body = post_predictions(app)
+
+    assert declared_status == chunked_status == rows_status == 413
+    assert b'exceeds the maximum size of 1024 bytes' in chunked_body
+    assert b'maximum of 2 flows' in rows_body
+    assert not sagemaker_client.requests
+
+
+def test_predictions_when_content_length_invalid_must_return_bad_request(app, sagemaker_client):
+    status, _, body = post_predictions(app, **{'Content-Length': 'invalid'})
+
+    assert status == 400
+    assert b'Invalid Content-Length header' in body
+    assert not sagemaker_client.requests
+
+
+@pytest.mark.parametrize('option, value', [('IDEMPOTENCY_STORE', 'memory'),
+                                           ('AWS_SAGEMAKER_OVERLOAD_PROTECTION', True),
+                                           ('AWS_SAGEMAKER_COALESCING', True),
+                                           ('PREDICTION_CACHE', 'memory'),
+                                           ('AWS_SAGEMAKER_HEDGING', True)])
+def test_check_supported_options_when_flask_only_option_enabled_must_raise_value_error(option, value):
+    config = create_config()
+    check_supported_options(config)
+    config[option] = value
+
+    with pytest.raises(ValueError, match=option):
+        check_supported_options(config)
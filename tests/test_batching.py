@@ -0,0 +1,300 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+import responses
+
+from unittest.mock import MagicMock
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient, AwsSagemakerHttpClientError
+from ml_ids_api.batching import PredictionRequestCoalescer, ChunkedPredictionClient, AsyncChunkedPredictionClient
+
+
+def create_body(values, columns=None):
+    return json.dumps({'columns': columns or ['feature'], 'data': [[value] for value in values]}).encode('utf-8')
+
+
+def predict_features(request_body):
+    return [row[0] for row in json.loads(request_body)['data']]
+
+
+@pytest.fixture
+def sagemaker_client_mock():
+    client = MagicMock()
+    client.post_invocations = MagicMock(side_effect=predict_features)
+    return client
+
+
+def post_concurrently(coalescer, bodies):
+    results = [None] * len(bodies)
+    barrier = threading.Barrier(len(bodies))
+
+    def post(i):
+        barrier.wait()
+        try:
+            results[i] = coalescer.post_invocations(bodies[i])
+        except Exception as err:
+            results[i] = err
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(len(bodies))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def test_post_invocations_must_combine_concurrent_requests(sagemaker_client_mock):
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock, max_wait_ms=200)
+    bodies = [create_body([i * 10 + j for j in range(i + 1)]) for i in range(5)]
+
+    results = post_concurrently(coalescer, bodies)
+
+    assert results == [predict_features(body) for body in bodies]
+    assert sagemaker_client_mock.post_invocations.call_count == 1
+    assert coalescer.metrics() == {'requests': 5, 'invocations': 1}
+
+
+def test_post_invocations_must_not_combine_requests_with_different_columns(sagemaker_client_mock):
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock, max_wait_ms=50)
+    bodies = [create_body([1], columns=['a']), create_body([2], columns=['b'])]
+
+    results = post_concurrently(coalescer, bodies)
+
+    assert results == [[1], [2]]
+    assert sagemaker_client_mock.post_invocations.call_count == 2
+
+
+def test_post_invocations_must_limit_rows_per_invocation(sagemaker_client_mock):
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock, max_wait_ms=50, max_rows=4)
+    bodies = [create_body([i, i]) for i in range(4)]
+
+    results = post_concurrently(coalescer, bodies)
+
+    assert results == [[i, i] for i in range(4)]
+    for call in sagemaker_client_mock.post_invocations.call_args_list:
+        assert len(json.loads(call[0][0])['data']) <= 4
+
+
+def test_post_invocations_must_send_large_requests_directly(sagemaker_client_mock):
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock, max_wait_ms=1000, max_rows=2)
+    body = create_body([1, 2, 3])
+
+    assert coalescer.post_invocations(body) == [1, 2, 3]
+    sagemaker_client_mock.post_invocations.assert_called_once_with(body)
+
+
+def test_post_invocations_when_invocation_fails_must_raise_error_for_all_requests(sagemaker_client_mock):
+    sagemaker_client_mock.post_invocations = MagicMock(side_effect=AwsSagemakerHttpClientError('Failed'))
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock, max_wait_ms=100)
+
+    results = post_concurrently(coalescer, [create_body([1]), create_body([2])])
+
+    assert all(isinstance(result, AwsSagemakerHttpClientError) for result in results)
+
+
+def test_post_invocations_when_batch_rejected_must_only_fail_invalid_request(sagemaker_client_mock):
+    def predict_valid_features(request_body):
+        features = predict_features(request_body)
+        if 'invalid' in features:
+            raise AwsSagemakerHttpClientError('Bad Request', status_code=400)
+        return features
+
+    sagemaker_client_mock.post_invocations = MagicMock(side_effect=predict_valid_features)
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock, max_wait_ms=100)
+
+    results = post_concurrently(coalescer, [create_body([1]), create_body(['invalid']), create_body([2])])
+
+    assert results[0] == [1]
+    assert isinstance(results[1], AwsSagemakerHttpClientError)
+    assert results[2] == [2]
+    assert sagemaker_client_mock.post_invocations.call_count == 4
+    assert coalescer.metrics() == {'requests': 3, 'invocations': 4}
+
+
+def test_post_invocations_when_batch_throttled_must_raise_error_for_all_requests(sagemaker_client_mock):
+    sagemaker_client_mock.post_invocations = MagicMock(
+        side_effect=AwsSagemakerHttpClientError('Too Many Requests', status_code=429))
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock, max_wait_ms=100)
+
+    results = post_concurrently(coalescer, [create_body([1]), create_body([2])])
+
+    assert all(isinstance(result, AwsSagemakerHttpClientError) for result in results)
+    assert sagemaker_client_mock.post_invocations.call_count == 1
+
+
+def test_post_invocations_when_prediction_count_mismatches_must_raise_error(sagemaker_client_mock):
+    sagemaker_client_mock.post_invocations = MagicMock(return_value=[0])
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock, max_wait_ms=1)
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        coalescer.post_invocations(create_body([1, 2]))
+
+
+def test_post_invocations_when_invalid_body_given_must_raise_value_error(sagemaker_client_mock):
+    coalescer = PredictionRequestCoalescer(sagemaker_client_mock)
+
+    with pytest.raises(ValueError):
+        coalescer.post_invocations(b'i_am_invalid')
+
+    sagemaker_client_mock.post_invocations.assert_not_called()
+
+
+def test_chunked_post_invocations_must_send_small_requests_unchanged(sagemaker_client_mock):
+    client = ChunkedPredictionClient(sagemaker_client_mock, max_chunk_bytes=1024)
+    body = create_body([1, 2, 3])
+
+    assert client.post_invocations(body) == [1, 2, 3]
+    sagemaker_client_mock.post_invocations.assert_called_once_with(body)
+
+
+def test_chunked_post_invocations_must_split_request_and_preserve_order(sagemaker_client_mock):
+    client = ChunkedPredictionClient(sagemaker_client_mock, max_chunk_bytes=100, max_concurrency=4)
+    values = list(range(1000, 1100))
+
+    predictions = client.post_invocations(create_body(values))
+
+    assert predictions == values
+    assert sagemaker_client_mock.post_invocations.call_count > 1
+    for call in sagemaker_client_mock.post_invocations.call_args_list:
+        assert len(call[0][0]) <= 100
+
+
+def test_chunked_post_invocations_must_retry_failed_chunks(sagemaker_client_mock):
+    failures = {'remaining': 2}
+
+    def predict_with_failures(request_body):
+        if failures['remaining'] > 0:
+            failures['remaining'] -= 1
+            raise AwsSagemakerHttpClientError('Failed', status_code=503)
+        return predict_features(request_body)
+
+    sagemaker_client_mock.post_invocations = MagicMock(side_effect=predict_with_failures)
+    client = ChunkedPredictionClient(sagemaker_client_mock, max_chunk_bytes=100, max_concurrency=1,
+                                     max_retries=2, retry_backoff=0)
+    values = list(range(1000, 1030))
+
+    assert client.post_invocations(create_body(values)) == values
+
+
+def test_chunked_post_invocations_when_retries_exhausted_must_raise_error(sagemaker_client_mock):
+    sagemaker_client_mock.post_invocations = MagicMock(side_effect=AwsSagemakerHttpClientError('Failed'))
+    client = ChunkedPredictionClient(sagemaker_client_mock, max_chunk_bytes=100, max_retries=1, retry_backoff=0)
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        client.post_invocations(create_body(list(range(1000, 1030))))
+
+
+def test_chunked_post_invocations_when_client_error_must_not_retry_and_cancel_remaining_chunks(
+        sagemaker_client_mock):
+    sagemaker_client_mock.post_invocations = MagicMock(side_effect=AwsSagemakerHttpClientError('Failed',
+                                                                                               status_code=400))
+    client = ChunkedPredictionClient(sagemaker_client_mock, max_chunk_bytes=100, max_concurrency=1, max_retries=2,
+                                     retry_backoff=0)
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        client.post_invocations(create_body(list(range(1000, 1030))))
+
+    assert sagemaker_client_mock.post_invocations.call_count == 1
+
+
+def test_chunked_post_invocations_when_chunk_fails_must_not_wait_for_slow_chunks(sagemaker_client_mock):
+    def predict_or_fail(request_body):
+        if json.loads(request_body)['data'][0][0] == 1000:
+            time.sleep(1)
+            return predict_features(request_body)
+        raise AwsSagemakerHttpClientError('Failed', status_code=400)
+
+    sagemaker_client_mock.post_invocations = MagicMock(side_effect=predict_or_fail)
+    client = ChunkedPredictionClient(sagemaker_client_mock, max_chunk_bytes=100, max_concurrency=2)
+    start = time.perf_counter()
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        client.post_invocations(create_body(list(range(1000, 1030))))
+
+    assert time.perf_counter() - start < 0.5
+
+
+def test_chunked_post_invocations_must_invoke_chunks_concurrently(sagemaker_client_mock):
+    def predict_slowly(request_body):
+        time.sleep(0.05)
+        return predict_features(request_body)
+
+    sagemaker_client_mock.post_invocations = MagicMock(side_effect=predict_slowly)
+    body = create_body(list(range(1000, 1080)))
+    elapsed = {}
+
+    for concurrency in [1, 8]:
+        client = ChunkedPredictionClient(sagemaker_client_mock, max_chunk_bytes=100, max_concurrency=concurrency)
+        start = time.perf_counter()
+        client.post_invocations(body)
+        elapsed[concurrency] = time.perf_counter() - start
+
+    assert elapsed[8] < elapsed[1] / 2
+
+
+def test_chunked_post_invocations_must_reassemble_predictions_from_sagemaker_endpoint():
+    sagemaker_client = AwsSagemakerHttpClient(access_key='ACCESS_KEY',
+                                              secret_key='SECRET_KEY',
+                                              schema='http',
+                                              host='sagemaker.aws.com',
+                                              endpoint='/invocations',
+                                              region='eu-west-1')
+    client = ChunkedPredictionClient(sagemaker_client, max_chunk_bytes=200, max_concurrency=4)
+    values = list(range(1000, 1200))
+
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(method=responses.POST,
+                          url='http://sagemaker.aws.com/invocations',
+                          callback=lambda request: (200, {}, json.dumps(predict_features(request.body))))
+
+        assert client.post_invocations(create_body(values)) == values
+        assert len(rsps.calls) > 1
+
+
+class AsyncSagemakerClientStub:
+    def __init__(self):
+        self.requests = []
+
+    async def post_invocations(self, request_body):
+        self.requests.append(request_body)
+        await asyncio.sleep(0)
+        return predict_features(request_body)
+
+
+def test_async_chunked_post_invocations_must_split_request_and_preserve_order():
+    sagemaker_client = AsyncSagemakerClientStub()
+    client = AsyncChunkedPredictionClient(sagemaker_client, max_chunk_bytes=100, max_concurrency=4)
+    values = list(range(1000, 1100))
+
+    predictions = asyncio.get_event_loop().run_until_complete(client.post_invocations(create_body(values)))
+
+    assert predictions == values
+    assert len(sagemaker_client.requests) > 1
+    assert all(len(request_body) <= 100 for request_body in sagemaker_client.requests)
+
+
+def test_async_chunked_post_invocations_when_chunk_fails_must_cancel_remaining_chunks():
+    sagemaker_client = AsyncSagemakerClientStub()
+    cancelled = []
+
+    async def predict_or_fail(request_body):
+        if json.loads(request_body)['data'][0][0] != 1000:
+            raise AwsSagemakerHttpClientError('Failed', status_code=400)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(request_body)
+            raise
+
+    sagemaker_client.post_invocations = predict_or_fail
+    client = AsyncChunkedPredictionClient(sagemaker_client, max_chunk_bytes=100, max_concurrency=4, retry_backoff=0)
+    loop = asyncio.get_event_loop()
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        loop.run_until_complete(client.post_invocations(create_body(list(range(1000, 1030)))))
+    loop.run_until_complete(asyncio.sleep(0))
+
+    assert len(cancelled) == 1
@@ -0,0 +1,155 @@
+import json
+import sqlite3
+import pytest
+
+from flask import Config
+from unittest.mock import MagicMock
+
+from ml_ids_api.app import create_sagemaker_client
+from ml_ids_api.caching import CachingPredictionClient, InMemoryCacheBackend, SqliteCacheBackend, \
+    create_cache_backend
+
+
+def create_body(rows, columns=('feature', 'timestamp')):
+    return json.dumps({'columns': list(columns), 'data': rows}).encode('utf-8')
+
+
+def predict_features(request_body):
+    return [row[0] % 2 for row in json.loads(request_body)['data']]
+
+
+@pytest.fixture
+def sagemaker_client_mock():
+    client = MagicMock()
+    client.post_invocations = MagicMock(side_effect=predict_features)
+    return client
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    return create_cache_backend(backend=request.param,
+                                max_entries=100,
+                                ttl=60,
+                                path=str(tmp_path / 'cache.db'))
+
+
+def test_post_invocations_must_only_send_cache_misses(sagemaker_client_mock, backend):
+    client = CachingPredictionClient(sagemaker_client_mock, backend)
+    client.post_invocations(create_body([[1, 't1'], [2, 't1']]))
+
+    predictions = client.post_invocations(create_body([[3, 't2'], [1, 't2'], [4, 't2'], [2, 't2']]))
+
+    assert predictions == [1, 1, 0, 0]
+    sent = json.loads(sagemaker_client_mock.post_invocations.call_args[0][0])
+    assert sent == {'columns': ['feature', 'timestamp'], 'data': [[3, 't2'], [4, 't2']]}
+
+
+def test_post_invocations_when_all_rows_cached_must_not_invoke_client(sagemaker_client_mock, backend):
+    client = CachingPredictionClient(sagemaker_client_mock, backend)
+    client.post_invocations(create_body([[1, 't1'], [2, 't1']]))
+
+    predictions = client.post_invocations(create_body([[2, 't3'], [1, 't3']]))
+
+    assert predictions == [0, 1]
+    assert sagemaker_client_mock.post_invocations.call_count == 1
+    metrics = client.metrics()
+    assert metrics['hits'] == 2
+    assert metrics['misses'] == 2
+    assert metrics['hit_rate'] == 0.5
+    assert metrics['entries'] == 2
+    assert metrics['memory_bytes'] > 0
+
+
+def test_post_invocations_must_send_duplicate_rows_once(sagemaker_client_mock, backend):
+    client = CachingPredictionClient(sagemaker_client_mock, backend)
+
+    predictions = client.post_invocations(create_body([[1, 't1'], [1, 't2'], [2, 't1']]))
+
+    assert predictions == [1, 1, 0]
+    sent = json.loads(sagemaker_client_mock.post_invocations.call_args[0][0])
+    assert sent['data'] == [[1, 't1'], [2, 't1']]
+
+
+def test_post_invocations_must_distinguish_columns(sagemaker_client_mock, backend):
+    client = CachingPredictionClient(sagemaker_client_mock, backend)
+    client.post_invocations(create_body([[1, 't1']], columns=('a', 'timestamp')))
+
+    client.post_invocations(create_body([[1, 't1']], columns=('b', 'timestamp')))
+
+    assert sagemaker_client_mock.post_invocations.call_count == 2
+
+
+def test_backend_must_evict_least_recently_used_entries(tmp_path):
+    for backend in [InMemoryCacheBackend(max_entries=2),
+                    SqliteCacheBackend(str(tmp_path / 'cache.db'), max_entries=2, access_resolution=0.0)]:
+        backend.set_many({b'a': 0})
+        backend.set_many({b'b': 1})
+        backend.get_many([b'a'])
+        backend.set_many({b'c': 1})
+
+        assert backend.get_many([b'a', b'b', b'c']) == {b'a': 0, b'c': 1}
+        assert backend.stats()['evictions'] == 1
+
+
+def test_sqlite_backend_must_update_access_time_and_evict_periodically(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / 'cache.db'), max_entries=2, access_resolution=60.0, evict_every=3)
+    backend.set_many({b'a': 0})
+    backend.set_many({b'b': 1})
+    backend.get_many([b'a'])
+    backend.set_many({b'c': 1})
+
+    # the recent access of `a` is not recorded, the least recently stored entry is evicted after every third entry
+    assert backend.get_many([b'a', b'b', b'c']) == {b'b': 1, b'c': 1}
+    assert backend.stats()['evictions'] == 1
+
+    backend.set_many({b'd': 0})
+    assert backend.stats()['entries'] == 3
+
+
+def test_sqlite_backend_must_count_entries_without_scanning_table(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    backend = SqliteCacheBackend(path, max_entries=2, evict_every=1)
+    backend.set_many({b'a': 0, b'b': 1})
+    backend.set_many({b'a': 1})
+
+    assert backend.stats()['entries'] == 2
+
+    backend.set_many({b'c': 1})
+
+    assert backend.stats()['entries'] == 2
+    assert SqliteCacheBackend(path).stats()['entries'] == 2
+
+    connection = sqlite3.connect(path)
+    assert connection.execute('SELECT COUNT(*) FROM predictions').fetchone()[0] == 2
+    connection.close()
+
+
+def test_backend_must_expire_entries(tmp_path):
+    for backend in [InMemoryCacheBackend(ttl=0), SqliteCacheBackend(str(tmp_path / 'cache.db'), ttl=0)]:
+        backend.set_many({b'a': 0})
+
+        assert backend.get_many([b'a']) == {}
+
+
+def test_sqlite_backend_must_share_entries_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    SqliteCacheBackend(path).set_many({b'a': 1})
+
+    assert SqliteCacheBackend(path).get_many([b'a']) == {b'a': 1}
+
+
+def test_create_cache_backend_when_invalid_backend_given_must_raise_error():
+    with pytest.raises(ValueError):
+        create_cache_backend(backend='invalid', max_entries=1, ttl=1, path='')
+
+
+def test_create_sagemaker_client_when_cache_configured_must_register_cache_metrics():
+    config = Config('.')
+    config.from_object('config.TestConfig')
+    config.update(PREDICTION_CACHE='memory')
+    metrics = MagicMock()
+
+    client = create_sagemaker_client(config, metrics)
+
+    assert isinstance(client, CachingPredictionClient)
+    metrics.register_source.assert_called_once_with('prediction_cache', client.metrics)
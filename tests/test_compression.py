@@ -0,0 +1,145 @@
+import gzip
+import json
+import pytest
+
+from unittest.mock import MagicMock
+
+from ml_ids_api.app import create_flask_app, register_api_endpoints
+from ml_ids_api.compression import PayloadTooLargeError, UnsupportedEncodingError, compress, compress_text, \
+    decompress, decompress_text
+from ml_ids_api.data import SplitFrame
+from ml_ids_api.messaging import SNSMessageProducer
+from ml_ids_api.util.constants import HttpHeaders, MimeTypes
+
+TEST_DATA_JSON = json.dumps({'columns': ['feature'], 'data': [[i] for i in range(1000)]}).encode('utf-8')
+
+
+@pytest.fixture(params=['gzip', 'zstd'])
+def encoding(request):
+    if request.param == 'zstd':
+        pytest.importorskip('zstandard')
+    return request.param
+
+
+def test_decompress_must_restore_compressed_data(encoding):
+    assert decompress(compress(TEST_DATA_JSON, encoding), encoding, max_bytes=len(TEST_DATA_JSON)) == TEST_DATA_JSON
+
+
+def test_decompress_must_accept_gzip_files_and_identity():
+    assert decompress(gzip.compress(TEST_DATA_JSON), 'x-gzip', max_bytes=len(TEST_DATA_JSON)) == TEST_DATA_JSON
+    assert decompress(TEST_DATA_JSON, None, max_bytes=0) == TEST_DATA_JSON
+    assert decompress(TEST_DATA_JSON, ' Identity ', max_bytes=0) == TEST_DATA_JSON
+
+
+def test_decompress_must_restore_concatenated_gzip_members_and_zstd_frames(encoding):
+    body = compress(TEST_DATA_JSON[:100], encoding) + compress(TEST_DATA_JSON[100:], encoding)
+
+    assert decompress(body, encoding, max_bytes=len(TEST_DATA_JSON)) == TEST_DATA_JSON
+
+
+def test_decompress_when_decompressed_size_exceeds_limit_must_raise_payload_too_large_error(encoding):
+    bomb = compress(b'\0' * 64 * 1024 * 1024, encoding)
+
+    with pytest.raises(PayloadTooLargeError) as err:
+        decompress(bomb, encoding, max_bytes=1024 * 1024)
+
+    assert err.value.limit == 1024 * 1024
+
+
+@pytest.mark.parametrize('corrupt', [lambda data: data[:len(data) // 2], lambda data: b'not compressed'])
+def test_decompress_when_data_invalid_must_raise_value_error(encoding, corrupt):
+    with pytest.raises(ValueError):
+        decompress(corrupt(compress(TEST_DATA_JSON, encoding)), encoding, max_bytes=len(TEST_DATA_JSON))
+
+
+def test_decompress_when_encoding_unsupported_must_raise_unsupported_encoding_error():
+    with pytest.raises(UnsupportedEncodingError):
+        decompress(TEST_DATA_JSON, 'br', max_bytes=len(TEST_DATA_JSON))
+    with pytest.raises(UnsupportedEncodingError):
+        compress(TEST_DATA_JSON, 'br')
+
+
+def test_decompress_text_must_restore_compressed_text(encoding):
+    text = TEST_DATA_JSON.decode('utf-8')
+
+    assert decompress_text(compress_text(text, encoding), encoding) == text
+
+
+def test_sns_producer_when_compression_given_must_compress_messages(encoding):
+    producer = SNSMessageProducer(client=None, topic=None, compression=encoding)
+    data = SplitFrame(columns=['feature', 'prediction'], data=[[1, 1]])
+
+    message = producer.create_notifications(data)[0]
+
+    assert message.attrs['content_encoding'] == {'DataType': 'String', 'StringValue': encoding}
+    assert message.attrs['prediction']['StringValue'] == 'attack'
+    assert json.loads(decompress_text(message.message, encoding))['data'] == [[1, 1]]
+
+
+def test_sns_producer_when_compression_unsupported_must_raise_value_error():
+    with pytest.raises(ValueError):
+        SNSMessageProducer(client=None, topic=None, compression='br')
+
+
+@pytest.fixture
+def sagemaker_client_mock():
+    client = MagicMock()
+    client.post_invocations = MagicMock(side_effect=lambda body: [0] * len(json.loads(body)['data']))
+    return client
+
+
+@pytest.fixture
+def client(sagemaker_client_mock):
+    app = create_flask_app('config.TestConfig')
+    app.config.update(TESTING=True, PREDICTIONS_PARSER='json', REQUEST_MAX_DECOMPRESSED_BYTES=1024 * 1024)
+    producer = SNSMessageProducer(client=None, topic=None)
+    producer.publish_predictions = MagicMock()
+    register_api_endpoints(app, sagemaker_client_mock, producer)
+    return app.test_client()
+
+
+def post_predictions(client, data, **headers):
+    headers[HttpHeaders.CONTENT_TYPE] = MimeTypes.APPLICATION_JSON_PANDAS_SPLIT
+    return client.post('/api/predictions', headers=headers, data=data)
+
+
+def test_predictions_when_request_compressed_must_return_predictions(client, sagemaker_client_mock, encoding):
+    res = post_predictions(client, compress(TEST_DATA_JSON, encoding), **{'Content-Encoding': encoding})
+
+    assert res.status_code == 200
+    assert res.get_json() == [0] * 1000
+    assert json.loads(sagemaker_client_mock.post_invocations.call_args[0][0])['data'][:2] == [[0], [1]]
+
+
+def test_predictions_when_decompressed_request_too_large_must_return_payload_too_large(client,
+                                                                                      sagemaker_client_mock):
+    res = post_predictions(client, gzip.compress(b' ' * 8 * 1024 * 1024), **{'Content-Encoding': 'gzip'})
+
+    assert res.status_code == 413
+    sagemaker_client_mock.post_invocations.assert_not_called()
+
+
+def test_predictions_when_request_encoding_unsupported_must_return_unsupported_media_type(client):
+    assert post_predictions(client, TEST_DATA_JSON, **{'Content-Encoding': 'br'}).status_code == 415
+
+
+def test_predictions_when_compressed_request_corrupt_must_return_bad_request(client):
+    assert post_predictions(client, b'not compressed', **{'Content-Encoding': 'gzip'}).status_code == 400
+
+
+def test_predictions_must_compress_response_according_to_accept_encoding(client):
+    res = post_predictions(client, TEST_DATA_JSON, **{'Accept-Encoding': 'br, gzip;q=0.8'})
+
+    assert res.status_code == 200
+    assert res.headers[HttpHeaders.CONTENT_ENCODING] == 'gzip'
+    assert res.headers[HttpHeaders.VARY] == HttpHeaders.ACCEPT_ENCODING
+    assert json.loads(gzip.decompress(res.data)) == [0] * 1000
+
+
+def test_predictions_when_response_small_or_encoding_not_accepted_must_not_compress_response(client):
+    small = post_predictions(client, b'{"columns":["feature"],"data":[[1]]}', **{'Accept-Encoding': 'gzip'})
+    not_accepted = post_predictions(client, TEST_DATA_JSON, **{'Accept-Encoding': 'br'})
+
+    assert HttpHeaders.CONTENT_ENCODING not in small.headers
+    assert not_accepted.get_json() == [0] * 1000
+    assert HttpHeaders.CONTENT_ENCODING not in not_accepted.headers
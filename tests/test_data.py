@@ -0,0 +1,64 @@
+import pytest
+import pandas as pd
+
+from ml_ids_api.data import deserialize_split_frame, merge_split_predictions, SplitFrame, count_rows
+
+
+@pytest.fixture
+def test_data():
+    return pd.DataFrame(data={'feature': [1, 2, 3], 'timestamp': ['21/02/2018 10:15:06'] * 3})
+
+
+@pytest.fixture
+def test_data_json(test_data):
+    return test_data.to_json(orient='split', index=False).encode('utf-8')
+
+
+def test_deserialize_split_frame_must_return_columns_and_rows(test_data_json):
+    frame = deserialize_split_frame(test_data_json)
+
+    assert frame.columns == ['feature', 'timestamp']
+    assert frame.data == [[1, '21/02/2018 10:15:06'], [2, '21/02/2018 10:15:06'], [3, '21/02/2018 10:15:06']]
+
+
+def test_deserialize_split_frame_when_index_given_must_return_row_index(test_data):
+    frame = deserialize_split_frame(test_data.set_index(pd.Index([10, 11, 12])).to_json(orient='split'))
+
+    assert frame.row_index == [10, 11, 12]
+    assert deserialize_split_frame(test_data.to_json(orient='split', index=False)).row_index is None
+
+
+@pytest.mark.parametrize('body', [
+    b'i_am_invalid',
+    b'[]',
+    b'{"data": [[1]]}',
+    b'{"columns": "feature", "data": [[1]]}',
+    b'{"columns": [1], "data": [[1]]}',
+    b'{"columns": ["feature"]}',
+    b'{"columns": ["feature"], "data": [[1, 2]]}',
+    b'{"columns": ["feature"], "data": [1]}',
+    b'{"columns": ["feature"], "index": [10], "data": [[1], [2]]}',
+    b'{"columns": ["feature"], "index": 10, "data": [[1]]}',
+])
+def test_deserialize_split_frame_when_invalid_body_given_must_raise_value_error(body):
+    with pytest.raises(ValueError):
+        deserialize_split_frame(body)
+
+
+def test_merge_split_predictions_must_append_prediction_column():
+    frame = SplitFrame(columns=['feature'], data=[[1], [2]])
+
+    merged = merge_split_predictions(frame, [0, 1])
+
+    assert merged.columns == ['feature', 'prediction']
+    assert merged.data == [[1, 0], [2, 1]]
+
+
+def test_merge_split_predictions_when_lengths_differ_must_raise_value_error():
+    with pytest.raises(ValueError):
+        merge_split_predictions(SplitFrame(columns=['feature'], data=[[1], [2]]), [0])
+
+
+def test_count_rows_must_count_rows_of_dataframes_and_split_frames(test_data):
+    assert count_rows(test_data) == 3
+    assert count_rows(SplitFrame(columns=['feature'], data=[[1], [2]])) == 2
@@ -0,0 +1,89 @@
+import pytest
+
+from ml_ids_api.data import SplitFrame
+from ml_ids_api.formats import deserialize_arrow_stream, deserialize_msgpack_split_frame, \
+    serialize_arrow_predictions, serialize_msgpack_predictions
+
+
+def create_arrow_stream(pyarrow, columns):
+    batch = pyarrow.RecordBatch.from_arrays([pyarrow.array(values) for values in columns.values()],
+                                            list(columns.keys()))
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def test_deserialize_arrow_stream_must_return_rows():
+    pyarrow = pytest.importorskip('pyarrow')
+    body = create_arrow_stream(pyarrow, {'dst_port': [80, 443], 'flow_byts_s': [1.5, None], 'timestamp': ['a', 'b']})
+
+    data = deserialize_arrow_stream(body)
+
+    assert data == SplitFrame(columns=['dst_port', 'flow_byts_s', 'timestamp'],
+                              data=[[80, 1.5, 'a'], [443, None, 'b']])
+
+
+def test_deserialize_arrow_stream_when_values_missing_must_keep_value_types():
+    pyarrow = pytest.importorskip('pyarrow')
+    body = create_arrow_stream(pyarrow, {'dst_port': [80, None], 'syn_flag': [None, True], 'timestamp': [None, 'b'],
+                                         'label': [None, None]})
+
+    data = deserialize_arrow_stream(body)
+
+    assert data.data == [[80, None, None, None], [None, True, 'b', None]]
+    assert type(data.data[0][0]) is int
+
+
+def test_deserialize_arrow_stream_when_no_rows_given_must_return_empty_frame():
+    pyarrow = pytest.importorskip('pyarrow')
+    body = create_arrow_stream(pyarrow, {'dst_port': pyarrow.array([], type=pyarrow.int64())})
+
+    assert deserialize_arrow_stream(body) == SplitFrame(columns=['dst_port'], data=[])
+
+
+def test_deserialize_arrow_stream_when_unsupported_column_type_given_must_raise_value_error():
+    pyarrow = pytest.importorskip('pyarrow')
+    body = create_arrow_stream(pyarrow, {'feature': [[1, 2]]})
+
+    with pytest.raises(ValueError, match='feature'):
+        deserialize_arrow_stream(body)
+
+
+def test_deserialize_arrow_stream_when_invalid_stream_given_must_raise_value_error():
+    pytest.importorskip('pyarrow')
+
+    with pytest.raises(ValueError):
+        deserialize_arrow_stream(b'i_am_invalid')
+
+
+def test_serialize_arrow_predictions_must_return_prediction_column():
+    pyarrow = pytest.importorskip('pyarrow')
+
+    table = pyarrow.ipc.open_stream(serialize_arrow_predictions([0, 1, 0])).read_all()
+
+    assert table.column_names == ['prediction']
+    assert table.column('prediction').to_pylist() == [0, 1, 0]
+
+
+def test_deserialize_msgpack_split_frame_must_return_rows():
+    msgpack = pytest.importorskip('msgpack')
+    body = msgpack.packb({'columns': ['dst_port', 'timestamp'], 'data': [[80, 'a'], [443, 'b']]})
+
+    data = deserialize_msgpack_split_frame(body)
+
+    assert data == SplitFrame(columns=['dst_port', 'timestamp'], data=[[80, 'a'], [443, 'b']])
+
+
+@pytest.mark.parametrize('document', [b'\x93\x01', b'\x01', b'\x81\xa7columns\x90'])
+def test_deserialize_msgpack_split_frame_when_invalid_document_given_must_raise_value_error(document):
+    pytest.importorskip('msgpack')
+
+    with pytest.raises(ValueError):
+        deserialize_msgpack_split_frame(document)
+
+
+def test_serialize_msgpack_predictions_must_return_array():
+    msgpack = pytest.importorskip('msgpack')
+
+    assert msgpack.unpackb(serialize_msgpack_predictions([0, 1, 0])) == [0, 1, 0]
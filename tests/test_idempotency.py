@@ -0,0 +1,268 @@
+import sqlite3
+import threading
+import time
+import pytest
+
+from unittest.mock import MagicMock
+
+from ml_ids_api.app import create_flask_app, create_idempotency_guard, register_api_endpoints
+from ml_ids_api.idempotency import IdempotencyConflictError, IdempotencyGuard, InMemoryIdempotencyStore, \
+    SqliteIdempotencyStore, StoredResponse, create_idempotency_store
+from ml_ids_api.messaging import SNSMessageProducer
+from ml_ids_api.util.constants import HttpHeaders, MimeTypes
+
+RESPONSE = StoredResponse(status=200, body=b'[0,1]', content_type='application/json')
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def create_store(request, tmpdir):
+    def create(**kwargs):
+        if request.param == 'memory':
+            return InMemoryIdempotencyStore(**kwargs)
+        return SqliteIdempotencyStore(str(tmpdir.join('idempotency.db')), **kwargs)
+
+    return create
+
+
+def test_store_must_return_stored_response_to_duplicates(create_store):
+    store = create_store()
+
+    assert store.claim(b'key', b'body', timeout=0.0) is None
+    store.complete(b'key', RESPONSE)
+
+    assert store.claim(b'key', b'body', timeout=0.0) == RESPONSE
+    assert store.stats()['entries'] == 1
+
+
+def test_store_when_key_reused_for_different_body_must_raise_conflict(create_store):
+    store = create_store()
+    store.claim(b'key', b'body', timeout=0.0)
+    store.complete(b'key', RESPONSE)
+
+    with pytest.raises(IdempotencyConflictError) as err:
+        store.claim(b'key', b'other body', timeout=0.0)
+
+    assert err.value.reason == 'mismatch'
+
+
+def test_store_when_request_in_progress_must_wait_for_response(create_store):
+    store = create_store()
+    store.claim(b'key', b'body', timeout=0.0)
+
+    threading.Timer(0.1, store.complete, args=(b'key', RESPONSE)).start()
+
+    assert store.claim(b'key', b'body', timeout=5.0) == RESPONSE
+
+
+def test_store_when_request_in_progress_too_long_must_raise_conflict(create_store):
+    store = create_store()
+    store.claim(b'key', b'body', timeout=0.0)
+
+    start = time.perf_counter()
+    with pytest.raises(IdempotencyConflictError) as err:
+        store.claim(b'key', b'body', timeout=0.1)
+
+    assert err.value.reason == 'in_progress'
+    assert time.perf_counter() - start < 1.0
+
+
+def test_store_when_claim_released_must_let_duplicate_claim_request(create_store):
+    store = create_store()
+    store.claim(b'key', b'body', timeout=0.0)
+
+    threading.Timer(0.1, store.release, args=(b'key',)).start()
+
+    assert store.claim(b'key', b'body', timeout=5.0) is None
+
+
+def test_store_when_lease_expired_must_let_duplicate_claim_request(create_store):
+    store = create_store(lease=0.05)
+    store.claim(b'key', b'body', timeout=0.0)
+
+    assert store.claim(b'key', b'body', timeout=5.0) is None
+
+
+def test_store_must_expire_and_evict_responses(create_store):
+    store = create_store(max_entries=2, ttl=0.05)
+    for key in (b'a', b'b', b'c'):
+        store.claim(key, b'body', timeout=0.0)
+        store.complete(key, RESPONSE)
+
+    assert store.stats()['entries'] == 2
+    assert store.stats()['evictions'] == 1
+
+    time.sleep(0.1)
+    assert store.claim(b'b', b'body', timeout=0.0) is None
+
+
+def test_sqlite_store_must_be_shared_by_separate_connections(tmpdir):
+    path = str(tmpdir.join('idempotency.db'))
+    store, other_store = SqliteIdempotencyStore(path), SqliteIdempotencyStore(path)
+
+    assert store.claim(b'key', b'body', timeout=0.0) is None
+    threading.Timer(0.1, store.complete, args=(b'key', RESPONSE)).start()
+
+    assert other_store.claim(b'key', b'body', timeout=5.0) == RESPONSE
+
+
+def test_sqlite_store_when_request_in_progress_must_poll_without_write_lock(tmpdir):
+    path = str(tmpdir.join('idempotency.db'))
+    store = SqliteIdempotencyStore(path)
+    store.claim(b'key', b'body', timeout=0.0)
+
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        start = time.perf_counter()
+        with pytest.raises(IdempotencyConflictError) as err:
+            store.claim(b'key', b'body', timeout=0.1)
+
+        assert err.value.reason == 'in_progress'
+        assert time.perf_counter() - start < 1.0
+    finally:
+        writer.execute('ROLLBACK')
+        writer.close()
+
+
+def test_sqlite_store_must_evict_periodically(tmpdir):
+    store = SqliteIdempotencyStore(str(tmpdir.join('idempotency.db')), max_entries=1, evict_every=3)
+    for key in (b'a', b'b'):
+        store.claim(key, b'body', timeout=0.0)
+        store.complete(key, RESPONSE)
+
+    assert store.stats()['entries'] == 2
+
+    store.claim(b'c', b'body', timeout=0.0)
+    assert store.stats()['entries'] == 1
+    assert store.stats()['evictions'] == 2
+
+
+def test_sqlite_store_must_count_entries_without_scanning_table(tmpdir):
+    path = str(tmpdir.join('idempotency.db'))
+    store = SqliteIdempotencyStore(path, lease=0.05)
+    store.claim(b'a', b'body', timeout=0.0)
+    store.claim(b'b', b'body', timeout=0.0)
+    time.sleep(0.1)
+    store.claim(b'a', b'body', timeout=0.0)
+
+    assert store.stats()['entries'] == 2
+
+    store.release(b'b')
+
+    assert store.stats()['entries'] == 1
+    assert SqliteIdempotencyStore(path).stats()['entries'] == 1
+
+
+def test_guard_must_create_keys_from_header_or_body():
+    guard = IdempotencyGuard(InMemoryIdempotencyStore())
+
+    assert guard.create_key('abc', b'body')[0] == guard.create_key('abc', b'other body')[0]
+    assert guard.create_key(None, b'body') == guard.create_key(None, b'body')
+    assert guard.create_key(None, b'body')[0] != guard.create_key(None, b'body', variant='accept')[0]
+    assert IdempotencyGuard(InMemoryIdempotencyStore(), hash_body=False).create_key(None, b'body') is None
+
+
+def test_guard_when_processing_fails_must_release_key():
+    guard = IdempotencyGuard(InMemoryIdempotencyStore(), wait_timeout=0.0)
+
+    with pytest.raises(IOError):
+        guard.execute(b'key', b'body', MagicMock(side_effect=IOError('unavailable')))
+    guard.execute(b'key', b'body', MagicMock(return_value=StoredResponse(500, b'', 'application/json')))
+
+    assert guard.execute(b'key', b'body', MagicMock(return_value=RESPONSE)) == (RESPONSE, False)
+    assert guard.execute(b'key', b'body', MagicMock()) == (RESPONSE, True)
+    assert guard.metrics()['stored'] == 1
+    assert guard.metrics()['replayed'] == 1
+
+
+def test_create_idempotency_store_when_unsupported_backend_given_must_raise_value_error():
+    with pytest.raises(ValueError):
+        create_idempotency_store('redis', max_entries=10, ttl=1.0, lease=1.0, path='')
+
+
+def test_create_idempotency_guard_must_register_guard_metrics():
+    app = create_flask_app('config.TestConfig')
+    app.config['IDEMPOTENCY_STORE'] = 'memory'
+    metrics = MagicMock()
+
+    guard = create_idempotency_guard(app.config, metrics)
+
+    metrics.register_source.assert_called_once_with('idempotency', guard.metrics)
+
+
+@pytest.fixture
+def sagemaker_client_mock():
+    client = MagicMock()
+
+    def post_invocations(body):
+        time.sleep(0.1)
+        return [0, 1, 0]
+
+    client.post_invocations = MagicMock(side_effect=post_invocations)
+    return client
+
+
+@pytest.fixture
+def sns_producer_mock():
+    producer = SNSMessageProducer(client=None, topic=None)
+    producer.publish_predictions = MagicMock()
+    return producer
+
+
+@pytest.fixture
+def app(sagemaker_client_mock, sns_producer_mock, tmpdir):
+    app = create_flask_app('config.TestConfig')
+    app.config.update(TESTING=True, PREDICTIONS_PARSER='json', IDEMPOTENCY_STORE='sqlite',
+                      IDEMPOTENCY_STORE_PATH=str(tmpdir.join('idempotency.db')))
+    register_api_endpoints(app, sagemaker_client_mock, sns_producer_mock)
+    return app
+
+
+def post_predictions(app, data=b'{"columns":["feature"],"data":[[1],[2],[3]]}', key=None):
+    headers = {HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT}
+    if key is not None:
+        headers[HttpHeaders.IDEMPOTENCY_KEY] = key
+    return app.test_client().post('/api/predictions', headers=headers, data=data)
+
+
+def test_predictions_when_request_retried_must_return_stored_response(app, sagemaker_client_mock,
+                                                                      sns_producer_mock):
+    first = post_predictions(app)
+    retry = post_predictions(app)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.get_json() == [0, 1, 0]
+    assert retry.headers[HttpHeaders.IDEMPOTENT_REPLAYED] == 'true'
+    assert HttpHeaders.IDEMPOTENT_REPLAYED not in first.headers
+    sagemaker_client_mock.post_invocations.assert_called_once()
+    sns_producer_mock.publish_predictions.assert_called_once()
+
+
+def test_predictions_when_idempotency_key_reused_for_different_body_must_return_unprocessable_entity(app):
+    post_predictions(app, key='upload-1')
+
+    res = post_predictions(app, data=b'{"columns":["feature"],"data":[[4]]}', key='upload-1')
+
+    assert res.status_code == 422
+
+
+def test_predictions_when_duplicates_sent_concurrently_must_invoke_sagemaker_once(app, sagemaker_client_mock,
+                                                                                  sns_producer_mock):
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(post_predictions(app, key='upload-1')))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [res.status_code for res in responses] == [200] * 4
+    assert sum(HttpHeaders.IDEMPOTENT_REPLAYED in res.headers for res in responses) == 3
+    sagemaker_client_mock.post_invocations.assert_called_once()
+    sns_producer_mock.publish_predictions.assert_called_once()
+
+
+def test_predictions_when_request_invalid_must_not_store_response(app):
+    assert post_predictions(app, data=b'i_am_invalid').status_code == 400
+
+    assert HttpHeaders.IDEMPOTENT_REPLAYED not in post_predictions(app, data=b'i_am_invalid').headers
@@ -0,0 +1,21 @@
+import sys
+
+from ml_ids_api.util.import_utils import DEFERRED_MODULES, import_deferred_modules, import_module, is_installed
+
+
+def test_is_installed_must_not_import_package():
+    assert is_installed('json')
+    assert not is_installed('ml_ids_api_missing_package')
+
+
+def test_import_module_must_return_imported_module():
+    assert import_module('json') is sys.modules['json']
+    assert import_module('json') is import_module('json')
+
+
+def test_import_deferred_modules_must_import_installed_modules():
+    imported = import_deferred_modules()
+
+    assert set(imported) <= set(DEFERRED_MODULES)
+    assert all(name in sys.modules for name in imported)
+    assert all(name in imported for name in DEFERRED_MODULES if is_installed(name.split('.')[0]))
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import pytest
+import numpy as np
+
+from types import SimpleNamespace
+from flask import Config
+
+from ml_ids_api.app import create_sagemaker_client
+from ml_ids_api.batching import ChunkedPredictionClient
+from ml_ids_api.inference import LocalModel, LocalModelPredictor, AsyncLocalModelPredictor, Predictor, load_model, \
+    create_feature_matrix
+
+
+@pytest.fixture
+def model():
+    # predicts an attack if feature_a - feature_b > 1 after standardization
+    return LocalModel(columns=['feature_a', 'feature_b'],
+                      mean=np.array([1.0, 1.0]),
+                      scale=np.array([2.0, 2.0]),
+                      weights=[np.array([[1.0, 0.0], [0.0, 1.0]]), np.array([[1.0], [-1.0]])],
+                      biases=[np.array([0.0, 0.0]), np.array([-1.0])])
+
+
+@pytest.fixture
+def model_path(model, tmpdir):
+    path = str(tmpdir.join('model'))
+    model.save(path)
+    return path
+
+
+def create_request(columns, data):
+    return json.dumps({'columns': columns, 'data': data}).encode('utf-8')
+
+
+def test_predict_must_classify_flows(model):
+    features = np.array([[5.0, 1.0], [1.0, 5.0], [3.0, 1.0]])
+
+    assert model.predict(features).tolist() == [1, 0, 0]
+
+
+def test_predict_when_threshold_given_must_classify_flows_above_threshold(model):
+    model = LocalModel(model.columns, model.mean, model.scale, model.weights, model.biases, threshold=0.25)
+
+    assert model.predict(np.array([[3.0, 1.0]])).tolist() == [1]
+
+
+@pytest.mark.parametrize('threshold', [0.0, 1.0, -0.5, 1.5])
+def test_model_when_threshold_out_of_range_must_raise_value_error(model, threshold):
+    with pytest.raises(ValueError):
+        LocalModel(model.columns, model.mean, model.scale, model.weights, model.biases, threshold=threshold)
+
+
+def test_predict_must_treat_missing_and_infinite_values_as_zero(model):
+    features = np.array([[np.inf, 1.0], [5.0, np.nan]])
+
+    assert model.predict(features).tolist() == [0, 1]
+
+
+def test_load_must_memory_map_arrays(model, model_path):
+    loaded = LocalModel.load(model_path)
+
+    assert loaded.columns == model.columns
+    assert loaded.threshold == model.threshold
+    assert isinstance(loaded.weights[0].base, np.memmap)
+    assert not loaded.weights[0].flags.writeable
+    np.testing.assert_array_equal(loaded.weights[1], model.weights[1])
+
+
+class Dense:
+    # stand-in for `tf.keras.layers.Dense`, providing the methods used by the conversion
+    def __init__(self, weights, bias, activation):
+        self.weights = [weights, bias]
+        self.activation = activation
+
+    def get_weights(self):
+        return self.weights
+
+    def get_config(self):
+        return {'activation': self.activation}
+
+
+class Dropout:
+    pass
+
+
+def create_keras_model(model, output_activation='sigmoid'):
+    return SimpleNamespace(layers=[Dense(model.weights[0], model.biases[0], 'relu'), Dropout(),
+                                   Dense(model.weights[1], model.biases[1], output_activation)])
+
+
+def test_from_keras_must_convert_trained_model(model, tmpdir):
+    scaler = SimpleNamespace(mean_=model.mean, scale_=model.scale)
+
+    converted = LocalModel.from_keras(create_keras_model(model), scaler, model.columns)
+    converted.save(str(tmpdir.join('converted')))
+    loaded = LocalModel.load(str(tmpdir.join('converted')))
+
+    features = np.array([[5.0, 1.0], [1.0, 5.0], [3.0, 1.0]])
+    assert loaded.columns == model.columns
+    assert len(loaded.weights) == 2
+    assert loaded.predict(features).tolist() == model.predict(features).tolist()
+
+
+def test_from_keras_when_unsupported_layers_given_must_raise_value_error(model):
+    scaler = SimpleNamespace(mean_=model.mean, scale_=model.scale)
+
+    with pytest.raises(ValueError, match='sigmoid'):
+        LocalModel.from_keras(create_keras_model(model, output_activation='softmax'), scaler, model.columns)
+    with pytest.raises(ValueError, match='BatchNormalization'):
+        LocalModel.from_keras(SimpleNamespace(layers=[type('BatchNormalization', (), {})()]), scaler, model.columns)
+
+
+def test_load_when_threshold_out_of_range_must_raise_value_error(model_path):
+    manifest_path = os.path.join(model_path, 'model.json')
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(dict(manifest, threshold=1.0), manifest_file)
+
+    with pytest.raises(ValueError):
+        LocalModel.load(model_path)
+
+
+def test_load_model_must_load_model_once(model_path):
+    assert load_model(model_path) is load_model(model_path)
+
+
+def test_post_invocations_must_return_predictions_in_row_order(model):
+    predictor = LocalModelPredictor(model)
+    request = create_request(['timestamp', 'feature_b', 'feature_a'], [['t1', 1, 5], ['t2', 5, 1], ['t3', None, 5]])
+
+    assert predictor.post_invocations(request) == [1, 0, 1]
+
+
+def test_post_invocations_when_no_rows_given_must_return_empty_predictions(model):
+    assert LocalModelPredictor(model).post_invocations(create_request(['feature_a', 'feature_b'], [])) == []
+
+
+def test_post_invocations_when_feature_column_missing_must_raise_value_error(model):
+    with pytest.raises(ValueError, match='feature_b'):
+        LocalModelPredictor(model).post_invocations(create_request(['feature_a'], [[1]]))
+
+
+def test_post_invocations_when_feature_not_numeric_must_raise_value_error(model):
+    with pytest.raises(ValueError, match='numeric'):
+        LocalModelPredictor(model).post_invocations(create_request(['feature_a', 'feature_b'], [[1, 'abc']]))
+
+
+def test_async_post_invocations_must_return_predictions(model):
+    predictor = AsyncLocalModelPredictor(LocalModelPredictor(model))
+    request = create_request(['feature_a', 'feature_b'], [[5, 1]])
+
+    assert asyncio.get_event_loop().run_until_complete(predictor.post_invocations(request)) == [1]
+
+
+def test_predictor_without_post_invocations_must_not_be_instantiable():
+    class IncompletePredictor(Predictor):  # pylint: disable=abstract-method
+        pass
+
+    with pytest.raises(TypeError):
+        IncompletePredictor()  # pylint: disable=abstract-class-instantiated
+
+
+def test_create_feature_matrix_must_select_columns():
+    matrix = create_feature_matrix([[1, 'a', 2.5], [3, 'b', 4]], [2, 0])
+
+    np.testing.assert_array_equal(matrix, np.array([[2.5, 1.0], [4.0, 3.0]]))
+
+
+def test_create_feature_matrix_when_single_column_selected_must_return_matrix():
+    assert create_feature_matrix([[1, 2], [3, None]], [1]).shape == (2, 1)
+
+
+def create_config(**values):
+    config = Config('.')
+    config.from_object('config.TestConfig')
+    config.update(values)
+    return config
+
+
+def test_create_sagemaker_client_when_local_backend_configured_must_return_local_predictor(model_path):
+    client = create_sagemaker_client(create_config(PREDICTION_BACKEND='local', LOCAL_MODEL_PATH=model_path))
+
+    assert isinstance(client, LocalModelPredictor)
+
+
+def test_create_sagemaker_client_when_sagemaker_backend_configured_must_return_sagemaker_client():
+    assert isinstance(create_sagemaker_client(create_config()), ChunkedPredictionClient)
+
+
+def test_create_sagemaker_client_when_chunking_enabled_must_only_retry_chunks():
+    client = create_sagemaker_client(create_config(AWS_SAGEMAKER_CHUNKING=True))
+
+    assert client.max_retries == 2
+    assert client.client.session.get_adapter('https://').max_retries.total == 0
+
+
+def test_create_sagemaker_client_when_chunking_disabled_must_retry_http_requests():
+    client = create_sagemaker_client(create_config(AWS_SAGEMAKER_CHUNKING=False))
+
+    assert client.session.get_adapter('https://').max_retries.total == 3
+
+
+def test_create_sagemaker_client_when_unknown_backend_configured_must_raise_value_error():
+    with pytest.raises(ValueError):
+        create_sagemaker_client(create_config(PREDICTION_BACKEND='unknown'))
@@ -0,0 +1,137 @@
+import asyncio
+import io
+import json
+import pytest
+
+from unittest.mock import MagicMock
+from werkzeug.test import EnvironBuilder
+
+from ml_ids_api.app import create_flask_app, register_api_endpoints
+from ml_ids_api.compression import PayloadTooLargeError
+from ml_ids_api.limits import BoundedReader, TooManyRowsError, check_content_length, check_rows, read_chunks
+from ml_ids_api.messaging import SNSMessageProducer
+from ml_ids_api.util.constants import HttpHeaders, MimeTypes
+
+
+def create_body(rows):
+    return json.dumps({'columns': ['feature'], 'data': [[i] for i in range(rows)]}).encode('utf-8')
+
+
+def test_bounded_reader_must_read_stream_within_limit():
+    reader = BoundedReader(io.BytesIO(b'line\n' * 4), max_bytes=20)
+
+    assert reader.readline() == b'line\n'
+    assert reader.read(5) == b'line\n'
+    assert reader.read() == b'line\n' * 2
+    assert reader.read() == b''
+
+
+def test_bounded_reader_when_stream_exceeds_limit_must_raise_payload_too_large_error():
+    with pytest.raises(PayloadTooLargeError):
+        BoundedReader(io.BytesIO(b' ' * 1024 * 1024), max_bytes=1000).read()
+
+
+def test_check_content_length_and_rows_when_limit_exceeded_must_raise_error():
+    check_content_length(None, 10)
+    check_content_length(10, 10)
+    check_content_length(11, None)
+    check_rows(10, 10)
+    check_rows(11, None)
+
+    with pytest.raises(PayloadTooLargeError):
+        check_content_length(11, 10)
+    with pytest.raises(TooManyRowsError):
+        check_rows(11, 10)
+
+
+def test_read_chunks_when_body_exceeds_limit_must_raise_payload_too_large_error():
+    async def chunks():
+        for _ in range(4):
+            yield b' ' * 10
+
+    assert asyncio.get_event_loop().run_until_complete(read_chunks(chunks(), 40)) == b' ' * 40
+    with pytest.raises(PayloadTooLargeError):
+        asyncio.get_event_loop().run_until_complete(read_chunks(chunks(), 39))
+
+
+@pytest.fixture
+def sagemaker_client_mock():
+    client = MagicMock()
+    client.post_invocations = MagicMock(side_effect=lambda body: [0] * len(json.loads(body)['data']))
+    return client
+
+
+@pytest.fixture(params=[None, 'memory'])
+def client(request, sagemaker_client_mock):
+    app = create_flask_app('config.TestConfig')
+    app.config.update(TESTING=True, PREDICTIONS_PARSER='json', MAX_CONTENT_LENGTH=1024, REQUEST_MAX_ROWS=10,
+                      IDEMPOTENCY_STORE=request.param)
+    producer = SNSMessageProducer(client=None, topic=None)
+    producer.publish_predictions = MagicMock()
+    register_api_endpoints(app, sagemaker_client_mock, producer)
+    return app.test_client()
+
+
+def post_predictions(client, data):
+    return client.post('/api/predictions', headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                       data=data)
+
+
+def test_predictions_within_limits_must_return_predictions(client):
+    res = post_predictions(client, create_body(10))
+
+    assert res.status_code == 200
+    assert res.get_json() == [0] * 10
+
+
+def test_predictions_when_content_length_exceeds_limit_must_reject_request_before_reading(client,
+                                                                                         sagemaker_client_mock):
+    res = post_predictions(client, create_body(200))
+
+    assert res.status_code == 413
+    assert '/api/predictions/stream' in res.get_json()['error']
+    sagemaker_client_mock.post_invocations.assert_not_called()
+
+
+def test_predictions_when_chunked_body_exceeds_limit_must_return_payload_too_large(client, sagemaker_client_mock):
+    environ = EnvironBuilder('/api/predictions', method='POST', data=create_body(200),
+                             content_type=MimeTypes.APPLICATION_JSON_PANDAS_SPLIT).get_environ()
+    # chunked bodies have no declared size, servers decoding them mark the input as terminated
+    del environ['CONTENT_LENGTH']
+    environ['wsgi.input_terminated'] = True
+
+    res = client.open(environ)
+
+    assert res.status_code == 413
+    assert 'exceeds the maximum size of 1024 bytes' in res.get_json()['error']
+    sagemaker_client_mock.post_invocations.assert_not_called()
+
+
+def test_predictions_when_rows_exceed_limit_must_return_payload_too_large(client, sagemaker_client_mock):
+    res = post_predictions(client, create_body(11))
+
+    assert res.status_code == 413
+    assert 'maximum of 10 flows' in res.get_json()['error']
+    sagemaker_client_mock.post_invocations.assert_not_called()
+
+
+def test_predictions_when_default_limits_configured_must_accept_large_batches(sagemaker_client_mock):
+    app = create_flask_app('config.TestConfig')
+    app.config.update(TESTING=True, PREDICTIONS_PARSER='json')
+    producer = SNSMessageProducer(client=None, topic=None)
+    producer.publish_predictions = MagicMock()
+    register_api_endpoints(app, sagemaker_client_mock, producer)
+
+    res = post_predictions(app.test_client(), create_body(200000))
+
+    assert res.status_code == 200
+    assert len(res.get_json()) == 200000
+
+
+def test_stream_predictions_must_not_be_limited(client):
+    body = b''.join(b'{"feature": %d}\n' % i for i in range(200))
+
+    res = client.post('/api/predictions/stream', headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_NDJSON},
+                      data=body)
+
+    assert res.status_code == 200
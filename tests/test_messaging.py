@@ -1,10 +1,17 @@
+import asyncio
+import json
+import threading
 import pytest
+import numpy as np
 import pandas as pd
 
 from unittest.mock import MagicMock
 
-from ml_ids_api.messaging import SNSMessageProducer
-from ml_ids_api.aws.client.sns_client import AwsSNSClient
+from ml_ids_api.messaging import SNSMessageProducer, AsyncMessageProducer, QueueFullPolicy, PublishPolicy, \
+    ExecutorMessageProducer
+from ml_ids_api.aws.client.sns_client import AwsSNSClient, AwsSNSClientError
+from ml_ids_api.data import SplitFrame, deserialize_dataframe, deserialize_split_frame, merge_predictions, \
+    merge_split_predictions
 
 AWS_TOPIC = 'AWS_TOPIC_ARN'
 
@@ -73,7 +80,234 @@ def test_publish_predictions_must_publish_message_per_prediction_s(producer, tes
                                    expected_prediction_attribute='benign')
 
 
+def test_create_messages_must_create_messages_identical_to_single_row_serialization():
+    data = pd.DataFrame(data={'dst_port': [80, 443, 22, 8080],
+                              'flow_byts_s': [20263.87212, np.nan, 1e20, 0.0],
+                              'pkt_len_std': np.float32([0.5, 1.25, 3.3333333, 0]),
+                              'label': ['http/1.1', 'tls "1.3"', None, '\u00e9'],
+                              'timestamp': pd.to_datetime(['2018-02-21 10:15:06', None,
+                                                           '2018-02-21 10:15:07', '2018-02-21 10:15:08']),
+                              'prediction': [0, 1, 0, 1]},
+                        index=[10, 11, 12, 13])
+
+    messages = SNSMessageProducer.create_messages(data)
+
+    assert [m.message for m in messages] == [data.iloc[i:i + 1].to_json(orient='split') for i in range(len(data))]
+    assert [m.attrs['prediction']['StringValue'] for m in messages] == ['benign', 'attack', 'benign', 'attack']
+
+
+def test_create_messages_when_numeric_data_given_must_preserve_integer_columns():
+    data = pd.DataFrame(data={'dst_port': [80, 443], 'flow_byts_s': [1.5, 2.0], 'prediction': [0, 1]})
+
+    messages = SNSMessageProducer.create_messages(data)
+
+    assert [m.message for m in messages] == [data.iloc[i:i + 1].to_json(orient='split') for i in range(len(data))]
+
+
 def test_publish_predictions_when_empty_data_given_must_publish_no_message(producer, sns_client_mock):
     producer.publish_predictions(pd.DataFrame())
 
     sns_client_mock.publish.assert_not_called()
+
+
+def test_publish_predictions_when_split_frame_given_must_publish_message_per_prediction(producer,
+                                                                                       test_data,
+                                                                                       sns_client_mock):
+    frame = SplitFrame(columns=list(test_data.columns), data=test_data.values.tolist())
+
+    producer.publish_predictions(frame)
+
+    arg_list = sns_client_mock.publish.call_args_list
+    assert len(arg_list) == len(test_data)
+
+    for i, (label, args) in enumerate(zip(['benign', 'attack', 'benign'], arg_list)):
+        assert args[1]['attrs']['prediction']['StringValue'] == label
+        assert json.loads(args[1]['message']) == json.loads(test_data.iloc[i:i + 1].to_json(orient='split'))
+
+
+def test_create_messages_of_both_parsers_must_contain_index_of_request():
+    body = pd.DataFrame(data={'feature': [1, 2]}, index=[10, 11]).to_json(orient='split')
+
+    dataframe_messages = SNSMessageProducer.create_messages(merge_predictions(deserialize_dataframe(body), [0, 1]))
+    split_frame_messages = SNSMessageProducer.create_split_frame_messages(
+        merge_split_predictions(deserialize_split_frame(body), [0, 1]))
+
+    assert [json.loads(m.message) for m in split_frame_messages] == \
+        [json.loads(m.message) for m in dataframe_messages]
+    assert [json.loads(m.message)['index'] for m in split_frame_messages] == [[10], [11]]
+
+
+def test_publish_predictions_when_attacks_policy_must_publish_attacks_only(sns_client_mock, test_data):
+    producer = SNSMessageProducer(client=sns_client_mock, topic=AWS_TOPIC, policy=PublishPolicy(PublishPolicy.ATTACKS))
+
+    producer.publish_predictions(test_data)
+
+    sns_client_mock.publish.assert_called_once()
+    assert sns_client_mock.publish.call_args[1]['message'] == test_data.iloc[1:2].to_json(orient='split')
+    assert producer.metrics() == {'published': 1, 'suppressed': 2}
+
+
+def test_publish_predictions_when_attacks_policy_and_split_frame_given_must_retain_row_index(sns_client_mock,
+                                                                                            test_data):
+    producer = SNSMessageProducer(client=sns_client_mock, topic=AWS_TOPIC, policy=PublishPolicy(PublishPolicy.ATTACKS))
+    frame = SplitFrame(columns=list(test_data.columns), data=test_data.values.tolist())
+
+    producer.publish_predictions(frame)
+
+    sns_client_mock.publish.assert_called_once()
+    assert json.loads(sns_client_mock.publish.call_args[1]['message'])['index'] == [1]
+    assert producer.metrics() == {'published': 1, 'suppressed': 2}
+
+
+@pytest.mark.parametrize('sample_rate,expected_published', [(0.0, 1), (1.0, 3)])
+def test_publish_predictions_when_sampled_policy_must_publish_attacks_and_sampled_benign_flows(sns_client_mock,
+                                                                                              test_data,
+                                                                                              sample_rate,
+                                                                                              expected_published):
+    policy = PublishPolicy(PublishPolicy.SAMPLED, benign_sample_rate=sample_rate, seed=1)
+    producer = SNSMessageProducer(client=sns_client_mock, topic=AWS_TOPIC, policy=policy)
+
+    producer.publish_predictions(test_data)
+
+    assert sns_client_mock.publish.call_count == expected_published
+    assert producer.metrics() == {'published': expected_published, 'suppressed': 3 - expected_published}
+
+
+def test_publish_policy_when_invalid_mode_given_must_raise_error():
+    with pytest.raises(ValueError):
+        PublishPolicy('invalid')
+
+
+@pytest.fixture
+def batch_producer(sns_client_mock):
+    sns_client_mock.publish_batch = MagicMock(return_value=None)
+    return SNSMessageProducer(client=sns_client_mock, topic=AWS_TOPIC, batch_size=10)
+
+
+def test_publish_predictions_when_batched_must_publish_single_batch(batch_producer, test_data, sns_client_mock):
+    batch_producer.publish_predictions(test_data)
+
+    sns_client_mock.publish.assert_not_called()
+    sns_client_mock.publish_batch.assert_called_once()
+
+    args = sns_client_mock.publish_batch.call_args[1]
+    assert args['topic'] == AWS_TOPIC
+    assert args['batch_size'] == 10
+    assert [m.message for m in args['messages']] == [test_data.iloc[i:i + 1].to_json(orient='split')
+                                                     for i in range(len(test_data))]
+    assert [m.attrs['prediction']['StringValue'] for m in args['messages']] == ['benign', 'attack', 'benign']
+
+
+def test_publish_predictions_when_batched_and_empty_data_given_must_publish_no_message(batch_producer,
+                                                                                       sns_client_mock):
+    batch_producer.publish_predictions(pd.DataFrame())
+
+    sns_client_mock.publish_batch.assert_not_called()
+
+
+@pytest.fixture
+def producer_mock():
+    producer = SNSMessageProducer(client=None, topic=None)
+    producer.publish_predictions = MagicMock()
+    return producer
+
+
+def test_async_publish_predictions_must_publish_in_background(producer_mock, test_data):
+    async_producer = AsyncMessageProducer(producer=producer_mock, workers=2)
+
+    async_producer.publish_predictions(test_data)
+    async_producer.publish_predictions(test_data)
+    async_producer.shutdown()
+
+    assert producer_mock.publish_predictions.call_count == 2
+    metrics = async_producer.metrics()
+    assert metrics['enqueued'] == 2
+    assert metrics['published'] == 2
+    assert metrics['queue_depth'] == 0
+
+
+def test_async_publish_predictions_when_queue_full_and_drop_policy_must_drop(producer_mock, test_data):
+    release = threading.Event()
+    producer_mock.publish_predictions = MagicMock(side_effect=lambda _: release.wait())
+    async_producer = AsyncMessageProducer(producer=producer_mock,
+                                          queue_size=1,
+                                          workers=1,
+                                          full_policy=QueueFullPolicy.DROP)
+
+    async_producer.publish_predictions(test_data)
+    while async_producer.queue.qsize() > 0:
+        release.wait(0.001)
+    async_producer.publish_predictions(test_data)
+    async_producer.publish_predictions(test_data)
+
+    assert async_producer.metrics()['dropped'] == 1
+
+    release.set()
+    async_producer.shutdown()
+    assert producer_mock.publish_predictions.call_count == 2
+
+
+def test_async_publish_predictions_when_publishing_fails_must_count_failure(producer_mock, test_data):
+    producer_mock.publish_predictions = MagicMock(side_effect=IOError('Failed'))
+    async_producer = AsyncMessageProducer(producer=producer_mock, workers=1)
+
+    async_producer.publish_predictions(test_data)
+    async_producer.shutdown()
+
+    assert async_producer.metrics()['failed'] == 1
+
+
+def test_async_publish_predictions_after_shutdown_must_raise_error(producer_mock, test_data):
+    async_producer = AsyncMessageProducer(producer=producer_mock)
+    async_producer.shutdown()
+
+    with pytest.raises(RuntimeError):
+        async_producer.publish_predictions(test_data)
+
+
+def test_async_producer_when_invalid_policy_given_must_raise_error(producer_mock):
+    with pytest.raises(ValueError):
+        AsyncMessageProducer(producer=producer_mock, full_policy='invalid')
+
+
+def test_executor_publish_predictions_must_publish_without_blocking_event_loop(producer_mock, test_data):
+    release = threading.Event()
+    producer_mock.publish_predictions = MagicMock(side_effect=lambda data: release.wait(1))
+    executor_producer = ExecutorMessageProducer(producer=producer_mock, workers=2)
+
+    async def publish():
+        publishing = asyncio.ensure_future(executor_producer.publish_predictions(test_data))
+        await asyncio.sleep(0.01)
+        assert not publishing.done()
+        release.set()
+        await publishing
+
+    asyncio.get_event_loop().run_until_complete(publish())
+    executor_producer.shutdown()
+
+    producer_mock.publish_predictions.assert_called_once_with(test_data)
+
+
+def test_publish_predictions_when_publishing_fails_must_record_error(sns_client_mock, test_data):
+    metrics = MagicMock()
+    sns_client_mock.publish_batch = MagicMock(side_effect=AwsSNSClientError(cause='failed'))
+    producer = SNSMessageProducer(client=sns_client_mock, topic=AWS_TOPIC, batch_size=10, metrics=metrics)
+
+    with pytest.raises(AwsSNSClientError):
+        producer.publish_predictions(test_data)
+
+    metrics.count_error.assert_called_once()
+    assert metrics.count_error.call_args[0][0] == 'sns'
+
+
+def test_publish_policy_when_unseeded_must_reseed_in_forked_process():
+    policy = PublishPolicy(PublishPolicy.SAMPLED, benign_sample_rate=0.5)
+    seeded_policy = PublishPolicy(PublishPolicy.SAMPLED, benign_sample_rate=0.5, seed=1)
+    policy.random = np.random.default_rng(1)
+    # simulates policies inherited from the parent process
+    policy._pid = seeded_policy._pid = -1
+
+    benign = np.zeros(1000)
+    expected = np.random.default_rng(1).random(1000) < 0.5
+    assert (seeded_policy._create_mask(benign) == expected).all()
+    assert (policy._create_mask(benign) != expected).any()
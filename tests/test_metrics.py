@@ -0,0 +1,156 @@
+import pytest
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError
+from ml_ids_api.aws.client.sns_client import AwsSNSClientError
+from ml_ids_api.metrics import NoopMetrics, PrometheusMetrics, STAGES, create_metrics, error_code
+
+
+@pytest.fixture
+def prometheus_client():
+    return pytest.importorskip('prometheus_client')
+
+
+def sample_value(metrics, name, labels=None):
+    return metrics.registry.get_sample_value(name, labels or {})
+
+
+def test_noop_metrics_must_accept_all_observations():
+    metrics = NoopMetrics()
+
+    for stage in STAGES:
+        with metrics.stage(stage):
+            pass
+
+    metrics.request_started('/api/predictions')
+    metrics.request_finished('/api/predictions', 200, 0.1, 100, 10)
+    metrics.count_rows(10)
+    metrics.count_error('sagemaker', ValueError())
+    metrics.register_source('sns_producer', lambda: {'published': 1})
+
+    assert not metrics.enabled
+
+
+def test_prometheus_metrics_must_record_stage_durations(prometheus_client):
+    metrics = PrometheusMetrics()
+
+    with metrics.stage('invoke'):
+        pass
+
+    assert sample_value(metrics, 'ml_ids_stage_duration_seconds_count', {'stage': 'invoke'}) == 1
+    assert sample_value(metrics, 'ml_ids_stage_duration_seconds_count', {'stage': 'publish'}) == 0
+
+
+def test_prometheus_metrics_must_record_requests(prometheus_client):
+    metrics = PrometheusMetrics()
+    route = '/api/predictions'
+
+    metrics.request_started(route)
+    assert sample_value(metrics, 'ml_ids_requests_in_flight', {'route': route}) == 1
+
+    metrics.request_finished(route, 200, 0.1, 1000, None)
+    metrics.count_rows(3)
+
+    assert sample_value(metrics, 'ml_ids_requests_in_flight', {'route': route}) == 0
+    assert sample_value(metrics, 'ml_ids_requests_total', {'route': route, 'status': '200'}) == 1
+    assert sample_value(metrics, 'ml_ids_request_duration_seconds_sum', {'route': route}) == 0.1
+    assert sample_value(metrics, 'ml_ids_payload_bytes_sum', {'route': route, 'direction': 'request'}) == 1000
+    assert sample_value(metrics, 'ml_ids_payload_bytes_count', {'route': route, 'direction': 'response'}) is None
+    assert sample_value(metrics, 'ml_ids_rows_total') == 3
+
+
+def test_prometheus_metrics_must_record_errors_by_code(prometheus_client):
+    metrics = PrometheusMetrics()
+
+    metrics.count_error('sagemaker', AwsSagemakerHttpClientError(cause='error', status_code=503))
+    metrics.count_error('sagemaker', AwsSagemakerHttpClientError(cause='error', status_code=503))
+
+    assert sample_value(metrics, 'ml_ids_backend_errors_total', {'service': 'sagemaker', 'code': '503'}) == 2
+
+
+def test_prometheus_metrics_generate_must_return_text_format(prometheus_client):
+    metrics = PrometheusMetrics()
+    metrics.count_rows(1)
+
+    body, content_type = metrics.generate()
+
+    assert content_type == prometheus_client.CONTENT_TYPE_LATEST
+    assert b'ml_ids_rows_total 1.0' in body
+
+
+def test_prometheus_metrics_generate_when_multiprocess_dir_set_must_aggregate_workers(prometheus_client,
+                                                                                      monkeypatch,
+                                                                                      tmpdir):
+    from prometheus_client import values
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmpdir))
+
+    workers = []
+    for pid in (101, 102):
+        monkeypatch.setattr(values, 'ValueClass', values.MultiProcessValue(lambda pid=pid: pid))
+        workers.append(PrometheusMetrics())
+
+    for worker in workers:
+        worker.count_rows(5)
+        worker.request_started('/api/predictions')
+
+    body, _ = workers[0].generate()
+
+    assert b'ml_ids_rows_total 10.0' in body
+    assert b'ml_ids_requests_in_flight{route="/api/predictions"} 2.0' in body
+
+
+def test_prometheus_metrics_generate_must_export_registered_sources(prometheus_client):
+    metrics = PrometheusMetrics()
+    counters = {'published': 1, 'circuit_state': 'closed'}
+    metrics.register_source('sns_producer', lambda: counters)
+
+    body, _ = metrics.generate()
+
+    assert b'ml_ids_component_metrics{component="sns_producer",name="published"} 1.0' in body
+    assert b'name="circuit_state"' not in body
+
+    counters['published'] = 5
+    metrics.generate()
+
+    assert sample_value(metrics, 'ml_ids_component_metrics', {'component': 'sns_producer', 'name': 'published'}) == 5
+
+
+def test_prometheus_metrics_must_refresh_registered_sources_periodically(prometheus_client, monkeypatch):
+    metrics = PrometheusMetrics()
+    counters = {'published': 1}
+    metrics.register_source('sns_producer', lambda: counters)
+    labels = {'component': 'sns_producer', 'name': 'published'}
+
+    metrics.request_finished('/api/predictions', 200, 0.1, None, None)
+    assert sample_value(metrics, 'ml_ids_component_metrics', labels) == 1
+
+    counters['published'] = 2
+    metrics.request_finished('/api/predictions', 200, 0.1, None, None)
+    assert sample_value(metrics, 'ml_ids_component_metrics', labels) == 1
+
+    monkeypatch.setattr('ml_ids_api.metrics.SOURCE_REFRESH_SECONDS', 0.0)
+    metrics.request_finished('/api/predictions', 200, 0.1, None, None)
+    assert sample_value(metrics, 'ml_ids_component_metrics', labels) == 2
+
+
+def test_error_code_must_return_status_code():
+    assert error_code(AwsSagemakerHttpClientError(cause='error', status_code=429)) == '429'
+
+
+def test_error_code_when_botocore_error_given_must_return_http_status_code():
+    err = Exception()
+    err.response = {'ResponseMetadata': {'HTTPStatusCode': 500}}
+
+    assert error_code(err) == '500'
+
+
+def test_error_code_when_no_response_received_must_return_error_name():
+    assert error_code(AwsSNSClientError(cause='error')) == 'AwsSNSClientError'
+
+
+def test_create_metrics_when_disabled_must_return_noop_metrics():
+    assert isinstance(create_metrics({'METRICS_ENABLED': False}), NoopMetrics)
+    assert not create_metrics({'METRICS_ENABLED': False}).enabled
+
+
+def test_create_metrics_when_enabled_must_return_prometheus_metrics(prometheus_client):
+    assert isinstance(create_metrics({'METRICS_ENABLED': True}), PrometheusMetrics)
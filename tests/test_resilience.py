@@ -0,0 +1,289 @@
+import json
+import threading
+import time
+import pytest
+import responses
+
+from unittest.mock import MagicMock
+from flask import Config
+
+from ml_ids_api.app import create_sagemaker_client
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClient, AwsSagemakerHttpClientError, \
+    create_http_session
+from ml_ids_api.metrics import PrometheusMetrics
+from ml_ids_api.resilience import AimdLimiter, CircuitBreaker, ResilientPredictionClient, ServiceUnavailableError, \
+    is_failure, retry_after_header
+
+BODY = b'{"columns":["feature"],"data":[[1],[2]]}'
+URL = 'http://sagemaker.aws.com/invocations'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SagemakerStub:
+    """
+    Callback of a mocked SageMaker endpoint injecting latency and errors.
+    """
+
+    def __init__(self):
+        self.latency = 0.0
+        self.status = 200
+
+    def __call__(self, request):
+        time.sleep(self.latency)
+        if self.status != 200:
+            return self.status, {}, 'unavailable'
+        return 200, {}, json.dumps([0] * len(json.loads(request.body)['data']))
+
+
+@pytest.fixture
+def sagemaker_stub():
+    stub = SagemakerStub()
+    with responses.RequestsMock() as rsps:
+        rsps.add_callback(method=responses.POST, url=URL, callback=stub)
+        yield stub
+
+
+def create_http_client():
+    return AwsSagemakerHttpClient(access_key='ACCESS_KEY',
+                                  secret_key='SECRET_KEY',
+                                  schema='http',
+                                  host='sagemaker.aws.com',
+                                  endpoint='/invocations',
+                                  region='eu-west-1',
+                                  session=create_http_session(max_retries=0))
+
+
+def test_limiter_must_reject_invocations_exceeding_limit():
+    limiter = AimdLimiter(initial_limit=2)
+
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    assert limiter.in_flight == 2
+
+
+def test_limiter_must_increase_limit_after_successful_invocations_at_high_utilization():
+    limiter = AimdLimiter(initial_limit=2, max_limit=3)
+
+    for _ in range(3):
+        limiter.try_acquire()
+        limiter.try_acquire()
+        limiter.release(0.01, False)
+        limiter.release(0.01, False)
+
+    assert limiter.limit == 3
+    assert limiter.in_flight == 0
+
+
+def test_limiter_must_not_increase_limit_at_low_utilization():
+    limiter = AimdLimiter(initial_limit=10)
+
+    limiter.try_acquire()
+    limiter.release(0.01, False)
+
+    assert limiter.limit == 10
+
+
+def test_limiter_must_decrease_limit_after_overloaded_or_slow_invocations():
+    limiter = AimdLimiter(initial_limit=10, min_limit=5, backoff_ratio=0.5, latency_threshold=1.0)
+
+    limiter.try_acquire()
+    limiter.release(None, True)
+    assert limiter.limit == 5
+
+    limiter = AimdLimiter(initial_limit=10, backoff_ratio=0.5, latency_threshold=1.0)
+    limiter.try_acquire()
+    limiter.release(2.0, False)
+    assert limiter.limit == 5
+
+
+def test_limiter_when_invalid_bounds_given_must_raise_value_error():
+    with pytest.raises(ValueError):
+        AimdLimiter(initial_limit=10, max_limit=5)
+    with pytest.raises(ValueError):
+        AimdLimiter(backoff_ratio=1.5)
+
+
+def test_breaker_must_open_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, clock=Clock())
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+    assert breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.try_acquire()
+
+
+def test_breaker_must_admit_single_trial_invocation_after_reset_timeout():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 4.0
+    assert breaker.retry_after() == 6.0
+    assert not breaker.try_acquire()
+
+    clock.now = 10.0
+    assert breaker.state == 'half_open'
+    assert breaker.try_acquire()
+    assert not breaker.try_acquire()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_breaker_when_trial_invocation_fails_must_open_again():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now = 10.0
+    breaker.try_acquire()
+
+    assert breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.retry_after() == 10.0
+
+
+def test_is_failure_must_classify_errors():
+    assert is_failure(AwsSagemakerHttpClientError('timeout'))
+    assert is_failure(AwsSagemakerHttpClientError('throttled', status_code=429))
+    assert is_failure(AwsSagemakerHttpClientError('failed', status_code=503))
+    assert is_failure(AwsSagemakerHttpClientError('invalid response', status_code=200))
+    assert is_failure(ValueError('invalid response'))
+    assert not is_failure(AwsSagemakerHttpClientError('invalid', status_code=400))
+    assert not is_failure(AwsSagemakerHttpClientError('not found', status_code=404))
+
+
+def test_retry_after_header_must_round_up_to_whole_seconds():
+    assert retry_after_header(ServiceUnavailableError('circuit_open', 0.0)) == '1'
+    assert retry_after_header(ServiceUnavailableError('circuit_open', 2.1)) == '3'
+
+
+def test_post_invocations_must_return_predictions(sagemaker_stub):
+    client = ResilientPredictionClient(create_http_client())
+
+    assert client.post_invocations(BODY) == [0, 0]
+    assert client.metrics()['in_flight'] == 0
+
+
+def test_post_invocations_when_endpoint_fails_must_open_circuit_and_reject_fast(sagemaker_stub):
+    clock = Clock()
+    client = ResilientPredictionClient(create_http_client(),
+                                       breaker=CircuitBreaker(failure_threshold=2, reset_timeout=5.0, clock=clock))
+    sagemaker_stub.status = 503
+
+    for _ in range(2):
+        with pytest.raises(AwsSagemakerHttpClientError):
+            client.post_invocations(BODY)
+
+    sagemaker_stub.latency = 0.5
+    start = time.perf_counter()
+    with pytest.raises(ServiceUnavailableError) as err:
+        client.post_invocations(BODY)
+
+    assert time.perf_counter() - start < 0.1
+    assert err.value.reason == 'circuit_open'
+    assert err.value.retry_after == 5.0
+    assert client.metrics()['circuit_opened'] == 1
+    assert client.metrics()['rejected_circuit_open'] == 1
+
+    sagemaker_stub.status, sagemaker_stub.latency = 200, 0.0
+    clock.now = 5.0
+    assert client.post_invocations(BODY) == [0, 0]
+    assert client.metrics()['circuit_state'] == 'closed'
+
+
+def test_post_invocations_when_client_error_returned_must_not_open_circuit(sagemaker_stub):
+    client = ResilientPredictionClient(create_http_client(), breaker=CircuitBreaker(failure_threshold=1))
+    sagemaker_stub.status = 400
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        client.post_invocations(BODY)
+
+    assert client.metrics()['circuit_state'] == 'closed'
+    assert client.metrics()['failures'] == 0
+
+
+def test_post_invocations_when_unexpected_error_raised_must_count_failure():
+    http_client = MagicMock()
+    http_client.post_invocations = MagicMock(side_effect=ValueError('invalid response'))
+    client = ResilientPredictionClient(http_client, limiter=AimdLimiter(initial_limit=10),
+                                       breaker=CircuitBreaker(failure_threshold=1))
+
+    with pytest.raises(ValueError):
+        client.post_invocations(BODY)
+
+    assert client.metrics()['failures'] == 1
+    assert client.metrics()['circuit_state'] == 'open'
+    assert client.metrics()['limit'] < 10
+
+
+def test_post_invocations_when_endpoint_slow_must_shed_excess_load(sagemaker_stub):
+    client = ResilientPredictionClient(create_http_client(), limiter=AimdLimiter(initial_limit=2, latency_threshold=0.1))
+    sagemaker_stub.latency = 0.2
+    errors = []
+
+    def post():
+        try:
+            client.post_invocations(BODY)
+        except ServiceUnavailableError as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=post) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 4
+    assert all(err.reason == 'concurrency' for err in errors)
+    assert client.metrics()['rejected_concurrency'] == 4
+    assert client.metrics()['limit'] == 1
+
+
+def test_post_invocations_must_export_limiter_state():
+    pytest.importorskip('prometheus_client')
+    metrics = PrometheusMetrics()
+    sagemaker_client = MagicMock()
+    sagemaker_client.post_invocations = MagicMock(return_value=[0])
+    client = ResilientPredictionClient(sagemaker_client, limiter=AimdLimiter(initial_limit=1), metrics=metrics)
+
+    client.post_invocations(BODY)
+    client.limiter.try_acquire()
+    client.limiter.try_acquire()
+    with pytest.raises(ServiceUnavailableError):
+        client.post_invocations(BODY)
+
+    output = metrics.generate()[0]
+    assert b'ml_ids_sagemaker_concurrency_limit 2.0' in output
+    assert b'ml_ids_sagemaker_invocations_in_flight 2.0' in output
+    assert b'ml_ids_sagemaker_circuit_state 0.0' in output
+    assert b'ml_ids_rejected_requests_total{reason="concurrency"} 1.0' in output
+
+
+def create_config(**values):
+    config = Config('.')
+    config.from_object('config.TestConfig')
+    config.update(values)
+    return config
+
+
+def test_create_sagemaker_client_when_overload_protection_enabled_must_guard_http_client():
+    client = create_sagemaker_client(create_config(AWS_SAGEMAKER_OVERLOAD_PROTECTION=True,
+                                                   AWS_SAGEMAKER_CONCURRENCY_INITIAL_LIMIT=7))
+
+    assert isinstance(client.client, ResilientPredictionClient)
+    assert isinstance(client.client.client, AwsSagemakerHttpClient)
+    assert client.client.limiter.limit == 7
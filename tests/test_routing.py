@@ -0,0 +1,333 @@
+import threading
+import time
+import pytest
+
+from unittest.mock import MagicMock
+from flask import Config
+
+from ml_ids_api.app import create_sagemaker_client
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError
+from ml_ids_api.batching import ChunkedPredictionClient
+from ml_ids_api.routing import Endpoint, EndpointRouter, LatencyTracker
+
+BODY = b'{"columns":["feature"],"data":[[1],[2]]}'
+
+
+def create_client(predictions=None, latency=0.0, error=None):
+    def post_invocations(_request_body):
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return predictions if predictions is not None else [0, 1]
+
+    client = MagicMock()
+    client.post_invocations = MagicMock(side_effect=post_invocations)
+    return client
+
+
+def record_latencies(router, name, latency, samples=20):
+    for _ in range(samples):
+        router.trackers[name].record(latency)
+
+
+def wait_for_shadow(router):
+    router.shadow_executor.shutdown(wait=True)
+
+
+def test_latency_tracker_must_return_percentile_of_recent_latencies():
+    tracker = LatencyTracker(window=100)
+    for latency in range(200):
+        tracker.record(latency / 1000)
+
+    assert len(tracker) == 100
+    assert tracker.percentile(50) == pytest.approx(0.1495)
+    assert tracker.percentile(100) == pytest.approx(0.199)
+
+
+def test_latency_tracker_when_too_few_latencies_recorded_must_return_none():
+    tracker = LatencyTracker()
+    tracker.record(0.1)
+
+    assert tracker.percentile(95, min_samples=2) is None
+    assert LatencyTracker().percentile(50) is None
+
+
+def test_latency_tracker_must_count_consecutive_failures():
+    tracker = LatencyTracker()
+    tracker.record_failure()
+    tracker.record_failure()
+
+    assert tracker.failures == 2
+
+    tracker.record(0.1)
+
+    assert tracker.failures == 0
+
+
+def test_router_without_endpoints_must_raise_value_error():
+    with pytest.raises(ValueError):
+        EndpointRouter([])
+
+
+def test_router_with_zero_weights_must_raise_value_error():
+    with pytest.raises(ValueError):
+        EndpointRouter([Endpoint('a', create_client(), 0.0)])
+
+
+def test_post_invocations_must_split_requests_according_to_weights():
+    primary, canary = create_client(), create_client()
+    router = EndpointRouter([Endpoint('primary', primary, 9.0), Endpoint('canary', canary, 1.0)], seed=1)
+
+    for _ in range(1000):
+        router.post_invocations(BODY)
+
+    assert primary.post_invocations.call_count + canary.post_invocations.call_count == 1000
+    assert 50 < canary.post_invocations.call_count < 150
+    assert router.metrics()['requests'] == 1000
+
+
+def test_post_invocations_must_record_latency_per_endpoint():
+    router = EndpointRouter([Endpoint('a', create_client(latency=0.01))])
+
+    router.post_invocations(BODY)
+
+    assert router.latencies()['a']['p50'] >= 0.01
+
+
+def test_post_invocations_must_mirror_requests_to_shadow_endpoint():
+    shadow = create_client(predictions=[1, 1])
+    router = EndpointRouter([Endpoint('a', create_client(predictions=[0, 1]))], shadow=Endpoint('shadow', shadow))
+
+    assert router.post_invocations(BODY) == [0, 1]
+    wait_for_shadow(router)
+
+    shadow.post_invocations.assert_called_once_with(BODY)
+    assert router.metrics()['shadowed'] == 1
+    assert router.metrics()['shadow_mismatches'] == 1
+
+
+def test_post_invocations_must_not_wait_for_shadow_endpoint():
+    router = EndpointRouter([Endpoint('a', create_client())], shadow=Endpoint('shadow', create_client(latency=0.5)))
+
+    start = time.perf_counter()
+    router.post_invocations(BODY)
+
+    assert time.perf_counter() - start < 0.25
+    wait_for_shadow(router)
+
+
+def test_post_invocations_when_shadow_endpoint_fails_must_return_predictions():
+    router = EndpointRouter([Endpoint('a', create_client())],
+                            shadow=Endpoint('shadow', create_client(error=RuntimeError('unavailable'))))
+
+    assert router.post_invocations(BODY) == [0, 1]
+    wait_for_shadow(router)
+
+    assert router.metrics()['shadow_failed'] == 1
+
+
+def test_post_invocations_when_shadow_endpoint_saturated_must_drop_shadow_invocations():
+    release = threading.Event()
+    shadow = MagicMock()
+    shadow.post_invocations = MagicMock(side_effect=lambda _: release.wait() and [0, 1])
+    router = EndpointRouter([Endpoint('a', create_client())], shadow=Endpoint('shadow', shadow),
+                            shadow_concurrency=1)
+
+    router.post_invocations(BODY)
+    router.post_invocations(BODY)
+    release.set()
+    wait_for_shadow(router)
+
+    assert shadow.post_invocations.call_count == 1
+    assert router.metrics()['shadow_dropped'] == 1
+
+
+def test_post_invocations_must_not_hedge_before_latencies_recorded():
+    slow, fast = create_client(latency=0.05), create_client()
+    router = EndpointRouter([Endpoint('slow', slow, 1.0), Endpoint('fast', fast, 0.0)], hedging=True)
+
+    router.post_invocations(BODY)
+
+    assert fast.post_invocations.call_count == 0
+    assert router.metrics()['hedged'] == 0
+
+
+def test_post_invocations_when_endpoint_exceeds_latency_percentile_must_return_hedged_response():
+    slow, fast = create_client(predictions=[0, 0], latency=0.5), create_client(predictions=[1, 1])
+    router = EndpointRouter([Endpoint('slow', slow, 1.0), Endpoint('fast', fast, 0.0)], hedging=True,
+                            hedge_min_delay_ms=1.0)
+    record_latencies(router, 'slow', 0.01)
+
+    start = time.perf_counter()
+    predictions = router.post_invocations(BODY)
+
+    assert predictions == [1, 1]
+    assert time.perf_counter() - start < 0.25
+    assert router.metrics()['hedged'] == 1
+    assert router.metrics()['hedge_wins'] == 1
+
+
+def test_post_invocations_when_endpoint_responds_within_latency_percentile_must_not_hedge():
+    primary, other = create_client(latency=0.01), create_client()
+    router = EndpointRouter([Endpoint('primary', primary, 1.0), Endpoint('other', other, 0.0)], hedging=True,
+                            hedge_min_delay_ms=200.0)
+    record_latencies(router, 'primary', 0.01)
+
+    router.post_invocations(BODY)
+
+    assert other.post_invocations.call_count == 0
+    assert router.metrics()['hedged'] == 0
+
+
+def test_post_invocations_when_hedged_request_fails_must_return_original_response():
+    slow = create_client(predictions=[0, 0], latency=0.05)
+    failing = create_client(error=RuntimeError('unavailable'))
+    router = EndpointRouter([Endpoint('slow', slow, 1.0), Endpoint('failing', failing, 0.0)], hedging=True,
+                            hedge_min_delay_ms=1.0)
+    record_latencies(router, 'slow', 0.001)
+
+    assert router.post_invocations(BODY) == [0, 0]
+    assert router.metrics()['hedge_wins'] == 0
+
+
+def test_post_invocations_when_all_requests_fail_must_raise_original_error():
+    first = create_client(latency=0.05, error=ValueError('first'))
+    second = create_client(error=RuntimeError('second'))
+    router = EndpointRouter([Endpoint('first', first, 1.0), Endpoint('second', second, 0.0)], hedging=True,
+                            hedge_min_delay_ms=1.0)
+    record_latencies(router, 'first', 0.001)
+
+    with pytest.raises(ValueError, match='first'):
+        router.post_invocations(BODY)
+
+
+def test_post_invocations_when_original_request_invalid_must_not_wait_for_hedged_request():
+    invalid = create_client(latency=0.05, error=AwsSagemakerHttpClientError('invalid', status_code=400))
+    slow = create_client(latency=1.0)
+    router = EndpointRouter([Endpoint('invalid', invalid, 1.0), Endpoint('slow', slow, 0.0)], hedging=True,
+                            hedge_min_delay_ms=1.0)
+    record_latencies(router, 'invalid', 0.001)
+
+    start = time.perf_counter()
+    with pytest.raises(AwsSagemakerHttpClientError):
+        router.post_invocations(BODY)
+
+    assert time.perf_counter() - start < 0.5
+
+
+def test_post_invocations_when_many_requests_hedged_concurrently_must_not_queue_invocations():
+    slow, fast = create_client(predictions=[0, 0], latency=0.5), create_client(predictions=[1, 1], latency=0.05)
+    router = EndpointRouter([Endpoint('slow', slow, 1.0), Endpoint('fast', fast, 0.0)], hedging=True,
+                            hedge_min_delay_ms=1.0)
+    record_latencies(router, 'slow', 0.01)
+    results = []
+
+    def post():
+        results.append(router.post_invocations(BODY))
+
+    threads = [threading.Thread(target=post) for _ in range(30)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.perf_counter() - start < 0.4
+    assert results == [[1, 1]] * 30
+
+
+def test_hedge_target_must_select_endpoint_with_lowest_median_latency():
+    router = EndpointRouter([Endpoint('a', create_client()), Endpoint('b', create_client()),
+                             Endpoint('c', create_client())])
+    record_latencies(router, 'b', 0.2)
+    record_latencies(router, 'c', 0.1)
+
+    assert router.hedge_target(router.endpoints[0]).name == 'c'
+    assert router.hedge_target(router.endpoints[2]).name == 'a'
+
+
+def test_post_invocations_when_pool_busy_must_send_request_without_duplicate():
+    slow, fast = create_client(predictions=[0, 0], latency=0.1), create_client(predictions=[1, 1])
+    router = EndpointRouter([Endpoint('slow', slow, 1.0), Endpoint('fast', fast, 0.0)], hedging=True,
+                            hedge_min_delay_ms=1.0, hedge_concurrency=1)
+    record_latencies(router, 'slow', 0.001)
+
+    assert router.post_invocations(BODY) == [0, 0]
+    assert fast.post_invocations.call_count == 0
+    assert router.metrics()['hedged'] == 0
+    assert router.metrics()['hedge_dropped'] == 1
+
+
+def test_post_invocations_when_endpoint_unavailable_must_record_failure():
+    failing = create_client(error=AwsSagemakerHttpClientError('unavailable', status_code=503))
+    router = EndpointRouter([Endpoint('failing', failing)])
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        router.post_invocations(BODY)
+
+    assert router.trackers['failing'].failures == 1
+    assert len(router.trackers['failing']) == 0
+
+
+def test_post_invocations_when_request_invalid_must_not_record_failure():
+    invalid = create_client(error=AwsSagemakerHttpClientError('invalid', status_code=400))
+    router = EndpointRouter([Endpoint('invalid', invalid)])
+
+    with pytest.raises(AwsSagemakerHttpClientError):
+        router.post_invocations(BODY)
+
+    assert router.trackers['invalid'].failures == 0
+
+
+def test_hedge_target_must_skip_failing_endpoints():
+    router = EndpointRouter([Endpoint('a', create_client()), Endpoint('b', create_client()),
+                             Endpoint('c', create_client())])
+    record_latencies(router, 'c', 0.1)
+    router.trackers['b'].record_failure()
+
+    assert router.hedge_target(router.endpoints[0]).name == 'c'
+
+    router.trackers['c'].record_failure()
+
+    assert router.hedge_target(router.endpoints[0]).name == 'a'
+
+
+def test_hedge_target_when_single_endpoint_must_select_same_endpoint():
+    router = EndpointRouter([Endpoint('a', create_client())])
+
+    assert router.hedge_target(router.endpoints[0]).name == 'a'
+
+
+def create_config(**values):
+    config = Config('.')
+    config.from_object('config.TestConfig')
+    config.update(values)
+    return config
+
+
+def test_create_sagemaker_client_when_routing_configured_must_route_below_chunking():
+    client = create_sagemaker_client(create_config(AWS_SAGEMAKER_ENDPOINTS=['/canary'],
+                                                   AWS_SAGEMAKER_ENDPOINT_WEIGHTS=['0.9', '0.1'],
+                                                   AWS_SAGEMAKER_SHADOW_ENDPOINT='/shadow'))
+
+    assert isinstance(client, ChunkedPredictionClient)
+    router = client.client
+    assert isinstance(router, EndpointRouter)
+    assert [(endpoint.name, endpoint.weight) for endpoint in router.endpoints] == \
+        [('AWS_SAGEMAKER_ENDPOINT', 0.9), ('/canary', 0.1)]
+    assert router.shadow.client.endpoint == '/shadow'
+    assert router.endpoints[0].client.session is router.endpoints[1].client.session
+
+
+def test_create_sagemaker_client_when_routing_configured_must_register_router_metrics():
+    metrics = MagicMock()
+
+    client = create_sagemaker_client(create_config(AWS_SAGEMAKER_HEDGING=True), metrics)
+
+    metrics.register_source.assert_called_once_with('sagemaker_router', client.client.metrics)
+
+
+def test_create_sagemaker_client_when_weights_do_not_match_endpoints_must_raise_value_error():
+    with pytest.raises(ValueError):
+        create_sagemaker_client(create_config(AWS_SAGEMAKER_ENDPOINTS=['/canary'],
+                                              AWS_SAGEMAKER_ENDPOINT_WEIGHTS=['1']))
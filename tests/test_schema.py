@@ -0,0 +1,203 @@
+import json
+import re
+import numpy as np
+import pandas as pd
+import pytest
+
+from unittest.mock import MagicMock
+
+from ml_ids_api.app import create_flask_app, register_api_endpoints
+from ml_ids_api.data import SplitFrame
+from ml_ids_api.messaging import SNSMessageProducer
+from ml_ids_api.schema import FLOW_COLUMNS, INTEGER, TIMESTAMP, ColumnSpec, FeatureSchema, create_flow_schema, \
+    integer, number
+from ml_ids_api.util.constants import HttpHeaders, MimeTypes
+
+
+def create_schema():
+    return FeatureSchema([integer('dst_port', 0, 65535), number('flow_byts_s'), ColumnSpec('timestamp', TIMESTAMP)])
+
+
+def create_frame(*rows, columns=None, row_index=None):
+    return SplitFrame(columns=columns if columns is not None else ['dst_port', 'flow_byts_s', 'timestamp'],
+                      data=[list(row) for row in rows], row_index=row_index)
+
+
+def create_flow():
+    return {spec.name: '01/03/2018 10:15:06' if spec.kind == TIMESTAMP else 1 if spec.kind == INTEGER else 0.5
+            for spec in FLOW_COLUMNS}
+
+
+def test_flow_columns_must_match_api_specification():
+    with open('api-spec.yaml') as spec:
+        columns = json.loads(re.search(r'example: (\["dst_port".*\])', spec.read()).group(1))
+
+    assert create_flow_schema().names == columns
+
+
+def test_validate_must_coerce_columns_to_declared_dtypes():
+    arrays = create_schema().validate(create_frame([80, 1, '01/03/2018 10:15:06'], [443.0, None, '21/02/2018 00:00:00']))
+
+    assert list(arrays) == ['dst_port', 'flow_byts_s', 'timestamp']
+    np.testing.assert_array_equal(arrays['dst_port'], np.array([80, 443], dtype=np.int64))
+    assert arrays['dst_port'].dtype == np.int64
+    assert arrays['flow_byts_s'].dtype == np.float64
+    assert arrays['flow_byts_s'][0] == 1.0 and np.isnan(arrays['flow_byts_s'][1])
+    assert arrays['timestamp'][0] == np.datetime64('2018-03-01T10:15:06')
+
+
+def test_validate_when_no_rows_given_must_return_empty_arrays():
+    arrays = create_schema().validate(create_frame())
+
+    assert all(len(array) == 0 for array in arrays.values())
+
+
+@pytest.mark.parametrize('columns, message', [
+    (['dst_port', 'flow_byts_s'], 'Missing columns: [\'timestamp\'].'),
+    (['dst_port', 'flow_byts_s', 'timestamp', 'label'], 'Unknown columns: [\'label\'].'),
+    (['dst_port', 'dst_port', 'timestamp'], 'Duplicate columns: [\'dst_port\'].')
+])
+def test_validate_when_columns_do_not_match_must_raise_value_error(columns, message):
+    with pytest.raises(ValueError) as err:
+        create_schema().validate(SplitFrame(columns=columns, data=[]))
+
+    assert str(err.value) == message
+
+
+@pytest.mark.parametrize('row, message', [
+    ([80, 1.0, 'yesterday'],
+     'Invalid value \'yesterday\' in row 1 of column \'timestamp\': expected a timestamp in the format '
+     '\'%d/%m/%Y %H:%M:%S\'.'),
+    ([80, 1.0, 20180221],
+     'Invalid value 20180221 in row 1 of column \'timestamp\': expected a timestamp in the format '
+     '\'%d/%m/%Y %H:%M:%S\'.'),
+    ([70000, 1.0, '21/02/2018 10:15:06'],
+     'Invalid value 70000 in row 1 of column \'dst_port\': expected an integer between 0 and 65535.'),
+    ([80.5, 1.0, '21/02/2018 10:15:06'],
+     'Invalid value 80.5 in row 1 of column \'dst_port\': expected an integer between 0 and 65535.'),
+    ([None, 1.0, '21/02/2018 10:15:06'],
+     'Invalid value None in row 1 of column \'dst_port\': expected an integer between 0 and 65535.'),
+    ([2 ** 70, 1.0, '21/02/2018 10:15:06'],
+     'Invalid value 1180591620717411303424 in row 1 of column \'dst_port\': expected an integer between 0 and '
+     '65535.'),
+    ([80, '1.0', '21/02/2018 10:15:06'],
+     'Invalid value \'1.0\' in row 1 of column \'flow_byts_s\': expected a number or null.')
+])
+def test_validate_when_value_invalid_must_raise_value_error_naming_row_and_column(row, message):
+    with pytest.raises(ValueError) as err:
+        create_schema().validate(create_frame([443, 1.0, '21/02/2018 10:15:06'], row))
+
+    assert str(err.value) == message
+
+
+def test_validate_when_row_index_given_must_report_row_label():
+    with pytest.raises(ValueError) as err:
+        create_schema().validate(create_frame([80, 1.0, '21/02/2018 10:15:06'], [80, [1], '21/02/2018 10:15:06'],
+                                              row_index=[1000, 1001]))
+
+    assert 'in row 1001 of column \'flow_byts_s\'' in str(err.value)
+
+
+
+def test_validate_when_column_contains_nested_lists_must_report_first_row():
+    with pytest.raises(ValueError) as err:
+        create_schema().validate(create_frame([[80], 1.0, '21/02/2018 10:15:06'], [[443], 1.0, '21/02/2018 10:15:06']))
+
+    assert 'in row 0 of column \'dst_port\'' in str(err.value)
+
+def test_schema_when_unsupported_column_declared_must_raise_value_error():
+    with pytest.raises(ValueError):
+        FeatureSchema([ColumnSpec('dst_port', 'string')])
+    with pytest.raises(ValueError):
+        FeatureSchema([integer('dst_port'), number('dst_port')])
+
+
+def test_deserialize_dataframe_must_build_dataframe_of_declared_dtypes():
+    body = json.dumps({'columns': ['timestamp', 'dst_port', 'flow_byts_s'],
+                       'data': [['01/03/2018 10:15:06', 80, 1], ['21/02/2018 10:15:06', 443, None]]})
+
+    df = create_schema().deserialize_dataframe(body)
+
+    assert list(df.columns) == ['timestamp', 'dst_port', 'flow_byts_s']
+    assert df['timestamp'].tolist() == [pd.Timestamp('2018-03-01 10:15:06'), pd.Timestamp('2018-02-21 10:15:06')]
+    assert df['dst_port'].dtype == np.int64
+    assert df['flow_byts_s'].dtype == np.float64
+    assert df.index.tolist() == [0, 1]
+
+
+def test_deserialize_dataframe_must_keep_index_of_document():
+    body = json.dumps({'columns': ['timestamp', 'dst_port', 'flow_byts_s'], 'index': [10, 11],
+                       'data': [['01/03/2018 10:15:06', 80, 1], ['21/02/2018 10:15:06', 443, None]]})
+
+    df = create_schema().deserialize_dataframe(body)
+
+    assert df.index.tolist() == [10, 11]
+    assert df['dst_port'].tolist() == [80, 443]
+
+
+@pytest.fixture
+def sagemaker_client_mock():
+    client = MagicMock()
+    client.post_invocations = MagicMock(side_effect=lambda body: [0] * len(json.loads(body)['data']))
+    return client
+
+
+@pytest.fixture
+def sns_producer_mock():
+    producer = SNSMessageProducer(client=None, topic=None)
+    producer.publish_predictions = MagicMock()
+    return producer
+
+
+def create_client(sagemaker_client, sns_producer, parser):
+    app = create_flask_app('config.TestConfig')
+    app.config.update(TESTING=True, PREDICTIONS_PARSER=parser, PREDICTIONS_SCHEMA_VALIDATION=True)
+    register_api_endpoints(app, sagemaker_client, sns_producer)
+    return app.test_client()
+
+
+def post_flows(client, flows):
+    columns = list(flows[0])
+    return client.post('/api/predictions',
+                       headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_JSON_PANDAS_SPLIT},
+                       data=json.dumps({'columns': columns, 'data': [[flow[c] for c in columns] for flow in flows]}))
+
+
+@pytest.mark.parametrize('parser', ['json', 'pandas'])
+def test_predictions_when_schema_validation_enabled_and_row_invalid_must_return_bad_request(
+        sagemaker_client_mock, sns_producer_mock, parser):
+    client = create_client(sagemaker_client_mock, sns_producer_mock, parser)
+    invalid_flow = dict(create_flow(), protocol='tcp')
+
+    res = post_flows(client, [create_flow(), invalid_flow])
+
+    assert res.status_code == 400
+    assert 'in row 1 of column \'protocol\'' in res.get_json()['error']
+    sagemaker_client_mock.post_invocations.assert_not_called()
+    sns_producer_mock.publish_predictions.assert_not_called()
+
+
+def test_predictions_when_schema_validation_enabled_must_parse_timestamps_day_first(sagemaker_client_mock,
+                                                                                    sns_producer_mock):
+    client = create_client(sagemaker_client_mock, sns_producer_mock, 'pandas')
+
+    res = post_flows(client, [create_flow()])
+
+    assert res.status_code == 200
+    data = sns_producer_mock.publish_predictions.call_args[0][0]
+    assert data['timestamp'][0] == pd.Timestamp('2018-03-01 10:15:06')
+    assert data['dst_port'].dtype == np.int64
+
+
+def test_stream_predictions_when_schema_validation_enabled_must_report_invalid_record(sagemaker_client_mock,
+                                                                                       sns_producer_mock):
+    client = create_client(sagemaker_client_mock, sns_producer_mock, 'json')
+    lines = [json.dumps(create_flow()), json.dumps(dict(create_flow(), dst_port=-1))]
+
+    res = client.post('/api/predictions/stream',
+                      headers={HttpHeaders.CONTENT_TYPE: MimeTypes.APPLICATION_NDJSON},
+                      data='\n'.join(lines))
+
+    assert res.status_code == 200
+    assert 'in row 1 of column \'dst_port\'' in json.loads(res.data.decode('utf-8').splitlines()[-1])['error']
+    sagemaker_client_mock.post_invocations.assert_not_called()
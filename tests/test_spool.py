@@ -0,0 +1,259 @@
+import multiprocessing
+import os
+import signal
+import time
+import pytest
+
+from unittest.mock import MagicMock
+from flask import Config
+
+from ml_ids_api.app import create_sns_message_producer
+from ml_ids_api.aws.client.sns_client import AwsSNSClientError, SNSMessage
+from ml_ids_api.data import SplitFrame
+from ml_ids_api.messaging import SNSMessageProducer
+from ml_ids_api.spool import SegmentSpool, SpoolingMessageProducer, SpoolLockedError, SpoolPosition, \
+    encode_message, decode_message
+
+
+def create_payloads(count, start=0):
+    return ['record-{:05d}'.format(i).encode('utf-8') for i in range(start, start + count)]
+
+
+def read_all(spool, max_records=1000):
+    payloads, position = spool.read(max_records)
+    spool.commit(position)
+    return payloads
+
+
+def test_spool_must_return_records_in_append_order(tmpdir):
+    spool = SegmentSpool(str(tmpdir), segment_bytes=1024)
+    spool.append(create_payloads(100))
+
+    assert read_all(spool) == create_payloads(100)
+    assert read_all(spool) == []
+
+
+def test_spool_must_roll_segments_and_delete_committed_segments(tmpdir):
+    spool = SegmentSpool(str(tmpdir), segment_bytes=256)
+    spool.append(create_payloads(100))
+
+    assert len([name for name in os.listdir(str(tmpdir)) if name.endswith('.seg')]) > 5
+
+    payloads, position = spool.read(50)
+    spool.commit(position)
+    assert payloads == create_payloads(50)
+
+    assert read_all(spool) == create_payloads(50, start=50)
+    assert len([name for name in os.listdir(str(tmpdir)) if name.endswith('.seg')]) == 1
+    assert spool.backlog_bytes() == 0
+
+
+def test_spool_must_not_advance_read_position_until_committed(tmpdir):
+    spool = SegmentSpool(str(tmpdir), segment_bytes=1024)
+    spool.append(create_payloads(10))
+
+    spool.read(5)
+
+    assert spool.read(5)[0] == create_payloads(5)
+
+
+def test_spool_when_reopened_must_resume_at_committed_position(tmpdir):
+    spool = SegmentSpool(str(tmpdir), segment_bytes=256)
+    spool.append(create_payloads(40))
+    payloads, position = spool.read(15)
+    spool.commit(position)
+    spool.read(10)
+    spool.close()
+
+    spool = SegmentSpool(str(tmpdir), segment_bytes=256)
+    spool.append(create_payloads(5, start=40))
+
+    assert read_all(spool) == create_payloads(30, start=15)
+
+
+def test_spool_when_last_record_partially_written_must_discard_record(tmpdir):
+    spool = SegmentSpool(str(tmpdir), segment_bytes=1024)
+    spool.append(create_payloads(3))
+    spool.close()
+
+    # corrupt the payload of the last record as if the process was killed while writing it
+    segment_path = os.path.join(str(tmpdir), '000000000000.seg')
+    with open(segment_path, 'r+b') as segment:
+        segment.seek(2 * (8 + 12) + 8 + 4)
+        segment.write(b'\xff\xff')
+
+    spool = SegmentSpool(str(tmpdir), segment_bytes=1024)
+    spool.append([b'next'])
+
+    assert read_all(spool) == create_payloads(2) + [b'next']
+
+
+def test_spool_when_locked_by_another_owner_must_raise_error(tmpdir):
+    spool = SegmentSpool(str(tmpdir))
+
+    with pytest.raises(SpoolLockedError):
+        SegmentSpool(str(tmpdir))
+    assert SegmentSpool.adopt(str(tmpdir)) is None
+    spool.close()
+    assert SegmentSpool.adopt(str(tmpdir)) is not None
+
+
+def test_spool_when_record_exceeds_segment_size_must_raise_value_error(tmpdir):
+    spool = SegmentSpool(str(tmpdir), segment_bytes=64)
+
+    with pytest.raises(ValueError):
+        spool.append([b'a', b'x' * 64])
+    assert read_all(spool) == []
+
+
+def test_encode_message_must_round_trip_message():
+    message = SNSMessage(message='{"columns":["a"]}', attrs={'prediction': {'DataType': 'String',
+                                                                           'StringValue': 'attack'}})
+
+    assert decode_message(encode_message(message)) == message
+
+
+def create_data(rows):
+    return SplitFrame(columns=['feature', 'prediction'], data=[[i, 1] for i in range(rows)])
+
+
+def create_sns_client():
+    client = MagicMock()
+    client.published = []
+    client.publish_batch = MagicMock(side_effect=lambda topic, messages, batch_size: client.published.extend(messages))
+    return client
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_spooling_producer_must_publish_spooled_notifications(tmpdir):
+    sns_client = create_sns_client()
+    producer = SpoolingMessageProducer(SNSMessageProducer(sns_client, 'topic', batch_size=10), str(tmpdir),
+                                       drain_batch_size=7)
+
+    producer.publish_predictions(create_data(20))
+
+    wait_until(lambda: len(sns_client.published) == 20)
+    producer.shutdown()
+    assert producer.metrics()['spooled'] == 20
+    assert producer.metrics()['published'] == 20
+
+
+def test_spooling_producer_when_publishing_fails_must_retry_with_backoff(tmpdir):
+    sns_client = create_sns_client()
+    publish = sns_client.publish_batch.side_effect
+
+    def fail_twice(**kwargs):
+        if sns_client.publish_batch.call_count <= 2:
+            raise IOError('unavailable')
+        publish(**kwargs)
+
+    sns_client.publish_batch.side_effect = fail_twice
+    producer = SpoolingMessageProducer(SNSMessageProducer(sns_client, 'topic', batch_size=10), str(tmpdir),
+                                       initial_backoff=0.01)
+
+    start = time.perf_counter()
+    producer.publish_predictions(create_data(5))
+
+    assert time.perf_counter() - start < 0.1
+    wait_until(lambda: len(sns_client.published) == 5)
+    assert producer.metrics()['failed'] == 2
+    producer.shutdown()
+
+
+def test_spooling_producer_when_messages_rejected_must_discard_messages(tmpdir):
+    sns_client = create_sns_client()
+    sns_client.publish_batch.side_effect = AwsSNSClientError('invalid', failed_entries=[{'Id': '0',
+                                                                                          'SenderFault': True}])
+    producer = SpoolingMessageProducer(SNSMessageProducer(sns_client, 'topic', batch_size=10), str(tmpdir))
+
+    producer.publish_predictions(create_data(1))
+
+    wait_until(lambda: producer.metrics()['rejected'] == 1)
+    producer.shutdown()
+    assert producer.metrics()['backlog_bytes'] == 0
+
+
+def test_spooling_producer_must_publish_notifications_of_exited_processes(tmpdir):
+    orphan = SegmentSpool(os.path.join(str(tmpdir), 'orphan'))
+    orphan.append([encode_message(SNSMessage(message='orphaned', attrs={}))])
+    orphan.close()
+    sns_client = create_sns_client()
+    producer = SpoolingMessageProducer(SNSMessageProducer(sns_client, 'topic', batch_size=10), str(tmpdir))
+
+    producer.publish_predictions(create_data(1))
+
+    wait_until(lambda: len(sns_client.published) == 2)
+    producer.shutdown()
+    assert sns_client.published[0].message == 'orphaned'
+    assert producer.metrics()['adopted'] == 1
+    assert not os.path.exists(os.path.join(str(tmpdir), 'orphan'))
+
+
+def drain_slowly(directory, published_path, records):
+    spool = SegmentSpool(directory, segment_bytes=512)
+    spool.append(create_payloads(records))
+
+    with open(published_path, 'a') as published:
+        while True:
+            payloads, position = spool.read(3)
+            for payload in payloads:
+                published.write(payload.decode('utf-8') + '\n')
+                published.flush()
+                time.sleep(0.002)
+            spool.commit(position)
+
+
+def test_spool_when_drainer_killed_mid_segment_must_not_lose_records(tmpdir):
+    directory, published_path = str(tmpdir.join('spool')), str(tmpdir.join('published'))
+    records = 500
+    process = multiprocessing.get_context('fork').Process(target=drain_slowly,
+                                                          args=(directory, published_path, records))
+    process.start()
+
+    wait_until(lambda: os.path.exists(published_path) and os.path.getsize(published_path) > 1000)
+    os.kill(process.pid, signal.SIGKILL)
+    process.join()
+
+    with open(published_path) as published:
+        published_before_kill = {line.strip().encode('utf-8') for line in published}
+    spool = SegmentSpool(directory, segment_bytes=512)
+    remaining, _ = spool.read(records)
+
+    assert 0 < len(published_before_kill) < records
+    assert not os.path.exists(os.path.join(directory, '000000000000.seg'))
+    assert published_before_kill | set(remaining) == set(create_payloads(records))
+    # records are published at least once, at most the uncommitted batch is published again
+    assert len(published_before_kill & set(remaining)) <= 3
+    assert remaining == sorted(remaining)
+
+
+def test_spool_position_must_be_persisted_in_checkpoint(tmpdir):
+    spool = SegmentSpool(str(tmpdir), segment_bytes=256)
+    spool.append(create_payloads(30))
+    _, position = spool.read(20)
+    spool.commit(position)
+
+    with open(os.path.join(str(tmpdir), 'checkpoint')) as checkpoint:
+        assert checkpoint.read() == '{{"segment": {}, "offset": {}}}'.format(position.segment, position.offset)
+    assert isinstance(position, SpoolPosition)
+
+
+def create_config(**values):
+    config = Config('.')
+    config.from_object('config.TestConfig')
+    config.update(values)
+    return config
+
+
+def test_create_sns_message_producer_when_spool_configured_must_create_spooling_producer(tmpdir):
+    producer = create_sns_message_producer(create_config(AWS_SNS_SPOOL_DIR=str(tmpdir), AWS_SNS_ASYNC_PUBLISHING=True),
+                                           sns_client=MagicMock())
+
+    assert isinstance(producer, SpoolingMessageProducer)
+    assert producer.directory == str(tmpdir)
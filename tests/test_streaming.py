@@ -0,0 +1,134 @@
+import io
+import json
+import os
+import pytest
+
+from unittest.mock import MagicMock
+
+from ml_ids_api.aws.client.sagemaker_client import AwsSagemakerHttpClientError
+from ml_ids_api.data import SplitFrame
+from ml_ids_api.streaming import FlowRecordReader, stream_predictions
+
+
+def create_stream(*records):
+    return io.BytesIO(b''.join((json.dumps(record) if isinstance(record, dict) else record).encode('utf-8') + b'\n'
+                               for record in records))
+
+
+def predict_features(request_body):
+    return [row[0] % 2 for row in json.loads(request_body)['data']]
+
+
+@pytest.fixture
+def sagemaker_client_mock():
+    client = MagicMock()
+    client.post_invocations = MagicMock(side_effect=predict_features)
+    return client
+
+
+def test_reader_must_return_values_in_column_order_of_first_record():
+    reader = FlowRecordReader(create_stream({'a': 1, 'b': 'x'}, {'b': 'y', 'a': 2}))
+
+    assert list(reader) == [[1, 'x'], [2, 'y']]
+    assert reader.columns == ['a', 'b']
+
+
+def test_reader_must_skip_blank_lines():
+    reader = FlowRecordReader(create_stream({'a': 1}, '', '  ', {'a': 2}))
+
+    assert list(reader) == [[1], [2]]
+
+
+def test_reader_peek_must_not_consume_first_record():
+    reader = FlowRecordReader(create_stream({'a': 1}, {'a': 2}))
+
+    assert reader.peek() == [1]
+    assert reader.columns == ['a']
+    assert list(reader) == [[1], [2]]
+
+
+def test_reader_peek_when_stream_empty_must_return_none():
+    assert FlowRecordReader(io.BytesIO(b'\n')).peek() is None
+
+
+@pytest.mark.parametrize('line', ['i_am_invalid', '[1, 2]', '{"a": 1, "b": 2}', '{"b": 1}'])
+def test_reader_when_invalid_record_given_must_raise_value_error(line):
+    reader = FlowRecordReader(create_stream({'a': 1}, line))
+    next(reader)
+
+    with pytest.raises(ValueError, match='Line 2'):
+        next(reader)
+
+
+def test_reader_when_line_exceeds_limit_must_raise_value_error():
+    reader = FlowRecordReader(create_stream({'a': 'x' * 100}), max_line_bytes=50)
+
+    with pytest.raises(ValueError, match='maximum length'):
+        next(reader)
+
+
+@pytest.mark.parametrize('max_batch_wait_ms', [None, 1000.0])
+def test_stream_predictions_must_invoke_sagemaker_in_bounded_batches(sagemaker_client_mock, max_batch_wait_ms):
+    reader = FlowRecordReader(create_stream(*[{'feature': i} for i in range(5)]))
+    producer = MagicMock()
+
+    lines = b''.join(stream_predictions(reader, sagemaker_client_mock, producer, batch_rows=2,
+                                        max_batch_wait_ms=max_batch_wait_ms)).splitlines()
+
+    assert lines == [b'0', b'1', b'0', b'1', b'0']
+    assert [len(json.loads(call[0][0])['data']) for call in sagemaker_client_mock.post_invocations.call_args_list] \
+        == [2, 2, 1]
+
+
+def test_stream_predictions_must_publish_predictions_indexed_by_stream_position(sagemaker_client_mock):
+    reader = FlowRecordReader(create_stream(*[{'feature': i} for i in range(3)]))
+    producer = MagicMock()
+
+    list(stream_predictions(reader, sagemaker_client_mock, producer, batch_rows=2))
+
+    assert [call[0][0] for call in producer.publish_predictions.call_args_list] == [
+        SplitFrame(columns=['feature', 'prediction'], data=[[0, 0], [1, 1]], row_index=[0, 1]),
+        SplitFrame(columns=['feature', 'prediction'], data=[[2, 0]], row_index=[2])]
+
+
+def test_stream_predictions_when_batch_not_filled_in_time_must_process_waiting_records(sagemaker_client_mock):
+    read_fd, write_fd = os.pipe()
+    reader = FlowRecordReader(os.fdopen(read_fd, 'rb'))
+    os.write(write_fd, b'{"feature": 1}\n{"feature": 2}\n')
+
+    predictions = stream_predictions(reader, sagemaker_client_mock, MagicMock(), batch_rows=10,
+                                     max_batch_wait_ms=50.0)
+
+    # the client has not closed the stream yet
+    assert next(predictions) == b'1\n0\n'
+
+    os.write(write_fd, b'{"feature": 3}\n')
+    os.close(write_fd)
+
+    assert b''.join(predictions) == b'1\n'
+    reader.stream.close()
+
+
+@pytest.mark.parametrize('max_batch_wait_ms', [None, 1000.0])
+def test_stream_predictions_when_invalid_record_given_must_process_preceding_records_and_report_error(
+        sagemaker_client_mock, max_batch_wait_ms):
+    reader = FlowRecordReader(create_stream({'feature': 1}, {'feature': 2}, 'i_am_invalid', {'feature': 3}))
+
+    lines = b''.join(stream_predictions(reader, sagemaker_client_mock, MagicMock(),
+                                        max_batch_wait_ms=max_batch_wait_ms)).splitlines()
+
+    assert lines[:2] == [b'1', b'0']
+    assert 'Line 3' in json.loads(lines[2])['error']
+    assert len(lines) == 3
+
+
+def test_stream_predictions_when_sagemaker_request_fails_must_report_error(sagemaker_client_mock):
+    sagemaker_client_mock.post_invocations.side_effect = [[1], AwsSagemakerHttpClientError('Failed')]
+    reader = FlowRecordReader(create_stream({'feature': 1}, {'feature': 2}))
+    producer = MagicMock()
+
+    lines = b''.join(stream_predictions(reader, sagemaker_client_mock, producer, batch_rows=1)).splitlines()
+
+    assert lines[0] == b'1'
+    assert 'error' in json.loads(lines[1])
+    producer.publish_predictions.assert_called_once()